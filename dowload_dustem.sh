@@ -12,27 +12,43 @@ echo "=========================================="
 
 CURREN_REPOS=$(pwd)
 
-cd ~
-find_dustem=$(find . -type f -name "dustem" 2>/dev/null)
+# Répertoire de l'application : celui du script, sans parcourir ~
+dir_app=$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)
+
+# Fichier de configuration partagé avec l'application (cf. dustem_core/locate.py)
+CONFIG_FILE="${DUSTEM_APP_CONFIG:-${XDG_CONFIG_HOME:-$HOME/.config}/dustem_app/paths.json}"
+
+# Emplacement connu de dustem : variables d'environnement, configuration,
+# puis emplacement d'installation par défaut. Chaque candidat est vérifié
+# par un simple test d'existence.
+find_dustem=""
+candidates=()
+[ -n "$DUSTEM_BINARY" ] && candidates+=("$DUSTEM_BINARY")
+[ -n "$DUSTEM_REPOSITORY" ] && candidates+=("$DUSTEM_REPOSITORY/src/dustem")
+if [ -f "$CONFIG_FILE" ]; then
+    config_binary=$(sed -n 's/.*"dustem_binary": *"\([^"]*\)".*/\1/p' "$CONFIG_FILE")
+    [ -n "$config_binary" ] && candidates+=("$config_binary")
+fi
+candidates+=("$dir_app/dustEM_repos/src/dustem")
+
+for candidate in "${candidates[@]}"; do
+    if [ -x "$candidate" ] && [ -f "$candidate" ]; then
+        find_dustem="$candidate"
+        break
+    fi
+done
 
 if [ -n "$find_dustem" ]; then
     echo "Les fichiers de dustem ont été localisé ici : "
     
-    dustem_repos=$(dirname $find_dustem)
+    dustem_repos=$(dirname "$find_dustem")
     cd "$dustem_repos/.."
     pwd
     echo ""
 
     echo "Ouverture de l'applicaiton"
 
-    cd "./../.."
-
-    pwd
-
-    cd ~
-    find_app=$(find -type f -name "dustEM_App.sh")
-    dir_app=$(dirname $find_app)
-    cd $dir_app
+    cd "$dir_app"
 
     ./dustEM_App.sh
 
@@ -40,108 +56,37 @@ if [ -n "$find_dustem" ]; then
 else
     echo "Dossier DustEM non trouvé."
     echo ""
-    
-    cd ~
-    find_app=$(find . -type f -name "dustEM_App.sh" 2>/dev/null)
-
-    if [ -z "$find_app" ]; then
-        echo "dustEM_App.sh non trouvé !"
-        exit 1
-    fi
-
-    # Récupérer le dossier contenant le script
-    dir_app=$(dirname "$find_app")
-    dir_app=$(realpath "$dir_app")   # <-- transforme en chemin absolu
 
     echo "Répertoire du script : $dir_app"
 
-    # Vérifier qu'il existe
-    if [ ! -d "$dir_app" ]; then
-        echo "Erreur : $dir_app n'existe pas"
-        exit 1
-    fi
-
-    # Créer le sous-dossier dustEM_repos (absolu)
-    dustem_repos="$dir_app/dustEM_repos"
-    mkdir -p "$dustem_repos"
-
-    # Aller dans ce dossier
-    cd "$dustem_repos" || { echo "Impossible de cd dans $dustem_repos"; exit 1; }
-
-    user_dir="$dustem_repos"
-
-    echo "Travail dans le dossier : $user_dir"
-    ls
-
     echo "=========================================="
-    echo "Téléchargement code dustEM et décompressaion"
+    echo "Construction de dustEM"
     echo "=========================================="
 
-    DOWNLOAD_URL="https://www.ias.u-psud.fr/DUSTEM/dustem4.3_web.tar.gz"
-    ARCHIVE_NAME="dustem4.3_web.tar.gz"
-
-    wget $DOWNLOAD_URL
-    echo "Décompression de l'archive..."
-    tar -xzf "$ARCHIVE_NAME"
-
-
-    if [ ! -d "oprop" ]; then
-        echo "Erreur: Le répertoire dustem4.3web n'a pas été créé après décompression"
-        exit 1
-    fi
-
-    #Définir le chemin absolu du repository
-    DUSTEM_PATH=$user_dir
-
+    # Archive des sources : $DUSTEM_TARBALL (chemin ou URL, pour une
+    # installation hors ligne), sinon le site de dustEM. Elle est conservée
+    # dans le cache des builds ($DUSTEM_BUILD_DIR) et vérifiée par sa somme
+    # SHA-256 ($DUSTEM_TARBALL_SHA256, sinon celle de la première archive
+    # obtenue). Compilation parallèle ; un build identique (même archive,
+    # mêmes chemins, mêmes options) déjà construit est réutilisé.
+    # Chemins relatifs (data_path='./', dir_PDR='./') : dustem lit data/ et
+    # écrit out/ dans son répertoire courant, ce qui permet à l'application
+    # de lancer chaque simulation dans un espace de travail isolé (plusieurs
+    # simulations en parallèle). Le build est testé en lançant dustem une fois.
+    build_args=(--smoke)
+    [ -n "$DUSTEM_TARBALL_SHA256" ] && build_args+=(--sha256 "$DUSTEM_TARBALL_SHA256")
+    DUSTEM_PATH=$(python3 "$dir_app/dustem_core/build.py" "${build_args[@]}")
 
     echo "Repository DustEM installé dans: $DUSTEM_PATH"
 
-
-
-    # Modificaiton du fichier DM_constant.f90
-    echo ""
-    echo "[2/4] Configuration du fichier DM_constant.f90..."
-
-    CONSTANT_FILE="$DUSTEM_PATH/src/DM_constants.f90"
-
-    if [ ! -f "$CONSTANT_FILE" ]; then
-        echo "Erreur: Le fichier $CONSTANT_FILE n'existe pas"
-        exit 1
+    # Mémoriser l'emplacement pour l'application (évite toute recherche)
+    mkdir -p "$(dirname "$CONFIG_FILE")"
+    if [ -f "$CONFIG_FILE" ] && grep -q '"dustem_binary"' "$CONFIG_FILE"; then
+        sed -i "s|\"dustem_binary\": *\"[^\"]*\"|\"dustem_binary\": \"$DUSTEM_PATH/src/dustem\"|" "$CONFIG_FILE"
+    else
+        printf '{\n "dustem_binary": "%s"\n}\n' "$DUSTEM_PATH/src/dustem" > "$CONFIG_FILE"
     fi
 
-    # Créer une sauvegarde du fichier original
-    cp "$CONSTANT_FILE" "${CONSTANT_FILE}.backup"
-
-    # Modifier la ligne 76 (variable path)
-    sed -i "76s|.*|  CHARACTER (len=100)        :: data_path='$DUSTEM_PATH/'|" "$CONSTANT_FILE"
-
-    # Modifier également la ligne 81 pour pointer vers le repository dustem4.3
-    sed -i "81s|.*|  CHARACTER(len=100)         :: dir_PDR ='$DUSTEM_PATH/'|" "$CONSTANT_FILE"
-
-    linge_76=$(sed -n '76p' $CONSTANT_FILE)
-    ligne_81=$(sed -n '81p' $CONSTANT_FILE)
-    echo "Fichier DM_constant.f90 modifié avec succès"
-    echo "  - Ligne 76 (path): $ligne_76/"
-    echo "  - Ligne 81 (dir_PDR): $ligne_81/"
-
-    echo ""
-    echo "[4/4] Vérification de l'installation"
-    echo ""
-
-    cd "$DUSTEM_PATH/src"
-
-    repo=$(pwd)
-
-    echo "repos actuel : $repo"
-
-    make
-
-    ls -l dustem
-
-    chmod +x dustem
-
-    ./dustem
-
     echo ""
     echo "L'installation s'est faite avec succès !"
     echo ""
@@ -1,106 +1,249 @@
 import streamlit as st
 import numpy as np
-import matplotlib.pyplot as plt
 import os
 import subprocess
-import pandas as pd
 from pathlib import Path
+import functools
 import io
+import tempfile
+import time
+
+from dustem_core.abundance import derive_from_cache, model_shape
+from dustem_core.api import resume_batch, run_adaptive, run_batch
+from dustem_core.build import build_info
+from dustem_core.cache import ResultCache, model_key, run_keywords
+from dustem_core.grain import grain_types
+from dustem_core.journal import Journal, new_batch_id
+from dustem_core.jobs import CANCELLED, DONE, FINISHED_STATES, PRIORITIES, QUEUED, JobManager
+from dustem_core.locate import APP_DIR, locate_dustem, remember_repository, scan_and_remember
+from dustem_core.matrix import sed_matrix
+from dustem_core.metrics import RunMetrics
+from dustem_core.outputs import discard_outputs, stage_outputs
+from dustem_core.plotting import FigureCache, plot_comparison, plot_emulated, plot_fit, plot_result, to_png
+from dustem_core.readers import SEDTable
+from dustem_core.remote import default_listen, serve_workers
+from dustem_core.results import save_data_test
+from dustem_core.store import ResultStore, list_projects
+from dustem_core.sweep import SWEEP_FIELDS, expand_sweep, parse_axes
+
 # Configuration de la page
 st.set_page_config(
     page_title="DustEM Interface",
     page_icon="🌌",
     layout="wide"
 )
+
+# Bandes (µm) et rapports proposés par défaut pour l'analyse des modèles
+DEFAULT_BANDS = "b12 = 8:15\nb60 = 40:80\nb100 = 80:120"
+DEFAULT_RATIOS = "b60/b100, b12/b60"
+
+# Nombre maximal de courbes superposées dans « Autres sorties de dustEM »
+MAX_OUTPUT_CURVES = 50
+
+# Conventions de correction de couleur de la photométrie synthétique
+CONVENTION_LABELS = {
+    "nuFnu": "νFν constant (IRAS, Spitzer IRAC, Herschel, Planck)",
+    "Fnu": "Fν constant (flux moyen)",
+    "nu-2": "Fν ∝ ν⁻² (WISE)",
+}
+
 # Fonctions utilitaires
-def test(file, grain_dict):
-    """Mise à jour du fichier GRAIN.DAT avec les paramètres du dictionnaire"""
-    nouvelles_lignes = []
-    
-    with open(file, "r") as f:
-        lignes = f.readlines()
-    
-    for ligne in lignes:
-        if ligne[0] == "#":
-            nouvelles_lignes.append(ligne)
-        elif ligne[0] == "s":
-            nouvelles_lignes.append(ligne)
-    
-    for i in grain_dict:
-        if i == "G0":
-            nouvelles_lignes.append(grain_dict["G0"])
-        else:
-            nouvelles_lignes.append(grain_dict[i])
-    
-    with open(file, "w") as f:
-        f.writelines(nouvelles_lignes)
+@st.cache_resource
+def get_job_manager():
+    """Planificateur des simulations en tâche de fond, commun à toutes les sessions
 
+    Avec ``$DUSTEM_WORKER_LISTEN``, la file est aussi servie aux travailleurs distants.
+    """
+    manager = JobManager()
+    if default_listen():
+        serve_workers(manager)
+    return manager
 
-def save_data_test(data, name_set, global_test):
-    """Sauvegarde des données SED dans un dictionnaire"""
-    data_out = {}
-    
-    data_out["wl"] = data[:, 0]
-    
-    for i in range(0, np.shape(data)[-1]):
-        if i == np.shape(data)[-1] - 1:
-            data_out["sed_tot"] = data[:, i]
-        else:
-            pop = "pop" + str(i)
-            data_out[pop] = data[:, i]
-    
-    global_test[name_set] = data_out
-    
-    return global_test
 
+def session_user():
+    """Utilisateur de la session, pour le partage équitable de la file d'attente"""
+    if st.user.get("is_logged_in"):
+        return st.user.get("email") or st.user.get("name")
+    return st.context.ip_address or "local"
 
-def plot_result(data_dict, scalex="log", scaley="log", xlim=[0.1, 1000], ylim=[1e-22, 1e-18], title="SED Result"):
-    """Génération du graphique SED"""
-    wl = data_dict["wl"]
-    
-    fig, ax = plt.subplots(figsize=(10, 6))
-    
-    for i in data_dict:
-        if i == "wl":
-            continue
-        elif i == "sed_tot":
-            ax.plot(wl, data_dict[i], label=i, linewidth=2)
-        else:
-            ax.plot(wl, data_dict[i], alpha=0.6)
-    
-    ax.set_yscale(scaley)
-    ax.set_xscale(scalex)
-    ax.set_title(title)
-    ax.set_xlabel("Wavelength (µm)")
-    ax.set_ylabel("Intensity")
-    
-    ax.set_ylim(ylim)
-    ax.set_xlim(xlim)
-    plt.legend()
-    plt.grid(True, alpha=0.3)
-    
-    return fig
 
-def get_path(file):
-    home = Path.home()
-    matches = list(home.rglob(file))
+@st.cache_resource
+def get_result_cache():
+    """Cache disque des résultats, partagé entre sessions"""
+    return ResultCache()
 
-    if not matches:
-        raise FileNotFoundError(f"{file} non trouvé")
 
-    # Prendre le premier trouvé
-    find_dustem = matches[0]
+@st.cache_resource(max_entries=16)
+def get_results_store(project):
+    """Stockage d'un projet, commun aux sessions : l'index n'est relu que s'il a changé"""
+    return ResultStore(project)
 
-    # Récupérer le dossier contenant dustem
-    repos = find_dustem.parent
 
-    # Aller dans le parent de dustem_repos
-    parent_dir = repos.parent
+@st.cache_data(ttl=30, show_spinner=False)
+def check_repository(repository):
+    """Dossiers src/ et data/ du repository présents (vérifiés au plus toutes les 30 s)"""
+    return all(os.path.isdir(path) for path in (repository, os.path.join(repository, "src"), os.path.join(repository, "data")))
 
-    #print("dustem trouvé dans :", dustem_repos)
-    #print("Parent :", parent_dir)
-    return repos, parent_dir
-    
+
+def lazy_expander(label, key, panel):
+    """Expander dont le panneau n'est exécuté que s'il est ouvert
+
+    Un panneau fermé ne coûte rien aux rerun de la page (ni calcul, ni import,
+    ni envoi de ses éléments au navigateur). ``key``/``on_change`` demandent
+    Streamlit >= 1.55.
+    """
+    expander = st.expander(label, key=key, on_change="rerun")
+    if expander.open:
+        with expander:
+            panel()
+
+
+@st.cache_resource
+def get_journal():
+    """Journal des lots (reprise des balayages interrompus)"""
+    return Journal()
+
+
+@st.cache_resource
+def get_figure_cache():
+    """Graphiques déjà rendus (PNG), communs à toutes les sessions"""
+    return FigureCache()
+
+
+@st.cache_resource(max_entries=4)
+def get_emulators(project, index_size):
+    """Émulateurs du projet, réentraînés quand son index change"""
+    from dustem_core.emulator import train_emulators
+
+    return train_emulators(ResultStore(project))
+
+
+@st.cache_data(max_entries=8)
+def get_analytics(project, index_size, bands):
+    """Grandeurs dérivées des résultats du projet, recalculées quand son index change
+
+    ``bands`` est un tuple de couples (nom, (lo, hi)) ; les grandeurs sont
+    aussi mémorisées sur disque avec les résultats (cf. dustem_core.analytics).
+    """
+    from dustem_core.analytics import model_analytics
+
+    return model_analytics(ResultStore(project), bands=dict(bands))
+
+
+def analytics_settings():
+    """Bandes et rapports choisis dans « Analyse des modèles » (défauts avant son premier affichage)"""
+    from dustem_core.analytics import parse_bands, parse_ratios
+
+    bands = parse_bands(st.session_state.get("analytics_bands", DEFAULT_BANDS))
+    ratios = parse_ratios(st.session_state.get("analytics_ratios", DEFAULT_RATIOS), bands)
+    return bands, ratios
+
+
+def filter_signature(directory):
+    """Fichiers du dossier des filtres et leurs dates : recharger les filtres quand il change"""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return ()
+    return tuple(sorted((p.name, p.stat().st_mtime_ns) for p in directory.iterdir() if p.is_file()))
+
+
+@st.cache_resource(max_entries=4)
+def get_filters(directory, signature):
+    from dustem_core.photometry import load_filters
+
+    return load_filters(directory)
+
+
+@st.cache_data(max_entries=8)
+def get_photometry(project, index_size, directory, signature, bands, convention, populations):
+    """Flux des résultats du projet dans les bandes choisies (mémorisés aussi sur disque)"""
+    from dustem_core.photometry import photometry
+
+    filters = get_filters(directory, signature)
+    return photometry(ResultStore(project), [filters[b] for b in bands], convention=convention,
+                      populations=populations)
+
+
+@st.cache_data(max_entries=8)
+def get_output_products(project, index_size):
+    """Autres fichiers de sortie de dustEM des résultats du projet : produit -> résultats qui l'ont"""
+    store = ResultStore(project)
+    products = {}
+    for name in store:
+        for product in store.entry(name).get("outputs", ()):
+            products.setdefault(product, []).append(name)
+    return products
+
+
+def export_file(store, fmt, names, populations):
+    """Export écrit en flux dans un fichier temporaire (appelé au clic)
+
+    Les résultats sont lus un modèle à la fois, mais Streamlit garde le
+    fichier produit en mémoire pour le servir au navigateur (les boutons de
+    téléchargement n'acceptent pas de flux) : pour un très gros projet,
+    ``python -m dustem_core export`` écrit directement sur le disque.
+    """
+    from dustem_core.export import export_results
+
+    tmp = tempfile.TemporaryFile()
+    export_results(store, tmp, fmt=fmt, names=names, populations=populations)
+    tmp.seek(0)
+    return tmp
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def read_manifest_file(data, filename):
+    """Modèles d'un manifeste téléversé, et mise en page des GRAIN.DAT pour les réécrire à l'identique"""
+    from dustem_core.grain import parse_grain
+    from dustem_core.manifest import iter_manifest, manifest_format
+
+    source = io.BytesIO(data)
+    source.name = filename
+    jobs = list(iter_manifest(source))
+    layouts = {}
+    if manifest_format(filename) == "grain":
+        layouts[jobs[0][0]] = parse_grain(data.decode("utf-8")).layout
+    return jobs, layouts
+
+
+def manifest_file(jobs, fmt):
+    """Manifeste des tests écrit au clic"""
+    from dustem_core.manifest import write_manifest
+
+    buffer = io.BytesIO()
+    write_manifest(jobs, buffer, fmt)
+    return buffer.getvalue()
+
+
+def result_ids(store, names):
+    """Identifiants stables des résultats sélectionnés, pour les clés de cache"""
+    return tuple((name, store.entry(name)["run"]) for name in names)
+
+
+def store_job_result(store, cache, cache_key, binary_digest, job, workspace):
+    """Enregistre le résultat d'une tâche terminée (appelé dans le thread de la tâche)
+
+    ``workspace`` vaut ``None`` si la tâche a tourné sur un travailleur distant.
+    """
+    job.metrics.cache = "miss"
+    if not job.finished_ok:
+        return
+    cache.put(cache_key, job.result.data, binary_digest, shape=model_shape(job.repository, job.config))
+    outputs = stage_outputs(workspace) if workspace is not None else None
+    try:
+        save_data_test(
+            data=job.result,
+            name_set=job.name,
+            global_test=store,
+            config=job.config,
+            metadata=dict({"source": "dustem", "cache_key": cache_key, "elapsed": job.elapsed},
+                          **({"worker": job.worker} if job.worker else {}), **build_info(job.repository)),
+            grain_template=workspace.grain_file if workspace is not None else Path(job.repository) / "data" / "GRAIN.DAT",
+            metrics=job.metrics,
+            outputs=outputs
+        )
+    finally:
+        discard_outputs(outputs)
 
 
 # Titre de l'application
@@ -112,33 +255,54 @@ st.markdown("""#### Prérequis :
 # Input pour le repository
 if 'repos' not in st.session_state:
     st.session_state.repos = {}
-    repos_app, parent_repos_app = get_path("dustEM_App.py")
-    st.session_state.repos["repos_app"] = repos_app
-    st.session_state.repos["parent_repos_app"] = parent_repos_app
+    st.session_state.repos["repos_app"] = APP_DIR
+    st.session_state.repos["parent_repos_app"] = APP_DIR.parent
     st.session_state.repos["State"] = False
 
 
 try : 
-    dustem_path, parent_dustem_path = get_path("dustem")
-    st.success(f"dustem a été localisé : {dustem_path}")
+    # Emplacement connu (variable d'environnement ou configuration) : recherché une fois par session
+    if not st.session_state.repos["State"]:
+        dustem_path, parent_dustem_path = locate_dustem()
+        st.session_state.repos["dustem_path"] = dustem_path
+        st.session_state.repos["parent_dustem_path"] = parent_dustem_path
+    st.success(f"dustem a été localisé : {st.session_state.repos['dustem_path']}")
 
-    st.session_state.repos["dustem_path"] = dustem_path
-    st.session_state.repos["parent_dustem_path"] = parent_dustem_path
     st.link_button("user guide", url="https://www.ias.u-psud.fr/DUSTEM/dustem_doc.pdf" )
     st.session_state.repos["State"] = True
 
 
-except : 
+except FileNotFoundError : 
     st.warning("Le code dustEM n'est pas présent dans votre PC veulliez le télécharger avant de continuer")
 
+    known_repository = st.text_input(
+        "Repository dustEM déjà installé",
+        value="",
+        placeholder="/chemin/vers/dustem4.3_web",
+        help="Dossier contenant src/dustem ; il sera mémorisé pour les prochaines sessions"
+    )
+    if known_repository:
+        try:
+            remember_repository(known_repository)
+            st.rerun()
+        except FileNotFoundError as e:
+            st.error(f"❌ {e}")
+
+    if st.button("Rechercher dustem sur le disque"):
+        with st.spinner("Recherche de dustem dans le répertoire personnel...", show_time=True):
+            try:
+                scan_and_remember()
+                st.rerun()
+            except FileNotFoundError as e:
+                st.error(f"❌ {e}")
+
     st.text_input("Repertorie dans lequel telecharger DustEM :", value=st.session_state.repos["repos_app"])
 
     with st.spinner("On recupère le code dustEM sur internet...", show_time=True):
         if st.button("download dustEM", type="primary"):
-            os.chdir(st.session_state.repos["repos_app"] )
-            subprocess.run(["./dowload_dustem.sh"])
+            subprocess.run(["./dowload_dustem.sh"], cwd=st.session_state.repos["repos_app"])
         
-            dustem_path, parent_dustem_path = get_path("dustem")
+            dustem_path, parent_dustem_path = locate_dustem()
             st.session_state.repos["dustem_path"] = dustem_path
             st.session_state.repos["parent_dustem_path"] = parent_dustem_path
             st.success("Download complet")
@@ -172,21 +336,19 @@ if st.session_state.repos["State"] :
 # Initialisation des chemins
 if st.session_state.repos["State"] : 
     if repository:
-        src = os.path.join(repository, "src")
-        output = os.path.join(repository, "out")
-        data = os.path.join(repository, "data")
-        sed = os.path.join(output, "SED.RES")
-        grain_file = os.path.join(data, "GRAIN.DAT")
-        
         # Vérification des chemins
-        paths_valid = all([
-            os.path.exists(repository),
-            os.path.exists(src),
-            os.path.exists(data)
-        ])
-        
-        if paths_valid:
+        if check_repository(repository):
             st.success("✅ Repository valide")
+            dustem_build = build_info(repository)
+            if dustem_build:
+                st.caption(f"Build {dustem_build['build_name']} — empreinte {dustem_build['build']}")
+            if Path(repository).resolve() != Path(st.session_state.repos["parent_dustem_path"]):
+                # Repository saisi à la main : mémorisé pour les prochaines sessions
+                try:
+                    remember_repository(repository)
+                    st.session_state.repos["parent_dustem_path"] = Path(repository).resolve()
+                except FileNotFoundError:
+                    pass
         else:
             st.error("❌ Repository invalide")
             st.error("Le chemin du repository n'est pas valide. Vérifiez les dossiers src/ et data/")
@@ -198,9 +360,34 @@ st.markdown("---")
 # Session state pour stocker les tests
 if 'dict_ligne' not in st.session_state:
     st.session_state.dict_ligne = {}
+# Mise en page (commentaires, mots-clés) des tests importés d'un GRAIN.DAT
+if 'grain_layouts' not in st.session_state:
+    st.session_state.grain_layouts = {}
+
+# Réglages des panneaux repliables : Streamlit oublie l'état d'un widget qui
+# n'est pas affiché, on les conserve quand leur panneau est fermé
+for key in ("analytics_bands", "analytics_ratios", "analytics_query", "photometry_dir", "manifest_format"):
+    if key in st.session_state:
+        st.session_state[key] = st.session_state[key]
+
+# Stockage persistant des résultats, un dossier par projet
+project_name = st.selectbox(
+    "Projet",
+    options=sorted(set(list_projects()) | {"default"}),
+    accept_new_options=True,
+    help="Les résultats sont conservés sur disque dans un dossier par projet"
+)
+results_store = get_results_store(project_name)
+
+# Cache disque des résultats, partagé entre sessions
+result_cache = get_result_cache()
 
-if 'results' not in st.session_state:
-    st.session_state.results = {}
+# Simulations en tâche de fond
+job_manager = get_job_manager()
+journal = get_journal()
+if 'jobs' not in st.session_state:
+    st.session_state.jobs = []
+    st.session_state.jobs_seen = set()
 
 # Section principale : Configuration des tests
 st.header("Configuration des tests")
@@ -220,15 +407,20 @@ with col2:
     st.subheader("Tests existants")
     if st.session_state.dict_ligne:
         st.write(f"**{len(st.session_state.dict_ligne)} test(s) configuré(s):**")
-        for name in st.session_state.dict_ligne.keys():
+        # Les lots importés comptent des milliers de tests : seuls les premiers sont listés
+        for name in list(st.session_state.dict_ligne)[:20]:
             st.write(f"- {name}")
+        if len(st.session_state.dict_ligne) > 20:
+            st.write(f"… et {len(st.session_state.dict_ligne) - 20} autre(s)")
     else:
         st.info("Aucun test configuré")
 
 st.markdown("---")
 
 # Formulaire de configuration des paramètres
-if test_name:
+@st.fragment
+def test_form(test_name):
+    """Paramètres d'un test : seul ce formulaire est réexécuté quand un champ change"""
     st.subheader(f"Paramètres pour: **{test_name}**")
     
     # Paramètre G0
@@ -381,54 +573,577 @@ if test_name:
         if test_name in st.session_state.dict_ligne:
             if st.button("🗑️ Supprimer", use_container_width=True):
                 del st.session_state.dict_ligne[test_name]
-                if test_name in st.session_state.results:
-                    del st.session_state.results[test_name]
+                st.session_state.grain_layouts.pop(test_name, None)
+                if test_name in results_store:
+                    del results_store[test_name]
                 st.success(f"Test '{test_name}' supprimé")
                 st.rerun()
 
+
+if test_name:
+    test_form(test_name)
+
 # Section d'exécution
 st.markdown("---")
 st.header("Exécution des simulations")
 
+
+def cache_panel():
+    """Statistiques du cache disque des résultats"""
+    cache_stats = result_cache.stats()
+    st.write(
+        f"{cache_stats['entries']} résultat(s) en cache "
+        f"({cache_stats['bytes'] / 1024 ** 2:.1f} / {result_cache.max_bytes / 1024 ** 2:.0f} Mo) — "
+        f"{cache_stats['hits']} succès, {cache_stats['misses']} échec(s), "
+        f"{cache_stats['derived']} dérivé(s), {cache_stats['evictions']} éviction(s)"
+    )
+    st.caption(f"Dossier : {result_cache.root}")
+    if st.button("Vider le cache"):
+        result_cache.clear()
+        st.rerun()
+
+
+lazy_expander("Cache des résultats", "open_cache", cache_panel)
+
 if st.session_state.dict_ligne:
     test_to_run = st.selectbox(
         "Sélectionner un test à exécuter",
         options=list(st.session_state.dict_ligne.keys())
     )
     
+    col1, col2 = st.columns(2)
+    with col1:
+        job_timeout = st.number_input(
+            "Délai maximal (s)",
+            min_value=0,
+            value=3600,
+            help="La simulation est arrêtée au-delà de ce délai (0 = sans limite)"
+        )
+    with col2:
+        job_priority = st.selectbox(
+            "Priorité",
+            options=list(PRIORITIES),
+            index=1,
+            key="job_priority",
+            help="Les simulations de priorité haute passent devant dans la file commune à toutes les sessions"
+        )
+    
     if st.button("Lancer la simulation", type="primary", use_container_width=False):
-        with st.spinner(f"Exécution de {test_to_run}..."):
-            try:
-                # Mise à jour du fichier GRAIN.DAT
-                test(grain_file, st.session_state.dict_ligne[test_to_run])
-                
-                # Exécution de DustEM
-                os.chdir(src)
-                result = subprocess.run(['./dustem'], capture_output=True, text=True)
-                
-                st.code(result.stdout, language="text")
-                
-                if result.returncode == 0:
-                    # Lecture des résultats
-                    data = np.loadtxt(sed, skiprows=9)
-                    st.session_state.results = save_data_test(
-                        data=data,
-                        name_set=test_to_run,
-                        global_test=st.session_state.results
-                    )
-                    st.success("✅ Simulation terminée avec succès!")
+        try:
+            # Recherche d'un résultat identique déjà calculé
+            metrics = RunMetrics(test_to_run)
+            metrics.start()
+            with metrics.stage("cache"):
+                cache_key, binary_digest = model_key(repository, st.session_state.dict_ligne[test_to_run])
+                data = result_cache.get(cache_key)
+                # Sinon, un résultat de même forme (seuls les Mdust/MH changent)
+                derived = None if data is not None else derive_from_cache(
+                    result_cache, repository, st.session_state.dict_ligne[test_to_run]
+                )
+
+            if derived is not None:
+                metrics.cache = "derived"
+                derived_data, source_key, factors = derived
+                save_data_test(
+                    data=derived_data,
+                    name_set=test_to_run,
+                    global_test=results_store,
+                    config=st.session_state.dict_ligne[test_to_run],
+                    metadata={"source": "derived", "derived_from": source_key, "abundance_factors": factors,
+                              **build_info(repository)},
+                    grain_template=os.path.join(repository, "data", "GRAIN.DAT"),
+                    metrics=metrics
+                )
+                metrics.log(project=results_store.project)
+                st.success("⚡ Résultat dérivé d'un calcul en cache par mise à l'échelle des abondances, dustem n'a pas été relancé")
+            elif data is not None:
+                metrics.cache = "hit"
+                save_data_test(
+                    data=SEDTable(data, grain_types(st.session_state.dict_ligne[test_to_run])),
+                    name_set=test_to_run,
+                    global_test=results_store,
+                    config=st.session_state.dict_ligne[test_to_run],
+                    metadata={"source": "cache", "cache_key": cache_key, **build_info(repository)},
+                    grain_template=os.path.join(repository, "data", "GRAIN.DAT"),
+                    metrics=metrics
+                )
+                metrics.log(project=results_store.project)
+                st.success("✅ Résultat identique trouvé dans le cache, dustem n'a pas été relancé")
+            else:
+                # Exécution de DustEM en tâche de fond, dans un espace de travail isolé
+                job = job_manager.submit(
+                    test_to_run,
+                    st.session_state.dict_ligne[test_to_run],
+                    repository,
+                    timeout=job_timeout or None,
+                    on_finish=functools.partial(
+                        store_job_result, results_store, result_cache, cache_key, binary_digest
+                    ),
+                    user=session_user(),
+                    priority=PRIORITIES[job_priority],
+                    key=cache_key
+                )
+                st.session_state.jobs.append(job.id)
+
+        except Exception as e:
+            st.error(f"❌ Erreur: {str(e)}")
+
+session_jobs = job_manager.jobs(st.session_state.jobs)
+jobs_active = any(job.state not in FINISHED_STATES for job in session_jobs)
+
+
+@st.fragment(run_every=1.0 if jobs_active else None)
+def jobs_panel():
+    """Suivi des simulations de la session, rafraîchi tant qu'une tâche tourne"""
+    jobs = job_manager.jobs(st.session_state.jobs)
+    n_running, n_queued, max_running = job_manager.status()
+    remote_workers = job_manager.workers()
+    st.caption(
+        f"Serveur : {n_running}/{max_running} simulation(s) en cours, {n_queued} en attente (toutes sessions)"
+        + (f" — {len(remote_workers)} travailleur(s) distant(s)" if remote_workers else "")
+    )
+    
+    for job in reversed(jobs):
+        with st.container(border=True):
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                position = job.position if job.state == QUEUED else None
+                if position is not None:
+                    st.markdown(f"**{job.name}** — {job.state} (position {position} dans la file)")
+                elif job.state == QUEUED:
+                    st.markdown(f"**{job.name}** — démarrage")
+                elif job.worker:
+                    st.markdown(f"**{job.name}** — {job.state} sur {job.worker} ({job.elapsed:.0f} s)")
                 else:
-                    st.error(f"❌ Erreur lors de l'exécution: {result.stderr}")
-                    
-            except Exception as e:
-                st.error(f"❌ Erreur: {str(e)}")
+                    st.markdown(f"**{job.name}** — {job.state} ({job.elapsed:.0f} s)")
+                if job.coalesced:
+                    st.caption("Modèle identique demandé ailleurs : un seul calcul, partagé")
+            with col2:
+                if job.state not in FINISHED_STATES:
+                    if st.button("⏹️ Annuler", key=f"cancel_job_{job.id}"):
+                        job.cancel()
+                elif st.button("Masquer", key=f"forget_job_{job.id}"):
+                    st.session_state.jobs.remove(job.id)
+                    job_manager.forget(job.id)
+                    st.rerun(scope="fragment")
+            
+            st.code(job.stdout[-20000:] or "...", language="text")
+            
+            with st.expander("Mesures"):
+                import pandas as pd
+
+                st.table(pd.DataFrame(job.metrics.rows(), columns=["Mesure", "Valeur"]))
+
+            if job.state == DONE:
+                st.success("✅ Simulation terminée avec succès!")
+            elif job.state == CANCELLED:
+                st.warning("Simulation annulée")
+            elif job.state in FINISHED_STATES:
+                st.error(f"❌ {job.state}: {job.error or job.stderr}")
+    
+    # Une tâche vient de se terminer : rafraîchir toute la page (nouveaux résultats)
+    finished = {job.id for job in jobs if job.state in FINISHED_STATES}
+    if finished - st.session_state.jobs_seen:
+        st.session_state.jobs_seen |= finished
+        st.rerun()
+
+
+if session_jobs:
+    jobs_panel()
+
+@st.fragment
+def emulator_panel(emulator):
+    """Curseurs de l'émulateur : seul ce panneau est réexécuté à chaque déplacement"""
+    from dustem_core.emulator import MAX_SIGMA_DEX, features, with_features
+
+    base = results_store.config(emulator.names[0])
+    x, mdust = features(base)
+    reference = dict(zip(emulator.feature_names, x))
+    log_dims = dict(zip(emulator.feature_names, emulator.log_dims))
+
+    values = {}
+    cols = st.columns(2)
+    for i, (name, (lo, hi)) in enumerate(emulator.bounds().items()):
+        with cols[i % 2]:
+            if log_dims[name]:
+                value = st.slider(
+                    f"log10 {name}", float(np.log10(lo)), float(np.log10(hi)),
+                    value=float(np.log10(reference[name])), key=f"emu_{name}"
+                )
+                values[name] = 10.0 ** value
+            else:
+                values[name] = st.slider(name, float(lo), float(hi), value=float(reference[name]), key=f"emu_{name}")
+    for i, m in enumerate(mdust):
+        with cols[(len(values) + i) % 2]:
+            mdust[i] = 10.0 ** st.slider(
+                f"log10 Mdust/MH pop{i + 1}", float(np.log10(m)) - 2, float(np.log10(m)) + 1,
+                value=float(np.log10(m)), key=f"emu_mdust_{i}"
+            )
+    max_sigma = st.number_input("Incertitude maximale (dex)", value=MAX_SIGMA_DEX, min_value=0.0, format="%.3f", key="emu_max_sigma")
+
+    config = with_features(base, values, mdust)
+    prediction = emulator.predict(config)
+    # Rendu mis en cache : un rerun de la page ne retrace pas le même point
+    st.image(get_figure_cache().get_png(
+        ("emulated", results_store.project, results_store.index_file.stat().st_size, emulator.names[0],
+         tuple(sorted(config.items()))),
+        plot_emulated,
+        prediction,
+        title="SED émulé"
+    ))
+    st.write(f"Incertitude maximale : {prediction.max_sigma:.3f} dex — {len(emulator)} modèle(s) d'entraînement")
+
+    if not prediction.reliable(max_sigma):
+        st.warning(f"⚠️ Prédiction non fiable : {prediction.reason or 'incertitude trop élevée'}")
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        run_name = st.text_input("Nom du test", value=f"emul_{len(results_store) + 1}", key="emu_run_name")
+    with col2:
+        if st.button("▶️ Calculer ce point avec dustem", key="emu_run"):
+            st.session_state.dict_ligne[run_name] = config
+            cache_key, binary_digest = model_key(repository, config)
+            job = job_manager.submit(
+                run_name, config, repository,
+                on_finish=functools.partial(store_job_result, results_store, result_cache, cache_key, binary_digest),
+                user=session_user(),
+                key=cache_key
+            )
+            st.session_state.jobs.append(job.id)
+            st.rerun()
+
+
+# Section balayage de paramètres
+st.markdown("---")
+st.header("Balayage de paramètres")
+
+
+def sweep_progress():
+    """Callback d'avancement d'un lot : barre de progression et configurations des résultats"""
+    progress_bar = st.progress(0.0)
+    progress_text = st.empty()
+
+    def _on_sweep_result(progress, outcome):
+        if outcome["data"] is not None:
+            st.session_state.dict_ligne[outcome["name"]] = outcome["config"]
+        progress_bar.progress(progress.fraction)
+        progress_text.text(progress.summary())
+
+    return _on_sweep_result
+
+
+def round_progress():
+    round_text = st.empty()
+    return lambda info: round_text.text(
+        f"Raffinement : {info['runs']} modèle(s) pour {info['cells']} cellule(s), "
+        f"écart max {info['max_diff']:.3f} dex"
+    )
+
+
+def sweep_report(outcomes):
+    """Bilan d'un lot : échecs, modèles servis par le cache et mesures"""
+    import pandas as pd
+
+    failed = [o for o in outcomes if o["data"] is None]
+    n_cached = sum(o["cached"] for o in outcomes)
+    if failed:
+        st.error(
+            f"❌ {len(failed)} modèle(s) en échec: "
+            + ", ".join(f"{o['name']} ({o['error']})" for o in failed[:10])
+        )
+    st.success(
+        f"✅ Balayage terminé: {len(outcomes) - len(failed)} modèle(s) calculé(s), "
+        f"dont {n_cached} servi(s) par le cache"
+    )
+    with st.expander("Mesures du balayage"):
+        sweep_metrics = pd.DataFrame([
+            dict(
+                {"modèle": o["name"], "cache": o["metrics"].cache, "attente (s)": o["metrics"].queue_wait,
+                 "CPU dustem (s)": o["metrics"].cpu_user, "mémoire max (Mo)": o["metrics"].max_rss_mb},
+                **{f"{stage} (s)": seconds for stage, seconds in o["metrics"].stages.items()}
+            )
+            for o in outcomes
+        ])
+        st.dataframe(sweep_metrics)
+        st.caption("Les mesures de chaque exécution sont aussi ajoutées au fichier de mesures (python -m dustem_core metrics)")
+
+
+def refinement_report(refinement):
+    status = {
+        "converged": "convergé",
+        "budget": "budget atteint",
+        "max_depth": "profondeur maximale atteinte",
+    }[refinement["status"]]
+    st.info(
+        f"Raffinement terminé ({status}) : écart restant {refinement['max_diff']:.3f} dex — "
+        f"{len(refinement['outcomes'])} modèle(s) contre {refinement['uniform_equivalent']} "
+        "pour une grille régulière de même résolution"
+    )
+    sweep_report(refinement["outcomes"])
+
+
+# Lots interrompus (arrêt du serveur, session fermée en cours de balayage)
+interrupted = journal.interrupted(project_name)
+if interrupted:
+    import pandas as pd
+
+    with st.expander(f"⏸️ Lots interrompus ({len(interrupted)})", expanded=True):
+        st.dataframe(pd.DataFrame([
+            {
+                "lot": batch["batch_id"],
+                "type": "raffinement adaptatif" if batch["kind"] == "refine" else "balayage",
+                "créé le": time.strftime("%Y-%m-%d %H:%M", time.localtime(batch["created"])),
+                "terminés": batch["counts"]["done"],
+                "à reprendre": batch["counts"]["queued"] + batch["counts"]["running"],
+                "échecs": batch["counts"]["failed"],
+            }
+            for batch in interrupted
+        ]), hide_index=True)
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            resume_id = st.selectbox("Lot", options=[batch["batch_id"] for batch in interrupted], key="resume_batch")
+        with col2:
+            resume_failed = st.checkbox("Relancer aussi les échecs", key="resume_failed")
+        with col3:
+            resume_clicked = st.button("▶️ Reprendre", key="resume_run", type="primary")
+            if st.button("🗑️ Abandonner", key="resume_drop", help="Le lot n'est plus proposé ; ses résultats sont conservés"):
+                journal.finish(resume_id)
+                st.rerun()
+        st.caption("Seuls les modèles non terminés sont relancés ; les résultats déjà enregistrés sont conservés")
+    if resume_clicked:
+        resumed = resume_batch(
+            resume_id,
+            cache=result_cache,
+            executor=job_manager.executor(session_user(), PRIORITIES["basse"]),
+            callback=sweep_progress(),
+            on_round=round_progress(),
+            retry_failed=resume_failed,
+            journal=journal
+        )
+        if isinstance(resumed, dict):
+            refinement_report(resumed)
+        else:
+            sweep_report(resumed)
+
+
+def manifest_panel():
+    """Import et export de tests par lot : manifestes et fichiers GRAIN.DAT"""
+    import pandas as pd
+    from dustem_core.grain import GrainFile
+    from dustem_core.manifest import FORMATS as MANIFEST_FORMATS
+
+    st.caption(
+        "Un manifeste décrit des modèles par lot : CSV (colonnes name, G0, pop1.grain_type, pop1.amin...), "
+        "JSON, JSON lines ou YAML (liste de {name, G0, populations} ou {name, config}). "
+        "Un GRAIN.DAT est lu avec ses commentaires et ses mots-clés, et réécrit à l'identique. "
+        "Les modèles d'un manifeste sont lancés directement, sans formulaire par modèle."
+    )
+    uploaded = st.file_uploader(
+        "Manifeste ou GRAIN.DAT", type=["csv", "json", "jsonl", "yaml", "yml", "dat"], key="manifest_file"
+    )
+    manifest_jobs, layouts = [], {}
+    if uploaded is not None:
+        try:
+            manifest_jobs, layouts = read_manifest_file(uploaded.getvalue(), uploaded.name)
+        except ValueError as e:
+            st.error(f"❌ Manifeste invalide: {e}")
+
+    if manifest_jobs:
+        existing = sum(name in st.session_state.dict_ligne or name in results_store for name, _ in manifest_jobs)
+        st.info(
+            f"{len(manifest_jobs)} modèle(s) dans {uploaded.name}"
+            + (f", dont {existing} remplaçant un test ou un résultat existant" if existing else "")
+        )
+        st.dataframe(pd.DataFrame([
+            {"nom": name, "G0": config["G0"].strip(), "populations": ", ".join(grain_types(config))}
+            for name, config in manifest_jobs[:100]
+        ]), hide_index=True)
+        # Les simulations utilisent les mots-clés du GRAIN.DAT du repository
+        repository_keywords = [k.split() for k in run_keywords(Path(repository) / "data" / "GRAIN.DAT")]
+        for name, layout in layouts.items():
+            keywords = GrainFile({}, layout).keywords
+            if [k.split() for k in keywords] != repository_keywords:
+                st.warning(
+                    f"Mots-clés de {name} ({' / '.join(k.strip() for k in keywords) or 'aucun'}) différents de ceux "
+                    "du repository : les simulations utilisent ceux du repository"
+                )
+        col1, col2, col3 = st.columns([1, 1, 1])
+        with col1:
+            if st.button("➕ Ajouter aux tests", key="manifest_add"):
+                st.session_state.dict_ligne.update(manifest_jobs)
+                st.session_state.grain_layouts.update(layouts)
+                st.rerun()
+        with col2:
+            manifest_priority = st.selectbox("Priorité", options=list(PRIORITIES), index=0, key="manifest_priority")
+        with col3:
+            manifest_run = st.button("▶️ Lancer le lot", key="manifest_run", type="primary")
+        if manifest_run:
+            sweep_report(run_batch(
+                manifest_jobs,
+                repository=repository,
+                project=results_store.project,
+                store_root=results_store.path.parent,
+                cache=result_cache,
+                executor=job_manager.executor(session_user(), PRIORITIES[manifest_priority]),
+                callback=sweep_progress(),
+                metadata={"manifest": uploaded.name},
+                journal=journal,
+                batch_id=new_batch_id()
+            ))
+
+    if st.session_state.dict_ligne:
+        st.markdown("**Export des tests**")
+        col1, col2, col3 = st.columns([1, 1, 2])
+        with col1:
+            st.session_state.setdefault("manifest_format", "csv")
+            export_format = st.selectbox("Format du manifeste", options=MANIFEST_FORMATS, key="manifest_format")
+            st.download_button(
+                label=f"💾 {len(st.session_state.dict_ligne)} test(s)",
+                data=functools.partial(manifest_file, list(st.session_state.dict_ligne.items()), export_format),
+                file_name=f"{project_name}_tests.{export_format}",
+                mime="text/plain",
+                key="manifest_download"
+            )
+        with col2:
+            grain_name = st.selectbox("GRAIN.DAT du test", options=list(st.session_state.dict_ligne), key="grain_name")
+            config = st.session_state.dict_ligne[grain_name]
+            if grain_name in st.session_state.grain_layouts:
+                grain = GrainFile(config, st.session_state.grain_layouts[grain_name])
+            else:
+                grain = GrainFile.from_template(Path(repository) / "data" / "GRAIN.DAT", config)
+            st.download_button(
+                label="💾 GRAIN.DAT",
+                data=grain.text(),
+                file_name="GRAIN.DAT",
+                mime="text/plain",
+                key="grain_download"
+            )
+        with col3:
+            st.caption(
+                "Les GRAIN.DAT importés gardent leurs commentaires et leurs mots-clés ; "
+                "les autres reprennent ceux du GRAIN.DAT du repository, comme à l'exécution."
+            )
+
+
+lazy_expander("📄 Manifestes de modèles (import et export par lot)", "open_manifest", manifest_panel)
+
+
+if st.session_state.dict_ligne:
+    col1, col2 = st.columns([1, 2])
+
+    with col1:
+        sweep_base = st.selectbox(
+            "Modèle de base",
+            options=list(st.session_state.dict_ligne.keys()),
+            key="sweep_base",
+            help="Les paramètres non balayés sont repris de ce test"
+        )
+        sweep_mode = st.radio(
+            "Échantillonnage",
+            options=["Grille (produit cartésien)", "Hypercube latin", "Raffinement adaptatif"],
+            key="sweep_mode",
+            help="Raffinement adaptatif : part de la grille décrite par les axes et ajoute des modèles là où le SED change vite"
+        )
+        sweep_n = st.number_input(
+            "Nombre de points (hypercube latin)",
+            min_value=1,
+            value=50,
+            key="sweep_n"
+        )
+        sweep_seed = st.number_input("Graine aléatoire", min_value=0, value=0, key="sweep_seed")
+        if sweep_mode == "Raffinement adaptatif":
+            sweep_tol = st.number_input(
+                "Tolérance (dex)", min_value=0.001, value=0.1, format="%.3f", key="sweep_tol",
+                help="Écart de forme maximal entre les SED de deux modèles voisins"
+            )
+            sweep_budget = st.number_input("Budget (modèles)", min_value=1, value=200, key="sweep_budget")
+            sweep_depth = st.number_input(
+                "Profondeur maximale", min_value=1, max_value=8, value=4, key="sweep_depth",
+                help="Nombre maximal de coupes de chaque intervalle de la grille grossière"
+            )
+        sweep_priority = st.selectbox(
+            "Priorité",
+            options=list(PRIORITIES),
+            index=0,
+            key="sweep_priority",
+            help=f"Les modèles passent par la file commune à toutes les sessions ({job_manager.max_running} simulations simultanées au plus)"
+        )
+        sweep_prefix = st.text_input("Préfixe des noms", value=f"{sweep_base}_sweep", key="sweep_prefix")
+
+    with col2:
+        sweep_text = st.text_area(
+            "Axes du balayage (une ligne par paramètre)",
+            value="G0 = 1e4:1e6:3:log\npop1.amin = 3e-8, 4e-8",
+            height=160,
+            key="sweep_axes",
+            help=(
+                "Clés : G0 ou pop<i>.<champ> avec champ parmi "
+                + ", ".join(SWEEP_FIELDS)
+                + ". Valeurs : liste séparée par des virgules, ou a:b:n[:log]."
+            )
+        )
+
+    try:
+        sweep_axes = parse_axes(sweep_text)
+        # En raffinement adaptatif, la grille des axes est la grille grossière de départ
+        mode = "lhs" if sweep_mode == "Hypercube latin" else "grid"
+        sweep_jobs = expand_sweep(
+            st.session_state.dict_ligne[sweep_base],
+            sweep_axes,
+            mode=mode,
+            n=int(sweep_n),
+            seed=int(sweep_seed),
+            prefix=sweep_prefix
+        ) if sweep_axes else []
+    except ValueError as e:
+        sweep_jobs = []
+        st.error(f"❌ Balayage invalide: {e}")
+
+    if sweep_jobs and sweep_mode == "Raffinement adaptatif":
+        st.info(f"{len(sweep_jobs)} modèle(s) pour la grille grossière, au plus {int(sweep_budget)} au total")
+    elif sweep_jobs:
+        st.info(f"{len(sweep_jobs)} modèle(s) à exécuter")
+
+    if st.button("Lancer le balayage", type="primary", disabled=not sweep_jobs):
+        # Lot inscrit au journal : repris depuis « Lots interrompus » si la session s'arrête
+        batch_options = dict(
+            repository=repository,
+            project=results_store.project,
+            store_root=results_store.path.parent,
+            cache=result_cache,
+            executor=job_manager.executor(session_user(), PRIORITIES[sweep_priority]),
+            callback=sweep_progress(),
+            metadata={"sweep": sweep_prefix},
+            journal=journal,
+            batch_id=new_batch_id()
+        )
+        if sweep_mode == "Raffinement adaptatif":
+            refinement_report(run_adaptive(
+                st.session_state.dict_ligne[sweep_base],
+                sweep_axes,
+                tol=float(sweep_tol),
+                budget=int(sweep_budget),
+                max_depth=int(sweep_depth),
+                on_round=round_progress(),
+                prefix=sweep_prefix,
+                **batch_options
+            ))
+        else:
+            sweep_report(run_batch(sweep_jobs, **batch_options))
+else:
+    st.info("Sauvegardez d'abord un test à utiliser comme modèle de base.")
 
 # Section de visualisation
 st.markdown("---")
 st.header("Visualisation des résultats")
 
-if st.session_state.results:
-    # Mode de visualisation
+
+@st.fragment
+def results_view():
+    """Graphique et tableaux des résultats choisis : seul ce panneau est réexécuté quand une option change"""
+    import pandas as pd
+
+    from dustem_core.analytics import band_ratios, residuals
+
     viz_mode = st.radio(
         "Mode de visualisation",
         options=["Simulation unique", "Comparaison multiple"],
@@ -442,7 +1157,7 @@ if st.session_state.results:
         # ========== MODE SIMULATION UNIQUE ==========
         result_to_plot = st.selectbox(
             "Sélectionner un résultat à visualiser",
-            options=list(st.session_state.results.keys())
+            options=list(results_store.keys())
         )
         
         col1, col2, col3 = st.columns(3)
@@ -459,22 +1174,26 @@ if st.session_state.results:
         with col3 : 
             graphe_title_solo = st.text_input("graphe_title", value="title")
         
-        fig = plot_result(
-            data_dict=st.session_state.results[result_to_plot],
+        # Rendu mis en cache : un rerun sans changement d'option ne retrace rien
+        png = get_figure_cache().get_png(
+            ("unique", results_store.project, result_ids(results_store, [result_to_plot]),
+             scale_x, scale_y, xlim_min, xlim_max, ylim_min, ylim_max, graphe_title_solo),
+            plot_result,
+            run=results_store[result_to_plot],
+            data_dict=results_store[result_to_plot],
             scalex=scale_x,
             scaley=scale_y,
             xlim=[xlim_min, xlim_max],
             ylim=[ylim_min, ylim_max],
             title=f"{graphe_title_solo}"
         )
-        st.pyplot(fig)
-        buf = io.BytesIO()
-        fig.savefig(buf, format="png")
-        buf.seek(0)  # Revenir au début du buffer
+        st.image(png)
+        if results_store[result_to_plot].meta.get("source") == "derived":
+            st.caption("⚡ Résultat dérivé par mise à l'échelle des abondances d'un calcul dustem, pas calculé directement")
 
         st.download_button(
             label="💾 Télécharger le graphique PNG",
-            data=buf,
+            data=png,
             file_name=f"{result_to_plot}_graph.png",
             mime="image/png"
         )
@@ -483,7 +1202,7 @@ if st.session_state.results:
         # Option de téléchargement
         st.download_button(
             label="💾 Télécharger les données CSV",
-            data=pd.DataFrame(st.session_state.results[result_to_plot]).to_csv(index=False),
+            data=lambda: pd.DataFrame(dict(results_store[result_to_plot])).to_csv(index=False),
             file_name=f"{result_to_plot}_data.csv",
             mime="text/csv"
         )
@@ -495,8 +1214,8 @@ if st.session_state.results:
         # Sélection multiple des résultats
         results_to_compare = st.multiselect(
             "Choisir les résultats à comparer",
-            options=list(st.session_state.results.keys()),
-            default=list(st.session_state.results.keys())[:min(3, len(st.session_state.results))],
+            options=list(results_store.keys()),
+            default=list(results_store.keys())[:min(3, len(results_store))],
             help="Sélectionnez 2 ou plusieurs simulations pour les comparer"
         )
         
@@ -531,79 +1250,30 @@ if st.session_state.results:
                 #show_legend = st.checkbox("Afficher la légende", value=True)
                 show_grid = st.checkbox("Grille", value=True)
             
+            # Matrice modèles × longueurs d'onde sur la grille du premier résultat
+            matrix = sed_matrix(results_store, results_to_compare, populations=show_populations)
+
             #if st.button("📊 Comparer les simulations", type="primary"):
-            # Création du graphique de comparaison
-            fig, ax = plt.subplots(figsize=(14, 8))
-                
-            # Palette de couleurs distinctes
-            colors = plt.cm.tab10(np.linspace(0, 1, len(results_to_compare)))
-                
-            # Tracer chaque simulation
-            for idx, result_name in enumerate(results_to_compare):
-                data_dict = st.session_state.results[result_name]
-                wl = data_dict["wl"]
-                color = colors[idx]
-                    
-                # Tracer le SED total avec une ligne épaisse
-                ax.plot(
-                    wl, 
-                    data_dict["sed_tot"], 
-                    label=f"{result_name}",
-                    linewidth=2.5,
-                    color=color,
-                    zorder=10
-                )
-                    
-                # Tracer les populations si demandé
-                if show_populations:
-                    for key in data_dict:
-                        if key.startswith("pop"):
-                            ax.plot(
-                                wl,
-                                data_dict[key],
-                                linestyle='--',
-                                alpha=0.4,
-                                color=color,
-                                linewidth=1.2,
-                                zorder=5
-                            )
-                
-            # Configuration des axes
-            ax.set_yscale(scale_y)
-            ax.set_xscale(scale_x)
-            ax.set_title(
-                f"{graph_title}", 
-                fontsize=16, 
-                fontweight='bold',
-                pad=20
+            # Graphique de comparaison, mis en cache avec ses options
+            png = get_figure_cache().get_png(
+                ("comparaison", results_store.project, result_ids(results_store, results_to_compare),
+                 scale_x, scale_y, xlim_min, xlim_max, ylim_min, ylim_max, graph_title,
+                 show_populations, show_grid),
+                plot_comparison,
+                matrix,
+                scalex=scale_x,
+                scaley=scale_y,
+                xlim=[xlim_min, xlim_max],
+                ylim=[ylim_min, ylim_max],
+                title=graph_title,
+                show_populations=show_populations,
+                show_grid=show_grid
             )
-            ax.set_xlabel("Longueur d'onde (µm)", fontsize=13, fontweight='bold')
-            ax.set_ylabel("Intensité", fontsize=13, fontweight='bold')
-            ax.set_ylim([ylim_min, ylim_max])
-            ax.set_xlim([xlim_min, xlim_max])
-                
-            if show_grid:
-                ax.grid(True, alpha=0.5, linestyle='-', linewidth=0.8)
-                
-            if True: #show_legend:
-                ax.legend(
-                    loc='best', 
-                    fontsize=10,
-                    framealpha=0.9,
-                    shadow=True,
-                    borderpad=1
-                )
-                
-            plt.tight_layout()
-            st.pyplot(fig)
-            
-            buf2 = io.BytesIO()
-            fig.savefig(buf2, format="png")
-            buf2.seek(0)  # Revenir au début du buffer
+            st.image(png)
 
             st.download_button(
                 label="💾 Télécharger le graphique PNG",
-                data=buf2,
+                data=png,
                 file_name=f"{graph_title}.png",
                 mime="image/png"
             )
@@ -611,40 +1281,53 @@ if st.session_state.results:
                 
             # ========== TABLEAU RÉCAPITULATIF ==========
             st.subheader("Résumé des simulations")
-                
-            summary_data = []
-            for result_name in results_to_compare:
-                config = st.session_state.dict_ligne.get(result_name, {})
-                G0 = config.get("G0", "N/A").strip()
-                n_pops = len([k for k in config.keys() if k.startswith("pop")])
-                    
-                summary_data.append({
-                    "Simulation": result_name,
-                    "G0": G0,
-                    "Nb populations": n_pops,
-                    "Max SED": f"{np.max(st.session_state.results[result_name]['sed_tot']):.2e}"
-                })
-                
-            df_summary = pd.DataFrame(summary_data)
-            st.dataframe(df_summary, use_container_width=True)
+            reference = st.selectbox(
+                "Référence",
+                options=results_to_compare,
+                key="compare_reference",
+                help="Les rapports de puissance et les écarts (dex) sont calculés par rapport à ce modèle"
+            )
+            try:
+                bands, ratios = analytics_settings()
+            except ValueError:
+                # Erreur affichée dans « Analyse des modèles »
+                bands, ratios = {}, []
+            # Grandeurs de tous les modèles sélectionnés en une passe (mémorisées avec les résultats)
+            analytics = get_analytics(
+                results_store.project, results_store.index_file.stat().st_size, tuple(bands.items())
+            ).loc[results_to_compare]
+            deviations = residuals(matrix, reference)
+            pop_fracs = [c for c in analytics if c.endswith("_frac")]
+            df_summary = pd.concat([
+                pd.DataFrame({
+                    "G0": analytics["G0"],
+                    "Nb populations": analytics[pop_fracs].notna().sum(axis=1),
+                    "Puissance intégrée": analytics["power"],
+                    "λ pic (µm)": analytics["peak_wl"],
+                    "Max SED": analytics["peak"],
+                }),
+                analytics[pop_fracs].rename(columns=lambda c: f"part {c[:-5]}"),
+                band_ratios(analytics, ratios),
+                pd.DataFrame({
+                    "Puissance / réf.": deviations["power_ratio"],
+                    "Écart rms (dex)": deviations["rms_dex"],
+                    "Écart max (dex)": deviations["max_dex"],
+                    "Source": [results_store[name].meta.get("source", "dustem") for name in results_to_compare],
+                }, index=analytics.index),
+            ], axis=1)
+            df_summary.index.name = "Simulation"
+            st.dataframe(
+                df_summary,
+                width="stretch",
+                column_config={
+                    column: st.column_config.NumberColumn(format="%.3e")
+                    for column in ("G0", "Puissance intégrée", "Max SED")
+                }
+            )
                 
             # ========== TÉLÉCHARGEMENT DES DONNÉES ==========
             st.markdown("---")
                 
-            # Créer un DataFrame combiné pour toutes les simulations
-            combined_data = {"wavelength_um": st.session_state.results[results_to_compare[0]]["wl"]}
-                
-            for result_name in results_to_compare:
-                # Ajouter le SED total
-                combined_data[f"{result_name}_SED_total"] = st.session_state.results[result_name]["sed_tot"]
-                    
-                # Ajouter les populations si demandé
-                if show_populations:
-                    for key in st.session_state.results[result_name]:
-                        if key.startswith("pop"):
-                            combined_data[f"{result_name}_{key}"] = st.session_state.results[result_name][key]
-                
-            csv_data = pd.DataFrame(combined_data).to_csv(index=False)
                 
             col1, col2 = st.columns(2)
             with col1:
@@ -654,13 +1337,354 @@ if st.session_state.results:
             with col2:
                 st.download_button(
                     label="Télécharger données comparées (CSV)",
-                    data=csv_data,
+                    # Tableau combiné construit depuis la matrice, seulement au clic
+                    data=lambda: matrix.table(populations=show_populations).to_csv(index=False),
                     file_name=f"dustem_comparison_{len(results_to_compare)}_sims.csv",
                     mime="text/csv",
                     use_container_width=True,
                     type="primary"
                 )
-                
+
+
+# ========== AJUSTEMENT DES ABONDANCES ==========
+@st.fragment
+def fit_panel():
+    import pandas as pd
+    from dustem_core.abundance import abundances, fit_abundances, rescale, with_abundances
+
+    st.caption(
+        "Ajuste les Mdust/MH d'un résultat sur un SED observé (moindres carrés non négatifs), "
+        "sans relancer dustem. Fichier CSV : longueur d'onde (µm), flux et, optionnellement, erreur."
+    )
+    fit_name = st.selectbox("Résultat de départ", options=list(results_store.keys()), key="fit_name")
+    observed_file = st.file_uploader("SED observé (CSV)", type=["csv", "txt"], key="fit_file")
+
+    if observed_file is not None and st.button("Ajuster", key="fit_button"):
+        try:
+            observed = pd.read_csv(observed_file, comment="#").to_numpy(dtype=float)
+            sigma = observed[:, 2] if observed.shape[1] > 2 else None
+            fit = fit_abundances(results_store[fit_name], observed[:, 0], observed[:, 1], sigma)
+            st.session_state.fit = dict(fit, name=fit_name, wl=observed[:, 0], flux=observed[:, 1], sigma=sigma)
+        except Exception as e:
+            st.error(f"❌ Erreur: {str(e)}")
+
+    fit = st.session_state.get("fit")
+    if fit is not None and fit["name"] in results_store:
+        fit_result = results_store[fit["name"]]
+        fit_config = results_store.config(fit["name"]) or st.session_state.dict_ligne.get(fit["name"], {})
+        initial = abundances(fit_config)
+        fitted = [a * f for a, f in zip(initial, fit["factors"])]
+        types = grain_types(fit_config)
+        st.table(pd.DataFrame({
+            "Population": fit["columns"],
+            "Type": types,
+            "Mdust/MH initial": [f"{a:.3E}" for a in initial],
+            "Facteur": [f"{f:.4g}" for f in fit["factors"]],
+            "Mdust/MH ajusté": [f"{a:.3E}" for a in fitted],
+        }))
+        st.write(f"χ² = {fit['chi2']:.4g} pour {fit['dof']} degré(s) de liberté")
+        st.image(to_png(plot_fit(
+            fit_result, fit["factors"], fit["wl"], fit["flux"], fit["sigma"], title=f"Ajustement de {fit['name']}"
+        )))
+
+        fit_save_name = st.text_input("Nom du résultat ajusté", value=f"{fit['name']}_fit", key="fit_save_name")
+        if st.button("💾 Enregistrer le résultat ajusté", key="fit_save"):
+            columns = ["wl"] + fit["columns"] + ["sed_tot"]
+            data = rescale(np.column_stack([fit_result[c] for c in columns]), fit["factors"])
+            new_config = with_abundances(fit_config, fitted)
+            # Le résultat ajusté hérite du GRAIN.DAT et du build de son résultat de départ
+            source_meta = fit_result.meta
+            grain_template = fit_result.path / "GRAIN.DAT"
+            source_build = {k: source_meta[k] for k in ("build", "build_name") if k in source_meta}
+            if st.session_state.repos["State"]:
+                if not grain_template.exists():
+                    grain_template = Path(repository) / "data" / "GRAIN.DAT"
+                source_build = source_build or build_info(repository)
+            save_data_test(
+                data=SEDTable(data, types),
+                name_set=fit_save_name,
+                global_test=results_store,
+                config=new_config,
+                metadata={
+                    "source": "derived",
+                    "derived_from_result": fit["name"],
+                    "abundance_factors": [float(f) for f in fit["factors"]],
+                    **source_build
+                },
+                grain_template=grain_template if grain_template.exists() else None
+            )
+            st.session_state.dict_ligne[fit_save_name] = new_config
+            st.success(f"✅ Résultat ajusté enregistré sous {fit_save_name}")
+
+
+# ========== EXPLORATION PAR ÉMULATEUR ==========
+def emulator_section():
+    st.caption(
+        "SED prédit en quelques millisecondes par un émulateur entraîné sur les résultats du projet. "
+        "Hors du domaine d'entraînement ou si l'incertitude est trop grande, le point doit être calculé par dustem."
+    )
+    emulators = get_emulators(results_store.project, results_store.index_file.stat().st_size)
+    if not emulators:
+        st.info("Pas assez de résultats comparables pour entraîner un émulateur : lancez d'abord un balayage.")
+    else:
+        emulator_family = st.selectbox(
+            "Famille de modèles",
+            options=list(emulators),
+            format_func=lambda key: emulators[key].describe(),
+            key="emu_family"
+        )
+        emulator_panel(emulators[emulator_family])
+
+
+# ========== ANALYSE DES MODÈLES DU PROJET ==========
+@st.fragment
+def analytics_panel():
+    import pandas as pd
+
+    from dustem_core.analytics import band_ratios
+
+    st.session_state.setdefault("analytics_bands", DEFAULT_BANDS)
+    st.session_state.setdefault("analytics_ratios", DEFAULT_RATIOS)
+    st.caption(
+        "Grandeurs de tous les résultats du projet, mémorisées avec eux : puissance intégrée (trapèzes en log λ), "
+        "longueur d'onde du pic, part de chaque population, puissance dans des bandes et rapports de bandes. "
+        "Cliquer sur un en-tête de colonne pour classer les modèles."
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        st.text_area("Bandes (µm), une ligne nom = lo:hi", height=110, key="analytics_bands")
+    with col2:
+        st.text_input("Rapports de bandes", key="analytics_ratios")
+        analytics_query = st.text_input(
+            "Filtre",
+            key="analytics_query",
+            placeholder="peak_wl > 100 and G0 < 1e3",
+            help="Expression sur les colonnes du tableau (pandas DataFrame.query) ; entourer de ` les noms contenant /"
+        )
+    try:
+        bands, ratios = analytics_settings()
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        bands, ratios = {}, []
+    project_analytics = get_analytics(
+        results_store.project, results_store.index_file.stat().st_size, tuple(bands.items())
+    )
+    project_analytics = pd.concat([project_analytics, band_ratios(project_analytics, ratios)], axis=1)
+    if analytics_query:
+        try:
+            project_analytics = project_analytics.query(analytics_query)
+        except Exception as e:
+            st.error(f"❌ Filtre invalide: {e}")
+    st.caption(f"{len(project_analytics)} modèle(s)")
+    st.dataframe(project_analytics, width="stretch")
+    st.download_button(
+        label="Télécharger le tableau (CSV)",
+        data=lambda: project_analytics.to_csv(),
+        file_name=f"{results_store.project}_analyse.csv",
+        mime="text/csv",
+        key="analytics_download"
+    )
+
+
+# ========== PHOTOMÉTRIE SYNTHÉTIQUE ==========
+@st.fragment
+def photometry_panel():
+    from dustem_core.photometry import CONVENTIONS, default_filter_dir, read_observations, score
+
+    st.caption(
+        "Flux des modèles du projet dans les bandes d'instruments, à partir des courbes de transmission "
+        "d'un dossier de filtres (un fichier par filtre : longueur d'onde en µm et transmission, "
+        "en-têtes optionnels « # lambda0 = 60 » et « # detector = photon »). "
+        "Les flux sont dans les unités du SED (νIν à lambda0) et mémorisés avec les résultats."
+    )
+    st.session_state.setdefault("photometry_dir", str(default_filter_dir()))
+    filter_dir = st.text_input("Dossier des filtres", key="photometry_dir")
+    try:
+        signature = filter_signature(filter_dir)
+        filters = get_filters(filter_dir, signature)
+    except (OSError, ValueError) as e:
+        st.error(f"❌ {e}")
+        filters = {}
+    if not filters:
+        st.info(f"Aucun filtre dans {filter_dir}")
+    else:
+        col1, col2 = st.columns(2)
+        with col1:
+            photometry_bands = st.multiselect(
+                "Filtres",
+                options=list(filters),
+                default=list(filters),
+                format_func=lambda b: f"{b} ({filters[b].lambda0:g} µm)",
+                key="photometry_bands"
+            )
+        with col2:
+            convention = st.selectbox(
+                "Correction de couleur",
+                options=list(CONVENTIONS),
+                format_func=CONVENTION_LABELS.get,
+                key="photometry_convention"
+            )
+            photometry_pops = st.checkbox("Flux de chaque population", key="photometry_pops")
+        if photometry_bands:
+            fluxes = get_photometry(
+                results_store.project, results_store.index_file.stat().st_size, filter_dir, signature,
+                tuple(photometry_bands), convention, photometry_pops
+            )
+            st.dataframe(fluxes, width="stretch")
+            st.download_button(
+                label="Télécharger les flux (CSV)",
+                data=lambda: fluxes.to_csv(),
+                file_name=f"{results_store.project}_photometrie.csv",
+                mime="text/csv",
+                key="photometry_download"
+            )
+
+            st.markdown("**Classement sur des flux observés**")
+            observed_fluxes = st.file_uploader(
+                "Flux observés (CSV : filtre, flux, erreur optionnelle), dans les unités du SED",
+                type=["csv", "txt"],
+                key="photometry_observed"
+            )
+            free_scale = st.checkbox(
+                "Facteur d'échelle libre",
+                value=True,
+                key="photometry_free_scale",
+                help="Chaque modèle est multiplié par le facteur qui minimise son χ² (colonne densité, angle solide)"
+            )
+            if observed_fluxes is not None:
+                observed_fluxes.seek(0)
+                try:
+                    ranking = score(
+                        fluxes.xs("sed_tot", level="column"), read_observations(observed_fluxes), free_scale=free_scale
+                    )
+                except ValueError as e:
+                    st.error(f"❌ {e}")
+                else:
+                    best = ranking.index[0]
+                    st.success(
+                        f"Meilleur modèle : {best} (χ² = {ranking['chi2'].iloc[0]:.4g} "
+                        f"pour {ranking['dof'].iloc[0]} degré(s) de liberté)"
+                    )
+                    st.dataframe(ranking, width="stretch")
+
+
+# ========== AUTRES SORTIES DE DUSTEM ==========
+def output_tab(product, names):
+    """Un produit de dustEM : bloc d'un résultat, puis même colonne pour plusieurs résultats"""
+    from dustem_core.outputs import product_curves
+    from dustem_core.plotting import plot_output_block, plot_product_curves
+
+    result_name = st.selectbox("Résultat", options=names, key=f"outputs_result_{product}")
+    output = results_store[result_name].outputs[product]
+    blocks = output.blocks
+    if not blocks:
+        st.info("Aucun bloc numérique dans ce fichier")
+        return
+    block = 0
+    if len(blocks) > 1:
+        block = st.slider("Bloc", min_value=1, max_value=len(blocks), key=f"outputs_block_{product}") - 1
+    info = blocks[block]
+    dims = "".join(f" — dimensions {' × '.join(f'{d:g}' for d in row)}" for row in info["dims"])
+    st.caption(f"{info['label'] or output.path.name} — {info['rows']} ligne(s) × {info['cols']} colonne(s){dims}")
+    if info["cols"] < 2:
+        st.dataframe(np.asarray(output.block(block)), width="stretch")
+    else:
+        st.image(get_figure_cache().get_png(
+            ("output", results_store.project, result_ids(results_store, [result_name]), product, block),
+            plot_output_block, output.block(block), title=f"{result_name} — {output.label}"
+        ))
+    with st.popover("Commentaires du fichier"):
+        st.code("\n".join(output.comments[:200]) or "(aucun)")
+    st.download_button(
+        label=f"💾 Télécharger {output.path.name}",
+        data=output.path.read_bytes,
+        file_name=f"{result_name}_{output.path.name}",
+        mime="text/plain",
+        key=f"outputs_download_{product}"
+    )
+
+    if info["cols"] < 2:
+        return
+    st.markdown("**Comparaison entre résultats** (même bloc, même colonne)")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        compared = st.multiselect(
+            "Résultats",
+            options=names,
+            default=names[:10],
+            max_selections=MAX_OUTPUT_CURVES,
+            key=f"outputs_compare_{product}"
+        )
+    with col2:
+        column = st.number_input(
+            "Colonne", min_value=2, max_value=info["cols"], value=2, key=f"outputs_column_{product}"
+        )
+    if compared:
+        # Seuls le bloc et les deux colonnes tracés sont lus dans chaque fichier
+        curves = product_curves(results_store, compared, product, column=column - 1, block=block)
+        st.image(get_figure_cache().get_png(
+            ("output_compare", results_store.project, result_ids(results_store, list(curves)), product, block,
+             column),
+            plot_product_curves, curves, title=f"{output.label} — colonne {column}"
+        ))
+        if len(curves) < len(compared):
+            st.caption(f"{len(compared) - len(curves)} résultat(s) sans ce bloc ou cette colonne")
+
+
+@st.fragment
+def outputs_panel():
+    from dustem_core.outputs import product_label
+
+    products = get_output_products(results_store.project, results_store.index_file.stat().st_size)
+    st.caption(
+        "Fichiers écrits par dustEM en plus du SED selon les mots-clés du GRAIN.DAT (EXT, TEMP, SDIST, POL...), "
+        "conservés avec chaque résultat calculé. Les fichiers sont indexés puis lus bloc par bloc à la demande. "
+        "Les résultats servis par le cache, dérivés ou calculés par un travailleur distant n'en ont pas."
+    )
+    if not products:
+        st.info("Aucun autre fichier de sortie dans ce projet")
+        return
+    names = sorted(products)
+    # Seul l'onglet affiché est calculé (onglets avec état : Streamlit >= 1.55)
+    tabs = st.tabs([product_label(p) for p in names], key="outputs_tab", on_change="rerun")
+    for product, tab in zip(names, tabs):
+        if tab.open:
+            with tab:
+                output_tab(product, products[product])
+
+
+# ========== EXPORT DU PROJET ==========
+@st.fragment
+def export_panel():
+    from dustem_core.export import FORMATS, MIME_TYPES
+
+    export_all = st.checkbox("Tout le projet", value=True, key="export_all")
+    export_names = list(results_store.keys()) if export_all else st.multiselect(
+        "Résultats à exporter", options=list(results_store.keys()), key="export_names"
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        export_format = st.selectbox("Format", options=FORMATS, key="export_format")
+    with col2:
+        export_pops = st.checkbox("Inclure les populations", value=True, key="export_pops")
+    # Le fichier n'est produit qu'au clic, modèle par modèle (puis servi depuis la mémoire de Streamlit)
+    st.download_button(
+        label=f"💾 Exporter {len(export_names)} résultat(s)",
+        data=functools.partial(export_file, results_store, export_format, export_names, export_pops),
+        file_name=f"{results_store.project}.{export_format}",
+        mime=MIME_TYPES[export_format],
+        disabled=not export_names
+    )
+
+
+if results_store:
+    results_view()
+    lazy_expander("Ajustement des abondances", "open_fit", fit_panel)
+    lazy_expander("Exploration rapide (émulateur)", "open_emulator", emulator_section)
+    lazy_expander("Analyse des modèles", "open_analytics", analytics_panel)
+    lazy_expander("Photométrie synthétique", "open_photometry", photometry_panel)
+    lazy_expander("Autres sorties de dustEM", "open_outputs", outputs_panel)
+    lazy_expander("Export des résultats", "open_export", export_panel)
 else:
     st.info("Aucun résultat disponible. Lancez d'abord une simulation.")
 
@@ -20,6 +20,8 @@ readonly VENV_NAME="env_dustEM"
 readonly PYTHON_MIN_VERSION="3.8"
 readonly REQUIREMENTS_FILE="requirements.txt"
 readonly APP_FILE="dustEM_App.py"
+# Répertoire contenant ce script (et l'application)
+readonly SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
 # Compteur d'erreurs
 ERROR_COUNT=0
@@ -269,10 +271,12 @@ create_default_requirements() {
     
     cat > "$REQUIREMENTS_FILE" << 'EOF'
 # Dépendances pour dustEM
-streamlit>=1.28.0
+streamlit>=1.55.0
 pandas>=2.0.0
 numpy>=1.24.0
 matplotlib>=3.7.0
+pyyaml>=6.0
+pyarrow>=14.0
 EOF
     
     log_info "Fichier $REQUIREMENTS_FILE créé"
@@ -294,13 +298,11 @@ setup_environment() {
 ################################################################################
 
 check_app_file() {
-    cd ~
-    repos_app=$(find . -type f -name dustEM_App.py)
-    dir_app=$(dirname $repos_app)
-    cd $dir_app
+    # L'application est livrée à côté de ce script : pas de recherche dans ~
+    cd "$SCRIPT_DIR" || exit_on_error $? "Impossible d'accéder à $SCRIPT_DIR"
 
-    if [ -n $repos_app ]; then
-        log_info "Fichier trouvé ici : $dir_app"
+    if [[ -f "$APP_FILE" ]]; then
+        log_info "Fichier trouvé ici : $SCRIPT_DIR"
     fi
 
     if [[ ! -f "$APP_FILE" ]]; then
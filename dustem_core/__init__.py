@@ -0,0 +1,7 @@
+"""Outils de pilotage de dustEM indépendants de l'interface Streamlit"""
+from .api import DustemError, load_results, resume_batch, run_adaptive, run_batch, run_model
+from .grain import GrainFile, build_config, parse_config, read_grain, write_grain
+from .outputs import OutputFile, open_outputs
+from .readers import SEDTable, read_sed
+from .store import ResultStore
+from .workspace import RunWorkspace
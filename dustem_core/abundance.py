@@ -0,0 +1,152 @@
+"""Mise à l'échelle des SED par l'abondance des poussières (Mdust/MH)
+
+À G0 et distributions de tailles fixés, l'émission de chaque population
+est proportionnelle à son Mdust/MH. Deux modèles qui ne diffèrent que par
+leurs Mdust/MH ont donc la même « forme » (clé de cache calculée sans les
+abondances) : le SED de l'un s'obtient en multipliant chaque colonne de
+population de l'autre par le rapport des abondances, puis en recalculant
+``sed_tot``. Ces résultats sont dérivés, pas calculés par dustem, et sont
+marqués comme tels (``source: "derived"`` dans les métadonnées).
+
+:func:`fit_abundances` ajuste de même, par moindres carrés non négatifs,
+les abondances d'un résultat stocké sur un SED observé.
+"""
+import numpy as np
+
+from .cache import model_key
+from .grain import grain_types, parse_config
+from .matrix import loglog_resample
+from .readers import SEDTable
+
+
+def abundances(config):
+    """Mdust/MH de chaque population d'un dictionnaire de test"""
+    return [float(pop["mdust_mh"]) for pop in parse_config(config)[1]]
+
+
+def with_abundances(config, values):
+    """Copie du dictionnaire de test avec de nouveaux Mdust/MH"""
+    new = {"G0": config["G0"]}
+    pops = [k for k in config if k != "G0"]
+    for key, value in zip(pops, values):
+        tokens = config[key].split()
+        tokens[3] = f"{value:.3E}"
+        new[key] = "\t".join(tokens) + "\n"
+    return new
+
+
+def model_shape(repository, config, inputs=None):
+    """(clé de forme, abondances) d'un modèle, à enregistrer avec son résultat en cache"""
+    shape_key, _ = model_key(repository, config, inputs=inputs, abundances=False)
+    return shape_key, abundances(config)
+
+
+def rescale(data, factors):
+    """Multiplie les colonnes de populations de ``data`` et recalcule le SED total"""
+    out = np.array(data, dtype=float)
+    out[:, 1:-1] *= np.asarray(factors, dtype=float)
+    out[:, -1] = out[:, 1:-1].sum(axis=1)
+    return out
+
+
+def scale_factors(old, new):
+    """Facteurs new/old, ou ``None`` si une population d'abondance nulle doit changer"""
+    if len(old) != len(new):
+        return None
+    factors = []
+    for o, n in zip(old, new):
+        if o > 0:
+            factors.append(n / o)
+        elif n == o:
+            factors.append(1.0)
+        else:
+            return None
+    return factors
+
+
+def derive_from_cache(cache, repository, config, inputs=None, shape=None):
+    """SED d'un modèle dérivé d'un résultat en cache de même forme
+
+    ``shape`` est le résultat de :func:`model_shape` s'il est déjà calculé.
+    Renvoie (:class:`~dustem_core.readers.SEDTable`, clé du résultat source,
+    facteurs appliqués) ou ``None`` si aucun résultat ne convient.
+    """
+    shape_key, new = shape or model_shape(repository, config, inputs)
+    for key, old in cache.find_shape(shape_key):
+        factors = scale_factors(old, new)
+        if factors is None:
+            continue
+        data = cache.get(key)
+        if data is None:
+            continue
+        cache.count("derived")
+        return SEDTable(rescale(data, factors), grain_types(config)), key, factors
+    return None
+
+
+def nnls(A, b, max_iter=None):
+    """Moindres carrés non négatifs : min ||A x - b|| avec x >= 0 (Lawson-Hanson)"""
+    A = np.asarray(A, dtype=float)
+    b = np.asarray(b, dtype=float)
+    n = A.shape[1]
+    x = np.zeros(n)
+    passive = np.zeros(n, dtype=bool)
+    max_iter = max_iter or 3 * n
+    tol = 10 * np.finfo(float).eps * np.linalg.norm(A, 1) * max(A.shape)
+    for _ in range(max_iter):
+        w = A.T @ (b - A @ x)
+        if passive.all() or w[~passive].max() <= tol:
+            break
+        passive[np.argmax(np.where(passive, -np.inf, w))] = True
+        while True:
+            z = np.zeros(n)
+            z[passive] = np.linalg.lstsq(A[:, passive], b, rcond=None)[0]
+            if z[passive].min() > 0:
+                x = z
+                break
+            # Recul jusqu'à la première variable qui s'annule
+            mask = passive & (z <= 0)
+            alpha = np.min(x[mask] / (x[mask] - z[mask]))
+            x = x + alpha * (z - x)
+            passive &= x > tol
+            x[~passive] = 0.0
+    return x
+
+
+def fit_abundances(result, wl_obs, flux_obs, sigma=None):
+    """Ajuste des facteurs d'abondance >= 0 sur un SED observé
+
+    ``result`` est un résultat stocké (colonnes ``wl``, ``pop1``...). Les
+    colonnes de populations sont interpolées en log-log sur les longueurs
+    d'onde observées ; les points hors de la grille du modèle sont ignorés.
+    Renvoie un dictionnaire : ``factors`` (par population), ``model`` (SED
+    ajusté aux longueurs d'onde observées), ``chi2``, ``dof`` et ``columns``.
+    """
+    columns = sorted((c for c in result if c.startswith("pop")), key=lambda c: int(c[3:]))
+    wl_obs = np.asarray(wl_obs, dtype=float)
+    flux_obs = np.asarray(flux_obs, dtype=float)
+    sigma = np.ones_like(flux_obs) if sigma is None else np.asarray(sigma, dtype=float)
+
+    A = loglog_resample(result["wl"], np.stack([result[c] for c in columns]), wl_obs).T
+    valid = np.all(np.isfinite(A), axis=1) & np.isfinite(flux_obs) & (sigma > 0)
+    if valid.sum() < len(columns):
+        raise ValueError(
+            f"{valid.sum()} point(s) observé(s) dans la grille du modèle pour {len(columns)} population(s)"
+        )
+    weights = 1.0 / sigma[valid]
+    design = A[valid] * weights[:, None]
+    target = flux_obs[valid] * weights
+    # Colonnes et cible normalisées : les flux (~1e-18) sont sous la tolérance de nnls
+    norms = np.linalg.norm(design, axis=0)
+    norms[norms == 0] = 1.0
+    scale = np.linalg.norm(target) or 1.0
+    factors = nnls(design / norms, target / scale) * scale / norms
+    model = A @ factors
+    chi2 = float(np.sum(((model[valid] - flux_obs[valid]) * weights) ** 2))
+    return {
+        "factors": factors,
+        "model": model,
+        "chi2": chi2,
+        "dof": int(valid.sum()) - len(columns),
+        "columns": columns,
+    }
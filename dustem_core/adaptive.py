@@ -0,0 +1,217 @@
+"""Échantillonnage adaptatif : raffiner le balayage là où le SED change vite
+
+Le balayage part de la grille grossière décrite par les axes (cf.
+:func:`dustem_core.sweep.parse_axes`). L'espace des paramètres est découpé
+en cellules dont les sommets sont des modèles calculés. Pour chaque cellule,
+on mesure l'écart entre les SED de sommets voisins le long de chaque axe
+(écart de forme de log10 sed_tot, en dex, cf. :func:`sed_distance`) ; une
+cellule dont l'écart dépasse la tolérance est coupée en deux le long des
+axes concernés et seuls les nouveaux sommets sont calculés. Chaque tour de
+raffinement est exécuté comme un lot par :func:`dustem_core.runner.run_batch`.
+
+Le raffinement s'arrête quand aucune cellule ne dépasse la tolérance
+(convergence), quand le budget de modèles est atteint ou quand les cellules
+restantes ont atteint la profondeur maximale (``max_depth`` coupes par
+intervalle de la grille grossière).
+"""
+import itertools
+
+import numpy as np
+
+from . import runner
+from .sweep import apply_values
+
+# Dynamique du SED (sous son maximum) prise en compte dans les écarts
+DYNAMIC_RANGE = 1e-4
+
+
+def sed_distance(a, b):
+    """Écart de forme en dex entre deux SED sur la même grille
+
+    Maximum sur les longueurs d'onde de |Δ log10 SED| une fois retiré le
+    décalage médian : un simple changement d'échelle (SED proportionnel à
+    G0 ou à Mdust/MH) est reproduit exactement par une interpolation en log
+    et n'est pas compté. Les longueurs d'onde où les deux SED sont sous
+    ``DYNAMIC_RANGE`` fois leur maximum sont ignorées.
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    keep = (a > DYNAMIC_RANGE * a.max()) | (b > DYNAMIC_RANGE * b.max())
+    keep &= (a > 0) & (b > 0)
+    if not keep.any():
+        return 0.0
+    delta = np.log10(a[keep]) - np.log10(b[keep])
+    return float(np.max(np.abs(delta - np.median(delta))))
+
+
+class _Lattice:
+    """Coordonnées entières des points : ``2**max_depth`` pas par intervalle grossier"""
+
+    def __init__(self, axes, max_depth):
+        self.keys = list(axes)
+        self.axes = axes
+        self.scale = 2 ** max_depth
+        self.coarse = [sorted(axes[k]["values"]) for k in self.keys]
+
+    def size(self, k):
+        return (len(self.coarse[k]) - 1) * self.scale
+
+    def value(self, k, c):
+        j, r = divmod(c, self.scale)
+        values = self.coarse[k]
+        if j >= len(values) - 1:
+            return values[-1]
+        a, b, t = values[j], values[j + 1], r / self.scale
+        if self.axes[self.keys[k]]["log"]:
+            return 10 ** (np.log10(a) + t * (np.log10(b) - np.log10(a)))
+        return a + t * (b - a)
+
+    def values(self, point):
+        return {key: self.value(k, c) for k, (key, c) in enumerate(zip(self.keys, point))}
+
+    def coarse_points(self):
+        return list(itertools.product(*(range(0, self.size(k) + 1, self.scale) for k in range(len(self.keys)))))
+
+    def coarse_cells(self):
+        ranges = [
+            [(c, c + self.scale) for c in range(0, self.size(k), self.scale)] or [(0, 0)]
+            for k in range(len(self.keys))
+        ]
+        return [tuple(zip(*cell)) for cell in itertools.product(*ranges)]
+
+
+def _corners(cell):
+    lo, hi = cell
+    return list(itertools.product(*({a, b} for a, b in zip(lo, hi))))
+
+
+def _cell_diffs(cell, seds):
+    """Écart maximal entre sommets voisins le long de chaque axe (``None`` si un sommet manque)"""
+    lo, hi = cell
+    diffs = []
+    for k in range(len(lo)):
+        if lo[k] == hi[k]:
+            diffs.append(0.0)
+            continue
+        worst = 0.0
+        for corner in _corners(cell):
+            if corner[k] != lo[k]:
+                continue
+            other = corner[:k] + (hi[k],) + corner[k + 1:]
+            if corner not in seds or other not in seds:
+                return None
+            worst = max(worst, sed_distance(seds[corner], seds[other]))
+        diffs.append(worst)
+    return diffs
+
+
+def _split(cell, axes):
+    """Cellules filles de ``cell`` coupée en deux le long de ``axes``"""
+    lo, hi = cell
+    ranges = []
+    for k in range(len(lo)):
+        if k in axes:
+            mid = (lo[k] + hi[k]) // 2
+            ranges.append([(lo[k], mid), (mid, hi[k])])
+        else:
+            ranges.append([(lo[k], hi[k])])
+    return [tuple(zip(*child)) for child in itertools.product(*ranges)]
+
+
+def refine_sweep(repository, base_config, axes, tol=0.1, budget=200, max_depth=4, workers=None,
+                 cache=None, timeout=None, callback=None, on_round=None, prefix="refine", executor=None,
+                 on_submit=None):
+    """Balayage adaptatif autour de ``base_config``
+
+    ``tol`` est l'écart maximal toléré (dex) entre modèles voisins et
+    ``budget`` le nombre maximal de modèles (grille grossière comprise).
+    ``callback(progress, outcome)`` est appelé à la fin de chaque modèle
+    comme pour :func:`dustem_core.runner.run_batch` ; ``on_round(info)``
+    après chaque tour ; ``executor`` et ``on_submit`` sont passés à
+    ``run_batch``. Renvoie un dictionnaire : ``outcomes`` (tous les
+    modèles), ``rounds``, ``status`` (``"converged"``, ``"budget"`` ou
+    ``"max_depth"``), ``max_diff`` (plus grand écart restant, en dex) et
+    ``uniform_equivalent`` (taille de la grille régulière de même
+    résolution).
+    """
+    lattice = _Lattice(axes, max_depth)
+    seds = {}
+    outcomes = []
+    rounds = []
+
+    def _run(points):
+        start = len(outcomes)
+        jobs = [
+            (f"{prefix}_{start + i:04d}", apply_values(base_config, lattice.values(point)))
+            for i, point in enumerate(points)
+        ]
+        results = runner.run_batch(repository, jobs, workers=workers, callback=callback, cache=cache,
+                                   timeout=timeout, executor=executor, on_submit=on_submit)
+        by_name = {outcome["name"]: outcome for outcome in results}
+        for (name, _), point in zip(jobs, points):
+            outcome = by_name[name]
+            outcome["point"] = lattice.values(point)
+            outcomes.append(outcome)
+            if outcome["data"] is not None:
+                seds[point] = outcome["data"].columns()["sed_tot"]
+
+    points = lattice.coarse_points()
+    if len(points) > budget:
+        raise ValueError(f"La grille grossière compte {len(points)} modèles pour un budget de {budget}")
+    _run(points)
+    done = set(points)
+    cells = lattice.coarse_cells()
+    finest = [lattice.scale] * len(lattice.keys)
+    # Plus grand écart des cellules qui ne sont plus coupées
+    max_diff = 0.0
+    at_depth = over_budget = False
+
+    while cells:
+        candidates = []
+        for cell in cells:
+            diffs = _cell_diffs(cell, seds)
+            if diffs is None:
+                continue
+            worst = max(diffs)
+            split = [k for k, d in enumerate(diffs) if d > tol and cell[1][k] - cell[0][k] >= 2]
+            if split:
+                candidates.append((worst, cell, split))
+            else:
+                max_diff = max(max_diff, worst)
+                at_depth |= worst > tol
+
+        # Les cellules les plus éloignées de la tolérance d'abord
+        candidates.sort(key=lambda c: -c[0])
+        new_points, next_cells = [], []
+        for worst, cell, split in candidates:
+            children = _split(cell, split)
+            fresh = sorted({corner for child in children for corner in _corners(child)} - done)
+            if len(done) + len(fresh) > budget:
+                over_budget = True
+                max_diff = max(max_diff, worst)
+                continue
+            done.update(fresh)
+            new_points.extend(fresh)
+            next_cells.extend(children)
+            for k in split:
+                finest[k] = min(finest[k], (cell[1][k] - cell[0][k]) // 2)
+        if not new_points:
+            break
+        _run(new_points)
+        rounds.append({"runs": len(new_points), "cells": len(candidates), "max_diff": candidates[0][0]})
+        if on_round is not None:
+            on_round(rounds[-1])
+        cells = next_cells
+
+    if over_budget:
+        status = "budget"
+    else:
+        status = "max_depth" if at_depth else "converged"
+    uniform = int(np.prod([lattice.size(k) // finest[k] + 1 for k in range(len(lattice.keys))]))
+    return {
+        "outcomes": outcomes,
+        "rounds": rounds,
+        "status": status,
+        "max_diff": max_diff,
+        "uniform_equivalent": uniform,
+    }
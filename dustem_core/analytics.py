@@ -0,0 +1,256 @@
+"""Grandeurs dérivées des SED, calculées sur tous les modèles à la fois
+
+Pour chaque modèle :
+
+- ``power`` : puissance intégrée, trapèzes de ``sed_tot`` en log λ ;
+- ``peak_wl`` et ``peak`` : longueur d'onde (µm) et valeur du maximum ;
+- ``pop<i>_frac`` : part de la puissance de chaque population ;
+- ``band:<lo>:<hi>`` : puissance entre ``lo`` et ``hi`` µm (intégrale
+  cumulée interpolée aux bornes), d'où les rapports de bandes ;
+- ``G0`` du modèle, repris de sa configuration, pour trier et filtrer.
+
+Les modèles de même grille de longueurs d'onde sont empilés en une matrice
+et traités en une seule passe NumPy. Ces grandeurs ne dépendent que du
+résultat : elles sont mémorisées dans le projet (``analytics.jsonl``, une
+ligne par résultat et par calcul, en ajout seul), associées à l'identifiant
+du dossier de résultat, et ne sont recalculées que pour les nouveaux
+résultats ou de nouvelles bandes. Les écarts à un modèle de référence
+(:func:`residuals`) dépendent de la référence et sont calculés à la demande
+sur une :class:`~dustem_core.matrix.SEDMatrix`.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .matrix import _grid_key
+
+ANALYTICS_FILE = "analytics.jsonl"
+
+# Dynamique du SED (sous son maximum) prise en compte dans les écarts
+DYNAMIC_RANGE = 1e-4
+
+
+def parse_bands(text):
+    """Analyse les bandes, une ligne ``nom = lo:hi`` (µm) ; renvoie nom -> (lo, hi)"""
+    bands = {}
+    for ligne in text.splitlines():
+        ligne = ligne.split("#")[0].strip()
+        if not ligne:
+            continue
+        if "=" not in ligne:
+            raise ValueError(f"Ligne invalide : {ligne!r} (attendu nom = lo:hi)")
+        name, spec = (part.strip() for part in ligne.split("=", 1))
+        parts = spec.split(":")
+        if len(parts) != 2:
+            raise ValueError(f"Bande invalide : {spec!r} (attendu lo:hi)")
+        lo, hi = float(parts[0]), float(parts[1])
+        if not 0 < lo < hi:
+            raise ValueError(f"Bande invalide : {spec!r} (0 < lo < hi)")
+        bands[name] = (lo, hi)
+    return bands
+
+
+def band_key(lo, hi):
+    return f"band:{lo:g}:{hi:g}"
+
+
+def _cumulative(wl, values):
+    """Intégrale cumulée en log λ (trapèzes) de chaque ligne de ``values``"""
+    x = np.log(wl)
+    steps = 0.5 * (values[:, 1:] + values[:, :-1]) * np.diff(x)
+    return np.concatenate([np.zeros((len(values), 1)), np.cumsum(steps, axis=1)], axis=1)
+
+
+def integrated_power(wl, values):
+    """Puissance intégrée de chaque ligne de ``values`` (trapèzes en log λ)"""
+    return _cumulative(wl, values)[:, -1]
+
+
+def band_power(wl, values, lo, hi, cumulative=None):
+    """Puissance de chaque ligne entre ``lo`` et ``hi`` (NaN si la bande dépasse la grille)"""
+    if cumulative is None:
+        cumulative = _cumulative(wl, values)
+    x = np.log(wl)
+    bounds = np.log([lo, hi])
+    if bounds[0] < x[0] or bounds[1] > x[-1]:
+        return np.full(len(values), np.nan)
+    idx = np.clip(np.searchsorted(x, bounds), 1, len(x) - 1)
+    w = (bounds - x[idx - 1]) / (x[idx] - x[idx - 1])
+    at = cumulative[:, idx - 1] * (1 - w) + cumulative[:, idx] * w
+    return at[:, 1] - at[:, 0]
+
+
+def compute(wl, sed_tot, pops=None, bands=()):
+    """Grandeurs de modèles de même grille
+
+    ``sed_tot`` est une matrice (modèles × longueurs d'onde), ``pops``
+    associe ``pop<i>`` à sa matrice (NaN pour les modèles sans cette
+    population) et ``bands`` est une liste de couples (lo, hi). Renvoie un
+    dictionnaire grandeur -> tableau (une valeur par modèle).
+    """
+    wl = np.asarray(wl, dtype=float)
+    order = np.argsort(wl)
+    wl = wl[order]
+    sed_tot = np.asarray(sed_tot, dtype=float)[:, order]
+    cumulative = _cumulative(wl, sed_tot)
+    power = cumulative[:, -1]
+    peak_idx = np.argmax(sed_tot, axis=1)
+    rows = np.arange(len(sed_tot))
+    out = {"power": power, "peak_wl": wl[peak_idx], "peak": sed_tot[rows, peak_idx]}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for pop, values in (pops or {}).items():
+            out[f"{pop}_frac"] = integrated_power(wl, np.asarray(values, dtype=float)[:, order]) / power
+    for lo, hi in bands:
+        out[band_key(lo, hi)] = band_power(wl, sed_tot, lo, hi, cumulative)
+    return out
+
+
+def residuals(matrix, reference):
+    """Écarts de chaque modèle d'une :class:`~dustem_core.matrix.SEDMatrix` au modèle ``reference``
+
+    Renvoie un dictionnaire de tableaux : ``power_ratio`` (rapport des
+    puissances intégrées), ``rms_dex`` et ``max_dex`` (écart quadratique
+    moyen et maximal de log10 sed_tot). Les longueurs d'onde où les deux
+    SED sont sous ``DYNAMIC_RANGE`` fois leur maximum, ou hors de la grille
+    d'un modèle, sont ignorées.
+    """
+    i_ref = matrix.names.index(reference)
+    wl = np.asarray(matrix.wl, dtype=float)
+    sed = np.asarray(matrix.sed_tot, dtype=float)
+    ref = sed[i_ref]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        peaks = np.nanmax(sed, axis=1)
+        keep = (sed > DYNAMIC_RANGE * peaks[:, None]) | (ref > DYNAMIC_RANGE * peaks[i_ref])
+        keep &= (sed > 0) & (ref > 0) & np.isfinite(sed)
+        delta = np.where(keep, np.log10(sed) - np.log10(ref), np.nan)
+        n = keep.sum(axis=1)
+        rms = np.sqrt(np.nansum(delta ** 2, axis=1) / n)
+        worst = np.max(np.where(keep, np.abs(delta), -np.inf), axis=1)
+        valid = np.isfinite(sed).all(axis=0)
+        order = np.argsort(wl[valid])
+        power = integrated_power(wl[valid][order], sed[:, valid][:, order])
+    worst[n == 0] = np.nan
+    return {"power_ratio": power / power[i_ref], "rms_dex": rms, "max_dex": worst}
+
+
+def _read_cache(path):
+    """Grandeurs mémorisées : identifiant de résultat -> {grandeur: valeur}"""
+    cache = {}
+    if not path.exists():
+        return cache
+    with open(path, "r") as f:
+        for ligne in f:
+            if ligne.strip():
+                record = json.loads(ligne)
+                cache.setdefault(record.pop("run"), {}).update(record)
+    return cache
+
+
+def _append_cache(path, records):
+    """Ajoute des lignes au fichier des grandeurs en une seule écriture (O_APPEND)"""
+    if not records:
+        return
+    data = "".join(json.dumps(record) + "\n" for record in records).encode()
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def _json_value(value):
+    return None if not np.isfinite(value) else float(value)
+
+
+def _g0(result):
+    config = result.config
+    try:
+        return float(config["G0"])
+    except (TypeError, KeyError, ValueError):
+        return np.nan
+
+
+def model_analytics(store, names=None, bands=None):
+    """Tableau des grandeurs des résultats ``names`` d'un :class:`~dustem_core.store.ResultStore`
+
+    ``bands`` associe un nom de bande à (lo, hi) en µm (cf.
+    :func:`parse_bands`) ; la colonne de la bande porte son nom. Seuls les
+    résultats absents du cache (ou une bande qui n'y figure pas) sont
+    relus et calculés, par groupes de même grille. Renvoie un
+    :class:`pandas.DataFrame` indexé par nom de résultat.
+    """
+    names = list(store) if names is None else list(names)
+    bands = bands or {}
+    path = store.path / ANALYTICS_FILE
+    cache = _read_cache(path)
+    runs = {name: store.entry(name)["run"] for name in names}
+
+    # Résultats à calculer, par grille et par nombre de populations ; quand
+    # seules des bandes manquent, les populations ne sont pas relues
+    todo = {}
+    results = {}
+    for name in names:
+        entry = store.entry(name)
+        cached = cache.get(runs[name], {})
+        missing = tuple(sorted({(lo, hi) for lo, hi in bands.values() if band_key(lo, hi) not in cached}))
+        if "power" in cached and not missing:
+            continue
+        results[name] = store[name]
+        n_pops = sum(c.startswith("pop") for c in entry["columns"]) if "power" not in cached else None
+        wl = results[name].read("wl")
+        todo.setdefault((_grid_key(wl), n_pops, missing), (wl, []))[1].append(name)
+
+    records = []
+    all_bands = sorted(set(bands.values()))
+    for (_, n_pops, missing), (wl, group) in todo.items():
+        sed_tot = np.stack([results[name].read("sed_tot") for name in group])
+        if n_pops is None:
+            order = np.argsort(wl)
+            values = {
+                band_key(lo, hi): band_power(wl[order], sed_tot[:, order], lo, hi) for lo, hi in missing
+            }
+        else:
+            pops = {
+                f"pop{i}": np.stack([results[name].read(f"pop{i}") for name in group])
+                for i in range(1, n_pops + 1)
+            }
+            values = compute(wl, sed_tot, pops, all_bands)
+            values["G0"] = np.array([_g0(results[name]) for name in group])
+        for i, name in enumerate(group):
+            record = {key: _json_value(column[i]) for key, column in values.items()}
+            cache.setdefault(runs[name], {}).update(record)
+            records.append(dict(record, run=runs[name]))
+    _append_cache(path, records)
+
+    rows = []
+    for name in names:
+        cached = cache[runs[name]]
+        row = {key: value for key, value in cached.items() if not key.startswith("band:")}
+        for band, (lo, hi) in bands.items():
+            row[band] = cached.get(band_key(lo, hi))
+        rows.append(row)
+    frame = pd.DataFrame(rows, index=pd.Index(names, name="name"), dtype=float)
+    pop_fracs = sorted((c for c in frame if c.startswith("pop")), key=lambda c: int(c[3:].split("_")[0]))
+    return frame.reindex(columns=["G0", "power", "peak_wl", "peak"] + pop_fracs + list(bands))
+
+
+def band_ratios(frame, ratios):
+    """Colonnes ``a/b`` des rapports de bandes (``ratios`` : liste de couples de noms de bande)"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return pd.DataFrame({f"{a}/{b}": frame[a] / frame[b] for a, b in ratios}, index=frame.index)
+
+
+def parse_ratios(text, bands):
+    """Analyse ``"b60/b100, b12/b60"`` en couples de noms de bande"""
+    ratios = []
+    for item in text.replace("\n", ",").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        a, sep, b = (part.strip() for part in item.partition("/"))
+        if not sep or a not in bands or b not in bands:
+            raise ValueError(f"Rapport invalide : {item!r} (bandes connues : {', '.join(bands) or 'aucune'})")
+        ratios.append((a, b))
+    return ratios
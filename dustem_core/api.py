@@ -0,0 +1,264 @@
+"""Interface Python sans Streamlit pour piloter dustEM
+
+Exemple::
+
+    from dustem_core import run_model, run_batch, load_results
+
+    sed = run_model(config)                    # SEDTable
+    run_batch(models, workers=8, project="grille_g0")
+    run_adaptive(config, "G0 = 1:1e4:5:log", tol=0.1, project="grille_g0")
+    results = load_results("grille_g0", columns=["wl", "sed_tot"])
+    resume_batch(batch_id)                     # après une interruption
+
+Les configurations sont des dictionnaires au format ``dict_ligne`` de
+l'application (cf. :func:`dustem_core.grain.build_config`).
+"""
+from pathlib import Path
+
+from . import runner
+from .abundance import derive_from_cache, model_shape
+from .adaptive import refine_sweep
+from .build import build_info
+from .cache import ResultCache, model_key
+from .grain import grain_types
+from .journal import DONE, FAILED, RUNNING, Journal
+from .locate import locate_dustem
+from .metrics import RunMetrics
+from .outputs import discard_outputs
+from .readers import SEDTable
+from .results import load_results, save_data_test
+from .runner import DustemError
+from .store import ResultStore
+from .sweep import parse_axes
+
+__all__ = [
+    "run_model", "run_batch", "run_adaptive", "resume_batch", "load_results", "default_repository", "DustemError"
+]
+
+
+def default_repository():
+    """Repository dustEM localisé (variables d'environnement ou configuration)"""
+    return locate_dustem()[1]
+
+
+def _cache_from(cache):
+    """``True`` : cache par défaut ; ``False``/``None`` : pas de cache"""
+    if cache is True:
+        return ResultCache()
+    return cache or None
+
+
+def result_source(outcome):
+    """Métadonnées de provenance d'un résultat de :func:`run_batch`"""
+    if outcome.get("derived"):
+        return {"source": "derived", "derived_from": outcome["derived"]["from"],
+                "abundance_factors": outcome["derived"]["factors"]}
+    return {"source": "cache" if outcome["cached"] else "dustem"}
+
+
+def run_model(config, repository=None, timeout=None, cache=True):
+    """Exécute un modèle et renvoie son SED (:class:`~dustem_core.readers.SEDTable`)
+
+    Un modèle qui ne diffère d'un résultat en cache que par ses Mdust/MH
+    en est dérivé par mise à l'échelle, sans lancer dustem. Lève
+    :class:`DustemError` si dustem échoue ou dépasse ``timeout``.
+    """
+    repository = Path(repository) if repository else default_repository()
+    cache = _cache_from(cache)
+    if cache is not None:
+        metrics = RunMetrics("model")
+        metrics.start()
+        with metrics.stage("cache"):
+            key, binary_digest = model_key(repository, config)
+            data = cache.get(key)
+            derived = None if data is not None else derive_from_cache(cache, repository, config)
+        if data is not None:
+            metrics.cache = "hit"
+            metrics.log()
+            return SEDTable(data, grain_types(config))
+        if derived is not None:
+            metrics.cache = "derived"
+            metrics.log()
+            return derived[0]
+
+    outcome = runner.run_job(str(repository), "model", config, timeout=timeout)
+    discard_outputs(outcome["outputs"])
+    metrics = outcome["metrics"]
+    if cache is not None:
+        metrics.cache = "miss"
+    metrics.log(ok=outcome["data"] is not None)
+    if outcome["data"] is None:
+        raise DustemError(outcome["error"])
+    if cache is not None:
+        cache.put(key, outcome["data"].data, binary_digest, shape=model_shape(repository, config))
+    return outcome["data"]
+
+
+def _journal_from(journal):
+    """``True`` : journal par défaut ; ``False``/``None`` : pas de journal"""
+    if journal is True:
+        return Journal()
+    return journal or None
+
+
+def _stored_callbacks(store, repository, metadata, journal, batch_id, callback, skip=()):
+    """Callbacks d'un lot enregistré : le modèle n'est marqué ``done`` qu'après l'enregistrement
+
+    Les résultats des modèles de ``skip`` (déjà enregistrés) ne sont pas réécrits.
+    Les métadonnées des résultats portent l'empreinte du build utilisé
+    (cf. :func:`dustem_core.build.build_info`).
+    """
+    grain_template = repository / "data" / "GRAIN.DAT"
+    metadata = dict(metadata, **build_info(repository))
+
+    def _on_result(progress, outcome):
+        ok = outcome["data"] is not None
+        if store is not None and ok and outcome["name"] not in skip:
+            save_data_test(
+                data=outcome["data"],
+                name_set=outcome["name"],
+                global_test=store,
+                config=outcome["config"],
+                metadata=dict(result_source(outcome), **metadata),
+                grain_template=grain_template,
+                metrics=outcome["metrics"],
+                outputs=outcome.get("outputs")
+            )
+        if journal is not None:
+            journal.mark(batch_id, outcome["name"], DONE if ok else FAILED, error=outcome["error"],
+                         config=outcome["config"])
+        if callback is not None:
+            callback(progress, outcome)
+
+    def _on_submit(name, config):
+        journal.mark(batch_id, name, RUNNING, config=config)
+
+    return _on_result, _on_submit if journal is not None else None
+
+
+def _run_stored(repository, jobs, store, metadata, journal, batch_id, workers, cache, timeout, callback,
+                executor):
+    on_result, on_submit = _stored_callbacks(store, repository, metadata, journal, batch_id, callback)
+    try:
+        return runner.run_batch(
+            repository, jobs, workers=workers, callback=on_result, cache=_cache_from(cache), timeout=timeout,
+            executor=executor, on_submit=on_submit
+        )
+    finally:
+        if journal is not None:
+            journal.release(batch_id)
+
+
+def _refine_stored(repository, params, store, journal, batch_id, workers, cache, timeout, callback, on_round,
+                   executor, skip=()):
+    metadata = dict(params["metadata"], refine=params["prefix"])
+    on_result, on_submit = _stored_callbacks(store, repository, metadata, journal, batch_id, callback, skip)
+    try:
+        return refine_sweep(
+            repository, params["config"], params["axes"], tol=params["tol"], budget=params["budget"],
+            max_depth=params["max_depth"], workers=workers, cache=_cache_from(cache), timeout=timeout,
+            callback=on_result, on_round=on_round, prefix=params["prefix"], executor=executor,
+            on_submit=on_submit
+        )
+    finally:
+        if journal is not None:
+            journal.release(batch_id)
+
+
+def run_batch(models, workers=None, repository=None, project=None, store_root=None,
+              cache=True, timeout=None, callback=None, executor=None, metadata=None, journal=True,
+              batch_id=None):
+    """Exécute un lot de modèles en parallèle
+
+    ``models`` est un dictionnaire nom -> config ou une liste de couples
+    (nom, config). Si ``project`` est donné, chaque SED réussi est ajouté au
+    stockage de résultats de ce projet (avec ``metadata`` en plus de sa
+    provenance) et le lot est inscrit au journal (cf.
+    :mod:`dustem_core.journal`) sous ``batch_id`` pour pouvoir être repris
+    par :func:`resume_batch`. ``callback(progress, outcome)`` est appelé à
+    la fin de chaque modèle ; ``executor`` est passé à
+    :func:`dustem_core.runner.run_batch`. Renvoie la liste des résultats
+    (cf. :func:`dustem_core.runner.run_job`).
+    """
+    repository = Path(repository) if repository else default_repository()
+    jobs = list(models.items()) if isinstance(models, dict) else list(models)
+    store = ResultStore(project, root=store_root) if project else None
+    metadata = metadata or {}
+    journal = _journal_from(journal) if store is not None else None
+    if journal is not None:
+        batch_id = journal.create(
+            jobs, project=project, store_root=store.path.parent, repository=repository,
+            params={"metadata": metadata}, batch_id=batch_id
+        )
+    return _run_stored(repository, jobs, store, metadata, journal, batch_id, workers, cache, timeout, callback,
+                       executor)
+
+
+def run_adaptive(config, axes, tol=0.1, budget=200, max_depth=4, workers=None, repository=None,
+                 project=None, store_root=None, cache=True, timeout=None, callback=None, on_round=None,
+                 prefix="refine", executor=None, metadata=None, journal=True, batch_id=None):
+    """Balayage adaptatif autour de ``config`` (cf. :func:`dustem_core.adaptive.refine_sweep`)
+
+    ``axes`` est la description textuelle des axes (cf.
+    :func:`dustem_core.sweep.parse_axes`) ou son résultat. Si ``project``
+    est donné, chaque SED réussi est ajouté au stockage de résultats de ce
+    projet avec ses valeurs de paramètres, et le balayage est inscrit au
+    journal comme pour :func:`run_batch`.
+    """
+    repository = Path(repository) if repository else default_repository()
+    params = {
+        "config": config,
+        "axes": parse_axes(axes) if isinstance(axes, str) else axes,
+        "tol": tol,
+        "budget": budget,
+        "max_depth": max_depth,
+        "prefix": prefix,
+        "metadata": metadata or {},
+    }
+    store = ResultStore(project, root=store_root) if project else None
+    journal = _journal_from(journal) if store is not None else None
+    if journal is not None:
+        batch_id = journal.create(
+            [], kind="refine", project=project, store_root=store.path.parent, repository=repository,
+            params=params, batch_id=batch_id
+        )
+    return _refine_stored(repository, params, store, journal, batch_id, workers, cache, timeout, callback,
+                          on_round, executor)
+
+
+def resume_batch(batch_id, workers=None, repository=None, cache=True, timeout=None, callback=None,
+                 on_round=None, executor=None, retry_failed=False, journal=True):
+    """Reprend un lot interrompu du journal
+
+    Seuls les modèles non terminés sont relancés (et ceux en échec avec
+    ``retry_failed``) ; un modèle dont le résultat est déjà dans le
+    stockage avec la même configuration est simplement marqué ``done``.
+    Un balayage adaptatif est rejoué : ses tours dépendent des résultats,
+    les modèles déjà calculés sont servis par le cache et ne sont pas
+    réenregistrés. Renvoie le résultat de :func:`run_batch` ou de
+    :func:`run_adaptive`.
+    """
+    journal = _journal_from(journal) or Journal()
+    batch = journal.batch(batch_id)
+    if batch["finished"] is None and not batch["interrupted"]:
+        raise ValueError(f"Le lot {batch_id} est en cours d'exécution (processus {batch['pid']})")
+    if batch["finished"] is not None and not (retry_failed and batch["counts"][FAILED]):
+        raise ValueError(f"Le lot {batch_id} est terminé")
+    repository = Path(repository or batch["repository"])
+    store = ResultStore(batch["project"], root=batch["store_root"])
+    journal.claim(batch_id)
+
+    if batch["kind"] == "refine":
+        skip = {job["name"] for job in journal.jobs(batch_id, [DONE])}
+        return _refine_stored(repository, batch["params"], store, journal, batch_id, workers, cache, timeout,
+                              callback, on_round, executor, skip)
+
+    jobs = []
+    for name, config in journal.unfinished(batch_id, retry_failed):
+        # Résultat enregistré avant l'arrêt, mais pas encore marqué dans le journal
+        if name in store and store.config(name) == config:
+            journal.mark(batch_id, name, DONE)
+        else:
+            jobs.append((name, config))
+    return _run_stored(repository, jobs, store, batch["params"]["metadata"], journal, batch_id, workers, cache,
+                       timeout, callback, executor)
@@ -0,0 +1,312 @@
+"""Mesures de performance de la chaîne de l'application
+
+Les étapes d'un modèle (écriture du GRAIN.DAT, lancement du processus,
+lecture de SED.RES, enregistrement, graphique, export CSV) sont chronométrées
+de bout en bout contre le faux dustem de :mod:`dustem_core.fake_dustem`,
+dont on choisit le nombre de longueurs d'onde, de populations et la durée.
+
+Scénarios :
+
+- ``single`` : un modèle à la fois, ``repeat`` fois ;
+- ``sweep`` : un lot de ``models`` modèles sur ``workers`` processus ;
+- ``compare`` : comparaison de ``models`` résultats stockés (matrice,
+  graphique, CSV combiné, export Parquet) ;
+- ``app`` : démarrage à froid de l'application Streamlit et coût d'une
+  réexécution (``streamlit.testing``), sur un projet de ``models`` résultats,
+  en vue simple puis en comparaison.
+
+Chaque scénario tourne dans un processus neuf pour mesurer son pic de
+mémoire (``ru_maxrss``). Un rapport peut être enregistré comme référence ;
+une mesure ultérieure comparée à cette référence échoue si une étape
+dépasse la tolérance.
+"""
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .export import export_results
+from .fake_dustem import make_fake_repository
+from .grain import build_config, grain_types, parse_pop_line
+from .locate import APP_DIR
+from .matrix import sed_matrix
+from .plotting import plot_comparison, plot_result, to_png
+from .readers import read_sed
+from .results import save_data_test
+from .runner import run_batch
+from .store import ResultStore
+from .workspace import RunWorkspace
+
+SCENARIOS = ("single", "sweep", "compare", "app")
+
+DEFAULTS = {"n_wl": 800, "n_pops": 4, "runtime": 0.0, "models": 20, "workers": 4, "repeat": 5}
+
+# Écarts absolus ignorés lors de la comparaison à la référence
+MIN_DELTA_S = 0.005
+MIN_DELTA_MB = 10.0
+
+
+class StageTimer:
+    """Accumule les durées mesurées par étape"""
+
+    def __init__(self):
+        self.samples = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.setdefault(name, []).append(time.perf_counter() - start)
+
+    def add(self, name, value):
+        self.samples.setdefault(name, []).append(value)
+
+    def summary(self):
+        return {
+            name: {"median": statistics.median(values), "min": min(values), "n": len(values)}
+            for name, values in self.samples.items()
+        }
+
+
+def _base_config(repository):
+    """Configuration (format dict_ligne) tirée du GRAIN.DAT du faux repository"""
+    with open(Path(repository) / "data" / "GRAIN.DAT") as f:
+        lines = [ligne for ligne in f if ligne.strip() and ligne[0] not in "#s"]
+    return build_config(lines[0].strip(), [parse_pop_line(ligne) for ligne in lines[1:]])
+
+
+def _scaled_config(config, g0):
+    return dict(config, G0=f"{g0}\n")
+
+
+def bench_single(repository, workdir, params):
+    timer = StageTimer()
+    store = ResultStore("bench_single", root=workdir / "store")
+    config = _base_config(repository)
+    types = grain_types(config)
+    for i in range(params["repeat"]):
+        name = f"single_{i}"
+        with ExitStack() as stack:
+            with timer.stage("workspace"):
+                workspace = stack.enter_context(RunWorkspace(repository, root=workdir / "runs"))
+            with timer.stage("grain"):
+                workspace.write_grain(config)
+            with timer.stage("process"):
+                result = workspace.run()
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr)
+            with timer.stage("parse"):
+                data = read_sed(workspace.sed_file, types, sidecar=False)
+            with timer.stage("store"):
+                save_data_test(data, name, store, config=config, grain_template=workspace.grain_file)
+        with timer.stage("plot"):
+            to_png(plot_result(store[name]))
+        with timer.stage("export_csv"):
+            pd.DataFrame(dict(store[name])).to_csv(index=False)
+    timer.add("process_overhead", timer.summary()["process"]["median"] - params["runtime"])
+    return timer.summary()
+
+
+def bench_sweep(repository, workdir, params):
+    timer = StageTimer()
+    store = ResultStore("bench_sweep", root=workdir / "store")
+    config = _base_config(repository)
+    jobs = [(f"sweep_{i:04d}", _scaled_config(config, 1.0 + i)) for i in range(params["models"])]
+
+    def _save(progress, outcome):
+        with timer.stage("store"):
+            save_data_test(outcome["data"], outcome["name"], store, config=outcome["config"])
+
+    with timer.stage("batch"):
+        outcomes = run_batch(repository, jobs, workers=params["workers"], callback=_save)
+    failed = [o for o in outcomes if o["data"] is None]
+    if failed:
+        raise RuntimeError(failed[0]["error"])
+    wall = timer.samples["batch"][0]
+    slots = min(params["workers"], params["models"])
+    timer.add("per_model", wall * slots / params["models"])
+    timer.add("per_model_overhead", wall * slots / params["models"] - params["runtime"])
+    return timer.summary()
+
+
+def bench_compare(repository, workdir, params):
+    timer = StageTimer()
+    store = ResultStore("bench_compare", root=workdir / "store")
+    config = _base_config(repository)
+    with RunWorkspace(repository, root=workdir / "runs") as workspace:
+        workspace.write_grain(config)
+        workspace.run()
+        data = read_sed(workspace.sed_file, grain_types(config), sidecar=False)
+    names = []
+    for i in range(params["models"]):
+        columns = {k: v * (1.0 + i) if k != "wl" else v for k, v in data.columns().items()}
+        store.append(f"compare_{i:04d}", columns, config=config)
+        names.append(f"compare_{i:04d}")
+
+    for _ in range(params["repeat"]):
+        with timer.stage("matrix"):
+            matrix = sed_matrix(store, names, populations=True)
+        with timer.stage("plot"):
+            to_png(plot_comparison(matrix, show_populations=True))
+        with timer.stage("export_csv"):
+            matrix.table(populations=True).to_csv(index=False)
+        with timer.stage("export_parquet"):
+            export_results(store, io.BytesIO(), fmt="parquet", names=names)
+    return timer.summary()
+
+
+# Mesures de l'application, dans un interpréteur neuf : le processus du
+# scénario a déjà importé pandas et NumPy avec ce module
+APP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+stages = {"import_streamlit": [time.perf_counter() - start]}
+app, repeat = sys.argv[1], int(sys.argv[2])
+at = AppTest.from_file(app, default_timeout=300)
+
+def timed(stage):
+    start = time.perf_counter()
+    at.run()
+    stages.setdefault(stage, []).append(time.perf_counter() - start)
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+
+timed("first_run")
+for _ in range(repeat):
+    timed("rerun")
+at.radio[0].set_value("Comparaison multiple")
+timed("compare_first")
+for _ in range(repeat):
+    timed("compare_rerun")
+print(json.dumps(stages))
+"""
+
+
+def bench_app(repository, workdir, params):
+    timer = StageTimer()
+    store = ResultStore("default", root=workdir / "store")
+    config = _base_config(repository)
+    with RunWorkspace(repository, root=workdir / "runs") as workspace:
+        workspace.write_grain(config)
+        workspace.run()
+        data = read_sed(workspace.sed_file, grain_types(config), sidecar=False)
+    for i in range(params["models"]):
+        columns = {k: v * (1.0 + i) if k != "wl" else v for k, v in data.columns().items()}
+        store.append(f"app_{i:04d}", columns, config=_scaled_config(config, 1.0 + i))
+
+    env = dict(
+        os.environ,
+        DUSTEM_REPOSITORY=str(repository),
+        DUSTEM_STORE_DIR=str(workdir / "store"),
+        DUSTEM_CACHE_DIR=str(workdir / "cache"),
+        DUSTEM_JOURNAL=str(workdir / "journal.sqlite"),
+        DUSTEM_METRICS_FILE=str(workdir / "metrics.jsonl"),
+        DUSTEM_APP_CONFIG=str(workdir / "config.json"),
+    )
+    env.pop("DUSTEM_BINARY", None)
+    env.pop("DUSTEM_WORKER_LISTEN", None)
+    app = APP_DIR / "dustEM_App.py"
+    result = subprocess.run(
+        [sys.executable, "-c", APP_SCRIPT, str(app), str(params["repeat"])],
+        env=env, cwd=workdir, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    for stage, values in json.loads(result.stdout.splitlines()[-1]).items():
+        for value in values:
+            timer.add(stage, value)
+    return timer.summary()
+
+
+BENCHMARKS = {"single": bench_single, "sweep": bench_sweep, "compare": bench_compare, "app": bench_app}
+
+
+def _run_scenario(scenario, params):
+    """Exécute un scénario dans le processus courant (processus neuf)"""
+    with tempfile.TemporaryDirectory(prefix="dustem_bench_") as tmp:
+        tmp = Path(tmp)
+        repository = make_fake_repository(tmp / "repository", params["n_wl"], params["n_pops"], params["runtime"])
+        stages = BENCHMARKS[scenario](repository, tmp, params)
+    return {
+        "stages": stages,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "children_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def run_benchmarks(scenarios=SCENARIOS, **params):
+    """Exécute les scénarios demandés et renvoie le rapport (dictionnaire)"""
+    params = dict(DEFAULTS, **{k: v for k, v in params.items() if v is not None})
+    report = {
+        "params": params,
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": multiprocessing.cpu_count(), "numpy": np.__version__},
+        "created": time.time(),
+        "scenarios": {},
+    }
+    context = multiprocessing.get_context("spawn")
+    for scenario in scenarios:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            report["scenarios"][scenario] = pool.submit(_run_scenario, scenario, params).result()
+    return report
+
+
+def compare_to_baseline(report, baseline, tolerance=0.25):
+    """Liste des régressions du rapport par rapport à la référence"""
+    if report["params"] != baseline["params"]:
+        raise ValueError(
+            f"Paramètres différents de la référence : {baseline['params']} (référence) "
+            f"contre {report['params']}"
+        )
+    regressions = []
+    for scenario, result in report["scenarios"].items():
+        base = baseline["scenarios"].get(scenario)
+        if base is None:
+            continue
+        for stage, values in result["stages"].items():
+            old = base["stages"].get(stage, {}).get("median")
+            new = values["median"]
+            if old is not None and new > old * (1 + tolerance) and new - old > MIN_DELTA_S:
+                regressions.append(f"{scenario}.{stage} : {old * 1e3:.1f} ms -> {new * 1e3:.1f} ms")
+        old, new = base["peak_rss_mb"], result["peak_rss_mb"]
+        if new > old * (1 + tolerance) and new - old > MIN_DELTA_MB:
+            regressions.append(f"{scenario}.peak_rss : {old:.0f} Mo -> {new:.0f} Mo")
+    return regressions
+
+
+def format_report(report):
+    lines = [f"paramètres : {report['params']}"]
+    for scenario, result in report["scenarios"].items():
+        lines.append(
+            f"[{scenario}] pic mémoire {result['peak_rss_mb']:.0f} Mo "
+            f"(processus enfants {result['children_peak_rss_mb']:.0f} Mo)"
+        )
+        for stage, values in result["stages"].items():
+            lines.append(f"    {stage:<20} médiane {values['median'] * 1e3:9.2f} ms   min {values['min'] * 1e3:9.2f} ms")
+    return "\n".join(lines)
+
+
+def save_report(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=1)
+
+
+def load_report(path):
+    with open(path, "r") as f:
+        return json.load(f)
@@ -0,0 +1,416 @@
+"""Construction reproductible des builds de dustEM
+
+Un build est décrit par une :class:`BuildSpec` : archive des sources (URL ou
+chemin, somme SHA-256), chemins compilés dans le binaire (``data_path`` et
+``dir_PDR`` de ``DM_constants.f90``) et variables passées à ``make``
+(compilateur, options). Son empreinte (:attr:`BuildSpec.digest`) couvre
+l'archive, les modifications des sources et les variables de ``make`` : un
+build d'empreinte déjà construite n'est pas refait.
+
+Organisation (``$DUSTEM_BUILD_DIR`` ou ``~/.local/share/dustem_app/builds``)::
+
+    <racine>/
+        tarballs/<archive>            archives des sources
+        tarballs/<archive>.sha256     somme de contrôle de l'archive
+        <nom>-<empreinte>/            un repository dustEM par build
+            src/dustem
+            BUILD.json                spécification, empreinte, binaire
+        .locks/                       un verrou par build
+
+Plusieurs builds (versions, options de compilation, chemins) coexistent
+côte à côte. Le verrou empêche deux processus (nœuds d'un cluster sur un
+disque partagé) de compiler le même build en même temps : le second attend
+puis réutilise le build du premier.
+
+Une archive déjà présente dans le cache est vérifiée puis utilisée sans
+réseau : l'installation fonctionne hors ligne. Sans somme de contrôle
+donnée, celle de la première archive obtenue est enregistrée et vérifiée à
+chaque utilisation suivante.
+
+La compilation lance ``make -j`` (un processus par processeur), puis
+``make`` en série si la compilation parallèle échoue (Makefile sans les
+dépendances entre modules Fortran). ``BUILD.json`` est écrit en dernier :
+un dossier sans ce fichier est un build interrompu, refait au prochain
+appel. Les résultats calculés avec un build géré enregistrent son empreinte
+dans leurs métadonnées (cf. :func:`build_info`).
+
+Ce module n'utilise que la bibliothèque standard : ``dowload_dustem.sh``
+l'exécute directement (``python3 dustem_core/build.py``), avant
+l'installation de l'environnement Python de l'application.
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tarfile
+import time
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+
+DEFAULT_URL = "https://www.ias.u-psud.fr/DUSTEM/dustem4.3_web.tar.gz"
+DEFAULT_NAME = "dustem4.3"
+
+# Fichier des chemins compilés dans le binaire, relatif à la racine des sources
+CONSTANTS_FILE = Path("src") / "DM_constants.f90"
+
+# Valeur de data_path / dir_PDR remplacée par la racine du build (chemin absolu)
+REPOSITORY_PLACEHOLDER = "{repository}"
+
+BUILD_FILE = "BUILD.json"
+
+# Lignes de sortie de make conservées dans les messages d'erreur
+MAKE_TAIL = 40
+
+
+class BuildError(RuntimeError):
+    """Échec de la construction d'un build dustem"""
+
+
+def default_build_dir():
+    """Racine des builds (``$DUSTEM_BUILD_DIR`` ou ``~/.local/share/dustem_app/builds``)"""
+    if os.environ.get("DUSTEM_BUILD_DIR"):
+        return Path(os.environ["DUSTEM_BUILD_DIR"])
+    base = os.environ.get("XDG_DATA_HOME") or Path.home() / ".local" / "share"
+    return Path(base) / "dustem_app" / "builds"
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _local_path(url):
+    """Chemin local d'une source (chemin ou URL ``file://``), ``None`` pour une URL distante"""
+    parsed = urllib.parse.urlparse(str(url))
+    if parsed.scheme == "file":
+        return Path(urllib.parse.unquote(parsed.path))
+    if not parsed.scheme:
+        return Path(url).expanduser()
+    return None
+
+
+def fetch_archive(url, cache_dir, sha256=None):
+    """Archive des sources dans le cache local, téléchargée ou copiée au besoin
+
+    L'archive est vérifiée contre ``sha256``, ou à défaut contre la somme
+    enregistrée à sa première obtention. Renvoie (chemin, somme SHA-256).
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    local = _local_path(url)
+    name = local.name if local is not None else Path(urllib.parse.urlparse(url).path).name
+    archive = cache_dir / name
+    recorded = archive.with_name(f"{name}.sha256")
+    expected = sha256 or (recorded.read_text().split()[0] if recorded.exists() else None)
+
+    if archive.exists():
+        digest = sha256_file(archive)
+        if expected is None or digest == expected:
+            if not recorded.exists():
+                recorded.write_text(f"{digest}  {name}\n")
+            return archive, digest
+        if sha256 is None:
+            raise BuildError(
+                f"{archive} ne correspond plus à sa somme de contrôle enregistrée ({recorded}) : "
+                "supprimer l'archive ou donner --sha256"
+            )
+        # Archive en cache différente de celle demandée : on la remplace
+
+    tmp = cache_dir / f".{name}.{os.getpid()}.tmp"
+    try:
+        if local is not None:
+            if not local.is_file():
+                raise BuildError(f"Archive introuvable : {local}")
+            shutil.copyfile(local, tmp)
+        else:
+            with urllib.request.urlopen(url, timeout=60) as response, open(tmp, "wb") as f:
+                shutil.copyfileobj(response, f, 1 << 20)
+        digest = sha256_file(tmp)
+        if expected is not None and digest != expected:
+            raise BuildError(f"Somme de contrôle de {name} : {digest} au lieu de {expected}")
+        os.replace(tmp, archive)
+    except OSError as e:
+        raise BuildError(f"Impossible d'obtenir {url} : {e}") from None
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    recorded.write_text(f"{digest}  {name}\n")
+    return archive, digest
+
+
+class BuildSpec:
+    """Description d'un build : sources, chemins compilés et variables de ``make``
+
+    ``data_path`` et ``dir_pdr`` sont les valeurs écrites dans
+    ``DM_constants.f90`` ; ``"./"`` (défaut) compile des chemins relatifs
+    (espaces de travail isolés, cf. :mod:`dustem_core.workspace`) et
+    ``"{repository}"`` la racine absolue du build (l'empreinte ne dépend
+    pas de la racine des builds). ``make_vars`` est passé à ``make``
+    (``{"FC": "ifort", "FFLAGS": "-O3"}``, selon le Makefile).
+    """
+
+    def __init__(self, name=DEFAULT_NAME, url=DEFAULT_URL, sha256=None, data_path="./", dir_pdr="./",
+                 make_vars=None):
+        self.name = name
+        self.url = str(url)
+        self.sha256 = sha256
+        self.data_path = data_path
+        self.dir_pdr = dir_pdr
+        self.make_vars = dict(sorted((make_vars or {}).items()))
+
+    def content(self):
+        """Ce qui détermine le binaire (l'URL et le nom n'en font pas partie)"""
+        if self.sha256 is None:
+            raise BuildError("Somme de contrôle de l'archive inconnue (cf. fetch_archive)")
+        return {
+            "archive_sha256": self.sha256,
+            "patches": {"data_path": self.data_path, "dir_PDR": self.dir_pdr},
+            "make_vars": self.make_vars,
+        }
+
+    @property
+    def digest(self):
+        payload = json.dumps(self.content(), sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+    @property
+    def dirname(self):
+        return f"{self.name}-{self.digest}"
+
+    def to_dict(self):
+        return {"name": self.name, "url": self.url, **self.content()}
+
+
+def patch_constants(path, values):
+    """Remplace les valeurs des variables ``CHARACTER`` de ``DM_constants.f90``
+
+    ``values`` associe un nom de variable (``data_path``, ``dir_PDR``) à sa
+    nouvelle valeur. La déclaration est cherchée par son nom plutôt que par
+    son numéro de ligne ; chaque variable doit être déclarée une seule fois.
+    """
+    path = Path(path)
+    with open(path, "r", newline="") as f:
+        text = f.read()
+    for variable, value in values.items():
+        pattern = re.compile(
+            rf"^(\s*CHARACTER\s*\(\s*len\s*=\s*\d+\s*\)\s*::\s*{re.escape(variable)}\s*=\s*)(['\"]).*?\2",
+            re.IGNORECASE | re.MULTILINE,
+        )
+        text, count = pattern.subn(lambda m: f"{m.group(1)}'{value}'", text)
+        if count != 1:
+            raise BuildError(f"{path} : {count} déclaration(s) de {variable} au lieu d'une")
+    with open(path, "w", newline="") as f:
+        f.write(text)
+
+
+def _extract(archive, dest):
+    """Décompresse l'archive dans ``dest`` (racine des sources, avec ``src/``)"""
+    with tarfile.open(archive) as tar:
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(dest, filter="data")
+        else:
+            tar.extractall(dest)
+    entries = list(Path(dest).iterdir())
+    # Archive contenant un seul dossier racine : on le remonte
+    if len(entries) == 1 and entries[0].is_dir() and not (Path(dest) / "src").is_dir():
+        inner = entries[0]
+        for entry in inner.iterdir():
+            shutil.move(str(entry), Path(dest) / entry.name)
+        inner.rmdir()
+    if not (Path(dest) / "src").is_dir():
+        raise BuildError(f"{archive} ne contient pas de dossier src/")
+
+
+def _make(src, make_vars, jobs):
+    """Compile avec ``make -j jobs``, puis en série si la compilation parallèle échoue"""
+    args = [f"{key}={value}" for key, value in make_vars.items()]
+    attempts = [["make", f"-j{jobs}", *args], ["make", *args]] if jobs > 1 else [["make", *args]]
+    for command in attempts:
+        result = subprocess.run(command, cwd=src, capture_output=True, text=True)
+        if result.returncode == 0:
+            return command
+    tail = "".join((result.stdout + result.stderr).splitlines(True)[-MAKE_TAIL:])
+    raise BuildError(f"Échec de {' '.join(command)} (code {result.returncode}) :\n{tail}")
+
+
+@contextmanager
+def _locked(root, name):
+    locks = Path(root) / ".locks"
+    locks.mkdir(parents=True, exist_ok=True)
+    with open(locks / f"{name}.lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_build(repository):
+    """Contenu de ``BUILD.json`` d'un repository (``None`` hors build géré ou build interrompu)"""
+    try:
+        with open(Path(repository) / BUILD_FILE, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, NotADirectoryError, ValueError):
+        return None
+
+
+def is_built(repository, digest):
+    """Build complet, de même empreinte, et binaire inchangé depuis sa compilation"""
+    info = read_build(repository)
+    binary = Path(repository) / "src" / "dustem"
+    return (
+        info is not None and info.get("digest") == digest and binary.is_file()
+        and sha256_file(binary) == info.get("binary_sha256")
+    )
+
+
+def build(spec, root=None, jobs=None, force=False, smoke=False, log=None):
+    """Construit le build ``spec`` (ou réutilise un build identique) et renvoie sa racine
+
+    ``jobs`` est le nombre de processus de ``make`` (défaut : nombre de
+    processeurs). ``force`` refait le build même s'il existe. ``smoke``
+    lance dustem une fois après la compilation (GRAIN.DAT de l'archive).
+    ``log(message)`` reçoit l'avancement.
+    """
+    log = log or (lambda message: None)
+    root = Path(root) if root else default_build_dir()
+    jobs = jobs or os.cpu_count() or 1
+    archive, spec.sha256 = fetch_archive(spec.url, root / "tarballs", spec.sha256)
+    repository = root / spec.dirname
+
+    with _locked(root, spec.dirname):
+        if not force and is_built(repository, spec.digest):
+            log(f"Build {spec.dirname} déjà construit : {repository}")
+            return repository
+        start = time.time()
+        if repository.exists():
+            shutil.rmtree(repository)
+        repository.mkdir(parents=True)
+        log(f"Décompression de {archive.name} dans {repository}")
+        _extract(archive, repository)
+
+        values = {"data_path": spec.data_path, "dir_PDR": spec.dir_pdr}
+        patch_constants(repository / CONSTANTS_FILE, {
+            key: value.replace(REPOSITORY_PLACEHOLDER, f"{repository}/") for key, value in values.items()
+        })
+
+        log(f"Compilation ({jobs} processus)")
+        command = _make(repository / "src", spec.make_vars, jobs)
+        binary = repository / "src" / "dustem"
+        if not binary.is_file():
+            raise BuildError(f"make n'a pas produit {binary}")
+        os.chmod(binary, 0o755)
+        (repository / "out").mkdir(exist_ok=True)
+
+        if smoke:
+            log("Test : exécution de dustem")
+            result = subprocess.run([str(binary)], cwd=repository, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise BuildError(f"Le test de dustem a échoué (code {result.returncode}) :\n{result.stderr}")
+
+        info = dict(
+            spec.to_dict(), digest=spec.digest, binary_sha256=sha256_file(binary), make=command,
+            built=time.time(), build_seconds=time.time() - start,
+        )
+        tmp = repository / f".{BUILD_FILE}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(info, f, indent=1)
+        os.replace(tmp, repository / BUILD_FILE)
+        log(f"Build {spec.dirname} construit en {info['build_seconds']:.0f} s : {repository}")
+    return repository
+
+
+def list_builds(root=None):
+    """Builds complets de la racine : liste de ``BUILD.json`` (avec ``path``)"""
+    root = Path(root) if root else default_build_dir()
+    if not root.is_dir():
+        return []
+    builds = []
+    for path in sorted(root.iterdir()):
+        info = read_build(path) if path.is_dir() and not path.name.startswith(".") else None
+        if info is not None:
+            builds.append(dict(info, path=str(path)))
+    return builds
+
+
+_info_cache = {}
+
+
+def build_info(repository):
+    """Métadonnées de build à enregistrer avec un résultat (``{}`` hors build géré)
+
+    Relu seulement quand ``BUILD.json`` change.
+    """
+    path = Path(repository) / BUILD_FILE
+    try:
+        key = (str(path), path.stat().st_mtime_ns)
+    except OSError:
+        return {}
+    if key not in _info_cache:
+        info = read_build(repository) or {}
+        _info_cache[key] = {"build": info["digest"], "build_name": info["name"]} if "digest" in info else {}
+    return _info_cache[key]
+
+
+def add_build_arguments(parser):
+    """Options de construction, communes à ce script et à ``python -m dustem_core build``"""
+    parser.add_argument("--url", default=os.environ.get("DUSTEM_TARBALL", DEFAULT_URL),
+                        help="archive des sources : URL, chemin ou file:// (défaut : $DUSTEM_TARBALL ou le site de dustEM)")
+    parser.add_argument("--sha256", default=None, help="somme de contrôle attendue de l'archive")
+    parser.add_argument("--name", default=DEFAULT_NAME, help="nom du build (préfixe du dossier)")
+    parser.add_argument("--data-path", default="./",
+                        help="data_path compilé (défaut : ./ ; {repository} pour la racine du build)")
+    parser.add_argument("--dir-pdr", default="./", help="dir_PDR compilé (défaut : ./)")
+    parser.add_argument("--make-var", action="append", default=[], metavar="VAR=VALEUR",
+                        help="variable passée à make (compilateur, options), répétable")
+    parser.add_argument("--root", default=None, help="racine des builds (défaut : $DUSTEM_BUILD_DIR)")
+    parser.add_argument("--jobs", type=int, default=None, help="processus de make (défaut : nombre de processeurs)")
+    parser.add_argument("--force", action="store_true", help="reconstruire même si le build existe")
+    parser.add_argument("--smoke", action="store_true", help="lancer dustem une fois après la compilation")
+    parser.add_argument("--list", action="store_true", help="lister les builds existants")
+
+
+def run_from_args(args):
+    """Construit le build décrit par les options ; renvoie sa racine (``None`` avec ``--list``)"""
+    if args.list:
+        for info in list_builds(args.root):
+            built = time.strftime("%Y-%m-%d %H:%M", time.localtime(info["built"]))
+            print(f"{info['digest']}  {info['name']:<16} {built}  {info['path']}")
+        return None
+    make_vars = {}
+    for item in args.make_var:
+        key, sep, value = item.partition("=")
+        if not sep or not key:
+            raise ValueError(f"Variable de make invalide : {item!r} (attendu VAR=VALEUR)")
+        make_vars[key] = value
+    spec = BuildSpec(args.name, args.url, args.sha256, args.data_path, args.dir_pdr, make_vars)
+    return build(spec, root=args.root, jobs=args.jobs, force=args.force, smoke=args.smoke,
+                 log=lambda message: print(message, file=sys.stderr))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Construction des builds de dustEM")
+    add_build_arguments(parser)
+    args = parser.parse_args(argv)
+    try:
+        repository = run_from_args(args)
+    except (BuildError, ValueError) as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        return 2
+    if repository is not None:
+        print(repository)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+"""Cache disque des résultats, adressé par le contenu du modèle
+
+La clé d'un modèle est l'empreinte SHA-256 de :
+
+- toutes les colonnes de ses lignes, les nombres canonisés (``1e5`` et
+  ``1.0E+05`` sont identiques),
+- les lignes de mots-clés d'exécution du GRAIN.DAT modèle,
+- les fichiers d'entrée du repository (``data/`` hors GRAIN.DAT, ``oprop/``...,
+  hors ``BUILD.json`` des builds gérés),
+- le binaire ``dustem`` lui-même.
+
+Les empreintes de fichiers sont mémorisées par (chemin, date, taille) : seul
+un ``stat`` est nécessaire tant qu'un fichier ne change pas. Les SED sont
+stockés en ``.npy`` ; un index SQLite conserve les dates d'accès (éviction
+LRU au-delà de la taille maximale) et les compteurs de succès/échecs. Une
+recompilation du binaire change les clés : les anciennes entrées ne sont
+plus servies et sont évincées avec les moins récemment utilisées, sans
+vider le cache des autres builds qui le partagent.
+
+Chaque entrée peut aussi être rattachée à la « forme » de son modèle
+(clé calculée sans les Mdust/MH, cf. :mod:`dustem_core.abundance`) et à ses
+abondances, pour retrouver un résultat qui ne diffère que par celles-ci.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .build import BUILD_FILE
+from .grain import POP_FIELDS, parse_config
+
+# Dossiers du repository qui ne sont pas des entrées de dustem
+IGNORED_ENTRIES = ("src", "out", "runs")
+
+DEFAULT_MAX_BYTES = 500 * 1024 ** 2
+
+_digest_cache = {}
+
+
+def default_cache_dir():
+    """Dossier du cache (``$DUSTEM_CACHE_DIR`` ou ``~/.cache/dustem_app``)"""
+    if os.environ.get("DUSTEM_CACHE_DIR"):
+        return Path(os.environ["DUSTEM_CACHE_DIR"])
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "dustem_app" / "results"
+
+
+def file_digest(path):
+    """Empreinte SHA-256 d'un fichier, mémorisée tant que le fichier est inchangé"""
+    st = os.stat(path)
+    key = (str(path), st.st_mtime_ns, st.st_size)
+    if key not in _digest_cache:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        _digest_cache[key] = h.hexdigest()
+    return _digest_cache[key]
+
+
+def inputs_digest(repository):
+    """Empreinte de l'ensemble des fichiers d'entrée du repository"""
+    repository = Path(repository)
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(repository):
+        rel_root = Path(root).relative_to(repository)
+        if rel_root == Path("."):
+            dirs[:] = [d for d in dirs if d not in IGNORED_ENTRIES]
+        dirs.sort()
+        for name in sorted(files):
+            rel = rel_root / name
+            if rel == Path("data") / "GRAIN.DAT" or rel == Path(BUILD_FILE):
+                continue
+            h.update(f"{rel}\0{file_digest(Path(root) / name)}\n".encode())
+    return h.hexdigest()
+
+
+def _canonical_number(value):
+    try:
+        return repr(float(value))
+    except ValueError:
+        return value
+
+
+def canonical_model(config, keywords=(), abundances=True):
+    """Représentation canonique (JSON) d'un dictionnaire de test
+
+    Toutes les colonnes des lignes sont prises en compte (σ d'une loi
+    log-normale, paramètres ``cv``...), chaque nombre sous forme canonique.
+    Avec ``abundances=False``, les Mdust/MH sont omis (forme du modèle).
+    """
+    # Valide les lignes (G0 présent, populations complètes)
+    parse_config(config)
+    canon_pops = []
+    for key in config:
+        if key == "G0":
+            continue
+        tokens = [_canonical_number(token) for token in config[key].split()]
+        if not abundances:
+            del tokens[POP_FIELDS.index("mdust_mh")]
+        canon_pops.append(tokens)
+    return json.dumps(
+        {"G0": [_canonical_number(token) for token in config["G0"].split()], "pops": canon_pops,
+         "keywords": [k.split() for k in keywords]},
+        sort_keys=True,
+    )
+
+
+def run_keywords(grain_file):
+    """Lignes de mots-clés d'exécution (``s...``) d'un GRAIN.DAT"""
+    with open(grain_file, "r") as f:
+        return [ligne for ligne in f if ligne[0] == "s"]
+
+
+def build_id(repository, binary=None):
+    """Identifiant d'un build dustem : binaire et fichiers d'entrée du repository
+
+    Deux repositories de même identifiant (par exemple sur deux machines)
+    produisent les mêmes résultats ; sert à apparier les tâches et les
+    travailleurs distants (cf. :mod:`dustem_core.remote`).
+    """
+    repository = Path(repository)
+    binary = Path(binary) if binary else repository / "src" / "dustem"
+    payload = "\n".join([file_digest(binary), inputs_digest(repository)])
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def model_key(repository, config, binary=None, inputs=None, abundances=True):
+    """Clé de cache d'un modèle exécuté avec un repository et un binaire donnés
+
+    ``inputs`` permet de fournir une empreinte :func:`inputs_digest` déjà
+    calculée (lots de modèles). Avec ``abundances=False``, la clé ignore les
+    Mdust/MH (clé de forme). Renvoie (clé, empreinte du binaire).
+    """
+    repository = Path(repository)
+    binary = Path(binary) if binary else repository / "src" / "dustem"
+    binary_digest = file_digest(binary)
+    if inputs is None:
+        inputs = inputs_digest(repository)
+    keywords = run_keywords(repository / "data" / "GRAIN.DAT")
+    payload = "\n".join([canonical_model(config, keywords, abundances), inputs, binary_digest])
+    return hashlib.sha256(payload.encode()).hexdigest(), binary_digest
+
+
+class ResultCache:
+    """Cache persistant des SED avec éviction LRU et compteurs"""
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = Path(root) if root else default_cache_dir()
+        if max_bytes is None:
+            max_mb = os.environ.get("DUSTEM_CACHE_MAX_MB")
+            max_bytes = int(float(max_mb) * 1024 ** 2) if max_mb else DEFAULT_MAX_BYTES
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, binary TEXT, size INTEGER, created REAL, last_access REAL)"
+            )
+            db.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)")
+            db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            db.execute("CREATE TABLE IF NOT EXISTS shapes (key TEXT PRIMARY KEY, shape TEXT, abundances TEXT)")
+            db.execute("CREATE INDEX IF NOT EXISTS shapes_shape ON shapes (shape)")
+
+    def _connect(self):
+        return sqlite3.connect(self.root / "index.sqlite", timeout=30)
+
+    def _payload(self, key):
+        return self.root / key[:2] / f"{key}.npy"
+
+    def _count(self, db, name):
+        db.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, key):
+        """Renvoie le tableau SED en cache, ou ``None``"""
+        path = self._payload(key)
+        with self._connect() as db:
+            row = db.execute("SELECT key FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or not path.exists():
+                self._count(db, "misses")
+                return None
+            db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._count(db, "hits")
+        return np.load(path)
+
+    def put(self, key, data, binary_digest, shape=None):
+        """Ajoute un SED au cache puis applique la limite de taille
+
+        ``shape`` est un couple (clé de forme, abondances) facultatif, cf.
+        :func:`dustem_core.abundance.model_shape`.
+        """
+        path = self._payload(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, data)
+        os.replace(tmp, path)
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, binary, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, binary_digest, path.stat().st_size, now, now),
+            )
+            if shape is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO shapes (key, shape, abundances) VALUES (?, ?, ?)",
+                    (key, shape[0], json.dumps(list(shape[1]))),
+                )
+            self._evict(db)
+
+    def _evict(self, db):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in db.execute(
+            "SELECT key, size FROM entries ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._payload(key).unlink(missing_ok=True)
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            db.execute("DELETE FROM shapes WHERE key = ?", (key,))
+            total -= size
+            self._count(db, "evictions")
+
+    def find_shape(self, shape_key):
+        """Entrées de même forme : liste de (clé, abondances), plus récentes d'abord"""
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT shapes.key, shapes.abundances FROM shapes JOIN entries ON entries.key = shapes.key "
+                "WHERE shapes.shape = ? ORDER BY entries.last_access DESC",
+                (shape_key,),
+            ).fetchall()
+        return [(key, json.loads(abundances)) for key, abundances in rows]
+
+    def count(self, name):
+        """Incrémente un compteur (ex. ``derived``)"""
+        with self._connect() as db:
+            self._count(db, name)
+
+    def stats(self):
+        """Compteurs du cache : succès, échecs, évictions, entrées, octets"""
+        with self._connect() as db:
+            counters = dict(db.execute("SELECT name, value FROM stats").fetchall())
+            entries, size = db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "derived": counters.get("derived", 0),
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def clear(self):
+        """Vide le cache (les compteurs sont conservés)"""
+        with self._connect() as db:
+            for (key,) in db.execute("SELECT key FROM entries").fetchall():
+                self._payload(key).unlink(missing_ok=True)
+            db.execute("DELETE FROM entries")
+            db.execute("DELETE FROM shapes")
@@ -0,0 +1,467 @@
+"""Ligne de commande : ``python -m dustem_core <commande>``
+
+Commandes :
+
+- ``run MANIFESTE`` : exécute les modèles d'un manifeste et enregistre les
+  SED dans le stockage de résultats d'un projet ;
+- ``refine MANIFESTE`` : balayage adaptatif autour du premier modèle du
+  manifeste, raffiné là où le SED change vite ;
+- ``manifest SOURCES`` : convertit des manifestes (CSV, JSON, JSON lines,
+  YAML) et des fichiers GRAIN.DAT en un manifeste, ou en un GRAIN.DAT par
+  modèle ;
+- ``batches`` : liste les lots du journal (``--interrupted`` pour ceux à
+  reprendre) ;
+- ``resume LOT`` : reprend les modèles non terminés d'un lot interrompu ;
+- ``worker URL`` : travailleur distant qui exécute les tâches du serveur
+  ``URL`` (application ou commande lancée avec ``--listen``) ;
+- ``list`` : liste les résultats d'un projet ;
+- ``export SORTIE`` : exporte les résultats d'un projet en flux (Parquet,
+  CSV compressé ou ZIP avec les GRAIN.DAT) ;
+- ``photometry`` : flux des résultats d'un projet dans les bandes d'un
+  dossier de filtres, ou (``--observed``) χ² des modèles sur des flux observés ;
+- ``bench`` : mesure les étapes de la chaîne contre un faux dustem et
+  compare à une référence (code de retour 1 en cas de régression) ;
+- ``metrics`` : affiche le fichier de mesures des exécutions, brut (JSON
+  lines) ou agrégé au format texte de Prometheus ;
+- ``locate`` : affiche le binaire dustem utilisé (``--scan`` pour le
+  rechercher sur le disque) ;
+- ``build`` : construit un build de dustem (archive vérifiée en cache,
+  compilation parallèle, sans recompiler un build identique) et, avec
+  ``--use``, en fait le binaire utilisé ; ``--list`` liste les builds.
+"""
+import argparse
+import json
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+from .api import default_repository, resume_batch, run_adaptive, run_batch
+from . import bench
+from .build import BuildError, add_build_arguments, run_from_args
+from .export import FORMATS, export_results
+from .jobs import JobManager
+from .journal import Journal, new_batch_id
+from .locate import locate_dustem, remember_repository, scan_and_remember
+from .grain import GrainFile, read_grain
+from .manifest import FORMATS as MANIFEST_FORMATS
+from .manifest import iter_manifest, load_manifest, manifest_format, write_manifest
+from .metrics import default_metrics_file, prometheus_text, read_metrics
+from .photometry import CONVENTIONS, load_filters, photometry, read_observations, score
+from .remote import HEARTBEAT, run_worker, serve_workers
+from .store import ResultStore
+
+
+def _progress(progress, outcome):
+    if outcome.get("derived"):
+        status = "dérivé"
+    else:
+        status = "cache" if outcome["cached"] else ("ok" if outcome["data"] is not None else "ÉCHEC")
+    print(f"[{status}] {outcome['name']} — {progress.summary()}", file=sys.stderr)
+    if outcome["error"]:
+        print(f"    {outcome['error'].strip()}", file=sys.stderr)
+
+
+def _round(info):
+    print(f"raffinement : {info['runs']} modèle(s) pour {info['cells']} cellule(s), "
+          f"écart max {info['max_diff']:.3f} dex", file=sys.stderr)
+
+
+@contextmanager
+def _executor(args):
+    """Planificateur ouvert aux travailleurs distants avec ``--listen``, sinon pool local"""
+    if not args.listen:
+        yield None
+        return
+    server = serve_workers(JobManager(max_running=args.workers), args.listen)
+    print(f"travailleurs distants : python -m dustem_core worker {server.url}", file=sys.stderr)
+    try:
+        yield server.manager.executor()
+    finally:
+        server.stop()
+
+
+def _announce_batch(batch_id):
+    print(f"lot {batch_id} — en cas d'interruption : python -m dustem_core resume {batch_id}", file=sys.stderr)
+
+
+def _cmd_run(args):
+    jobs = load_manifest(args.manifest)
+    repository = args.repository or default_repository()
+    batch_id = args.batch or new_batch_id()
+    print(f"{len(jobs)} modèle(s) — repository {repository} — projet {args.project}", file=sys.stderr)
+    _announce_batch(batch_id)
+
+    with _executor(args) as executor:
+        outcomes = run_batch(
+            jobs,
+            workers=args.workers,
+            repository=repository,
+            project=args.project,
+            store_root=args.store,
+            cache=not args.no_cache,
+            timeout=args.timeout,
+            callback=_progress,
+            executor=executor,
+            batch_id=batch_id,
+        )
+    failed = sum(o["data"] is None for o in outcomes)
+    return 1 if failed else 0
+
+
+def _cmd_refine(args):
+    name, config = load_manifest(args.manifest)[0]
+    repository = args.repository or default_repository()
+    axes = "\n".join(args.axis)
+    prefix = args.prefix or f"{name}_refine"
+    batch_id = args.batch or new_batch_id()
+    print(f"Balayage adaptatif de {name} — tolérance {args.tol} dex — budget {args.budget}", file=sys.stderr)
+    _announce_batch(batch_id)
+
+    with _executor(args) as executor:
+        result = run_adaptive(
+            config,
+            axes,
+            tol=args.tol,
+            budget=args.budget,
+            max_depth=args.max_depth,
+            workers=args.workers,
+            repository=repository,
+            project=args.project,
+            store_root=args.store,
+            cache=not args.no_cache,
+            timeout=args.timeout,
+            callback=_progress,
+            on_round=_round,
+            prefix=prefix,
+            executor=executor,
+            batch_id=batch_id,
+        )
+    return _refine_summary(result)
+
+
+def _refine_summary(result):
+    n = len(result["outcomes"])
+    print(
+        f"{n} modèle(s) ({result['status']}, écart restant {result['max_diff']:.3f} dex) — "
+        f"grille régulière équivalente : {result['uniform_equivalent']} modèle(s)",
+        file=sys.stderr,
+    )
+    return 1 if any(o["data"] is None for o in result["outcomes"]) else 0
+
+
+def _cmd_batches(args):
+    journal = Journal(args.journal)
+    for batch in journal.batches(args.project):
+        if args.interrupted and not batch["interrupted"]:
+            continue
+        if batch["interrupted"]:
+            status = "interrompu"
+        else:
+            status = "en cours" if batch["finished"] is None else "terminé"
+        counts = " ".join(f"{state}={n}" for state, n in batch["counts"].items())
+        print(f"{batch['batch_id']}\t{batch['kind']}\t{batch['project']}\t{status}\t{counts}")
+    return 0
+
+
+def _cmd_resume(args):
+    journal = Journal(args.journal)
+    batch = journal.batch(args.batch)
+    todo = batch["counts"]["queued"] + batch["counts"]["running"]
+    if args.retry_failed:
+        todo += batch["counts"]["failed"]
+    print(f"Reprise du lot {args.batch} ({batch['kind']}, projet {batch['project']}) : "
+          f"{todo} modèle(s) non terminé(s)", file=sys.stderr)
+    with _executor(args) as executor:
+        result = resume_batch(
+            args.batch,
+            workers=args.workers,
+            repository=args.repository,
+            cache=not args.no_cache,
+            timeout=args.timeout,
+            callback=_progress,
+            on_round=_round,
+            executor=executor,
+            retry_failed=args.retry_failed,
+            journal=journal,
+        )
+    if batch["kind"] == "refine":
+        return _refine_summary(result)
+    return 1 if any(o["data"] is None for o in result) else 0
+
+
+def _cmd_worker(args):
+    try:
+        run_worker(args.url, repository=args.repository, capacity=args.capacity, name=args.name,
+                   token=args.token, heartbeat=args.heartbeat)
+    except KeyboardInterrupt:
+        print("arrêt du travailleur", file=sys.stderr)
+    return 0
+
+
+def _cmd_list(args):
+    store = ResultStore(args.project, root=args.store)
+    for name in store:
+        entry = store.entry(name)
+        print(f"{name}\t{entry['n_wl']}\t{','.join(entry['columns'])}")
+    return 0
+
+
+def _cmd_export(args):
+    store = ResultStore(args.project, root=args.store)
+    names = args.names or list(store)
+    missing = [name for name in names if name not in store]
+    if missing:
+        raise ValueError(f"résultat(s) absent(s) du projet {args.project} : {', '.join(missing)}")
+    export_results(store, args.output, fmt=args.format, names=names, populations=not args.no_populations)
+    print(f"{len(names)} résultat(s) exporté(s) vers {args.output}", file=sys.stderr)
+    return 0
+
+
+def _cmd_photometry(args):
+    store = ResultStore(args.project, root=args.store)
+    filters = load_filters(args.filters)
+    if args.bands:
+        unknown = [name for name in args.bands if name not in filters]
+        if unknown:
+            raise ValueError(f"filtre(s) inconnu(s) : {', '.join(unknown)}")
+        filters = {name: filters[name] for name in args.bands}
+    if not filters:
+        raise ValueError(f"aucun filtre dans {args.filters or 'le dossier par défaut'}")
+    table = photometry(store, filters, names=args.names, convention=args.convention,
+                       populations=args.populations and not args.observed)
+    if args.observed:
+        table = score(table.xs("sed_tot", level="column"), read_observations(args.observed),
+                      free_scale=not args.fixed_scale)
+    table.to_csv(args.output or sys.stdout)
+    return 0
+
+
+def _cmd_bench(args):
+    report = bench.run_benchmarks(
+        args.scenarios,
+        n_wl=args.n_wl,
+        n_pops=args.n_pops,
+        runtime=args.runtime,
+        models=args.models,
+        workers=args.workers,
+        repeat=args.repeat,
+    )
+    print(bench.format_report(report))
+    if args.json:
+        bench.save_report(report, args.json)
+    if args.save_baseline:
+        bench.save_report(report, args.save_baseline)
+        print(f"Référence enregistrée : {args.save_baseline}", file=sys.stderr)
+    if args.baseline:
+        regressions = bench.compare_to_baseline(report, bench.load_report(args.baseline), args.tolerance)
+        for regression in regressions:
+            print(f"RÉGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"Aucune régression (tolérance {args.tolerance:.0%})", file=sys.stderr)
+    return 0
+
+
+def _cmd_manifest(args):
+    if not args.output and not args.grain_dir:
+        raise ValueError("indiquer --output ou --grain-dir")
+    models = []
+    for source in args.sources:
+        if manifest_format(source) == "grain":
+            (name, config), = iter_manifest(source)
+            # Un GRAIN.DAT lu est réécrit avec ses commentaires et ses mots-clés
+            models.append((name, config, read_grain(source)))
+        else:
+            models += [(name, config, None) for name, config in iter_manifest(source)]
+    print(f"{len(models)} modèle(s)", file=sys.stderr)
+    if args.output:
+        write_manifest([(name, config) for name, config, _ in models], args.output, args.format)
+    if args.grain_dir:
+        template = args.template or Path(args.repository or default_repository()) / "data" / "GRAIN.DAT"
+        for name, config, grain in models:
+            (Path(args.grain_dir) / name).mkdir(parents=True, exist_ok=True)
+            grain = grain or GrainFile.from_template(template, config)
+            grain.write(Path(args.grain_dir) / name / "GRAIN.DAT")
+    return 0
+
+
+def _cmd_metrics(args):
+    path = args.file or default_metrics_file()
+    if args.format == "prometheus":
+        text = prometheus_text(read_metrics(path))
+    else:
+        text = "".join(json.dumps(record) + "\n" for record in read_metrics(path))
+    if args.output is None:
+        sys.stdout.write(text)
+        return 0
+    # Écriture atomique pour un collecteur qui lit le fichier à tout moment
+    tmp = f"{args.output}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, args.output)
+    return 0
+
+
+def _cmd_locate(args):
+    src, repository = scan_and_remember() if args.scan else locate_dustem()
+    print(repository)
+    return 0
+
+
+def _cmd_build(args):
+    try:
+        repository = run_from_args(args)
+    except BuildError as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        return 1
+    if repository is not None:
+        if args.use:
+            remember_repository(repository)
+        print(repository)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m dustem_core", description="Pilotage de dustEM sans interface")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="exécuter les modèles d'un manifeste")
+    run.add_argument("manifest", help="manifeste des modèles (CSV, JSON, JSON lines, YAML ou GRAIN.DAT)")
+    run.add_argument("--project", default="default", help="projet du stockage de résultats")
+    run.add_argument("--store", default=None, help="racine du stockage (défaut : $DUSTEM_STORE_DIR)")
+    run.add_argument("--repository", default=None, help="repository dustEM (défaut : localisé)")
+    run.add_argument("--workers", type=int, default=None, help="nombre de processus")
+    run.add_argument("--timeout", type=float, default=None, help="durée maximale par modèle (s)")
+    run.add_argument("--no-cache", action="store_true", help="ne pas utiliser le cache de résultats")
+    run.add_argument("--batch", default=None, help="identifiant du lot dans le journal (défaut : généré)")
+    run.add_argument("--listen", default=None, help="ouvrir la file aux travailleurs distants sur hôte:port (cf. worker)")
+    run.set_defaults(func=_cmd_run)
+
+    ref = sub.add_parser("refine", help="balayage adaptatif autour du premier modèle d'un manifeste")
+    ref.add_argument("manifest", help="manifeste (le premier modèle sert de base)")
+    ref.add_argument("--axis", action="append", required=True,
+                     help="axe « clé = valeurs » (grille grossière), répétable ; ex. 'G0 = 1:1e4:5:log'")
+    ref.add_argument("--tol", type=float, default=0.1, help="écart toléré entre modèles voisins (dex)")
+    ref.add_argument("--budget", type=int, default=200, help="nombre maximal de modèles")
+    ref.add_argument("--max-depth", type=int, default=4, help="coupes maximales par intervalle grossier")
+    ref.add_argument("--prefix", default=None, help="préfixe des noms (défaut : <modèle>_refine)")
+    ref.add_argument("--project", default="default")
+    ref.add_argument("--store", default=None)
+    ref.add_argument("--repository", default=None)
+    ref.add_argument("--workers", type=int, default=None)
+    ref.add_argument("--timeout", type=float, default=None)
+    ref.add_argument("--no-cache", action="store_true")
+    ref.add_argument("--batch", default=None)
+    ref.add_argument("--listen", default=None)
+    ref.set_defaults(func=_cmd_refine)
+
+    man = sub.add_parser("manifest", help="convertir des manifestes et des GRAIN.DAT")
+    man.add_argument("sources", nargs="+", help="manifestes (.csv, .json, .jsonl, .yaml) ou fichiers GRAIN.DAT (.dat)")
+    man.add_argument("--output", default=None, help="manifeste de sortie (format d'après l'extension)")
+    man.add_argument("--format", choices=MANIFEST_FORMATS, default=None, help="format du manifeste de sortie")
+    man.add_argument("--grain-dir", default=None, help="écrire <dossier>/<modèle>/GRAIN.DAT pour chaque modèle")
+    man.add_argument("--template", default=None,
+                     help="GRAIN.DAT dont sont repris commentaires et mots-clés (défaut : celui du repository)")
+    man.add_argument("--repository", default=None, help="repository dustEM (défaut : localisé)")
+    man.set_defaults(func=_cmd_manifest)
+
+    bts = sub.add_parser("batches", help="lister les lots du journal")
+    bts.add_argument("--project", default=None, help="seulement les lots de ce projet")
+    bts.add_argument("--interrupted", action="store_true", help="seulement les lots à reprendre")
+    bts.add_argument("--journal", default=None, help="journal des lots (défaut : $DUSTEM_JOURNAL)")
+    bts.set_defaults(func=_cmd_batches)
+
+    res = sub.add_parser("resume", help="reprendre un lot interrompu")
+    res.add_argument("batch", help="identifiant du lot (cf. batches)")
+    res.add_argument("--retry-failed", action="store_true", help="relancer aussi les modèles en échec")
+    res.add_argument("--repository", default=None, help="repository dustEM (défaut : celui du lot)")
+    res.add_argument("--workers", type=int, default=None)
+    res.add_argument("--timeout", type=float, default=None)
+    res.add_argument("--no-cache", action="store_true")
+    res.add_argument("--journal", default=None)
+    res.add_argument("--listen", default=None)
+    res.set_defaults(func=_cmd_resume)
+
+    wrk = sub.add_parser("worker", help="travailleur distant : exécuter les tâches d'un serveur")
+    wrk.add_argument("url", help="adresse du serveur, ex. http://tete:8765")
+    wrk.add_argument("--repository", default=None, help="repository dustEM local (défaut : localisé)")
+    wrk.add_argument("--capacity", type=int, default=None, help="tâches simultanées (défaut : $DUSTEM_MAX_JOBS)")
+    wrk.add_argument("--name", default=None, help="nom du travailleur (défaut : machine-pid)")
+    wrk.add_argument("--token", default=None, help="jeton partagé (défaut : $DUSTEM_WORKER_TOKEN)")
+    wrk.add_argument("--heartbeat", type=float, default=HEARTBEAT, help="intervalle des signes de vie (s)")
+    wrk.set_defaults(func=_cmd_worker)
+
+    lst = sub.add_parser("list", help="lister les résultats d'un projet")
+    lst.add_argument("--project", default="default")
+    lst.add_argument("--store", default=None)
+    lst.set_defaults(func=_cmd_list)
+
+    exp = sub.add_parser("export", help="exporter les résultats d'un projet")
+    exp.add_argument("output", help="fichier de sortie")
+    exp.add_argument("--project", default="default")
+    exp.add_argument("--store", default=None)
+    exp.add_argument("--format", choices=FORMATS, default="parquet")
+    exp.add_argument("--names", nargs="+", default=None, help="résultats à exporter (défaut : tous)")
+    exp.add_argument("--no-populations", action="store_true", help="n'exporter que le SED total")
+    exp.set_defaults(func=_cmd_export)
+
+    pho = sub.add_parser("photometry", help="photométrie synthétique des résultats d'un projet")
+    pho.add_argument("--project", default="default")
+    pho.add_argument("--store", default=None)
+    pho.add_argument("--filters", default=None, help="dossier des filtres (défaut : $DUSTEM_FILTER_DIR)")
+    pho.add_argument("--bands", nargs="+", default=None, help="filtres à utiliser (défaut : tous)")
+    pho.add_argument("--convention", choices=list(CONVENTIONS), default="nuFnu",
+                     help="spectre de référence de la correction de couleur")
+    pho.add_argument("--names", nargs="+", default=None, help="résultats (défaut : tous)")
+    pho.add_argument("--populations", action="store_true", help="flux de chaque population en plus du total")
+    pho.add_argument("--observed", default=None, help="CSV filtre, flux[, erreur] : classer les modèles par χ²")
+    pho.add_argument("--fixed-scale", action="store_true", help="comparer sans ajuster de facteur d'échelle")
+    pho.add_argument("--output", default=None, help="fichier CSV (défaut : sortie standard)")
+    pho.set_defaults(func=_cmd_photometry)
+
+    bch = sub.add_parser("bench", help="mesurer les performances contre un faux dustem")
+    bch.add_argument("--scenarios", nargs="+", choices=bench.SCENARIOS, default=list(bench.SCENARIOS))
+    bch.add_argument("--n-wl", type=int, default=None, help="longueurs d'onde du SED factice")
+    bch.add_argument("--n-pops", type=int, default=None, help="populations du GRAIN.DAT factice")
+    bch.add_argument("--runtime", type=float, default=None, help="durée artificielle d'un modèle (s)")
+    bch.add_argument("--models", type=int, default=None, help="modèles des scénarios sweep et compare")
+    bch.add_argument("--workers", type=int, default=None)
+    bch.add_argument("--repeat", type=int, default=None)
+    bch.add_argument("--json", default=None, help="écrire le rapport JSON")
+    bch.add_argument("--save-baseline", default=None, help="enregistrer le rapport comme référence")
+    bch.add_argument("--baseline", default=None, help="référence à laquelle comparer")
+    bch.add_argument("--tolerance", type=float, default=0.25, help="dégradation tolérée (0.25 = 25 %%)")
+    bch.set_defaults(func=_cmd_bench)
+
+    met = sub.add_parser("metrics", help="mesures des exécutions (JSON lines ou Prometheus)")
+    met.add_argument("--format", choices=("jsonl", "prometheus"), default="jsonl")
+    met.add_argument("--file", default=None, help="fichier de mesures (défaut : $DUSTEM_METRICS_FILE)")
+    met.add_argument("--output", default=None, help="fichier de sortie (défaut : sortie standard)")
+    met.set_defaults(func=_cmd_metrics)
+
+    loc = sub.add_parser("locate", help="afficher le repository dustEM utilisé")
+    loc.add_argument("--scan", action="store_true", help="rechercher dustem sur le disque")
+    loc.set_defaults(func=_cmd_locate)
+
+    bld = sub.add_parser("build", help="construire dustem (archive en cache, compilation parallèle)")
+    add_build_arguments(bld)
+    bld.add_argument("--use", action="store_true", help="utiliser ce build (fichier de configuration)")
+    bld.set_defaults(func=_cmd_build)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except KeyError as e:
+        print(f"Erreur : lot inconnu {e}", file=sys.stderr)
+        return 2
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
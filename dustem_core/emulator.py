@@ -0,0 +1,325 @@
+"""Émulateur des SED appris sur les résultats stockés
+
+Un émulateur est entraîné par *famille* de modèles : même nombre de
+populations, mêmes types de grains, ``nsize`` et mots-clés de type. Les
+paramètres d'entrée sont G0 et les paramètres numériques de chaque
+population : ``rho``, ``amin``, ``amax``, ``alpha_a0``, puis ceux que lit
+dustEM selon les mots-clés du type (σ pour ``logn``, ``at``/``ac``/``gamma``
+pour ``ed``, ``au``/``zeta``/``eta`` pour ``cv``). Les paramètres
+strictement positifs sont pris en logarithme et ceux qui ne varient pas
+dans les données d'entraînement restent fixés.
+
+Les Mdust/MH ne sont pas appris : chaque population est divisée par son
+abondance avant l'entraînement puis remultipliée à la prédiction (cf.
+:mod:`dustem_core.abundance`), ce qui est exact.
+
+Le modèle est une régression par processus gaussien dans l'espace
+log10(SED), autour d'une moyenne linéaire en les paramètres : une
+prédiction coûte un produit matriciel et donne une incertitude (écart-type
+en dex) par longueur d'onde. L'échelle du noyau est choisie par erreur de
+validation croisée « leave-one-out », calculée en forme fermée.
+
+Un point hors de l'enveloppe convexe des données d'entraînement, ou dont
+l'incertitude dépasse le seuil, n'est pas émulé : :func:`predict_or_run`
+lance alors dustem.
+"""
+import numpy as np
+
+from .abundance import nnls, with_abundances
+from .grain import grain_types, parse_config, pop_fields
+from .matrix import loglog_resample
+from .readers import SEDTable
+
+# Champs d'une ligne de population qui ne sont pas des paramètres appris
+NOT_FEATURES = ("grain_type", "nsize", "type_keyword", "mdust_mh")
+
+# Incertitude maximale (dex sur le SED total) acceptée par défaut
+MAX_SIGMA_DEX = 0.05
+
+# Dynamique conservée sous le maximum de chaque population avant passage en log10
+DYNAMIC_RANGE = 1e-30
+
+LENGTH_SCALES = np.geomspace(0.05, 3.0, 16)
+NUGGET = 1e-8
+
+
+def pop_features(type_keyword):
+    """Paramètres appris pour une population de ce type"""
+    return [k for k in pop_fields(type_keyword) if k not in NOT_FEATURES]
+
+
+def _pops(config):
+    """Champs de chaque population, colonnes facultatives comprises"""
+    parse_config(config)
+    pops = []
+    for key in config:
+        if key == "G0":
+            continue
+        tokens = config[key].split()
+        fields = pop_fields(tokens[2])
+        if len(tokens) < len(fields):
+            raise ValueError(f"{key} : {len(fields)} colonnes attendues pour le type {tokens[2]}")
+        pops.append(dict(zip(fields, tokens)))
+    return pops
+
+
+def family(config):
+    """Famille d'un modèle : structure commune aux modèles émulables ensemble
+
+    Les mots-clés du type fixent les paramètres appris (cf. :func:`pop_features`).
+    """
+    return tuple((p["grain_type"], int(p["nsize"]), p["type_keyword"]) for p in parse_config(config)[1])
+
+
+def feature_names(config):
+    names = ["G0"]
+    for i, pop in enumerate(_pops(config)):
+        names += [f"pop{i + 1}.{k}" for k in pop_features(pop["type_keyword"])]
+    return names
+
+
+def features(config):
+    """(paramètres d'entrée, Mdust/MH par population) d'un modèle"""
+    x = [float(config["G0"])]
+    pops = _pops(config)
+    for pop in pops:
+        x += [float(pop[k]) for k in pop_features(pop["type_keyword"])]
+    return np.array(x), np.array([float(pop["mdust_mh"]) for pop in pops])
+
+
+def with_features(config, values, mdust=None):
+    """Copie d'un dictionnaire de test avec d'autres paramètres d'entrée
+
+    ``values`` associe un nom de :func:`feature_names` (``"G0"``,
+    ``"pop1.amin"``...) à sa nouvelle valeur ; ``mdust`` remplace les
+    Mdust/MH s'il est donné.
+    """
+    new = with_abundances(config, mdust) if mdust is not None else dict(config)
+    for name, value in values.items():
+        if name == "G0":
+            new["G0"] = f"{value:.4E}\n"
+            continue
+        pop, field = name.split(".")
+        tokens = new[pop].split()
+        fields = pop_fields(tokens[2])[:len(tokens)]
+        if field not in fields:
+            raise ValueError(f"{name} : sans effet pour le type {tokens[2]}")
+        tokens[fields.index(field)] = f"{value:.3E}"
+        new[pop] = "\t".join(tokens) + "\n"
+    return new
+
+
+class Prediction:
+    """SED émulé d'un modèle
+
+    ``sigma_dex`` est l'écart-type estimé de log10(sed_tot) par longueur
+    d'onde ; ``reason`` explique pourquoi le point n'est pas fiable
+    (``None`` sinon).
+    """
+
+    def __init__(self, data, sigma_dex, inside, reason=None):
+        self.data = data
+        self.sigma_dex = sigma_dex
+        self.inside = inside
+        self.reason = reason
+
+    @property
+    def max_sigma(self):
+        return float(np.max(self.sigma_dex)) if self.sigma_dex is not None else np.inf
+
+    def reliable(self, max_sigma=MAX_SIGMA_DEX):
+        return self.inside and self.max_sigma <= max_sigma
+
+
+class Emulator:
+    """Émulateur d'une famille de modèles (cf. :func:`train_emulators`)"""
+
+    def __init__(self, family, names, configs, wl, columns):
+        self.family = family
+        self.names = list(names)
+        self.wl = np.asarray(wl, dtype=float)
+        self.feature_names = feature_names(configs[0])
+        self.types = grain_types(configs[0])
+        self.n_pops = len(family)
+
+        X = np.array([features(c)[0] for c in configs])
+        floor = np.max(columns, axis=-1, keepdims=True) * DYNAMIC_RANGE
+        Y = np.log10(np.maximum(columns, np.maximum(floor, 1e-300))).reshape(len(configs), -1)
+        # Les modèles dérivés les uns des autres ont les mêmes paramètres : moyennés
+        X, inverse = np.unique(X, axis=0, return_inverse=True)
+        Y = np.array([Y[inverse.ravel() == i].mean(axis=0) for i in range(len(X))])
+
+        self.log_dims = np.all(X > 0, axis=0)
+        T = self._transform(X)
+        self.lo, self.hi = T.min(axis=0), T.max(axis=0)
+        self.active = self.hi > self.lo
+        # Valeurs des paramètres fixes (et d'un modèle de référence)
+        self.reference = X[0]
+        n_active = int(self.active.sum())
+        if len(X) < n_active + 2:
+            raise ValueError(
+                f"{len(X)} modèle(s) distinct(s) pour {n_active} paramètre(s) variable(s) : "
+                "pas assez de données pour entraîner l'émulateur"
+            )
+        self.Z = self._normalise(T)
+
+        # Moyenne linéaire, puis processus gaussien sur les résidus
+        design = np.column_stack([np.ones(len(self.Z)), self.Z])
+        self.beta = np.linalg.lstsq(design, Y, rcond=None)[0]
+        R = Y - design @ self.beta
+        self.length_scale, self.loo_dex = self._select_length_scale(R)
+        self.K_inv = np.linalg.inv(self._kernel(self.Z, self.Z) + NUGGET * np.eye(len(self.Z)))
+        self.alpha = self.K_inv @ R
+        # Variance du signal par sortie (maximum de vraisemblance)
+        self.signal_var = np.maximum(np.sum(R * self.alpha, axis=0) / len(R), 0.0)
+
+    def __len__(self):
+        return len(self.Z)
+
+    @property
+    def active_features(self):
+        return [n for n, a in zip(self.feature_names, self.active) if a]
+
+    def _transform(self, X):
+        return np.where(self.log_dims, np.log10(np.where(self.log_dims, X, 1.0)), X)
+
+    def _normalise(self, T):
+        return (T[..., self.active] - self.lo[self.active]) / (self.hi[self.active] - self.lo[self.active])
+
+    def _kernel(self, A, B, length_scale=None):
+        length_scale = length_scale or self.length_scale
+        d2 = np.sum(A ** 2, axis=1)[:, None] + np.sum(B ** 2, axis=1)[None, :] - 2 * A @ B.T
+        return np.exp(-np.maximum(d2, 0.0) / (2 * length_scale ** 2))
+
+    def _select_length_scale(self, R):
+        """Échelle du noyau minimisant l'erreur leave-one-out (forme fermée)"""
+        best = None
+        for length_scale in LENGTH_SCALES:
+            K = self._kernel(self.Z, self.Z, length_scale) + NUGGET * np.eye(len(self.Z))
+            try:
+                K_inv = np.linalg.inv(K)
+            except np.linalg.LinAlgError:
+                continue
+            loo = (K_inv @ R) / np.diag(K_inv)[:, None]
+            score = float(np.sqrt(np.mean(loo ** 2)))
+            if best is None or score < best[1]:
+                best = (float(length_scale), score)
+        return best
+
+    def bounds(self):
+        """Intervalle d'entraînement (valeurs naturelles) des paramètres variables"""
+        lo = np.where(self.log_dims, 10.0 ** self.lo, self.lo)
+        hi = np.where(self.log_dims, 10.0 ** self.hi, self.hi)
+        return {n: (lo[i], hi[i]) for i, n in enumerate(self.feature_names) if self.active[i]}
+
+    def inside(self, config):
+        """``None`` si le modèle est dans le domaine d'entraînement, sinon la raison"""
+        if family(config) != self.family:
+            return "structure de modèle différente"
+        x, _ = features(config)
+        moved = ~self.active & ~np.isclose(x, self.reference, rtol=1e-6, atol=0.0)
+        if moved.any():
+            names = [n for n, m in zip(self.feature_names, moved) if m]
+            return f"paramètre(s) fixe(s) à l'entraînement modifié(s) : {', '.join(names)}"
+        if np.any(x[self.log_dims] <= 0):
+            return "paramètre négatif ou nul hors du domaine d'entraînement"
+        z = self._normalise(self._transform(x))
+        if np.any(z < -1e-9) or np.any(z > 1 + 1e-9):
+            return "hors de l'intervalle d'entraînement"
+        # Enveloppe convexe : z combinaison convexe des points d'entraînement
+        weight = 1e3
+        A = np.vstack([self.Z.T, weight * np.ones(len(self.Z))])
+        b = np.append(z, weight)
+        lam = nnls(A, b)
+        if np.linalg.norm(A @ lam - b) > 1e-6 * max(1.0, np.linalg.norm(b)):
+            return "hors de l'enveloppe convexe des modèles d'entraînement"
+        return None
+
+    def predict(self, config):
+        """:class:`Prediction` du SED d'un modèle de la famille"""
+        reason = self.inside(config)
+        x, mdust = features(config)
+        if family(config) != self.family or np.any(x[self.log_dims] <= 0):
+            return Prediction(None, None, False, reason)
+        z = self._normalise(self._transform(x))[None, :]
+        k = self._kernel(z, self.Z)
+        mean = np.column_stack([np.ones(1), z]) @ self.beta + k @ self.alpha
+        var = max(float(1.0 - (k @ self.K_inv @ k.T)[0, 0]), 0.0)
+        sigma_pops = np.sqrt(var * self.signal_var).reshape(self.n_pops, -1)
+
+        pops = 10.0 ** mean.reshape(self.n_pops, -1) * mdust[:, None]
+        sed_tot = pops.sum(axis=0)
+        # Incertitude de log10(sed_tot), populations supposées indépendantes
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sigma_tot = np.sqrt(np.sum((pops * sigma_pops) ** 2, axis=0)) / sed_tot
+        sigma_tot = np.nan_to_num(sigma_tot, nan=0.0)
+
+        data = SEDTable(np.column_stack([self.wl, pops.T, sed_tot]), self.types)
+        return Prediction(data, sigma_tot, reason is None, reason)
+
+    def describe(self):
+        types = ", ".join(self.types)
+        return f"{self.n_pops} pop. ({types}) — {len(self)} modèle(s), erreur LOO {self.loo_dex:.3f} dex"
+
+
+def train_emulators(store, names=None):
+    """Entraîne un émulateur par famille de modèles du stockage
+
+    Renvoie un dictionnaire famille -> :class:`Emulator` ; les familles avec
+    trop peu de modèles sont ignorées. Les modèles dont une abondance est
+    nulle ne sont pas utilisés (leur population ne peut pas être normalisée).
+    """
+    groups = {}
+    for name in (list(store) if names is None else names):
+        config = store.config(name)
+        if not config or "G0" not in config:
+            continue
+        try:
+            _, mdust = features(config)
+            key = family(config)
+        except (KeyError, ValueError):
+            continue
+        if np.any(mdust <= 0):
+            continue
+        groups.setdefault(key, []).append((name, config, mdust))
+
+    emulators = {}
+    for key, members in groups.items():
+        result = store[members[0][0]]
+        wl = np.asarray(result["wl"], dtype=float)
+        pop_columns = [f"pop{i + 1}" for i in range(len(key))]
+        columns = []
+        for name, config, mdust in members:
+            result = store[name]
+            pops = np.stack([np.asarray(result[c], dtype=float) for c in pop_columns])
+            if len(result["wl"]) != len(wl) or not np.allclose(result["wl"], wl):
+                pops = loglog_resample(result["wl"], pops, wl)
+            columns.append(pops / mdust[:, None])
+        columns = np.array(columns)
+        # Longueurs d'onde couvertes par tous les modèles
+        keep = np.all(np.isfinite(columns), axis=(0, 1))
+        try:
+            emulators[key] = Emulator(
+                key, [m[0] for m in members], [m[1] for m in members], wl[keep], columns[:, :, keep]
+            )
+        except ValueError:
+            continue
+    return emulators
+
+
+def predict_or_run(emulators, config, max_sigma=MAX_SIGMA_DEX, **run_kwargs):
+    """SED émulé si le point est fiable, sinon calculé par dustem
+
+    ``emulators`` est un :class:`Emulator` ou le dictionnaire renvoyé par
+    :func:`train_emulators`. ``run_kwargs`` est passé à
+    :func:`dustem_core.api.run_model`. Renvoie (SED, :class:`Prediction` ou
+    ``None`` si dustem a été lancé).
+    """
+    emulator = emulators.get(family(config)) if isinstance(emulators, dict) else emulators
+    if emulator is not None:
+        prediction = emulator.predict(config)
+        if prediction.reliable(max_sigma):
+            return prediction.data, prediction
+    from .api import run_model
+
+    return run_model(config, **run_kwargs), None
@@ -0,0 +1,105 @@
+"""Export en flux des résultats d'un projet
+
+Les résultats sont écrits un modèle à la fois, directement dans le fichier
+de destination (chemin ou fichier binaire ouvert) : la mémoire utilisée ne
+dépend pas du nombre de modèles exportés.
+
+Formats :
+
+- ``parquet`` : table longue (``model``, ``wavelength_um``, ``sed_tot``,
+  ``pop1``...), un groupe de lignes par modèle ;
+- ``csv.gz`` : même table longue en CSV compressé ;
+- ``zip`` : un dossier par modèle avec ses données CSV, le GRAIN.DAT
+  exécuté, ses métadonnées et ses autres fichiers de sortie (``EXT.RES``...).
+"""
+import gzip
+import io
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+FORMATS = ("parquet", "csv.gz", "zip")
+
+MIME_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "csv.gz": "application/gzip",
+    "zip": "application/zip",
+}
+
+
+def _pop_columns(store, names):
+    """Colonnes de populations de l'ensemble des modèles, lues dans l'index"""
+    columns = {c for name in names for c in store.entry(name)["columns"] if c.startswith("pop")}
+    return sorted(columns, key=lambda c: int(c[3:]))
+
+
+def _model_frame(name, result, pop_columns, with_model=True):
+    """Table longue d'un modèle (populations absentes : NaN)"""
+    n = len(result["wl"])
+    frame = {}
+    if with_model:
+        frame["model"] = np.full(n, name, dtype=object)
+    frame["wavelength_um"] = np.asarray(result["wl"])
+    frame["sed_tot"] = np.asarray(result["sed_tot"])
+    for pop in pop_columns:
+        frame[pop] = np.asarray(result[pop]) if pop in result else np.full(n, np.nan)
+    return pd.DataFrame(frame)
+
+
+def _pyarrow():
+    """Modules pyarrow ; ``ValueError`` explicite s'il n'est pas installé"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("L'export Parquet demande pyarrow (pip install pyarrow) ; sinon, exporter en csv.gz") from None
+    return pa, pq
+
+
+def export_parquet(store, names, dest, populations=True):
+    pa, pq = _pyarrow()
+
+    pop_columns = _pop_columns(store, names) if populations else []
+    fields = [("model", pa.string()), ("wavelength_um", pa.float64()), ("sed_tot", pa.float64())]
+    schema = pa.schema(fields + [(pop, pa.float64()) for pop in pop_columns])
+    with pq.ParquetWriter(dest, schema, compression="zstd") as writer:
+        for name in names:
+            frame = _model_frame(name, store[name], pop_columns)
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+
+
+def export_csv(store, names, dest, populations=True):
+    pop_columns = _pop_columns(store, names) if populations else []
+    with gzip.open(dest, "wt", newline="") as f:
+        for i, name in enumerate(names):
+            _model_frame(name, store[name], pop_columns).to_csv(f, header=(i == 0), index=False)
+
+
+def export_zip(store, names, dest, populations=True):
+    with zipfile.ZipFile(dest, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name in names:
+            result = store[name]
+            pop_columns = [c for c in result if c.startswith("pop")] if populations else []
+            with zf.open(f"{name}/{name}_data.csv", "w") as raw:
+                with io.TextIOWrapper(raw, encoding="utf-8", newline="") as f:
+                    _model_frame(name, result, pop_columns, with_model=False).to_csv(f, index=False)
+            for extra in ("GRAIN.DAT", "meta.json"):
+                if (result.path / extra).exists():
+                    zf.write(result.path / extra, f"{name}/{extra}")
+            for output in result.outputs.values():
+                zf.write(output.path, f"{name}/{output.path.name}")
+
+
+def export_results(store, dest, fmt="parquet", names=None, populations=True):
+    """Exporte ``names`` (par défaut tout le projet) vers ``dest`` au format ``fmt``"""
+    names = list(store) if names is None else list(names)
+    if fmt == "parquet":
+        export_parquet(store, names, dest, populations)
+    elif fmt == "csv.gz":
+        export_csv(store, names, dest, populations)
+    elif fmt == "zip":
+        export_zip(store, names, dest, populations)
+    else:
+        raise ValueError(f"Format d'export inconnu : {fmt} (formats : {', '.join(FORMATS)})")
+    return dest
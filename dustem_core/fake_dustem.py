@@ -0,0 +1,125 @@
+"""Remplaçant de dustem pour les mesures de performance
+
+Crée un faux repository dustEM (``src/dustem``, ``data/GRAIN.DAT``,
+``out/``) dont le binaire lit le GRAIN.DAT du répertoire courant, attend une
+durée choisie et écrit un ``out/SED.RES`` au format de dustEM avec le
+nombre de longueurs d'onde demandé et une colonne par population. Selon les
+mots-clés du GRAIN.DAT, il écrit aussi ``out/EXT.RES`` (``ext``) et un
+``out/DIST_<type>.RES`` par population (``temp``, un bloc par taille de
+grain). Il permet de mesurer l'application sans compiler ni attendre le code
+Fortran.
+
+Le binaire exécute ce fichier directement (``runpy``), sans importer le
+paquet : il ne dépend que de la bibliothèque standard pour que son propre
+démarrage pèse le moins possible dans les mesures.
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+GRAIN_HEADER = """# DUSTEM grain file (faux repository de mesure)
+# type  nsize  type_keywords  Mdust/MH  rho  amin  amax  alpha/a0  at  ac  gamma
+"""
+
+POP_LINE = "{type}\t10\tplaw-ed\t1.00E-03\t2.00E+00\t4.00E-08\t2.00E-05\t-3.50E+00\t1.00E-06\t5.00E-06\t1.00E+00\n"
+
+
+def write_sed(path, g0, pops, n_wl):
+    """Écrit un SED.RES factice : loi de puissance par population"""
+    wl = [10 ** (-1 + 5 * i / (n_wl - 1)) for i in range(n_wl)]
+    scales = [float(p.split()[3]) * g0 * (i + 1) * 1e-16 for i, p in enumerate(pops)]
+    types = " ".join(p.split()[0] for p in pops)
+    with open(path, "w") as f:
+        f.write("# DUSTEM SED (faux dustem)\n")
+        f.write(f"# grain types : {types}\n")
+        f.write(f"  {len(pops)}  {n_wl}\n")
+        for w in wl:
+            cols = [s * w ** -(1 + 0.1 * i) for i, s in enumerate(scales)]
+            f.write(" ".join(f"{v:.6E}" for v in [w] + cols + [sum(cols)]) + "\n")
+
+
+def write_ext(path, pops, n_wl):
+    """Écrit un EXT.RES factice : section efficace par population"""
+    wl = [10 ** (-1 + 5 * i / (n_wl - 1)) for i in range(n_wl)]
+    with open(path, "w") as f:
+        f.write("# DUSTEM EXT (faux dustem)\n")
+        f.write("# lambda (microns), sigma_ext par population (cm2/H), total\n")
+        f.write(f"  {len(pops)}  {n_wl}\n")
+        for w in wl:
+            cols = [float(p.split()[3]) * 1e-19 * w ** -(1 + 0.2 * i) for i, p in enumerate(pops)]
+            f.write(" ".join(f"{v:.6E}" for v in [w] + cols + [sum(cols)]) + "\n")
+
+
+def write_dist(path, g0, pop, n_temp=200):
+    """Écrit un DIST_<type>.RES factice : distribution de température par taille de grain"""
+    fields = pop.split()
+    nsize, amin, amax = int(fields[1]), float(fields[5]), float(fields[6])
+    with open(path, "w") as f:
+        f.write(f"# DUSTEM DIST {fields[0]} (faux dustem)\n")
+        f.write("# T (K), dP/dlnT\n")
+        for k in range(nsize):
+            a = amin * (amax / amin) ** (k / max(nsize - 1, 1))
+            t_eq = 17.5 * g0 ** (1 / 6) * (a / 1e-5) ** -0.15
+            f.write(f"# a = {a:.6E} cm\n")
+            f.write(f"  {n_temp}\n")
+            for j in range(n_temp):
+                t = 10 ** (0.5 + 3.5 * j / (n_temp - 1))
+                f.write(f"{t:.6E} {2.718281828 ** (-((t - t_eq) / (0.2 * t_eq)) ** 2):.6E}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="faux dustem")
+    parser.add_argument("--n-wl", type=int, default=800)
+    parser.add_argument("--runtime", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    lines = [ligne for ligne in open("data/GRAIN.DAT") if ligne.strip() and ligne[0] != "#"]
+    keywords, g0, pops = lines[0].lower().split(), float(lines[1].split()[0]), lines[2:]
+    if args.runtime:
+        time.sleep(args.runtime)
+    write_sed("out/SED.RES", g0, pops, args.n_wl)
+    if "ext" in keywords:
+        write_ext("out/EXT.RES", pops, args.n_wl)
+    if "temp" in keywords:
+        for pop in pops:
+            write_dist(f"out/DIST_{pop.split()[0]}.RES", g0, pop)
+    print(f"faux dustem : {len(pops)} population(s), {args.n_wl} longueurs d'onde")
+    return 0
+
+
+def make_fake_repository(root, n_wl=800, n_pops=4, runtime=0.0, keywords="sed", shared=False):
+    """Crée un faux repository dans ``root`` et renvoie son chemin
+
+    ``keywords`` est la ligne de mots-clés du GRAIN.DAT (``"sed ext temp"``
+    pour produire aussi les autres fichiers de sortie). Avec ``shared=True``,
+    le binaire contient le chemin absolu du repository et y lit ses fichiers,
+    comme un dustem compilé sans ``data_path='./'`` (mode partagé).
+    """
+    root = Path(root).resolve()
+    for sub in ("src", "data", "out"):
+        (root / sub).mkdir(parents=True, exist_ok=True)
+
+    binary = root / "src" / "dustem"
+    with open(binary, "w") as f:
+        f.write(f"#!{sys.executable}\n")
+        f.write("import os, runpy, sys\n")
+        if shared:
+            f.write(f"os.chdir({str(root) + '/'!r})\n")
+        f.write(f"sys.argv[1:] = ['--n-wl', '{n_wl}', '--runtime', '{runtime}']\n")
+        f.write(f"runpy.run_path({str(Path(__file__).resolve())!r}, run_name='__main__')\n")
+    os.chmod(binary, 0o755)
+
+    with open(root / "data" / "GRAIN.DAT", "w") as f:
+        f.write(GRAIN_HEADER)
+        f.write(f"{keywords}\n1.00E+00\n")
+        for i in range(n_pops):
+            f.write(POP_LINE.format(type=f"POP{i + 1}"))
+    with open(root / "data" / "LAMBDA.DAT", "w") as f:
+        f.write(f"# grille factice\n{n_wl}\n")
+    return root
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""Lecture et écriture des fichiers GRAIN.DAT de dustEM"""
+
+
+def write_grain(template, grain_dict, dest=None):
+    """Écrit un GRAIN.DAT à partir d'un modèle et des lignes du dictionnaire
+
+    Les lignes de commentaire (``#``) et la ligne des mots-clés d'exécution
+    (``s...``) du fichier ``template`` sont conservées, puis les lignes du
+    dictionnaire (G0 puis populations) sont ajoutées. Le résultat est écrit
+    dans ``dest`` (par défaut, le modèle lui-même est réécrit).
+    """
+    nouvelles_lignes = []
+
+    with open(template, "r") as f:
+        lignes = f.readlines()
+
+    for ligne in lignes:
+        if ligne[0] == "#":
+            nouvelles_lignes.append(ligne)
+        elif ligne[0] == "s":
+            nouvelles_lignes.append(ligne)
+
+    for i in grain_dict:
+        if i == "G0":
+            nouvelles_lignes.append(grain_dict["G0"])
+        else:
+            nouvelles_lignes.append(grain_dict[i])
+
+    with open(dest if dest is not None else template, "w") as f:
+        f.writelines(nouvelles_lignes)
+
+
+# Champs d'une ligne de population, dans l'ordre de GRAIN.DAT
+POP_FIELDS = (
+    "grain_type", "nsize", "type_keyword", "mdust_mh", "rho",
+    "amin", "amax", "alpha_a0", "at", "ac", "gamma",
+)
+
+
+# Paramètres facultatifs d'une ligne de population, dans l'ordre où dustEM
+# les lit après alpha/a0, selon les mots-clés du type (``mix-logn``, ``plaw-ed-cv``...)
+OPTIONAL_FIELDS = (("logn", ("sigma",)), ("ed", ("at", "ac", "gamma")), ("cv", ("au", "zeta", "eta")))
+
+
+def pop_fields(type_keyword):
+    """Noms des champs d'une ligne de population de ce type, dans l'ordre des colonnes"""
+    keywords = type_keyword.lower().split("-")
+    fields = list(POP_FIELDS[:8])
+    for keyword, names in OPTIONAL_FIELDS:
+        if keyword in keywords:
+            fields += names
+    return fields
+
+
+def build_pop_line(pop):
+    """Construit la ligne GRAIN.DAT d'une population à partir de ses champs"""
+    fields = [pop[k] for k in POP_FIELDS[:8]]
+    type_keyword = pop["type_keyword"]
+    if "ed" in type_keyword:
+        fields += [pop["at"], pop["ac"], pop["gamma"]]
+    elif "chrg" not in type_keyword:
+        # Pour logn ou plaw simple
+        fields.append("1.00E+00")
+    return "\t".join(str(f) for f in fields) + "\n"
+
+
+def parse_pop_line(line):
+    """Découpe une ligne de population GRAIN.DAT en dictionnaire de champs"""
+    tokens = line.split()
+    if len(tokens) < 8:
+        raise ValueError(f"Ligne de population incomplète : {line.strip()!r}")
+    pop = dict(zip(POP_FIELDS[:8], tokens[:8]))
+    if "ed" in pop["type_keyword"] and len(tokens) >= 11:
+        pop.update(zip(POP_FIELDS[8:], tokens[8:11]))
+    return pop
+
+
+def build_config(g0, pops):
+    """Construit un dictionnaire de test (format ``dict_ligne``)"""
+    config = {"G0": f"{g0}\n"}
+    for idx, pop in enumerate(pops, start=1):
+        config[f"pop{idx}"] = build_pop_line(pop)
+    return config
+
+
+def parse_config(config):
+    """Inverse de :func:`build_config` : renvoie (G0, liste des populations)"""
+    g0 = config["G0"].strip()
+    pops = [parse_pop_line(config[k]) for k in config if k != "G0"]
+    return g0, pops
+
+
+def grain_types(config):
+    """Types de grains d'un dictionnaire de test, dans l'ordre des populations"""
+    return [pop["grain_type"] for pop in parse_config(config)[1]]
+
+
+class GrainFile:
+    """GRAIN.DAT structuré, réécrit à l'identique
+
+    ``config`` contient les lignes du test (format ``dict_ligne`` : G0 puis
+    populations) et ``layout`` la suite des lignes du fichier : ``("line",
+    texte)`` pour une ligne conservée telle quelle (commentaire ``#``, mots-clés
+    d'exécution ``s...``, ligne vide) et ``("config", clé)`` pour une ligne du
+    test. Une population ajoutée au test est écrite après la dernière ligne du
+    test ; une population retirée disparaît du fichier.
+    """
+
+    def __init__(self, config, layout=None):
+        self.config = dict(config)
+        self.layout = list(layout) if layout is not None else [("config", key) for key in self.config]
+
+    @classmethod
+    def from_template(cls, template, config):
+        """Commentaires et mots-clés de ``template`` suivis des lignes de ``config`` (cf. :func:`write_grain`)"""
+        with open(template, "r", newline="") as f:
+            layout = [("line", ligne) for ligne in f if ligne[:1] in ("#", "s")]
+        return cls(config, layout + [("config", key) for key in config])
+
+    def lines(self):
+        """Lignes conservées (commentaires, mots-clés, lignes vides)"""
+        return [text for kind, text in self.layout if kind == "line"]
+
+    @property
+    def keywords(self):
+        """Lignes de mots-clés d'exécution (``s...``)"""
+        return [ligne for ligne in self.lines() if ligne[:1] == "s"]
+
+    @property
+    def comments(self):
+        return [ligne for ligne in self.lines() if ligne[:1] == "#"]
+
+    @property
+    def g0(self):
+        return parse_config(self.config)[0]
+
+    @property
+    def populations(self):
+        """Champs de chaque population (cf. :data:`POP_FIELDS`)"""
+        return parse_config(self.config)[1]
+
+    def text(self):
+        keys = [text for kind, text in self.layout if kind == "config"]
+        extra = [key for key in self.config if key not in keys]
+        lignes = []
+        for kind, text in self.layout:
+            if kind == "line":
+                lignes.append(text)
+                continue
+            if text in self.config:
+                lignes.append(self.config[text])
+            if text == keys[-1]:
+                lignes += [self.config[key] for key in extra]
+                extra = []
+        lignes += [self.config[key] for key in extra]
+        # La dernière ligne du fichier d'origine peut être sans fin de ligne
+        return "".join(
+            ligne if ligne.endswith("\n") or i == len(lignes) - 1 else ligne + "\n"
+            for i, ligne in enumerate(lignes)
+        )
+
+    def write(self, dest):
+        with open(dest, "w", newline="") as f:
+            f.write(self.text())
+
+
+def _read_text(path):
+    with open(path, "r", newline="") as f:
+        return f.read()
+
+
+def parse_grain(text):
+    """Analyse le texte d'un GRAIN.DAT en :class:`GrainFile`
+
+    La première ligne de données est G0, les suivantes les populations
+    (``pop1``, ``pop2``...). Les lignes sont gardées avec leurs fins de ligne
+    et leurs espacements : ``parse_grain(text).text() == text``.
+    """
+    config = {}
+    layout = []
+    for ligne in text.splitlines(keepends=True):
+        if ligne[:1] in ("#", "s") or not ligne.strip():
+            layout.append(("line", ligne))
+            continue
+        key = "G0" if not config else f"pop{len(config)}"
+        if key != "G0":
+            parse_pop_line(ligne)
+        config[key] = ligne
+        layout.append(("config", key))
+    if "G0" not in config:
+        raise ValueError("GRAIN.DAT sans ligne G0")
+    return GrainFile(config, layout)
+
+
+def read_grain(path):
+    """Lit un fichier GRAIN.DAT (cf. :func:`parse_grain`)"""
+    return parse_grain(_read_text(path))
@@ -0,0 +1,653 @@
+"""Exécutions de dustem en tâche de fond
+
+Chaque :class:`Job` tourne dans son propre thread : il prépare un espace de
+travail isolé, lance dustem, lit ses sorties au fil de l'eau (consultables à
+tout moment par l'interface), applique un délai maximal et peut être annulé.
+L'arrêt envoie SIGTERM au groupe de processus puis SIGKILL s'il ne se
+termine pas. Les mesures de l'exécution (:attr:`Job.metrics`) sont écrites
+dans le fichier de mesures à la fin de la tâche.
+
+:class:`JobManager` est le planificateur commun à toutes les sessions : au
+plus ``max_running`` tâches tournent à la fois (``$DUSTEM_MAX_JOBS``, par
+défaut le nombre de processeurs) ; les autres attendent dans une file
+servie par priorité décroissante puis, à priorité égale, à tour de rôle
+entre utilisateurs. Chaque soumission est une :class:`JobRequest` ; deux
+demandes du même modèle (même clé de cache) en attente ou en cours
+partagent une seule exécution et reçoivent le même résultat.
+
+Les tâches en attente peuvent aussi être confiées à des travailleurs
+distants (cf. :mod:`dustem_core.remote`) : :meth:`JobManager.lease` leur
+remet les prochaines tâches de la file dont le build dustem est identique
+au leur, ils signalent leur activité par :meth:`JobManager.heartbeat` et
+rendent le résultat par :meth:`JobManager.complete`. Une tâche dont le
+travailleur ne donne plus signe de vie est remise en file
+(:meth:`JobManager.expire`).
+"""
+import copy
+import itertools
+import os
+import signal
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import ExitStack
+
+from .cache import build_id
+from .grain import grain_types
+from .metrics import RunMetrics
+from .outputs import copy_staged, discard_outputs, stage_outputs
+from .readers import read_sed
+from .workspace import RunWorkspace
+
+QUEUED = "en attente"
+RUNNING = "en cours"
+DONE = "terminé"
+FAILED = "échec"
+CANCELLED = "annulé"
+TIMEOUT = "délai dépassé"
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED, TIMEOUT)
+
+# Nombre maximal de lignes de sortie conservées par flux
+MAX_OUTPUT_LINES = 5000
+
+# Délai laissé au processus entre SIGTERM et SIGKILL
+KILL_GRACE = 5.0
+
+# Priorités proposées par l'interface
+PRIORITIES = {"basse": -1, "normale": 0, "haute": 1}
+
+# Travailleurs distants : délai sans signe de vie avant de remettre une
+# tâche en file, et nombre maximal de tentatives d'une tâche
+LEASE_TIMEOUT = 30.0
+MAX_ATTEMPTS = 3
+
+# Durée de validité des identifiants de build calculés pour les travailleurs
+BUILD_TTL = 30.0
+
+
+def default_max_running():
+    """Nombre maximal de tâches locales simultanées (``$DUSTEM_MAX_JOBS`` ou nombre de processeurs)
+
+    ``DUSTEM_MAX_JOBS=0`` réserve les tâches aux travailleurs distants.
+    """
+    if os.environ.get("DUSTEM_MAX_JOBS"):
+        return max(0, int(os.environ["DUSTEM_MAX_JOBS"]))
+    return os.cpu_count() or 1
+
+
+class Job:
+    """Exécution d'un modèle en tâche de fond
+
+    ``requests`` liste les demandes (:class:`JobRequest`) servies par cette
+    exécution ; ``on_finish(request, workspace)`` de chacune est appelé
+    dans le thread de la tâche, avant la suppression de l'espace de travail
+    (``workspace`` vaut ``None`` pour une exécution distante). ``worker``
+    est le nom du travailleur distant qui exécute la tâche, le cas échéant.
+    ``outputs`` est le dossier où sont mis de côté les autres fichiers de
+    sortie quand une demande les réclame (``keep_outputs``), jusqu'à la fin
+    de la tâche.
+    """
+
+    def __init__(self, job_id, name, config, repository, timeout=None, key=None, on_done=None):
+        self.id = job_id
+        self.name = name
+        self.config = config
+        self.repository = repository
+        self.timeout = timeout
+        self.key = key
+        self.on_done = on_done
+        self.requests = []
+        self.state = QUEUED
+        self.result = None
+        self.outputs = None
+        self.error = None
+        self.returncode = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.metrics = RunMetrics(name, self.submitted)
+        self.worker = None
+        self.lease = None
+        self.heartbeat = None
+        self.attempts = 0
+        self._stdout = deque(maxlen=MAX_OUTPUT_LINES)
+        self._stderr = deque(maxlen=MAX_OUTPUT_LINES)
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"dustem-job-{job_id}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    @property
+    def live_requests(self):
+        return [r for r in self.requests if not r.cancelled]
+
+    @property
+    def user(self):
+        live = self.live_requests or self.requests
+        return live[0].user if live else None
+
+    @property
+    def priority(self):
+        return max((r.priority for r in self.live_requests), default=0)
+
+    def cancel(self):
+        """Demande l'arrêt du processus (sans attendre)"""
+        self._cancel.set()
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.state in FINISHED_STATES
+
+    @property
+    def finished_ok(self):
+        return self.state == DONE
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def stdout(self):
+        with self._lock:
+            return "".join(self._stdout)
+
+    @property
+    def stderr(self):
+        with self._lock:
+            return "".join(self._stderr)
+
+    def _pump(self, stream, buffer):
+        for ligne in stream:
+            with self._lock:
+                buffer.append(ligne)
+        stream.close()
+
+    def _stop(self, workspace, proc):
+        """Arrête le groupe de processus : SIGTERM puis SIGKILL"""
+        try:
+            os.killpg(proc.pid, signal.SIGTERM)
+            workspace.wait(proc, KILL_GRACE)
+        except ProcessLookupError:
+            return
+        except Exception:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            workspace.wait(proc)
+
+    def _run(self):
+        metrics = self.metrics
+        metrics.start()
+        try:
+            with ExitStack() as stack:
+                with metrics.stage("workspace"):
+                    workspace = stack.enter_context(RunWorkspace(self.repository))
+                if self._cancel.is_set():
+                    self.state = CANCELLED
+                    return
+                with metrics.stage("config"):
+                    workspace.write_grain(self.config)
+                proc = workspace.popen()
+                self.started = time.time()
+                self.state = RUNNING
+                pumps = [
+                    threading.Thread(target=self._pump, args=(proc.stdout, self._stdout), daemon=True),
+                    threading.Thread(target=self._pump, args=(proc.stderr, self._stderr), daemon=True),
+                ]
+                for pump in pumps:
+                    pump.start()
+
+                deadline = self.started + self.timeout if self.timeout else None
+                while workspace.poll(proc) is None:
+                    if self._cancel.is_set():
+                        self._stop(workspace, proc)
+                        self.state = CANCELLED
+                        break
+                    if deadline is not None and time.time() > deadline:
+                        self._stop(workspace, proc)
+                        self.state = TIMEOUT
+                        self.error = f"délai maximal de {self.timeout:.0f} s dépassé"
+                        break
+                    time.sleep(0.1)
+                for pump in pumps:
+                    pump.join()
+                self.returncode = metrics.returncode = proc.returncode
+                metrics.add("process", time.time() - self.started)
+                metrics.record_usage(workspace.usage)
+
+                if self.state == RUNNING:
+                    if proc.returncode == 0:
+                        with metrics.stage("parse"):
+                            self.result = read_sed(workspace.sed_file, grain_types(self.config), sidecar=False)
+                        if any(r.keep_outputs for r in self.live_requests):
+                            self.outputs = stage_outputs(workspace)
+                        self.state = DONE
+                    else:
+                        self.state = FAILED
+                        self.error = self.stderr or f"code de retour {proc.returncode}"
+                self._notify(workspace)
+        except Exception as e:
+            self.state = FAILED
+            self.error = str(e)
+        finally:
+            self._close()
+
+    def _notify(self, workspace):
+        errors = []
+        for request in self.live_requests:
+            if request.on_finish is not None:
+                try:
+                    request.on_finish(request, workspace)
+                except Exception as e:
+                    errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def _close(self):
+        self.finished = time.time()
+        extra = {"worker": self.worker} if self.worker else {}
+        self.metrics.log(ok=self.state == DONE, state=self.state, **extra)
+        self._done.set()
+        try:
+            if self.on_done is not None:
+                self.on_done(self)
+        finally:
+            discard_outputs(self.outputs)
+            self.outputs = None
+
+    def start_remote(self, worker):
+        """La tâche est confiée au travailleur distant ``worker``"""
+        self.worker = worker
+        self.lease = uuid.uuid4().hex
+        self.heartbeat = self.started = time.time()
+        self.attempts += 1
+        self.metrics.start()
+        self.state = RUNNING
+
+    def requeue(self):
+        """Le travailleur distant a disparu : la tâche repasse en attente"""
+        self.worker = self.lease = self.heartbeat = self.started = None
+        self.state = QUEUED
+
+    def set_output(self, stdout, stderr):
+        """Sorties (fin des flux) transmises par le travailleur distant"""
+        with self._lock:
+            self._stdout.clear()
+            self._stdout.extend(stdout.splitlines(True))
+            self._stderr.clear()
+            self._stderr.extend(stderr.splitlines(True))
+
+    def finish_remote(self, state, result=None, error=None, returncode=None, metrics=None, stdout=None,
+                      stderr=None):
+        """Fin d'une exécution distante (appelé dans le thread du serveur)"""
+        try:
+            if stdout is not None:
+                self.set_output(stdout, stderr or "")
+            self.returncode = self.metrics.returncode = returncode
+            if metrics:
+                self.metrics.merge(metrics)
+            self.result = result
+            self.error = error
+            self.state = CANCELLED if self._cancel.is_set() and state != DONE else state
+            self._notify(None)
+        except Exception as e:
+            self.state = FAILED
+            self.error = str(e)
+        finally:
+            self._close()
+
+
+class JobRequest:
+    """Demande d'exécution d'un modèle par une session
+
+    Se lit comme la :class:`Job` qui la sert (état, sorties, mesures,
+    résultat), sous son propre nom. ``future`` reçoit le résultat au format
+    de :func:`dustem_core.runner.run_job` à la fin de l'exécution ; avec
+    ``keep_outputs``, son ``outputs`` est une copie des autres fichiers de
+    sortie, à supprimer par le destinataire.
+    """
+
+    def __init__(self, request_id, manager, job, name, config, user, priority, on_finish, keep_outputs=False):
+        self.id = request_id
+        self.manager = manager
+        self.job = job
+        self.name = name
+        self.config = config
+        self.user = user
+        self.priority = priority
+        self.on_finish = on_finish
+        self.keep_outputs = keep_outputs
+        self.cancelled = False
+        self.future = Future()
+
+    def __getattr__(self, attr):
+        # Attributs de l'exécution (sorties, résultat, durées...)
+        return getattr(self.job, attr)
+
+    @property
+    def state(self):
+        if self.cancelled:
+            return CANCELLED
+        return self.job.state
+
+    @property
+    def finished_ok(self):
+        return self.state == DONE
+
+    @property
+    def coalesced(self):
+        """Vrai si l'exécution est partagée avec d'autres demandes"""
+        return len(self.job.requests) > 1
+
+    @property
+    def position(self):
+        """Rang dans la file d'attente (1 = prochaine tâche lancée), ``None`` hors file"""
+        return self.manager.position(self.job)
+
+    def cancel(self):
+        self.manager.cancel(self)
+
+    def wait(self, timeout=None):
+        try:
+            self.future.result(timeout)
+        except FutureTimeoutError:
+            return False
+        return True
+
+    def outcome(self):
+        """Résultat au format de :func:`dustem_core.runner.run_job`"""
+        metrics = copy.copy(self.job.metrics)
+        metrics.name = self.name
+        metrics.stages = dict(metrics.stages)
+        ok = self.state == DONE
+        return {
+            "name": self.name, "config": self.config, "data": self.job.result if ok else None,
+            "error": None if ok else (self.job.error or self.state), "cached": False, "derived": None,
+            "metrics": metrics, "returncode": self.job.returncode, "stdout": self.job.stdout,
+            "stderr": self.job.stderr, "logged": True,
+            "outputs": copy_staged(self.job.outputs) if ok and self.keep_outputs else None,
+        }
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(self.outcome())
+
+
+class SchedulerExecutor:
+    """Soumission des modèles d'un lot au planificateur (cf. ``runner.run_batch``)"""
+
+    def __init__(self, manager, user=None, priority=0):
+        self.manager = manager
+        self.user = user
+        self.priority = priority
+
+    def submit_model(self, repository, name, config, timeout=None, key=None):
+        request = self.manager.submit(
+            name, config, repository, timeout=timeout, user=self.user, priority=self.priority, key=key,
+            keep_outputs=True
+        )
+        return request.future
+
+
+class JobManager:
+    """Planificateur des tâches de fond, partagé par toutes les sessions"""
+
+    def __init__(self, max_running=None):
+        self.max_running = default_max_running() if max_running is None else max_running
+        self._requests = {}
+        self._queue = []
+        self._running = set()
+        self._leases = {}
+        self._workers = {}
+        self._builds = {}
+        self._active = {}
+        self._served = {}
+        self._tick = 0
+        self._ids = itertools.count(1)
+        self._job_ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def submit(self, name, config, repository, timeout=None, on_finish=None, user=None, priority=0, key=None,
+               keep_outputs=False):
+        """Soumet un modèle et renvoie sa :class:`JobRequest`
+
+        ``key`` (clé de cache du modèle) permet de rattacher la demande à
+        une exécution identique déjà en attente ou en cours.
+        ``on_finish(request, workspace)`` est appelé dans le thread de la
+        tâche avant la suppression de l'espace de travail. Avec
+        ``keep_outputs``, le résultat de la demande (``future``) porte aussi
+        les autres fichiers de sortie de dustem (exécutions locales).
+        """
+        with self._lock:
+            job = self._active.get(key) if key is not None else None
+            if job is not None and (job.repository != repository or job.state in FINISHED_STATES):
+                job = None
+            if job is None:
+                job = Job(next(self._job_ids), name, config, repository, timeout=timeout, key=key,
+                          on_done=self._finished)
+                self._queue.append(job)
+                if key is not None:
+                    self._active[key] = job
+            request = JobRequest(next(self._ids), self, job, name, config, user or "anonyme", priority, on_finish,
+                                 keep_outputs)
+            job.requests.append(request)
+            self._requests[request.id] = request
+            self._dispatch()
+        return request
+
+    def executor(self, user=None, priority=0):
+        """Exécuteur pour :func:`dustem_core.runner.run_batch`"""
+        return SchedulerExecutor(self, user=user, priority=priority)
+
+    def _order(self):
+        """File d'attente dans l'ordre de lancement
+
+        Priorité décroissante, puis l'utilisateur qui a le moins de tâches
+        en cours, puis celui servi le moins récemment ; ordre de soumission
+        pour un même utilisateur.
+        """
+        running = Counter(job.user for job in itertools.chain(self._running, self._leases.values()))
+        served = dict(self._served)
+        tick = self._tick
+        heads = {}
+        for job in sorted(self._queue, key=lambda j: (-j.priority, j.id)):
+            heads.setdefault(job.user, deque()).append(job)
+        order = []
+        while heads:
+            user = min(heads, key=lambda u: (-heads[u][0].priority, running[u], served.get(u, 0)))
+            job = heads[user].popleft()
+            if not heads[user]:
+                del heads[user]
+            order.append(job)
+            running[user] += 1
+            tick += 1
+            served[user] = tick
+        return order
+
+    def _dispatch(self):
+        while self._queue and len(self._running) < self.max_running:
+            job = self._order()[0]
+            self._queue.remove(job)
+            self._running.add(job)
+            self._tick += 1
+            self._served[job.user] = self._tick
+            job.start()
+
+    def _finished(self, job):
+        """Fin d'une exécution (thread de la tâche) : libère sa place et lance la suivante"""
+        with self._lock:
+            self._running.discard(job)
+            self._leases.pop(job.lease, None)
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+            self._dispatch()
+        for request in job.requests:
+            request._resolve()
+
+    def _build(self, repository):
+        now = time.time()
+        cached = self._builds.get(repository)
+        if cached is None or now - cached[0] > BUILD_TTL:
+            cached = self._builds[repository] = (now, build_id(repository))
+        return cached[1]
+
+    def lease(self, worker, build, slots):
+        """Confie au travailleur ``worker`` jusqu'à ``slots`` tâches en attente de build ``build``
+
+        Les tâches sont prises dans l'ordre de la file ; celles d'un autre
+        build (binaire ou fichiers d'entrée différents) restent en attente.
+        """
+        leased = []
+        with self._lock:
+            for job in self._order():
+                if len(leased) >= slots:
+                    break
+                try:
+                    if self._build(job.repository) != build:
+                        continue
+                except OSError:
+                    continue
+                self._queue.remove(job)
+                job.start_remote(worker)
+                self._leases[job.lease] = job
+                self._tick += 1
+                self._served[job.user] = self._tick
+                leased.append(job)
+        return leased
+
+    def heartbeat(self, worker, leases, capacity=None, build=None, address=None, outputs=None):
+        """Signe de vie d'un travailleur ; renvoie les baux à abandonner
+
+        Un bail est à abandonner s'il n'appartient plus au travailleur
+        (remis en file après une absence) ou si sa tâche a été annulée.
+        ``outputs`` associe à un bail la fin de ses sorties (stdout, stderr).
+        """
+        now = time.time()
+        cancel = []
+        with self._lock:
+            info = self._workers.setdefault(worker, {})
+            info.update(seen=now, running=len(leases))
+            if capacity is not None:
+                info.update(capacity=capacity, build=build, address=address)
+            for lease in leases:
+                job = self._leases.get(lease)
+                if job is None or job.worker != worker or job._cancel.is_set():
+                    cancel.append(lease)
+                else:
+                    job.heartbeat = now
+                    if outputs and lease in outputs:
+                        job.set_output(*outputs[lease])
+        return cancel
+
+    def leased(self, worker, lease):
+        """Tâche d'un bail en cours de ``worker``, ``None`` si le bail n'est plus valide"""
+        with self._lock:
+            job = self._leases.get(lease)
+            return job if job is not None and job.worker == worker else None
+
+    def complete(self, worker, lease, **report):
+        """Résultat d'un bail (cf. :meth:`Job.finish_remote`) ; ``None`` si le bail n'est plus valide"""
+        with self._lock:
+            job = self._leases.get(lease)
+            if job is None or job.worker != worker:
+                return None
+            del self._leases[lease]
+        job.finish_remote(**report)
+        return job
+
+    def expire(self, timeout=LEASE_TIMEOUT, max_attempts=MAX_ATTEMPTS):
+        """Remet en file les tâches dont le travailleur n'a pas donné signe de vie depuis ``timeout``
+
+        Au-delà de ``max_attempts`` tentatives, ou si plus personne
+        n'attend la tâche, elle est terminée en échec.
+        """
+        now = time.time()
+        lost = []
+        with self._lock:
+            for lease, job in list(self._leases.items()):
+                if now - job.heartbeat <= timeout:
+                    continue
+                del self._leases[lease]
+                if job.live_requests and not job._cancel.is_set() and job.attempts < max_attempts:
+                    job.requeue()
+                    self._queue.append(job)
+                else:
+                    lost.append(job)
+            for worker, info in list(self._workers.items()):
+                if now - info["seen"] > timeout:
+                    del self._workers[worker]
+            self._dispatch()
+        for job in lost:
+            error = f"travailleur {job.worker} perdu ({job.attempts} tentative(s))"
+            job.finish_remote(CANCELLED if job._cancel.is_set() else FAILED, error=error)
+
+    def workers(self):
+        """Travailleurs distants actifs : nom -> capacité, build, tâches en cours, dernier signe de vie"""
+        with self._lock:
+            return {name: dict(info) for name, info in self._workers.items()}
+
+    def position(self, job):
+        with self._lock:
+            if job not in self._queue:
+                return None
+            return self._order().index(job) + 1
+
+    def cancel(self, request):
+        """Annule une demande ; l'exécution n'est arrêtée que si plus personne ne l'attend"""
+        with self._lock:
+            request.cancelled = True
+            job = request.job
+            if job.live_requests:
+                request._resolve()
+                return
+            if job in self._queue:
+                self._queue.remove(job)
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+                job.state = CANCELLED
+                job.finished = time.time()
+                job._done.set()
+            else:
+                # Une nouvelle demande identique ne doit pas rejoindre une exécution arrêtée
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+                job.cancel()
+                return
+        for r in job.requests:
+            r._resolve()
+
+    def status(self):
+        """(tâches en cours, tâches en attente, limite)
+
+        Les tâches des travailleurs distants comptent parmi les tâches en
+        cours, et leur capacité s'ajoute à la limite locale.
+        """
+        with self._lock:
+            remote = sum(info.get("capacity") or 0 for info in self._workers.values())
+            return len(self._running) + len(self._leases), len(self._queue), self.max_running + remote
+
+    def get(self, request_id):
+        return self._requests.get(request_id)
+
+    def jobs(self, ids=None):
+        with self._lock:
+            if ids is None:
+                return list(self._requests.values())
+            return [self._requests[i] for i in ids if i in self._requests]
+
+    def forget(self, request_id):
+        """Retire une demande terminée du registre"""
+        with self._lock:
+            request = self._requests.get(request_id)
+            if request is not None and request.state in FINISHED_STATES:
+                del self._requests[request_id]
@@ -0,0 +1,211 @@
+"""Journal des lots : reprise d'un balayage interrompu
+
+Chaque lot enregistré dans un projet (balayage de l'application, commandes
+``run`` et ``refine``) est inscrit dans un journal SQLite en mode WAL
+(``$DUSTEM_JOURNAL``, par défaut ``~/.local/state/dustem_app/journal.sqlite``)
+avec chacun de ses modèles et son état : ``queued``, ``running``, ``done`` ou
+``failed``. Un modèle ne passe à ``done`` qu'une fois son résultat enregistré
+dans le stockage, lui-même écrit sous un nom temporaire puis renommé.
+
+Un lot appartient au processus qui l'exécute (pid et machine). Un lot non
+terminé dont le processus a disparu (arrêt du serveur, redémarrage de la
+machine) ou qui a été abandonné est « interrompu » : :func:`dustem_core.api.resume_batch`
+ne relance que ses modèles non terminés.
+"""
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+STATES = (QUEUED, RUNNING, DONE, FAILED)
+UNFINISHED_STATES = (QUEUED, RUNNING)
+
+
+def default_journal_file():
+    if os.environ.get("DUSTEM_JOURNAL"):
+        return Path(os.environ["DUSTEM_JOURNAL"])
+    base = os.environ.get("XDG_STATE_HOME") or Path.home() / ".local" / "state"
+    return Path(base) / "dustem_app" / "journal.sqlite"
+
+
+def new_batch_id():
+    """Identifiant de lot : date et suffixe aléatoire (``20261017-2215-1a2b3c``)"""
+    return time.strftime("%Y%m%d-%H%M") + "-" + uuid.uuid4().hex[:6]
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Journal:
+    """Lots et états de leurs modèles, partagés entre processus"""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else default_journal_file()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS batches ("
+                "batch_id TEXT PRIMARY KEY, kind TEXT, project TEXT, store_root TEXT, repository TEXT, "
+                "params TEXT, host TEXT, pid INTEGER, created REAL, finished REAL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "batch_id TEXT, name TEXT, config TEXT, state TEXT, error TEXT, updated REAL, "
+                "PRIMARY KEY (batch_id, name))"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def create(self, jobs, kind="batch", project=None, store_root=None, repository=None, params=None,
+               batch_id=None):
+        """Inscrit un lot et ses couples (nom, config) à l'état ``queued``
+
+        Le lot appartient au processus appelant jusqu'à :meth:`release`.
+        Renvoie son identifiant.
+        """
+        batch_id = batch_id or new_batch_id()
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO batches (batch_id, kind, project, store_root, repository, params, host, pid, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (batch_id, kind, project, str(store_root) if store_root else None,
+                 str(repository) if repository else None, json.dumps(params or {}),
+                 socket.gethostname(), os.getpid(), now),
+            )
+            db.executemany(
+                "INSERT OR IGNORE INTO jobs (batch_id, name, config, state, updated) VALUES (?, ?, ?, ?, ?)",
+                [(batch_id, name, json.dumps(config), QUEUED, now) for name, config in jobs],
+            )
+        return batch_id
+
+    def claim(self, batch_id):
+        """Le processus appelant reprend un lot interrompu"""
+        with self._connect() as db:
+            db.execute(
+                "UPDATE batches SET host = ?, pid = ?, finished = NULL WHERE batch_id = ?",
+                (socket.gethostname(), os.getpid(), batch_id),
+            )
+
+    def mark(self, batch_id, name, state, error=None, config=None):
+        """Nouvel état d'un modèle (ajouté au lot s'il n'y figure pas, avec ``config``)"""
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs (batch_id, name, config, state, error, updated) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(batch_id, name) DO UPDATE SET state = excluded.state, error = excluded.error, "
+                "updated = excluded.updated",
+                (batch_id, name, json.dumps(config), state, error, time.time()),
+            )
+
+    def release(self, batch_id):
+        """Fin d'exécution d'un lot : terminé s'il ne reste aucun modèle à faire, interrompu sinon"""
+        with self._connect() as db:
+            left = db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE batch_id = ? AND state IN (?, ?)", (batch_id, *UNFINISHED_STATES)
+            ).fetchone()[0]
+            db.execute(
+                "UPDATE batches SET pid = NULL, finished = ? WHERE batch_id = ?",
+                (None if left else time.time(), batch_id),
+            )
+
+    def finish(self, batch_id):
+        """Déclare un lot terminé même s'il reste des modèles (abandon)"""
+        with self._connect() as db:
+            db.execute("UPDATE batches SET pid = NULL, finished = ? WHERE batch_id = ?", (time.time(), batch_id))
+
+    def forget(self, batch_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM jobs WHERE batch_id = ?", (batch_id,))
+            db.execute("DELETE FROM batches WHERE batch_id = ?", (batch_id,))
+
+    def batch(self, batch_id):
+        """Description d'un lot avec le nombre de modèles par état (``KeyError`` s'il n'existe pas)"""
+        batches = self.batches(batch_id=batch_id)
+        if not batches:
+            raise KeyError(batch_id)
+        return batches[0]
+
+    def batches(self, project=None, batch_id=None, unfinished=False):
+        """Lots du journal, plus récents d'abord
+
+        Chaque lot est un dictionnaire : colonnes de la table, ``params``
+        décodés, ``counts`` (modèles par état), ``interrupted``. Avec
+        ``unfinished``, seuls les lots non terminés sont lus. Les comptes de
+        tous les lots sont obtenus en une seule requête.
+        """
+        query = "SELECT * FROM batches"
+        conditions, values = [], []
+        if project is not None:
+            conditions.append("project = ?")
+            values.append(project)
+        if batch_id is not None:
+            conditions.append("batch_id = ?")
+            values.append(batch_id)
+        if unfinished:
+            conditions.append("finished IS NULL")
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._connect() as db:
+            db.row_factory = sqlite3.Row
+            rows = [dict(row) for row in db.execute(query + " ORDER BY created DESC", values)]
+            counts = {}
+            if rows:
+                for batch, state, count in db.execute(
+                    "SELECT batch_id, state, COUNT(*) FROM jobs "
+                    f"WHERE batch_id IN (SELECT batch_id FROM ({query})) GROUP BY batch_id, state",
+                    values,
+                ):
+                    counts.setdefault(batch, {})[state] = count
+        for row in rows:
+            row["params"] = json.loads(row["params"])
+            row["counts"] = dict.fromkeys(STATES, 0)
+            row["counts"].update(counts.get(row["batch_id"], {}))
+            row["interrupted"] = self._interrupted(row)
+        return rows
+
+    def _interrupted(self, batch):
+        if batch["finished"] is not None:
+            return False
+        if batch["pid"] is None:
+            return True
+        # Processus propriétaire disparu ; sur une autre machine, on ne peut pas savoir
+        return batch["host"] == socket.gethostname() and not _process_alive(batch["pid"])
+
+    def interrupted(self, project=None):
+        """Lots interrompus à reprendre"""
+        return [batch for batch in self.batches(project, unfinished=True) if batch["interrupted"]]
+
+    def jobs(self, batch_id, states=None):
+        """Modèles d'un lot : liste de dictionnaires ``name``, ``config``, ``state``, ``error``"""
+        query = "SELECT name, config, state, error FROM jobs WHERE batch_id = ?"
+        values = [batch_id]
+        if states is not None:
+            query += f" AND state IN ({', '.join('?' * len(states))})"
+            values += list(states)
+        with self._connect() as db:
+            rows = db.execute(query + " ORDER BY rowid", values).fetchall()
+        return [
+            {"name": name, "config": json.loads(config), "state": state, "error": error}
+            for name, config, state, error in rows
+        ]
+
+    def unfinished(self, batch_id, retry_failed=False):
+        """Couples (nom, config) restant à exécuter"""
+        states = UNFINISHED_STATES + ((FAILED,) if retry_failed else ())
+        return [(job["name"], job["config"]) for job in self.jobs(batch_id, states)]
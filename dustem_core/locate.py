@@ -0,0 +1,146 @@
+"""Localisation du binaire dustem sans parcourir tout le répertoire personnel
+
+Ordre de recherche, chaque candidat étant vérifié par un simple ``stat`` :
+
+1. variable d'environnement ``DUSTEM_BINARY`` (chemin du binaire) ou
+   ``DUSTEM_REPOSITORY`` (racine du repository, binaire dans ``src/``) ;
+2. fichier de configuration ``~/.config/dustem_app/paths.json`` (ou
+   ``$DUSTEM_APP_CONFIG``), écrit dès qu'un emplacement est trouvé ;
+3. emplacement d'installation par défaut de ``dowload_dustem.sh``
+   (``dustEM_repos/`` à côté de l'application).
+
+Le parcours du disque n'a lieu que sur demande explicite (:func:`scan`) : il
+est borné en profondeur et en durée et liste les dossiers en parallèle.
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+# Dossiers jamais parcourus lors d'une recherche
+SKIPPED_DIRS = {"node_modules", "__pycache__", "site-packages", "env_dustEM", "venv", "proc", "sys"}
+
+
+def config_file():
+    """Chemin du fichier de configuration des emplacements"""
+    if os.environ.get("DUSTEM_APP_CONFIG"):
+        return Path(os.environ["DUSTEM_APP_CONFIG"])
+    base = os.environ.get("XDG_CONFIG_HOME") or Path.home() / ".config"
+    return Path(base) / "dustem_app" / "paths.json"
+
+
+def load_config():
+    try:
+        with open(config_file(), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_config(**values):
+    """Met à jour le fichier de configuration (écriture atomique)"""
+    path = config_file()
+    config = load_config()
+    config.update({k: str(v) for k, v in values.items()})
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(config, f, indent=1)
+    os.replace(tmp, path)
+
+
+def is_dustem_binary(path):
+    """Vérification peu coûteuse : fichier exécutable existant"""
+    return path is not None and os.path.isfile(path) and os.access(path, os.X_OK)
+
+
+def _candidates():
+    if os.environ.get("DUSTEM_BINARY"):
+        yield Path(os.environ["DUSTEM_BINARY"])
+    if os.environ.get("DUSTEM_REPOSITORY"):
+        yield Path(os.environ["DUSTEM_REPOSITORY"]) / "src" / "dustem"
+    config = load_config()
+    if config.get("dustem_binary"):
+        yield Path(config["dustem_binary"])
+    yield APP_DIR / "dustEM_repos" / "src" / "dustem"
+
+
+def locate_dustem():
+    """Renvoie (dossier src, racine du repository) ou lève FileNotFoundError
+
+    Même convention que l'ancienne fonction ``get_path`` de l'application.
+    """
+    for binary in _candidates():
+        if is_dustem_binary(binary):
+            binary = binary.resolve()
+            if load_config().get("dustem_binary") != str(binary):
+                save_config(dustem_binary=binary)
+            return binary.parent, binary.parent.parent
+    raise FileNotFoundError("dustem non trouvé (DUSTEM_BINARY, DUSTEM_REPOSITORY ou configuration)")
+
+
+def remember_repository(repository):
+    """Enregistre un repository choisi par l'utilisateur ; renvoie le binaire"""
+    binary = Path(repository).expanduser().resolve() / "src" / "dustem"
+    if not is_dustem_binary(binary):
+        raise FileNotFoundError(f"{binary} n'existe pas ou n'est pas exécutable")
+    save_config(dustem_binary=binary)
+    return binary
+
+
+def _list_dir(path, name, deadline):
+    """Renvoie (sous-dossiers, correspondances) d'un dossier"""
+    subdirs, matches = [], []
+    if time.monotonic() > deadline:
+        return subdirs, matches
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith(".") and entry.name not in SKIPPED_DIRS:
+                            subdirs.append(entry.path)
+                    elif entry.name == name and is_dustem_binary(entry.path):
+                        matches.append(Path(entry.path))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return subdirs, matches
+
+
+def scan(name="dustem", roots=None, max_depth=6, timeout=30.0, workers=8):
+    """Recherche bornée et parallèle d'un exécutable ``name``
+
+    Parcours en largeur, niveau par niveau, depuis ``roots`` (par défaut le
+    répertoire personnel) ; chaque niveau est listé par ``workers`` threads.
+    S'arrête au premier niveau contenant une correspondance, à
+    ``max_depth`` ou après ``timeout`` secondes. Renvoie la liste des
+    correspondances (vide si rien n'est trouvé).
+    """
+    deadline = time.monotonic() + timeout
+    level = [str(r) for r in (roots or [Path.home()])]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for _ in range(max_depth + 1):
+            if not level or time.monotonic() > deadline:
+                break
+            next_level, matches = [], []
+            for subdirs, found in pool.map(lambda p: _list_dir(p, name, deadline), level):
+                next_level.extend(subdirs)
+                matches.extend(found)
+            if matches:
+                return sorted(matches)
+            level = next_level
+    return []
+
+
+def scan_and_remember(**kwargs):
+    """Lance :func:`scan` et enregistre le premier binaire trouvé"""
+    matches = scan(**kwargs)
+    if not matches:
+        raise FileNotFoundError("dustem non trouvé lors de la recherche")
+    save_config(dustem_binary=matches[0].resolve())
+    return locate_dustem()
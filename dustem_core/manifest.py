@@ -0,0 +1,259 @@
+"""Manifestes de modèles pour les exécutions par lot
+
+Un manifeste décrit une liste de modèles. Chaque modèle a un ``name`` et,
+au choix :
+
+- ``config`` : dictionnaire au format ``dict_ligne`` (lignes GRAIN.DAT) ;
+- ``G0`` et ``populations`` : liste de dictionnaires de champs (cf.
+  :data:`dustem_core.grain.POP_FIELDS`).
+
+Formats, reconnus à l'extension :
+
+- ``.json`` : liste de modèles (ou objet ``{"models": [...]}``) ;
+- ``.jsonl`` : un modèle JSON par ligne ;
+- ``.yaml`` / ``.yml`` : même structure que le JSON (PyYAML) ;
+- ``.csv`` : une ligne par modèle, colonnes ``name``, ``G0`` et
+  ``pop<i>.<champ>`` (mêmes clés que les axes d'un balayage), ou ``pop<i>``
+  pour la ligne GRAIN.DAT complète d'une population ; une population dont
+  toutes les colonnes sont vides est absente du modèle ;
+- ``.dat`` (ou ``GRAIN.DAT``) : un fichier GRAIN.DAT, un seul modèle nommé
+  d'après le fichier (ou son dossier pour ``<modèle>/GRAIN.DAT``).
+
+Chaque modèle lu est vérifié (:func:`check_config`) : G0 numérique et au
+moins une population complète, sinon ``ValueError``.
+
+Exemple JSON::
+
+    [{"name": "g0_1e4", "G0": 1e4,
+      "populations": [{"grain_type": "CM20", "nsize": 25, "type_keyword": "plaw-ed",
+                       "mdust_mh": 1.7e-3, "rho": 1.6, "amin": 4e-8, "amax": 4.9e-4,
+                       "alpha_a0": -5, "at": 1e-6, "ac": 5e-6, "gamma": 1}]}]
+
+Les formats CSV et JSON Lines sont lus et écrits en flux : :func:`iter_manifest`
+produit les modèles un à un, sans charger le fichier en mémoire. À l'écriture,
+un modèle dont les lignes ne se reconstruisent pas à l'identique à partir de
+ses champs (espacements, valeurs au-delà des champs connus d'un GRAIN.DAT
+d'origine) est écrit sous forme ``config`` en JSON et YAML, et par lignes
+complètes (colonnes ``pop<i>``) en CSV.
+"""
+import csv
+import io
+import json
+from contextlib import contextmanager
+from pathlib import Path
+
+from .grain import POP_FIELDS, build_config, build_pop_line, parse_config, parse_grain
+
+FORMATS = ("csv", "json", "jsonl", "yaml")
+
+SUFFIXES = {".csv": "csv", ".json": "json", ".jsonl": "jsonl", ".yaml": "yaml", ".yml": "yaml", ".dat": "grain"}
+
+
+def manifest_format(name):
+    """Format d'un manifeste d'après son nom de fichier"""
+    path = Path(str(name))
+    if path.name.upper() == "GRAIN.DAT":
+        return "grain"
+    try:
+        return SUFFIXES[path.suffix.lower()]
+    except KeyError:
+        raise ValueError(
+            f"Format de manifeste inconnu : {path.name!r} (extensions : {', '.join(SUFFIXES)})"
+        ) from None
+
+
+def _yaml():
+    """Module PyYAML ; ``ValueError`` explicite s'il n'est pas installé"""
+    try:
+        import yaml
+    except ImportError:
+        raise ValueError("Les manifestes YAML demandent PyYAML (pip install pyyaml)") from None
+    return yaml
+
+
+def check_config(name, config):
+    """Vérifie une configuration lue : lignes de texte, G0 numérique, au moins une population
+
+    Lève ``ValueError`` en nommant le modèle.
+    """
+    if not isinstance(config, dict) or not all(isinstance(k, str) and isinstance(v, str) for k, v in config.items()):
+        raise ValueError(f"Modèle {name!r} : config doit associer G0, pop1... à des lignes GRAIN.DAT (texte)")
+    try:
+        g0, pops = parse_config(config)
+        float(g0.split()[0])
+    except KeyError as e:
+        raise ValueError(f"Modèle {name!r} : ligne manquante {e}") from None
+    except (IndexError, ValueError) as e:
+        raise ValueError(f"Modèle {name!r} : configuration invalide ({e or 'G0 vide'})") from None
+    if not pops:
+        raise ValueError(f"Modèle {name!r} : aucune population")
+    return config
+
+
+def model_config(entry):
+    """Configuration (format ``dict_ligne``) d'une entrée de manifeste"""
+    if "config" in entry:
+        return entry["config"]
+    try:
+        if not isinstance(entry["populations"], list) or not all(isinstance(p, dict) for p in entry["populations"]):
+            raise ValueError(f"Modèle {entry.get('name', '?')!r} : populations doit être une liste de dictionnaires")
+        pops = [{k: str(v) for k, v in pop.items()} for pop in entry["populations"]]
+        return build_config(entry["G0"], pops)
+    except KeyError as e:
+        raise ValueError(f"Modèle {entry.get('name', '?')!r} : champ manquant {e}") from None
+
+
+def model_entry(name, config):
+    """Entrée de manifeste d'un modèle : champs si les lignes s'en reconstruisent à l'identique"""
+    g0, pops = parse_config(config)
+    entry = {"name": name, "G0": g0, "populations": pops}
+    if model_config(entry) != config:
+        return {"name": name, "config": config}
+    return entry
+
+
+def _grain_name(path):
+    """Nom d'un modèle lu dans un GRAIN.DAT : nom du fichier, ou de son dossier pour ``<modèle>/GRAIN.DAT``"""
+    path = Path(str(path))
+    if path.name.upper() == "GRAIN.DAT" and path.parent.name:
+        return path.parent.name
+    return path.stem
+
+
+@contextmanager
+def _open_text(source, mode="r"):
+    """Ouvre un chemin, ou enveloppe un fichier binaire (téléversement), en texte"""
+    if isinstance(source, (str, Path)):
+        with open(source, mode, encoding="utf-8", newline="") as f:
+            yield f
+    elif isinstance(source, io.TextIOBase):
+        yield source
+    else:
+        f = io.TextIOWrapper(source, encoding="utf-8", newline="")
+        try:
+            yield f
+        finally:
+            f.flush()
+            f.detach()
+
+
+def _csv_entry(row, i):
+    """Entrée de manifeste d'une ligne CSV (colonnes ``pop<i>.<champ>`` ou ``pop<i>``)"""
+    if not (row.get("G0") or "").strip():
+        raise ValueError(f"Ligne {i + 2} : G0 manquant")
+    name = (row.get("name") or "").strip() or f"model_{i:04d}"
+    lines, pops = {}, {}
+    for column, value in row.items():
+        if column is None or not column.startswith("pop") or value is None or not value.strip():
+            continue
+        pop, _, field = column.partition(".")
+        if not pop[3:].isdigit() or (field and field not in POP_FIELDS):
+            raise ValueError(f"Ligne {i + 2} : colonne inconnue {column!r}")
+        if field:
+            pops.setdefault(int(pop[3:]), {})[field] = value.strip()
+        else:
+            lines[int(pop[3:])] = value.rstrip("\r\n") + "\n"
+    config = {"G0": row["G0"].rstrip("\r\n") + "\n"}
+    for idx in sorted(set(lines) | set(pops)):
+        try:
+            config[f"pop{idx}"] = lines[idx] if idx in lines else build_pop_line(pops[idx])
+        except KeyError as e:
+            raise ValueError(f"Modèle {name!r} : champ manquant {e} (pop{idx})") from None
+    return {"name": name, "config": config}
+
+
+def _entries(f, fmt):
+    if fmt == "csv":
+        try:
+            for i, row in enumerate(csv.DictReader(f)):
+                yield _csv_entry(row, i)
+        except csv.Error as e:
+            raise ValueError(f"CSV invalide : {e}") from None
+    elif fmt == "jsonl":
+        for ligne in f:
+            if ligne.strip():
+                yield json.loads(ligne)
+    else:
+        if fmt == "yaml":
+            yaml = _yaml()
+            try:
+                models = yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise ValueError(f"YAML invalide : {e}") from None
+        else:
+            models = json.load(f)
+        if isinstance(models, dict):
+            models = models.get("models")
+        if not isinstance(models, list):
+            raise ValueError("Le manifeste doit être une liste de modèles (ou {\"models\": [...]})")
+        yield from models
+
+
+def iter_manifest(source, fmt=None):
+    """Modèles d'un manifeste, un à un : couples (nom, config)
+
+    ``source`` est un chemin ou un fichier ouvert (texte ou binaire) ; le
+    format est déduit de son nom si ``fmt`` n'est pas donné.
+    """
+    fmt = fmt or manifest_format(getattr(source, "name", source))
+    with _open_text(source) as f:
+        if fmt == "grain":
+            name = _grain_name(getattr(source, "name", source))
+            yield name, check_config(name, parse_grain(f.read()).config)
+            return
+        for i, entry in enumerate(_entries(f, fmt)):
+            if not isinstance(entry, dict):
+                raise ValueError(f"Modèle {i + 1} : entrée invalide {entry!r}")
+            name = str(entry.get("name", f"model_{i:04d}"))
+            yield name, check_config(name, model_config(entry))
+
+
+def load_manifest(path, fmt=None):
+    """Lit un manifeste et renvoie une liste de couples (nom, config)"""
+    return list(iter_manifest(path, fmt))
+
+
+def _csv_columns(jobs):
+    """Colonnes du CSV : champs des populations, et lignes complètes si un modèle l'exige"""
+    n_pops, raw = 0, False
+    for name, config in jobs:
+        n_pops = max(n_pops, len(config) - 1)
+        raw = raw or "config" in model_entry(name, config)
+    columns = ["name", "G0"] + [f"pop{i}.{field}" for i in range(1, n_pops + 1) for field in POP_FIELDS]
+    return columns + ([f"pop{i}" for i in range(1, n_pops + 1)] if raw else [])
+
+
+def write_manifest(jobs, dest, fmt=None):
+    """Écrit des couples (nom, config) dans un manifeste (chemin ou fichier ouvert)
+
+    Les modèles sont écrits un à un ; en CSV, ``jobs`` est parcouru deux fois
+    (nombre de populations des colonnes, puis lignes).
+    """
+    fmt = fmt or manifest_format(getattr(dest, "name", dest))
+    if fmt not in FORMATS:
+        raise ValueError(f"Format de manifeste inconnu : {fmt!r} (formats : {', '.join(FORMATS)})")
+    with _open_text(dest, "w") as f:
+        if fmt == "csv":
+            writer = csv.DictWriter(f, fieldnames=_csv_columns(jobs), restval="")
+            writer.writeheader()
+            for name, config in jobs:
+                entry = model_entry(name, config)
+                if "config" in entry:
+                    row = {key: ligne.rstrip("\r\n") for key, ligne in config.items()}
+                else:
+                    row = {"G0": entry["G0"]}
+                    for i, pop in enumerate(entry["populations"], start=1):
+                        row.update({f"pop{i}.{field}": value for field, value in pop.items()})
+                writer.writerow(dict(row, name=name))
+        elif fmt == "jsonl":
+            for name, config in jobs:
+                f.write(json.dumps(model_entry(name, config)) + "\n")
+        elif fmt == "json":
+            f.write("[")
+            for i, (name, config) in enumerate(jobs):
+                f.write(("," if i else "") + "\n " + json.dumps(model_entry(name, config)))
+            f.write("\n]\n")
+        else:
+            yaml = _yaml()
+            for name, config in jobs:
+                yaml.safe_dump([model_entry(name, config)], f, sort_keys=False, allow_unicode=True)
@@ -0,0 +1,134 @@
+"""Matrice des SED de plusieurs modèles sur une grille de longueurs d'onde commune
+
+Les résultats sont rassemblés dans des tableaux 2-D (modèles × longueurs
+d'onde) : les comparaisons, statistiques et exports opèrent sur toute la
+matrice en une seule passe NumPy au lieu de boucler sur les modèles.
+
+Un résultat dont la grille diffère de la grille canonique est rééchantillonné
+par interpolation linéaire en log-log ; les modèles partageant une même
+grille sont interpolés ensemble (indices et poids calculés une seule fois).
+Hors de la grille source, les valeurs sont NaN.
+"""
+import numpy as np
+
+
+def loglog_resample(wl_src, values, wl_dst):
+    """Interpole ``values`` (lignes = modèles) de ``wl_src`` vers ``wl_dst`` en log-log
+
+    Les valeurs nulles ou négatives restent nulles là où elles encadrent le
+    point interpolé ; un point qui tombe exactement sur la grille source
+    reprend la valeur source.
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    x_src = np.log(np.asarray(wl_src, dtype=float))
+    x_dst = np.log(np.asarray(wl_dst, dtype=float))
+    order = np.argsort(x_src)
+    x_src = x_src[order]
+    values = values[:, order]
+
+    idx = np.clip(np.searchsorted(x_src, x_dst), 1, len(x_src) - 1)
+    w = (x_dst - x_src[idx - 1]) / (x_src[idx] - x_src[idx - 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_v = np.log(values)
+        out = np.exp(log_v[:, idx - 1] * (1 - w) + log_v[:, idx] * w)
+    out[np.isnan(out)] = 0.0
+    # Point de la grille source : pas d'interpolation (log(0) * 0 donnerait NaN)
+    on_left, on_right = w == 0, w == 1
+    out[:, on_left] = values[:, idx[on_left] - 1]
+    out[:, on_right] = values[:, idx[on_right]]
+    outside = (x_dst < x_src[0]) | (x_dst > x_src[-1])
+    out[:, outside] = np.nan
+    return out
+
+
+class SEDMatrix:
+    """SED de plusieurs modèles alignés sur une grille commune
+
+    ``wl`` est la grille canonique, ``sed_tot`` une matrice
+    (modèles × longueurs d'onde) et ``pops`` associe chaque colonne de
+    population (``pop1``...) à sa matrice, NaN pour les modèles qui n'ont
+    pas cette population.
+    """
+
+    def __init__(self, names, wl, sed_tot, pops=None):
+        self.names = list(names)
+        self.wl = wl
+        self.sed_tot = sed_tot
+        self.pops = pops or {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def rows(self):
+        """Itère sur (nom, colonnes) comme les résultats du stockage"""
+        for i, name in enumerate(self.names):
+            columns = {"wl": self.wl, "sed_tot": self.sed_tot[i]}
+            for pop, values in self.pops.items():
+                if not np.all(np.isnan(values[i])):
+                    columns[pop] = values[i]
+            yield name, columns
+
+    def peak(self):
+        """Maximum du SED total de chaque modèle"""
+        return np.nanmax(self.sed_tot, axis=1)
+
+    def table(self, populations=False):
+        """Tableau large : longueurs d'onde puis, pour chaque modèle, son SED
+        total et (si demandé) ses populations"""
+        import pandas as pd
+
+        labels = ["wavelength_um"]
+        blocks = [self.wl[:, None]]
+        pops = self.pops if populations else {}
+        present = {pop: ~np.all(np.isnan(values), axis=1) for pop, values in pops.items()}
+        for i, name in enumerate(self.names):
+            labels.append(f"{name}_SED_total")
+            blocks.append(self.sed_tot[i][:, None])
+            for pop, values in pops.items():
+                if present[pop][i]:
+                    labels.append(f"{name}_{pop}")
+                    blocks.append(values[i][:, None])
+        return pd.DataFrame(np.hstack(blocks), columns=labels)
+
+
+def _grid_key(wl):
+    return (len(wl), np.asarray(wl).tobytes())
+
+
+def sed_matrix(results, names, grid=None, populations=False):
+    """Construit la :class:`SEDMatrix` des résultats ``names``
+
+    ``results`` est un mapping nom -> colonnes (par exemple un
+    :class:`~dustem_core.store.ResultStore`). La grille canonique est
+    ``grid`` si fournie, sinon celle du premier résultat.
+    """
+    names = list(names)
+    data = [results[name] for name in names]
+    wl = np.asarray(grid if grid is not None else data[0]["wl"], dtype=float)
+
+    pop_columns = []
+    if populations:
+        pop_columns = sorted(
+            {c for d in data for c in d if c.startswith("pop")}, key=lambda c: int(c[3:])
+        )
+
+    sed_tot = np.empty((len(names), len(wl)))
+    pops = {c: np.full((len(names), len(wl)), np.nan) for c in pop_columns}
+
+    # Regroupement des modèles par grille source
+    groups = {}
+    for i, d in enumerate(data):
+        groups.setdefault(_grid_key(d["wl"]), []).append(i)
+
+    for rows in groups.values():
+        wl_src = np.asarray(data[rows[0]]["wl"], dtype=float)
+        same = len(wl_src) == len(wl) and np.array_equal(wl_src, wl)
+        columns = ["sed_tot"] + [c for c in pop_columns if any(c in data[i] for i in rows)]
+        for column in columns:
+            present = [i for i in rows if column in data[i]]
+            block = np.stack([np.asarray(data[i][column], dtype=float) for i in present])
+            if not same:
+                block = loglog_resample(wl_src, block, wl)
+            target = sed_tot if column == "sed_tot" else pops[column]
+            target[present] = block
+    return SEDMatrix(names, wl, sed_tot, pops)
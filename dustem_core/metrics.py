@@ -0,0 +1,190 @@
+"""Mesures par exécution : durées des étapes et ressources du processus dustem
+
+Chaque exécution enregistre la durée de ses étapes (espace de travail,
+écriture du GRAIN.DAT, processus, lecture de SED.RES, enregistrement), le
+temps CPU et la mémoire maximale (max RSS) du processus dustem obtenus par
+``wait4``, l'attente avant démarrage et le statut du cache. Les mesures sont
+jointes aux métadonnées du résultat, complétées par la durée de son
+graphique quand il est tracé (:class:`~dustem_core.plotting.FigureCache`),
+et ajoutées, une ligne JSON par exécution, au fichier de mesures
+(``$DUSTEM_METRICS_FILE``, par défaut
+``~/.local/state/dustem_app/metrics.jsonl``). :func:`prometheus_text`
+agrège ce fichier au format texte de Prometheus.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def default_metrics_file():
+    if os.environ.get("DUSTEM_METRICS_FILE"):
+        return Path(os.environ["DUSTEM_METRICS_FILE"])
+    base = os.environ.get("XDG_STATE_HOME") or Path.home() / ".local" / "state"
+    return Path(base) / "dustem_app" / "metrics.jsonl"
+
+
+def log_metrics(record, path=None):
+    """Ajoute un enregistrement au fichier de mesures en une seule écriture (O_APPEND)
+
+    Une erreur d'écriture n'interrompt jamais une exécution.
+    """
+    path = Path(path) if path else default_metrics_file()
+    ligne = (json.dumps(dict(record, time=record.get("time", time.time()))) + "\n").encode()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, ligne)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+def read_metrics(path=None):
+    """Itère sur les enregistrements du fichier de mesures"""
+    path = Path(path) if path else default_metrics_file()
+    if not path.exists():
+        return
+    with open(path, "r") as f:
+        for ligne in f:
+            if ligne.strip():
+                yield json.loads(ligne)
+
+
+class RunMetrics:
+    """Mesures d'une exécution
+
+    ``submitted`` est l'instant de soumission : l'attente est mesurée
+    jusqu'à l'appel de :meth:`start`. L'objet est sérialisable (pickle) pour
+    revenir des processus du pool.
+    """
+
+    def __init__(self, name=None, submitted=None):
+        self.name = name
+        self.submitted = submitted if submitted is not None else time.time()
+        self.queue_wait = None
+        self.stages = {}
+        self.cache = None
+        self.cpu_user = None
+        self.cpu_system = None
+        self.max_rss_mb = None
+        self.returncode = None
+
+    def start(self):
+        self.queue_wait = max(0.0, time.time() - self.submitted)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def record_usage(self, usage):
+        """Ressources du processus dustem (``resource.struct_rusage`` de ``wait4``)"""
+        if usage is None:
+            return
+        self.cpu_user = usage.ru_utime
+        self.cpu_system = usage.ru_stime
+        # ru_maxrss est en kilo-octets sous Linux
+        self.max_rss_mb = usage.ru_maxrss / 1024
+
+    def merge(self, record):
+        """Reprend les mesures d'une exécution distante (format :meth:`to_dict`)
+
+        L'attente reste celle mesurée localement.
+        """
+        for name, seconds in record.get("stages", {}).items():
+            self.add(name, seconds)
+        for field in ("cpu_user", "cpu_system", "max_rss_mb", "returncode"):
+            if record.get(field) is not None:
+                setattr(self, field, record[field])
+
+    @property
+    def total(self):
+        return sum(self.stages.values())
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "queue_wait": self.queue_wait,
+            "stages": dict(self.stages),
+            "cache": self.cache,
+            "cpu_user": self.cpu_user,
+            "cpu_system": self.cpu_system,
+            "max_rss_mb": self.max_rss_mb,
+            "returncode": self.returncode,
+        }
+
+    def rows(self):
+        """Lignes (mesure, valeur) lisibles pour l'interface"""
+        rows = [(f"étape : {stage}", f"{seconds * 1e3:.1f} ms") for stage, seconds in self.stages.items()]
+        if self.queue_wait is not None:
+            rows.append(("attente", f"{self.queue_wait * 1e3:.1f} ms"))
+        if self.cpu_user is not None:
+            rows.append(("CPU dustem (utilisateur / système)", f"{self.cpu_user:.2f} s / {self.cpu_system:.2f} s"))
+            rows.append(("mémoire max dustem", f"{self.max_rss_mb:.1f} Mo"))
+        rows.append(("cache", self.cache or "non utilisé"))
+        return rows
+
+    def log(self, ok=True, path=None, **extra):
+        """Écrit l'exécution dans le fichier de mesures"""
+        log_metrics(dict(self.to_dict(), event="run", ok=ok, **extra), path)
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+def prometheus_text(records):
+    """Agrège des enregistrements au format texte de Prometheus"""
+    runs = {}
+    stage_sum, stage_count = {}, {}
+    queue_sum = queue_count = 0
+    cpu = {"user": 0.0, "system": 0.0}
+    max_rss = 0.0
+    for record in records:
+        if record.get("event", "run") == "run":
+            key = (record.get("cache") or "none", "ok" if record.get("ok", True) else "failed")
+            runs[key] = runs.get(key, 0) + 1
+            if record.get("queue_wait") is not None:
+                queue_sum += record["queue_wait"]
+                queue_count += 1
+            if record.get("cpu_user") is not None:
+                cpu["user"] += record["cpu_user"]
+                cpu["system"] += record["cpu_system"]
+                max_rss = max(max_rss, record["max_rss_mb"])
+        for stage, seconds in record.get("stages", {}).items():
+            stage_sum[stage] = stage_sum.get(stage, 0.0) + seconds
+            stage_count[stage] = stage_count.get(stage, 0) + 1
+
+    lines = ["# HELP dustem_runs_total Exécutions de dustem", "# TYPE dustem_runs_total counter"]
+    for (cache, status), n in sorted(runs.items()):
+        lines.append(f"dustem_runs_total{_labels(cache=cache, status=status)} {n}")
+    lines += ["# HELP dustem_stage_seconds Durée des étapes", "# TYPE dustem_stage_seconds summary"]
+    for stage in sorted(stage_sum):
+        lines.append(f"dustem_stage_seconds_sum{_labels(stage=stage)} {stage_sum[stage]:.6f}")
+        lines.append(f"dustem_stage_seconds_count{_labels(stage=stage)} {stage_count[stage]}")
+    lines += [
+        "# HELP dustem_queue_wait_seconds Attente avant démarrage",
+        "# TYPE dustem_queue_wait_seconds summary",
+        f"dustem_queue_wait_seconds_sum {queue_sum:.6f}",
+        f"dustem_queue_wait_seconds_count {queue_count}",
+        "# HELP dustem_child_cpu_seconds_total Temps CPU des processus dustem",
+        "# TYPE dustem_child_cpu_seconds_total counter",
+    ]
+    for mode, seconds in cpu.items():
+        lines.append(f"dustem_child_cpu_seconds_total{_labels(mode=mode)} {seconds:.6f}")
+    lines += [
+        "# HELP dustem_child_max_rss_bytes Mémoire maximale d'un processus dustem",
+        "# TYPE dustem_child_max_rss_bytes gauge",
+        f"dustem_child_max_rss_bytes {int(max_rss * 1024 * 1024)}",
+    ]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,298 @@
+"""Lecture paresseuse des autres fichiers de sortie de dustEM
+
+Selon les mots-clés d'exécution du GRAIN.DAT, dustEM écrit dans ``out/``
+d'autres produits que ``SED.RES`` : extinction (``EXT.RES``), polarisation
+(``SED_POL.RES``, ``EXT_POL.RES``), distributions de tailles
+(``SDIST.RES``), distributions de température (``DIST_<type>.RES``)...
+Leur présentation suit celle de ``SED.RES`` : lignes de commentaire, lignes
+de dimensions, puis un ou plusieurs blocs numériques (un par taille de grain
+pour les distributions de température), souvent bien plus volumineux que le
+SED.
+
+Un fichier est parcouru une seule fois pour en indexer la structure : les
+commentaires et, pour chaque bloc numérique, sa position en octets, ses
+nombres de lignes et de colonnes et les lignes de dimensions qui le
+précèdent. L'index est conservé à côté du fichier (``<fichier>.index.json``).
+Un bloc n'est converti qu'à sa première lecture, depuis une projection en
+mémoire du fichier (mmap), puis conservé en ``.npy`` et relu par projection
+(``np.load(mmap_mode="r")``) : tracer une colonne d'un bloc pour tous les
+modèles d'un balayage ne lit que ce bloc, et ne garde que cette colonne.
+
+Les fichiers sont recueillis dans l'espace de travail à la fin de chaque
+exécution (:func:`stage_outputs`) puis rangés avec le résultat dans le
+stockage (``runs/<id>/outputs/``, cf. :attr:`dustem_core.store.StoredResult.outputs`).
+Les résultats servis par le cache et ceux des travailleurs distants n'ont
+que leur SED.
+"""
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from .readers import _parse_block
+
+# Fichiers de sortie recueillis (SED.RES est lu par :mod:`dustem_core.readers`)
+OUTPUT_SUFFIX = ".RES"
+SED_FILE = "SED.RES"
+
+# Libellés des produits connus, par préfixe du nom de fichier
+PRODUCTS = {
+    "SED_POL": "Polarisation (émission)",
+    "EXT_POL": "Polarisation (extinction)",
+    "EXT": "Extinction",
+    "SDIST": "Distribution de tailles",
+    "DIST": "Distribution de températures",
+    "EMIS": "Émissivité",
+}
+
+_NUMERIC_START = frozenset(b"+-.0123456789")
+
+
+def product_label(name):
+    """Libellé d'un produit d'après le nom de son fichier (``DIST_aSil`` -> « Distribution de températures (aSil) »)"""
+    for prefix in sorted(PRODUCTS, key=len, reverse=True):
+        if name == prefix:
+            return PRODUCTS[prefix]
+        if name.startswith(prefix + "_"):
+            return f"{PRODUCTS[prefix]} ({name[len(prefix) + 1:]})"
+    return name
+
+
+def _scan(mm):
+    """Parcourt le fichier ligne à ligne : commentaires et suites de lignes numériques"""
+    comments = []
+    runs = []
+    current = None
+    label = None
+    pos = 0
+    size = len(mm)
+    while pos < size:
+        end = mm.find(b"\n", pos)
+        end = size if end < 0 else end + 1
+        text = mm[pos:end].strip()
+        if text and text[0] in _NUMERIC_START:
+            n_cols = len(text.split())
+            if current is not None and current["cols"] == n_cols and not current["gap"]:
+                current["rows"] += 1
+                current["end"] = end
+            else:
+                current = {"start": pos, "end": end, "rows": 1, "cols": n_cols, "label": label, "gap": False,
+                           "first": text}
+                runs.append(current)
+        else:
+            # Commentaire, ligne de texte ou ligne vide : fin du bloc en cours
+            if text:
+                comment = text.decode(errors="replace").lstrip("#").strip()
+                comments.append(comment)
+                label = comment or label
+            if current is not None:
+                current["gap"] = True
+            current = None
+        pos = end
+    return comments, runs
+
+
+def _blocks(runs):
+    """Blocs numériques : une ligne isolée suivie d'un bloc d'une autre largeur en est la ligne de dimensions"""
+    blocks = []
+    dims = []
+    for i, run in enumerate(runs):
+        following = runs[i + 1] if i + 1 < len(runs) else None
+        if run["rows"] == 1 and following is not None and not run["gap"] and following["cols"] != run["cols"]:
+            dims.append([float(t.replace(b"D", b"E").replace(b"d", b"e")) for t in run["first"].split()])
+            continue
+        blocks.append({
+            "start": run["start"], "end": run["end"], "rows": run["rows"], "cols": run["cols"],
+            "dims": dims, "label": run["label"],
+        })
+        dims = []
+    return blocks
+
+
+def index_file(path):
+    """Index d'un fichier de sortie : ``comments`` et ``blocks`` (position, forme, dimensions, libellé)"""
+    stat = os.stat(path)
+    index = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "comments": [], "blocks": []}
+    if not stat.st_size:
+        return index
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        comments, runs = _scan(mm)
+    index["comments"] = comments
+    index["blocks"] = _blocks(runs)
+    return index
+
+
+def _save_atomic(path, write):
+    """Écrit un fichier annexe sous un nom temporaire ; ignoré si le dossier est en lecture seule"""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+
+
+class OutputFile:
+    """Fichier de sortie de dustEM, indexé une fois et lu bloc par bloc"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.name = self.path.name[:-len(OUTPUT_SUFFIX)] if self.path.name.endswith(OUTPUT_SUFFIX) else self.path.stem
+        self._index = None
+
+    @property
+    def label(self):
+        return product_label(self.name)
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = self._load_index()
+        return self._index
+
+    def _index_path(self):
+        return Path(f"{self.path}.index.json")
+
+    def _load_index(self):
+        stat = os.stat(self.path)
+        try:
+            with open(self._index_path(), "r") as f:
+                index = json.load(f)
+            if index["size"] == stat.st_size and index["mtime_ns"] == stat.st_mtime_ns:
+                return index
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        index = index_file(self.path)
+        _save_atomic(self._index_path(), lambda f: f.write(json.dumps(index).encode()))
+        return index
+
+    @property
+    def comments(self):
+        return self.index["comments"]
+
+    @property
+    def blocks(self):
+        """Description des blocs numériques : ``rows``, ``cols``, ``dims``, ``label``"""
+        return self.index["blocks"]
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def block(self, i=0):
+        """Bloc numérique ``i`` (tableau lignes × colonnes en lecture seule)"""
+        info = self.blocks[i]
+        cached = Path(f"{self.path}.{i}.npy")
+        if cached.exists() and cached.stat().st_mtime_ns >= self.index["mtime_ns"]:
+            return np.load(cached, mmap_mode="r")
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            values = _parse_block(mm[info["start"]:info["end"]], info["cols"])
+        _save_atomic(cached, lambda f: np.save(f, values))
+        if cached.exists():
+            return np.load(cached, mmap_mode="r")
+        return values
+
+    def column(self, column, block=0):
+        """Colonne d'un bloc (copie 1-D)"""
+        return np.array(self.block(block)[:, column])
+
+
+def open_outputs(directory):
+    """Fichiers de sortie d'un dossier : nom du produit -> :class:`OutputFile`"""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return {}
+    files = sorted(p for p in directory.iterdir() if p.name.endswith(OUTPUT_SUFFIX))
+    return {output.name: output for output in map(OutputFile, files)}
+
+
+def _output_files(directory):
+    return sorted(
+        p for p in Path(directory).iterdir() if p.name.endswith(OUTPUT_SUFFIX) and p.name != SED_FILE and p.is_file()
+    )
+
+
+def clear_outputs(directory):
+    """Supprime les fichiers de sortie (hors SED.RES) laissés dans ``directory`` par une exécution précédente"""
+    if Path(directory).is_dir():
+        for path in _output_files(directory):
+            path.unlink(missing_ok=True)
+
+
+def stage_outputs(workspace):
+    """Met de côté les fichiers de sortie (hors SED.RES) d'un espace de travail
+
+    Appelé avant la suppression de l'espace de travail : les fichiers sont
+    déplacés (copiés en mode partagé, où ``out/`` est celui du repository,
+    vidé de ses anciens produits au début de l'exécution) dans un dossier
+    temporaire. Renvoie le chemin de ce dossier, à ranger
+    dans le stockage puis à supprimer (:func:`discard_outputs`), ou ``None``
+    si dustem n'a écrit que le SED.
+    """
+    files = _output_files(workspace.output_dir)
+    if not files:
+        return None
+    workspace.root.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix="outputs_", dir=workspace.root))
+    for path in files:
+        if workspace.shared:
+            shutil.copy2(path, staging / path.name)
+        else:
+            shutil.move(str(path), staging / path.name)
+    return str(staging)
+
+
+def link_outputs(src, dest):
+    """Copie les fichiers de sortie (hors SED.RES) de ``src`` dans ``dest`` (liens physiques si possible)
+
+    Renvoie la liste des noms de produits copiés.
+    """
+    dest = Path(dest)
+    dest.mkdir(parents=True, exist_ok=True)
+    names = []
+    for path in _output_files(src):
+        try:
+            os.link(path, dest / path.name)
+        except OSError:
+            shutil.copy2(path, dest / path.name)
+        names.append(OutputFile(path).name)
+    return names
+
+
+def copy_staged(staging):
+    """Copie (liens physiques) d'un dossier de sortie mis de côté, pour un autre consommateur"""
+    if staging is None:
+        return None
+    copy = Path(tempfile.mkdtemp(prefix="outputs_", dir=Path(staging).parent))
+    link_outputs(staging, copy)
+    return str(copy)
+
+
+def discard_outputs(staging):
+    """Supprime un dossier de sortie mis de côté (après son rangement dans le stockage)"""
+    if staging is not None:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def product_curves(store, names, product, column=1, block=0, x_column=0):
+    """Une colonne d'un produit pour plusieurs résultats : nom -> (x, y)
+
+    Seul le bloc demandé de chaque fichier est lu (projection en mémoire) et
+    seules les deux colonnes sont copiées : la mémoire utilisée est celle des
+    courbes renvoyées. Les résultats sans ce produit (ou sans ce bloc) sont
+    ignorés.
+    """
+    curves = {}
+    for name in names:
+        if product not in store.entry(name).get("outputs", ()):
+            continue
+        output = store[name].outputs.get(product)
+        if output is None or block >= len(output) or max(column, x_column) >= output.blocks[block]["cols"]:
+            continue
+        values = output.block(block)
+        curves[name] = (np.array(values[:, x_column]), np.array(values[:, column]))
+    return curves
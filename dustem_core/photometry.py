@@ -0,0 +1,303 @@
+"""Photométrie synthétique : flux des modèles dans les bandes d'instruments
+
+Les courbes de transmission sont lues dans un dossier de filtres
+(``$DUSTEM_FILTER_DIR``, par défaut ``~/.local/share/dustem_app/filters``),
+un fichier par filtre nommé d'après lui (``IRAS_60.dat``...) : deux colonnes,
+longueur d'onde (µm) et transmission, et des lignes de commentaire ``#``
+dont deux sont reconnues ::
+
+    # lambda0 = 60        longueur d'onde de référence (µm), défaut : moyenne pondérée
+    # detector = photon   compteur de photons (défaut : energy, bolomètre)
+
+Pour une grille de longueurs d'onde donnée, chaque filtre devient une ligne
+de poids (:meth:`Filter.weights`) : l'intégrale de la transmission contre
+l'interpolation linéaire (en ln λ) du SED entre les points de la grille,
+calculée sur la réunion des deux grilles. Le flux dans la bande est alors
+un produit scalaire, et celui de tous les modèles et populations de même
+grille un seul produit matriciel, limité aux colonnes couvertes par les
+filtres.
+
+Conventions de correction de couleur (``CONVENTIONS``) : la valeur d'une
+bande est celle, à ``lambda0``, du spectre de référence Fν ∝ ν^-α qui
+donnerait le même signal dans le détecteur. Pour les SED de dustem (νIν),
+la bande vaut ::
+
+    ∫ sed R dln λ / ∫ (λ/λ0)^(α-1) R dln λ      (R × λ pour un compteur de photons)
+
+dans les unités du SED (νIν à ``lambda0``). Les flux sont mémorisés dans le
+projet (``photometry.jsonl``), associés à l'identifiant du résultat, au
+contenu du filtre et à la convention.
+"""
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .analytics import _append_cache, _json_value, _read_cache
+from .matrix import _grid_key
+
+PHOTOMETRY_FILE = "photometry.jsonl"
+
+FILTER_SUFFIXES = (".dat", ".txt", ".csv")
+
+# Indice α du spectre de référence Fν ∝ ν^-α de chaque convention
+CONVENTIONS = {
+    "nuFnu": 1.0,  # νFν constant : IRAS, ISO, Spitzer IRAC, Herschel, Planck
+    "Fnu": 0.0,  # Fν constant : flux moyen dans la bande
+    "nu-2": 2.0,  # Fν ∝ ν^-2 : WISE
+}
+
+DETECTORS = ("energy", "photon")
+
+# Erreur relative des flux observés donnés sans erreur
+DEFAULT_RELATIVE_ERROR = 0.1
+
+
+def default_filter_dir():
+    if os.environ.get("DUSTEM_FILTER_DIR"):
+        return Path(os.environ["DUSTEM_FILTER_DIR"])
+    base = os.environ.get("XDG_DATA_HOME") or Path.home() / ".local" / "share"
+    return Path(base) / "dustem_app" / "filters"
+
+
+class Filter:
+    """Courbe de transmission d'un filtre (longueurs d'onde en µm)"""
+
+    def __init__(self, name, wl, transmission, lambda0=None, detector="energy"):
+        wl = np.asarray(wl, dtype=float)
+        transmission = np.asarray(transmission, dtype=float)
+        order = np.argsort(wl)
+        self.name = name
+        self.wl = wl[order]
+        self.transmission = np.clip(transmission[order], 0.0, None)
+        if len(self.wl) < 2 or self.wl[0] <= 0 or not self.transmission.any():
+            raise ValueError(f"Filtre {name} : au moins deux longueurs d'onde > 0 et une transmission non nulle")
+        if detector not in DETECTORS:
+            raise ValueError(f"Filtre {name} : détecteur {detector!r} inconnu ({', '.join(DETECTORS)})")
+        self.detector = detector
+        if lambda0 is None:
+            norm = np.sum(np.diff(self.wl) * 0.5 * (self.transmission[1:] + self.transmission[:-1]))
+            moment = self.wl * self.transmission
+            lambda0 = np.sum(np.diff(self.wl) * 0.5 * (moment[1:] + moment[:-1])) / norm
+        self.lambda0 = float(lambda0)
+        h = hashlib.sha256()
+        for array in (self.wl, self.transmission, np.array([self.lambda0])):
+            h.update(array.tobytes())
+        h.update(detector.encode())
+        self.digest = h.hexdigest()[:12]
+
+    def __repr__(self):
+        return f"Filter({self.name!r}, lambda0={self.lambda0:g}, detector={self.detector!r})"
+
+    def key(self, convention):
+        """Clé du flux de ce filtre dans le cache du projet"""
+        return f"{self.name}:{self.digest}:{convention}"
+
+    def weights(self, wl, convention="nuFnu"):
+        """Poids sur la grille ``wl`` tels que ``weights @ sed`` soit le flux dans la bande
+
+        NaN partout si le filtre dépasse la grille.
+        """
+        alpha = CONVENTIONS[convention]
+        wl = np.asarray(wl, dtype=float)
+        order = np.argsort(wl)
+        x_model = np.log(wl[order])
+        x_filter = np.log(self.wl)
+        out = np.zeros(len(wl))
+        if x_filter[0] < x_model[0] or x_filter[-1] > x_model[-1]:
+            out[:] = np.nan
+            return out
+
+        # Réunion des grilles sur le support du filtre : le produit des deux
+        # interpolations linéaires y est intégré par la méthode des trapèzes
+        inside = (x_model > x_filter[0]) & (x_model < x_filter[-1])
+        x = np.union1d(x_filter, x_model[inside])
+        response = np.interp(x, x_filter, self.transmission)
+        if self.detector == "photon":
+            response = response * np.exp(x)
+        dx = np.diff(x)
+        trapeze = np.zeros(len(x))
+        trapeze[:-1] += 0.5 * dx
+        trapeze[1:] += 0.5 * dx
+        a = response * trapeze
+        norm = np.sum(a * np.exp((alpha - 1) * (x - np.log(self.lambda0))))
+
+        idx = np.clip(np.searchsorted(x_model, x), 1, len(x_model) - 1)
+        w = (x - x_model[idx - 1]) / (x_model[idx] - x_model[idx - 1])
+        sorted_weights = np.zeros(len(wl))
+        np.add.at(sorted_weights, idx - 1, a * (1 - w))
+        np.add.at(sorted_weights, idx, a * w)
+        out[order] = sorted_weights / norm
+        return out
+
+
+def read_filter(path):
+    """Lit un fichier de filtre (cf. en-tête du module) ; le nom du filtre est celui du fichier"""
+    path = Path(path)
+    options = {}
+    rows = []
+    with open(path, "r") as f:
+        for ligne in f:
+            ligne = ligne.strip()
+            if ligne.startswith("#"):
+                key, sep, value = ligne[1:].partition("=")
+                if sep and key.strip().lower() in ("lambda0", "detector"):
+                    options[key.strip().lower()] = value.strip()
+                continue
+            tokens = ligne.replace(",", " ").replace(";", " ").split()
+            if len(tokens) < 2:
+                continue
+            try:
+                rows.append((float(tokens[0]), float(tokens[1])))
+            except ValueError:
+                # Ligne d'en-tête d'un CSV
+                continue
+    if not rows:
+        raise ValueError(f"Filtre {path.name} : aucune ligne longueur d'onde / transmission")
+    wl, transmission = np.array(rows).T
+    lambda0 = float(options["lambda0"]) if "lambda0" in options else None
+    return Filter(path.stem, wl, transmission, lambda0=lambda0, detector=options.get("detector", "energy").lower())
+
+
+def load_filters(directory=None):
+    """Filtres d'un dossier, par longueur d'onde de référence croissante : nom -> :class:`Filter`"""
+    directory = Path(directory) if directory else default_filter_dir()
+    if not directory.is_dir():
+        return {}
+    filters = [
+        read_filter(path) for path in sorted(directory.iterdir())
+        if path.suffix.lower() in FILTER_SUFFIXES and not path.name.startswith(".")
+    ]
+    return {f.name: f for f in sorted(filters, key=lambda f: f.lambda0)}
+
+
+def weight_matrix(filters, wl, convention="nuFnu"):
+    """Matrice des poids (filtres × longueurs d'onde) de ``filters`` sur la grille ``wl``"""
+    return np.stack([f.weights(wl, convention) for f in filters])
+
+
+def band_fluxes(values, weights):
+    """Flux dans les bandes de chaque ligne de ``values`` (modèles × longueurs d'onde)
+
+    Un seul produit matriciel, limité aux colonnes où un filtre a un poids
+    non nul. Un filtre hors de la grille donne NaN.
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    covered = np.flatnonzero(np.nan_to_num(weights, nan=0.0).any(axis=0))
+    if len(covered) == 0:
+        return np.full((len(values), len(weights)), np.nan)
+    lo, hi = covered[0], covered[-1] + 1
+    known = ~np.isnan(weights).any(axis=1)
+    out = np.full((len(values), len(weights)), np.nan)
+    out[:, known] = values[:, lo:hi] @ weights[known, lo:hi].T
+    return out
+
+
+def photometry(store, filters, names=None, convention="nuFnu", populations=False):
+    """Flux des résultats ``names`` d'un :class:`~dustem_core.store.ResultStore` dans les bandes ``filters``
+
+    ``filters`` est une liste de :class:`Filter` (ou le dictionnaire de
+    :func:`load_filters`). Les flux absents du cache du projet sont
+    calculés par grille : les lignes (SED total et, si ``populations``,
+    chaque population) de tous les modèles de même grille forment une
+    matrice multipliée une seule fois par celle des poids. Renvoie un
+    :class:`pandas.DataFrame` indexé par (nom, colonne), une colonne par
+    filtre.
+    """
+    if convention not in CONVENTIONS:
+        raise ValueError(f"Convention inconnue : {convention} ({', '.join(CONVENTIONS)})")
+    filters = list(filters.values()) if isinstance(filters, dict) else list(filters)
+    names = list(store) if names is None else list(names)
+    path = store.path / PHOTOMETRY_FILE
+    cache = _read_cache(path)
+    keys = [f.key(convention) for f in filters]
+
+    rows = []
+    todo = {}
+    results = {}
+    for name in names:
+        entry = store.entry(name)
+        run = entry["run"]
+        columns = ["sed_tot"]
+        if populations:
+            columns += sorted((c for c in entry["columns"] if c.startswith("pop")), key=lambda c: int(c[3:]))
+        cached = cache.get(run, {})
+        for column in columns:
+            rows.append((name, column, run))
+            if all(f"{column}@{key}" in cached for key in keys):
+                continue
+            if name not in results:
+                results[name] = store[name]
+                wl = results[name].read("wl")
+                group = todo.setdefault(_grid_key(wl), (wl, []))[1]
+            group.append((name, column, run))
+
+    records = []
+    for wl, group in todo.values():
+        values = np.stack([results[name].read(column) for name, column, _ in group])
+        fluxes = band_fluxes(values, weight_matrix(filters, wl, convention))
+        for (name, column, run), row in zip(group, fluxes):
+            record = {f"{column}@{key}": _json_value(value) for key, value in zip(keys, row)}
+            cache.setdefault(run, {}).update(record)
+            records.append(dict(record, run=run))
+    _append_cache(path, records)
+
+    data = [[cache[run].get(f"{column}@{key}") for key in keys] for _, column, run in rows]
+    index = pd.MultiIndex.from_tuples([(name, column) for name, column, _ in rows], names=["name", "column"])
+    return pd.DataFrame(data, index=index, columns=[f.name for f in filters], dtype=float)
+
+
+def read_observations(source):
+    """Lit des flux observés (CSV : filtre, flux, erreur optionnelle)
+
+    ``source`` est un chemin ou un fichier ouvert. Renvoie un
+    :class:`pandas.DataFrame` indexé par filtre, colonnes ``flux`` et
+    ``sigma`` (NaN si non fournie).
+    """
+    table = pd.read_csv(source, comment="#", skipinitialspace=True)
+    if table.shape[1] < 2:
+        raise ValueError("Flux observés : colonnes attendues filtre, flux[, erreur]")
+    observed = pd.DataFrame({
+        "flux": pd.to_numeric(table.iloc[:, 1], errors="coerce").to_numpy(),
+        "sigma": pd.to_numeric(table.iloc[:, 2], errors="coerce").to_numpy() if table.shape[1] > 2 else np.nan,
+    }, index=pd.Index(table.iloc[:, 0].astype(str).str.strip(), name="filter"))
+    return observed
+
+
+def score(fluxes, observed, free_scale=True):
+    """χ² de chaque modèle sur des flux observés
+
+    ``fluxes`` est un tableau modèles × filtres (par exemple
+    ``photometry(...).xs("sed_tot", level="column")``) et ``observed`` celui
+    de :func:`read_observations`, dans les unités des SED. Sans erreur, elle
+    vaut ``DEFAULT_RELATIVE_ERROR`` fois le flux. Si ``free_scale``, chaque
+    modèle est multiplié par le facteur qui minimise son χ² (colonne densité,
+    angle solide...). Renvoie un :class:`pandas.DataFrame` trié par χ²
+    croissant : ``chi2``, ``scale``, ``dof``.
+    """
+    missing = [name for name in observed.index if name not in fluxes.columns]
+    if missing:
+        raise ValueError(f"Filtre(s) observé(s) non calculé(s) : {', '.join(missing)}")
+    flux = observed["flux"].to_numpy(dtype=float)
+    sigma = observed["sigma"].to_numpy(dtype=float)
+    sigma = np.where(np.isfinite(sigma) & (sigma > 0), sigma, DEFAULT_RELATIVE_ERROR * np.abs(flux))
+    valid = np.isfinite(flux) & (sigma > 0)
+    if not valid.any():
+        raise ValueError("Aucun flux observé exploitable")
+    model = fluxes[list(observed.index[valid])].to_numpy(dtype=float) / sigma[valid]
+    target = flux[valid] / sigma[valid]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if free_scale:
+            scale = model @ target / np.sum(model ** 2, axis=1)
+        else:
+            scale = np.ones(len(model))
+        chi2 = np.sum((target - scale[:, None] * model) ** 2, axis=1)
+    chi2[~np.isfinite(model).all(axis=1)] = np.nan
+    table = pd.DataFrame({
+        "chi2": chi2,
+        "scale": scale,
+        "dof": int(valid.sum()) - int(free_scale),
+    }, index=fluxes.index)
+    return table.sort_values("chi2", na_position="last")
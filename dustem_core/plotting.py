@@ -0,0 +1,317 @@
+"""Graphiques des SED
+
+Les figures sont rendues une seule fois en PNG : :class:`FigureCache`
+conserve les octets PNG, indexés par les résultats sélectionnés et les
+options du graphique, et les rerun de Streamlit qui ne changent pas le
+graphique ne refont aucun rendu. Les courbes sont décimées à la résolution
+de la figure avant d'être tracées.
+
+Les figures sont des :class:`matplotlib.figure.Figure` créées hors de
+pyplot : matplotlib n'est importé qu'au premier graphique (pas au démarrage
+de l'application ni de la ligne de commande), et aucune figure n'est
+enregistrée dans l'état global de pyplot, partagé par les sessions qui
+s'exécutent chacune dans un thread.
+"""
+import io
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .metrics import log_metrics
+
+# Résolution des PNG affichés et téléchargés
+DPI = 100
+
+
+def decimate(x, y, max_points):
+    """Réduit une courbe à environ ``max_points`` points
+
+    Les points sont regroupés par paquets consécutifs ; on garde le minimum
+    et le maximum de chaque paquet (ainsi que les extrémités), ce qui
+    préserve les pics à l'échelle du pixel.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = len(x)
+    if not max_points or n <= max_points:
+        return x, y
+    n_bins = max(1, max_points // 2)
+    size = -(-n // n_bins)
+    padded = np.full(n_bins * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(n_bins, size)
+    filled = ~np.all(np.isnan(padded), axis=1)
+    offsets = np.arange(n_bins)[filled] * size
+    lows = np.where(np.isnan(padded[filled]), np.inf, padded[filled]).argmin(axis=1) + offsets
+    highs = np.where(np.isnan(padded[filled]), -np.inf, padded[filled]).argmax(axis=1) + offsets
+    keep = np.unique(np.concatenate([[0, n - 1], lows, highs]))
+    return x[keep], y[keep]
+
+
+def max_points(fig):
+    """Nombre de points utiles par courbe : largeur de la figure en pixels"""
+    return int(fig.get_figwidth() * DPI)
+
+
+def subplots(figsize):
+    """Figure et axes, sans pyplot (import de matplotlib au premier appel)"""
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    return fig, fig.subplots()
+
+
+def to_png(fig):
+    """Rend la figure en PNG"""
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=DPI)
+    return buf.getvalue()
+
+
+def plot_result(data_dict, scalex="log", scaley="log", xlim=[0.1, 1000], ylim=[1e-22, 1e-18], title="SED Result"):
+    """Génération du graphique SED"""
+    wl = data_dict["wl"]
+
+    fig, ax = subplots(figsize=(10, 6))
+    n_max = max_points(fig)
+
+    for i in data_dict:
+        if i == "wl":
+            continue
+        elif i == "sed_tot":
+            ax.plot(*decimate(wl, data_dict[i], n_max), label=i, linewidth=2)
+        else:
+            ax.plot(*decimate(wl, data_dict[i], n_max), alpha=0.6)
+
+    ax.set_yscale(scaley)
+    ax.set_xscale(scalex)
+    ax.set_title(title)
+    ax.set_xlabel("Wavelength (µm)")
+    ax.set_ylabel("Intensity")
+
+    ax.set_ylim(ylim)
+    ax.set_xlim(xlim)
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+
+    return fig
+
+
+def plot_comparison(matrix, scalex="log", scaley="log", xlim=[0.1, 1000], ylim=[1e-22, 1e-18], title="",
+                    show_populations=False, show_grid=True):
+    """Graphique de comparaison des modèles d'une :class:`~dustem_core.matrix.SEDMatrix`"""
+    fig, ax = subplots(figsize=(14, 8))
+    n_max = max_points(fig)
+
+    # Palette de couleurs distinctes
+    from matplotlib import colormaps
+
+    colors = colormaps["tab10"](np.linspace(0, 1, len(matrix)))
+
+    for (result_name, data_dict), color in zip(matrix.rows(), colors):
+        wl = data_dict["wl"]
+
+        # SED total avec une ligne épaisse
+        ax.plot(
+            *decimate(wl, data_dict["sed_tot"], n_max),
+            label=f"{result_name}",
+            linewidth=2.5,
+            color=color,
+            zorder=10
+        )
+
+        # Populations en pointillés si demandé
+        if show_populations:
+            for key in data_dict:
+                if key.startswith("pop"):
+                    ax.plot(
+                        *decimate(wl, data_dict[key], n_max),
+                        linestyle='--',
+                        alpha=0.4,
+                        color=color,
+                        linewidth=1.2,
+                        zorder=5
+                    )
+
+    ax.set_yscale(scaley)
+    ax.set_xscale(scalex)
+    ax.set_title(f"{title}", fontsize=16, fontweight='bold', pad=20)
+    ax.set_xlabel("Longueur d'onde (µm)", fontsize=13, fontweight='bold')
+    ax.set_ylabel("Intensité", fontsize=13, fontweight='bold')
+    ax.set_ylim(ylim)
+    ax.set_xlim(xlim)
+
+    if show_grid:
+        ax.grid(True, alpha=0.5, linestyle='-', linewidth=0.8)
+
+    ax.legend(loc='best', fontsize=10, framealpha=0.9, shadow=True, borderpad=1)
+    fig.tight_layout()
+
+    return fig
+
+
+def plot_fit(data_dict, factors, wl_obs, flux_obs, sigma=None, title=""):
+    """SED observé et SED ajusté (populations mises à l'échelle par ``factors``)"""
+    wl = data_dict["wl"]
+    fig, ax = subplots(figsize=(10, 6))
+    n_max = max_points(fig)
+
+    columns = sorted((c for c in data_dict if c.startswith("pop")), key=lambda c: int(c[3:]))
+    total = np.zeros(len(wl))
+    for column, factor in zip(columns, factors):
+        scaled = np.asarray(data_dict[column]) * factor
+        total += scaled
+        ax.plot(*decimate(wl, scaled, n_max), alpha=0.6, label=f"{column} x {factor:.3g}")
+    ax.plot(*decimate(wl, total, n_max), color="black", linewidth=2, label="SED ajusté")
+    ax.errorbar(wl_obs, flux_obs, yerr=sigma, fmt="o", color="crimson", label="observé", zorder=10)
+
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_title(title)
+    ax.set_xlabel("Wavelength (µm)")
+    ax.set_ylabel("Intensity")
+    ax.set_xlim(min(wl[0], np.min(wl_obs)), max(wl[-1], np.max(wl_obs)))
+    positive = np.asarray(flux_obs)[np.asarray(flux_obs) > 0]
+    if positive.size:
+        ax.set_ylim(positive.min() / 100, positive.max() * 10)
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+
+    return fig
+
+
+def plot_emulated(prediction, scalex="log", scaley="log", xlim=[0.1, 1000], ylim=[1e-22, 1e-18], title=""):
+    """SED émulé, avec la bande d'incertitude (± 1 écart-type) du SED total"""
+    data_dict = prediction.data.columns()
+    wl = data_dict["wl"]
+    fig, ax = subplots(figsize=(10, 6))
+    n_max = max_points(fig)
+
+    for key in data_dict:
+        if key.startswith("pop"):
+            ax.plot(*decimate(wl, data_dict[key], n_max), alpha=0.6)
+    factor = 10.0 ** prediction.sigma_dex
+    ax.fill_between(wl, data_dict["sed_tot"] / factor, data_dict["sed_tot"] * factor,
+                    color="tab:blue", alpha=0.25, label="± 1 σ")
+    ax.plot(*decimate(wl, data_dict["sed_tot"], n_max), color="tab:blue", linewidth=2, label="sed_tot (émulé)")
+
+    ax.set_yscale(scaley)
+    ax.set_xscale(scalex)
+    ax.set_title(title)
+    ax.set_xlabel("Wavelength (µm)")
+    ax.set_ylabel("Intensity")
+    ax.set_ylim(ylim)
+    ax.set_xlim(xlim)
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+
+    return fig
+
+
+def _scale(values):
+    """Échelle logarithmique si toutes les valeurs sont strictement positives"""
+    values = np.asarray(values)
+    return "log" if values.size and np.all(values > 0) else "linear"
+
+
+def plot_output_block(values, title="", xlabel="Colonne 1", ylabel="Valeur"):
+    """Bloc d'un fichier de sortie de dustEM : colonnes 2 et suivantes en fonction de la première"""
+    values = np.asarray(values)
+    fig, ax = subplots(figsize=(10, 6))
+    n_max = max_points(fig)
+
+    x = values[:, 0]
+    for column in range(1, values.shape[1]):
+        ax.plot(*decimate(x, values[:, column], n_max), label=f"colonne {column + 1}")
+
+    ax.set_xscale(_scale(x))
+    ax.set_yscale(_scale(values[:, 1:]))
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    if values.shape[1] <= 11:
+        ax.legend()
+    ax.grid(True, alpha=0.3)
+
+    return fig
+
+
+def plot_product_curves(curves, title="", xlabel="Colonne 1", ylabel="Valeur"):
+    """Même colonne d'un produit de dustEM pour plusieurs résultats (dictionnaire nom -> (x, y))"""
+    fig, ax = subplots(figsize=(14, 8))
+    n_max = max_points(fig)
+
+    from matplotlib import colormaps
+
+    colors = colormaps["viridis"](np.linspace(0, 1, max(len(curves), 1)))
+    for (name, (x, y)), color in zip(curves.items(), colors):
+        ax.plot(*decimate(x, y, n_max), label=name, color=color, linewidth=1.5)
+
+    ax.set_xscale(_scale(np.concatenate([x for x, _ in curves.values()]) if curves else []))
+    ax.set_yscale(_scale(np.concatenate([y for _, y in curves.values()]) if curves else []))
+    ax.set_title(title, fontsize=16, fontweight='bold', pad=20)
+    ax.set_xlabel(xlabel, fontsize=13, fontweight='bold')
+    ax.set_ylabel(ylabel, fontsize=13, fontweight='bold')
+    if len(curves) <= 20:
+        ax.legend(loc='best', fontsize=10, framealpha=0.9)
+    ax.grid(True, alpha=0.5)
+    fig.tight_layout()
+
+    return fig
+
+
+class FigureCache:
+    """Cache LRU des graphiques rendus en PNG, partagé entre sessions
+
+    La clé doit identifier les données (par exemple les identifiants de
+    résultat du stockage) et toutes les options du graphique. Le cache est
+    borné en nombre d'entrées et en octets. Chaque rendu est ajouté au
+    fichier de mesures (étape ``plot``) et, pour le graphique d'un seul
+    résultat stocké (``run``), à ses mesures enregistrées.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=64 * 1024 ** 2):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._png = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_png(self, key, render, *args, run=None, **kwargs):
+        """PNG du graphique ``render(*args, **kwargs)``, rendu au premier appel
+
+        ``run`` est le :class:`~dustem_core.store.StoredResult` tracé, dont
+        les métadonnées reçoivent la durée du rendu.
+        """
+        with self._lock:
+            if key in self._png:
+                self._png.move_to_end(key)
+                self.hits += 1
+                return self._png[key]
+        start = time.perf_counter()
+        png = to_png(render(*args, **kwargs))
+        seconds = time.perf_counter() - start
+        log_metrics({"event": "plot", "name": render.__name__, "stages": {"plot": seconds}})
+        if run is not None:
+            try:
+                run.record_stage("plot", seconds)
+            except OSError:
+                pass
+        with self._lock:
+            self.misses += 1
+            if key not in self._png:
+                self._png[key] = png
+                self._bytes += len(png)
+            while self._png and (len(self._png) > self.max_entries or self._bytes > self.max_bytes):
+                _, old = self._png.popitem(last=False)
+                self._bytes -= len(old)
+        return png
+
+    def clear(self):
+        with self._lock:
+            self._png.clear()
+            self._bytes = 0
@@ -0,0 +1,183 @@
+"""Lecture des fichiers de sortie de dustEM
+
+Un fichier ``SED.RES`` commence par des lignes de commentaire (``#``), puis une
+ligne donnant le nombre de types de grains et le nombre de longueurs d'onde,
+puis le bloc numérique : longueur d'onde, une colonne par population et le
+SED total. Le bloc est converti en une seule passe par le lecteur C de NumPy
+(quelle que soit la taille de l'en-tête) et sa forme est vérifiée contre
+l'en-tête et le GRAIN.DAT exécuté.
+
+Une copie binaire ``SED.RES.npy`` (tableau structuré nommé) est écrite à côté
+du fichier : les relectures suivantes ne coûtent aucune analyse tant que le
+fichier source n'a pas changé. La copie enregistre la taille et la date
+(``st_mtime_ns``) du fichier source et n'est utilisée que si les deux sont
+identiques : un fichier réécrit dans la même unité de temps n'est pas
+confondu avec sa version précédente.
+"""
+import io
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+from numpy.lib import recfunctions
+
+# Exposants Fortran à trois chiffres écrits sans « E » (ex. 0.123-100)
+_FORTRAN_EXPONENT = re.compile(rb"(?<=[0-9.])([+-]\d{3})(?=\s)")
+
+
+class SEDTable:
+    """SED lu depuis un fichier de sortie : tableau 2-D et noms de colonnes"""
+
+    def __init__(self, data, grain_types=None):
+        self.data = np.asarray(data, dtype=float)
+        n_pops = self.data.shape[1] - 2
+        if grain_types is None:
+            grain_types = [f"pop{i}" for i in range(1, n_pops + 1)]
+        self.grain_types = list(grain_types)
+        self.names = ["wl"] + [f"pop{i}" for i in range(1, n_pops + 1)] + ["sed_tot"]
+
+    @property
+    def n_pops(self):
+        return len(self.names) - 2
+
+    def columns(self):
+        """Dictionnaire nom de colonne -> tableau 1-D"""
+        return {name: self.data[:, i] for i, name in enumerate(self.names)}
+
+
+def _parse_header(raw):
+    """Renvoie (commentaires, nb de types, nb de longueurs d'onde, début du bloc numérique)"""
+    comments = []
+    pos = 0
+    while pos < len(raw):
+        end = raw.find(b"\n", pos)
+        end = len(raw) if end < 0 else end + 1
+        text = raw[pos:end].strip()
+        if not text:
+            pos = end
+            continue
+        if text.startswith(b"#"):
+            comments.append(text[1:].decode(errors="replace").strip())
+            pos = end
+            continue
+        tokens = text.split()
+        if len(tokens) == 2 and all(t.isdigit() for t in tokens):
+            return comments, int(tokens[0]), int(tokens[1]), end
+        return comments, None, None, pos
+    raise ValueError("Fichier de sortie vide ou sans bloc numérique")
+
+
+def _header_grain_types(comments, n_types):
+    """Cherche dans les commentaires une ligne ``...: type1 type2 ...``"""
+    for comment in comments:
+        if ":" not in comment:
+            continue
+        tokens = comment.split(":", 1)[1].replace(",", " ").split()
+        if len(tokens) == n_types and all(re.match(r"^[A-Za-z][\w-]*$", t) for t in tokens):
+            return tokens
+    return None
+
+
+def _parse_block(block, n_cols):
+    """Convertit le bloc numérique en tableau (n_lignes, n_cols)
+
+    Le bloc entier est passé en une fois au lecteur C de NumPy (>= 1.23) ;
+    en cas d'échec (exposants Fortran sans « E »), on corrige les exposants
+    et on découpe le bloc en jetons.
+    """
+    block = block.replace(b"D", b"E").replace(b"d", b"e")
+    try:
+        values = np.loadtxt(io.BytesIO(block), dtype=float, ndmin=2)
+    except ValueError:
+        values = np.array(_FORTRAN_EXPONENT.sub(rb"E\1", block).split(), dtype=float)
+        n_cols = n_cols or len(block.strip().split(b"\n", 1)[0].split())
+        if values.size % n_cols:
+            raise ValueError(f"Bloc numérique incomplet : {values.size} valeurs pour {n_cols} colonnes")
+        values = values.reshape(-1, n_cols)
+    if n_cols and values.shape[1] != n_cols:
+        raise ValueError(f"{values.shape[1]} colonnes lues, l'en-tête en annonce {n_cols}")
+    return values
+
+
+def sidecar_path(path):
+    return Path(f"{path}.npy")
+
+
+def _source_stamp(path):
+    """Taille et date de modification (ns) du fichier source"""
+    st = os.stat(path)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+def _load_sidecar(path):
+    """Copie binaire à jour, ou ``None`` (absente, ancienne ou d'une autre version du fichier)"""
+    try:
+        with open(sidecar_path(path), "rb") as f:
+            stamp = np.load(f)
+            if stamp.dtype.names is not None or not np.array_equal(stamp, _source_stamp(path)):
+                return None
+            table = np.load(f)
+    except (FileNotFoundError, ValueError, EOFError):
+        return None
+    header_types = [name.partition("|")[2] for name in table.dtype.names[1:-1]]
+    return recfunctions.structured_to_unstructured(table), header_types
+
+
+def _write_sidecar(path, data, header_types, stamp):
+    """Écrit la copie binaire ; les champs sont nommés ``wl``, ``pop<i>|<type>``, ``sed_tot``
+
+    Le fichier contient deux tableaux : ``stamp`` (taille et date du fichier
+    source lu, cf. :func:`_source_stamp`) puis le tableau structuré.
+    """
+    n_pops = data.shape[1] - 2
+    header_types = header_types or [""] * n_pops
+    names = ["wl"] + [f"pop{i}|{t}" for i, t in enumerate(header_types, start=1)] + ["sed_tot"]
+    dtype = [(name, float) for name in names]
+    table = recfunctions.unstructured_to_structured(np.ascontiguousarray(data), dtype=np.dtype(dtype))
+    sidecar = sidecar_path(path)
+    tmp = sidecar.with_name(f".{sidecar.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            np.save(f, stamp)
+            np.save(f, table)
+        os.replace(tmp, sidecar)
+    except OSError:
+        # Dossier en lecture seule : la copie binaire est facultative
+        tmp.unlink(missing_ok=True)
+
+
+def read_sed(path, grain_types=None, sidecar=True):
+    """Lit un fichier SED.RES et renvoie un :class:`SEDTable`
+
+    ``grain_types`` (types de grains du GRAIN.DAT exécuté, dans l'ordre)
+    sert à nommer et à valider les colonnes : une ``ValueError`` est levée
+    si le nombre de populations ne correspond pas.
+    """
+    path = Path(path)
+    cached = _load_sidecar(path) if sidecar else None
+    if cached is not None:
+        data, header_types = cached
+    else:
+        stamp = _source_stamp(path) if sidecar else None
+        with open(path, "rb") as f:
+            raw = f.read()
+        comments, n_types, n_wl, start = _parse_header(raw)
+        n_cols = n_types + 2 if n_types is not None else None
+        data = _parse_block(raw[start:], n_cols)
+        if n_wl is not None and data.shape[0] != n_wl:
+            raise ValueError(
+                f"{path.name} : {data.shape[0]} longueurs d'onde lues, l'en-tête en annonce {n_wl}"
+            )
+        header_types = _header_grain_types(comments, data.shape[1] - 2)
+        if sidecar:
+            _write_sidecar(path, data, header_types, stamp)
+
+    n_pops = data.shape[1] - 2
+    if grain_types is not None and len(grain_types) != n_pops:
+        raise ValueError(
+            f"{path.name} contient {n_pops} population(s), le GRAIN.DAT exécuté en déclare {len(grain_types)}"
+        )
+    if grain_types is None and header_types and all(header_types):
+        grain_types = header_types
+    return SEDTable(data, grain_types)
@@ -0,0 +1,348 @@
+"""Travailleurs distants : exécution des tâches sur d'autres machines
+
+Le planificateur (:class:`dustem_core.jobs.JobManager`) est exposé par un
+petit serveur HTTP (:class:`WorkerServer`, JSON sur ``POST``). Un
+travailleur (:func:`run_worker`, ``python -m dustem_core worker URL``)
+tourne sur chaque machine où dustem est installé :
+
+- ``/lease`` : le travailleur annonce son nom, sa capacité et son build
+  (:func:`dustem_core.cache.build_id` de son repository) et reçoit au plus
+  autant de tâches que de places libres, parmi celles de même build ;
+- ``/heartbeat`` : signe de vie toutes les ``HEARTBEAT`` secondes, avec la
+  fin des sorties des tâches en cours ; la réponse liste les baux à
+  abandonner (tâche annulée, ou remise en file après une absence) ;
+- ``/result`` : état, sorties, mesures et SED lu (tableau ``.npy`` en
+  base64) d'une tâche terminée ; renvoyé jusqu'à ce que le serveur le reçoive ;
+- ``GET /status`` : travailleurs actifs et état de la file.
+
+Chez le travailleur, chaque tâche est une :class:`dustem_core.jobs.Job`
+(espace de travail isolé, délai maximal, annulation). Une tâche dont le
+travailleur ne donne plus signe de vie pendant ``LEASE_TIMEOUT`` secondes
+est remise en file, au plus ``MAX_ATTEMPTS`` fois. Si un jeton est défini
+(``$DUSTEM_WORKER_TOKEN``), chaque requête doit le porter dans l'en-tête
+``X-Dustem-Token`` ; il est obligatoire pour écouter ailleurs que sur la
+boucle locale. Le serveur ne se fie pas aux résultats reçus : l'état doit
+être un état de fin, et le SED doit avoir les colonnes des populations de
+la tâche (types de grains tirés de sa propre configuration).
+"""
+import base64
+import hmac
+import io
+import ipaddress
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+
+from .cache import build_id
+from .grain import grain_types
+from .jobs import DONE, FAILED, FINISHED_STATES, LEASE_TIMEOUT, MAX_ATTEMPTS, Job, default_max_running
+from .locate import locate_dustem
+from .readers import SEDTable
+
+DEFAULT_PORT = 8765
+
+# Intervalle des signes de vie d'un travailleur (s)
+HEARTBEAT = 5.0
+
+# Fin des sorties transmise au serveur (caractères par flux)
+OUTPUT_TAIL = 20000
+
+
+def default_listen():
+    """Adresse d'écoute ``hôte:port`` (``$DUSTEM_WORKER_LISTEN``), ``None`` si non définie"""
+    return os.environ.get("DUSTEM_WORKER_LISTEN") or None
+
+
+def default_token():
+    return os.environ.get("DUSTEM_WORKER_TOKEN") or None
+
+
+def parse_listen(listen):
+    """``"hôte:port"``, ``":port"`` ou ``"port"`` -> (hôte, port)"""
+    host, _, port = str(listen).rpartition(":")
+    return host or "127.0.0.1", int(port or DEFAULT_PORT)
+
+
+def encode_sed(table):
+    buf = io.BytesIO()
+    np.save(buf, table.data)
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def is_loopback(host):
+    """Adresse de la boucle locale (seule la machine elle-même peut s'y connecter)"""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def decode_sed(text, grain_types):
+    """SED reçu d'un travailleur ; ``ValueError`` s'il n'a pas une colonne par population"""
+    data = np.load(io.BytesIO(base64.b64decode(text)), allow_pickle=False)
+    if data.ndim != 2 or data.shape[1] != len(grain_types) + 2:
+        raise ValueError(f"SED de forme {data.shape}, {len(grain_types)} population(s) attendue(s)")
+    return SEDTable(data, grain_types)
+
+
+def job_report(job):
+    """Compte rendu d'une tâche terminée chez le travailleur (corps de ``/result``)"""
+    report = {
+        "state": job.state,
+        "error": job.error,
+        "returncode": job.returncode,
+        "stdout": job.stdout[-OUTPUT_TAIL:],
+        "stderr": job.stderr[-OUTPUT_TAIL:],
+        "metrics": job.metrics.to_dict(),
+        "sed": None,
+        "grain_types": None,
+    }
+    if job.state == DONE:
+        report["sed"] = encode_sed(job.result)
+        report["grain_types"] = job.result.grain_types
+    return report
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "dustem-workers"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        token = self.server.workers.token
+        return token is None or hmac.compare_digest(self.headers.get("X-Dustem-Token", ""), token)
+
+    def do_GET(self):
+        if not self._authorized():
+            return self._reply(403, {"error": "jeton invalide"})
+        if self.path != "/status":
+            return self._reply(404, {"error": f"chemin inconnu : {self.path}"})
+        self._reply(200, self.server.workers.status())
+
+    def do_POST(self):
+        if not self._authorized():
+            return self._reply(403, {"error": "jeton invalide"})
+        workers = self.server.workers
+        handler = {"/lease": workers.lease, "/heartbeat": workers.heartbeat, "/result": workers.result}.get(self.path)
+        if handler is None:
+            return self._reply(404, {"error": f"chemin inconnu : {self.path}"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            payload = handler(body, self.client_address[0])
+        except (KeyError, TypeError, ValueError) as e:
+            return self._reply(400, {"error": str(e)})
+        self._reply(200, payload)
+
+
+class WorkerServer:
+    """Serveur HTTP des travailleurs distants pour un :class:`~dustem_core.jobs.JobManager`
+
+    ``port=0`` choisit un port libre (cf. :attr:`url`). Un thread remet
+    en file, chaque seconde, les tâches des travailleurs silencieux. Lève
+    ``ValueError`` pour une adresse hors de la boucle locale sans jeton.
+    """
+
+    def __init__(self, manager, host="127.0.0.1", port=DEFAULT_PORT, token=None, lease_timeout=LEASE_TIMEOUT,
+                 max_attempts=MAX_ATTEMPTS):
+        if token is None and not is_loopback(host):
+            raise ValueError(
+                f"Écoute sur {host} sans jeton : définir DUSTEM_WORKER_TOKEN (ou écouter sur 127.0.0.1)"
+            )
+        self.manager = manager
+        self.token = token
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.workers = self
+        self._stop = threading.Event()
+        self._threads = [
+            threading.Thread(target=self.httpd.serve_forever, name="dustem-workers-http", daemon=True),
+            threading.Thread(target=self._expire, name="dustem-workers-expire", daemon=True),
+        ]
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        if host in ("0.0.0.0", ""):
+            host = socket.gethostname()
+        return f"http://{host}:{port}"
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _expire(self):
+        while not self._stop.wait(1.0):
+            self.manager.expire(self.lease_timeout, self.max_attempts)
+
+    def lease(self, body, address):
+        cancel = self.manager.heartbeat(body["worker"], body.get("leases", []), body["capacity"], body["build"],
+                                        address)
+        jobs = self.manager.lease(body["worker"], body["build"], int(body["slots"]))
+        return {
+            "jobs": [
+                {"lease": job.lease, "job_id": job.id, "name": job.name, "config": job.config,
+                 "timeout": job.timeout}
+                for job in jobs
+            ],
+            "cancel": cancel,
+        }
+
+    def heartbeat(self, body, address):
+        leases = body.get("leases", {})
+        outputs = {lease: (out.get("stdout", ""), out.get("stderr", "")) for lease, out in leases.items()}
+        cancel = self.manager.heartbeat(body["worker"], list(leases), body.get("capacity"), body.get("build"),
+                                        address, outputs=outputs)
+        return {"cancel": cancel}
+
+    def result(self, body, address):
+        state = body["state"]
+        if state not in FINISHED_STATES:
+            raise ValueError(f"état de fin inconnu : {state}")
+        job = self.manager.leased(body["worker"], body["lease"])
+        if job is None:
+            return {"accepted": False}
+        result, error = None, body.get("error")
+        if state == DONE:
+            try:
+                result = decode_sed(body["sed"], grain_types(job.config))
+            except (KeyError, TypeError, ValueError, OSError, EOFError) as e:
+                state, error = FAILED, f"SED invalide reçu du travailleur : {e}"
+        job = self.manager.complete(
+            body["worker"],
+            body["lease"],
+            state=state,
+            result=result,
+            error=error,
+            returncode=body.get("returncode"),
+            metrics=body.get("metrics"),
+            stdout=body.get("stdout"),
+            stderr=body.get("stderr"),
+        )
+        return {"accepted": job is not None}
+
+    def status(self, *args):
+        running, queued, limit = self.manager.status()
+        return {"running": running, "queued": queued, "limit": limit, "workers": self.manager.workers()}
+
+
+def serve_workers(manager, listen=None, token=None):
+    """Démarre un :class:`WorkerServer` sur ``listen`` (``hôte:port``, défaut ``$DUSTEM_WORKER_LISTEN``)"""
+    host, port = parse_listen(listen or default_listen() or DEFAULT_PORT)
+    return WorkerServer(manager, host, port, token=token if token is not None else default_token()).start()
+
+
+class _Client:
+    def __init__(self, url, token=None, timeout=30.0):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+
+    def post(self, path, payload):
+        request = urllib.request.Request(
+            self.url + path,
+            data=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json", "X-Dustem-Token": self.token or ""},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.load(response)
+
+
+def run_worker(url, repository=None, capacity=None, name=None, token=None, heartbeat=HEARTBEAT, poll=1.0,
+               stop=None, log=None):
+    """Boucle d'un travailleur distant, jusqu'à ``stop.set()``
+
+    ``capacity`` est le nombre de tâches simultanées (par défaut
+    ``$DUSTEM_MAX_JOBS`` ou le nombre de processeurs). Si le serveur est
+    injoignable, les tâches en cours continuent et leurs résultats sont
+    renvoyés dès qu'il répond. À l'arrêt, les tâches en cours sont annulées :
+    le serveur les remet en file après ``LEASE_TIMEOUT``.
+    """
+    repository = Path(repository) if repository else locate_dustem()[1]
+    capacity = capacity or default_max_running() or 1
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+    log = log or (lambda message: print(message, file=sys.stderr))
+    stop = stop or threading.Event()
+    build = build_id(repository)
+    client = _Client(url, token if token is not None else default_token())
+    running = {}
+    reports = {}
+    last_beat = 0.0
+    log(f"travailleur {name} — build {build} — capacité {capacity} — serveur {url}")
+
+    def _cancel(leases):
+        for lease in leases:
+            if lease in running:
+                running[lease].cancel()
+
+    while not stop.is_set():
+        leased = False
+        try:
+            for lease, job in list(running.items()):
+                if job.state in FINISHED_STATES:
+                    reports[lease] = job_report(job)
+                    del running[lease]
+            for lease, report in list(reports.items()):
+                reply = client.post("/result", dict(report, worker=name, lease=lease))
+                del reports[lease]
+                log(f"{report['state']} : bail {lease}" + ("" if reply["accepted"] else " (refusé par le serveur)"))
+            if time.time() - last_beat >= heartbeat:
+                outputs = {
+                    lease: {"stdout": job.stdout[-OUTPUT_TAIL:], "stderr": job.stderr[-OUTPUT_TAIL:]}
+                    for lease, job in running.items()
+                }
+                reply = client.post("/heartbeat", {"worker": name, "capacity": capacity, "build": build,
+                                                   "leases": outputs})
+                _cancel(reply["cancel"])
+                last_beat = time.time()
+            free = capacity - len(running)
+            if free > 0:
+                reply = client.post("/lease", {"worker": name, "capacity": capacity, "build": build, "slots": free,
+                                               "leases": list(running)})
+                _cancel(reply["cancel"])
+                for spec in reply["jobs"]:
+                    job = Job(spec["job_id"], spec["name"], spec["config"], repository, timeout=spec["timeout"])
+                    running[spec["lease"]] = job.start()
+                    log(f"tâche {spec['name']} reçue (bail {spec['lease']})")
+                    leased = True
+        except (OSError, ValueError) as e:
+            log(f"serveur injoignable : {e}")
+            stop.wait(max(poll, heartbeat))
+            continue
+        stop.wait(0.05 if leased else poll)
+
+    for job in running.values():
+        job.cancel()
@@ -0,0 +1,55 @@
+"""Enregistrement et relecture des résultats de simulation"""
+import time
+
+from .store import ResultStore
+
+
+def save_data_test(data, name_set, global_test, config=None, metadata=None, grain_template=None, metrics=None,
+                   outputs=None):
+    """Sauvegarde d'un SED (SEDTable) dans le stockage de résultats du projet
+
+    Les colonnes sont nommées par le lecteur : wl, pop1..popN, sed_tot ; les
+    types de grains correspondants sont conservés dans les métadonnées.
+    Les mesures de l'exécution (:class:`~dustem_core.metrics.RunMetrics`)
+    sont jointes aux métadonnées, puis mises à jour avec la durée de
+    l'enregistrement. ``outputs`` est un dossier contenant les autres
+    fichiers de sortie de dustem, rangés avec le résultat.
+    """
+    metadata = dict(metadata or {}, grain_types=data.grain_types)
+    if metrics is not None:
+        metadata["metrics"] = metrics.to_dict()
+
+    start = time.perf_counter()
+    result = global_test.append(
+        name_set,
+        data.columns(),
+        config=config,
+        metadata=metadata,
+        grain_template=grain_template,
+        outputs=outputs
+    )
+    if metrics is not None:
+        metrics.add("store", time.perf_counter() - start)
+        result.update_meta({"metrics": metrics.to_dict()})
+
+    return global_test
+
+
+def load_results(project="default", names=None, columns=None, root=None):
+    """Relit des résultats d'un projet
+
+    Renvoie un dictionnaire nom -> colonnes. Sans ``columns``, chaque
+    résultat est un :class:`~dustem_core.store.StoredResult` dont les colonnes
+    sont projetées en mémoire à la demande ; sinon seules les colonnes
+    demandées (et présentes) sont chargées.
+    """
+    store = ResultStore(project, root=root)
+    names = list(store) if names is None else names
+    results = {}
+    for name in names:
+        result = store[name]
+        if columns is None:
+            results[name] = result
+        else:
+            results[name] = {c: result[c] for c in columns if c in result}
+    return results
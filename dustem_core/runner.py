@@ -0,0 +1,210 @@
+"""Exécution de lots de modèles sur un pool de processus"""
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import ExitStack
+
+from .abundance import derive_from_cache, model_shape
+from .cache import inputs_digest, model_key
+from .grain import grain_types
+from .metrics import RunMetrics
+from .outputs import discard_outputs, stage_outputs
+from .readers import SEDTable, read_sed
+from .workspace import RunWorkspace
+
+
+class DustemError(RuntimeError):
+    """Échec d'une exécution de dustem"""
+
+
+def run_job(repository, name, config, timeout=None, submitted=None):
+    """Exécute un modèle dans son espace de travail et lit le SED produit
+
+    Fonction de niveau module pour pouvoir être envoyée aux processus du pool.
+    Renvoie un dictionnaire décrivant le résultat (``data`` est un
+    :class:`~dustem_core.readers.SEDTable`, ou ``None`` en cas d'échec ;
+    ``metrics`` est un :class:`~dustem_core.metrics.RunMetrics` ;
+    ``outputs`` est le dossier où sont mis de côté les autres fichiers de
+    sortie, cf. :func:`dustem_core.outputs.stage_outputs`, à supprimer par
+    l'appelant).
+    """
+    metrics = RunMetrics(name, submitted)
+    metrics.start()
+    outcome = {
+        "name": name, "config": config, "data": None, "error": None, "cached": False, "derived": None,
+        "metrics": metrics, "outputs": None,
+    }
+    try:
+        with ExitStack() as stack:
+            with metrics.stage("workspace"):
+                workspace = stack.enter_context(RunWorkspace(repository))
+            with metrics.stage("config"):
+                workspace.write_grain(config)
+            try:
+                with metrics.stage("process"):
+                    result = workspace.run(timeout=timeout)
+            finally:
+                metrics.record_usage(workspace.usage)
+            metrics.returncode = result.returncode
+            outcome.update(returncode=result.returncode, stdout=result.stdout, stderr=result.stderr)
+            if result.returncode == 0:
+                # Espace de travail temporaire : pas de copie binaire
+                with metrics.stage("parse"):
+                    outcome["data"] = read_sed(workspace.sed_file, grain_types(config), sidecar=False)
+                outcome["outputs"] = stage_outputs(workspace)
+            else:
+                outcome["error"] = result.stderr or f"code de retour {result.returncode}"
+    except Exception as e:
+        outcome["error"] = str(e)
+    return outcome
+
+
+class BatchProgress:
+    """Avancement d'un lot : débit (modèles/min) et temps restant estimé"""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.start = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    @property
+    def fraction(self):
+        return self.done / self.total if self.total else 1.0
+
+    @property
+    def rate(self):
+        """Débit en modèles par minute"""
+        return 60.0 * self.done / self.elapsed if self.done else 0.0
+
+    @property
+    def eta(self):
+        """Temps restant estimé en secondes (``None`` avant le premier modèle)"""
+        if not self.done:
+            return None
+        return (self.total - self.done) * self.elapsed / self.done
+
+    def summary(self):
+        eta = "?" if self.eta is None else f"{self.eta:.0f} s"
+        return (
+            f"{self.done}/{self.total} modèles ({self.failed} échec(s)) — "
+            f"{self.rate:.1f} modèles/min — reste ~{eta}"
+        )
+
+
+def run_batch(repository, jobs, workers=None, callback=None, cache=None, timeout=None, executor=None,
+              on_submit=None):
+    """Exécute une liste de couples (nom, config) sur un pool borné
+
+    ``callback(progress, outcome)`` est appelé dans le processus appelant à
+    la fin de chaque modèle (``outcome["outputs"]``, les autres fichiers de
+    sortie de dustem, est supprimé au retour) ; ses mesures (``outcome["metrics"]``) sont
+    ensuite écrites dans le fichier de mesures, avec la durée de
+    l'enregistrement si ``callback`` la mesure. Si un
+    :class:`~dustem_core.cache.ResultCache` est fourni, les modèles déjà
+    calculés sont servis depuis le cache sans lancer dustem, ceux qui ne
+    diffèrent d'un résultat en cache que par leurs Mdust/MH en sont dérivés
+    par mise à l'échelle (``outcome["derived"]`` décrit alors la source et
+    les facteurs) et les nouveaux résultats y sont ajoutés. ``timeout``
+    borne la durée de chaque modèle. Les modèles sont exécutés par un pool
+    de ``workers`` processus, ou soumis à ``executor`` (par exemple
+    :meth:`dustem_core.jobs.JobManager.executor`, qui applique la limite de
+    tâches commune à toutes les sessions). ``on_submit(name, config)`` est
+    appelé quand un modèle est confié au pool ou à ``executor``. Renvoie la
+    liste des résultats dans l'ordre de fin d'exécution.
+    """
+    progress = BatchProgress(len(jobs))
+    outcomes = []
+
+    def _record(outcome):
+        progress.done += 1
+        if outcome["data"] is None:
+            progress.failed += 1
+        outcomes.append(outcome)
+        try:
+            if callback is not None:
+                callback(progress, outcome)
+        finally:
+            discard_outputs(outcome.get("outputs"))
+        if not outcome.get("logged"):
+            outcome["metrics"].log(ok=outcome["data"] is not None)
+
+    def _from_cache(name, config, metrics, shape):
+        """Sert un modèle depuis le cache (exact ou dérivé) ; renvoie False sinon"""
+        with metrics.stage("cache"):
+            derived = derive_from_cache(cache, repository, config, inputs, shape=shape)
+        if derived is None:
+            return False
+        metrics.cache = "derived"
+        table, source, factors = derived
+        _record({"name": name, "config": config, "data": table, "error": None, "cached": True,
+                 "derived": {"from": source, "factors": factors}, "metrics": metrics})
+        return True
+
+    # Modèles à calculer ; ceux de même forme qu'un modèle déjà soumis
+    # attendent son résultat pour en être dérivés
+    pending = []
+    waiting = {}
+    inputs = inputs_digest(repository) if cache is not None else None
+    for name, config in jobs:
+        key = metrics = shape = None
+        if cache is not None:
+            metrics = RunMetrics(name)
+            metrics.start()
+            with metrics.stage("cache"):
+                key, binary_digest = model_key(repository, config, inputs=inputs)
+                data = cache.get(key)
+                shape = model_shape(repository, config, inputs)
+            if data is not None:
+                metrics.cache = "hit"
+                _record({"name": name, "config": config, "data": SEDTable(data, grain_types(config)),
+                         "error": None, "cached": True, "derived": None, "metrics": metrics})
+                continue
+            if _from_cache(name, config, metrics, shape):
+                continue
+            if shape[0] in waiting:
+                waiting[shape[0]].append((name, config, key, metrics, shape))
+                continue
+            waiting[shape[0]] = []
+        pending.append((name, config, key, metrics, shape))
+
+    if not pending:
+        return outcomes
+
+    with ExitStack() as stack:
+        if executor is None:
+            context = multiprocessing.get_context("spawn")
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers, mp_context=context))
+        futures = {}
+
+        def _submit(name, config, key, lookup, shape):
+            if on_submit is not None:
+                on_submit(name, config)
+            if executor is None:
+                future = pool.submit(run_job, str(repository), name, config, timeout, time.time())
+            else:
+                future = executor.submit_model(str(repository), name, config, timeout=timeout, key=key)
+            futures[future] = (key, lookup, shape)
+
+        for item in pending:
+            _submit(*item)
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, lookup, shape = futures.pop(future)
+                outcome = future.result()
+                if key is not None:
+                    outcome["metrics"].cache = "miss"
+                    outcome["metrics"].stages = dict(lookup.stages, **outcome["metrics"].stages)
+                    if outcome["data"] is not None:
+                        cache.put(key, outcome["data"].data, binary_digest, shape=shape)
+                _record(outcome)
+                if shape is not None:
+                    for name, config, key, metrics, shape in waiting.pop(shape[0], []):
+                        if not _from_cache(name, config, metrics, shape):
+                            _submit(name, config, key, metrics, shape)
+    return outcomes
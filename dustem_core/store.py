@@ -0,0 +1,254 @@
+"""Stockage persistant et colonnaire des résultats, un dossier par projet
+
+Organisation d'un projet::
+
+    <racine>/<projet>/
+        index.jsonl          journal des ajouts et suppressions (ajout seul)
+        runs/<id>/
+            wl.npy           une colonne par fichier .npy
+            pop1.npy ...
+            sed_tot.npy
+            GRAIN.DAT        fichier d'entrée exécuté
+            meta.json        configuration (format dict_ligne) et métadonnées
+            outputs/         autres fichiers de sortie de dustem (EXT.RES...)
+
+Les colonnes sont lues paresseusement et projetées en mémoire
+(``np.load(mmap_mode="r")``) : une vue qui ne trace que ``sed_tot`` ne lit
+jamais les colonnes des populations. Un dossier de résultat est écrit sous
+un nom temporaire puis renommé, et n'est référencé dans l'index qu'une fois
+complet.
+"""
+import json
+import os
+import shutil
+import time
+import uuid
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+
+from .grain import write_grain
+from .outputs import link_outputs, open_outputs
+
+
+def default_store_dir():
+    """Racine des projets (``$DUSTEM_STORE_DIR`` ou ``~/.local/share/dustem_app``)"""
+    if os.environ.get("DUSTEM_STORE_DIR"):
+        return Path(os.environ["DUSTEM_STORE_DIR"])
+    base = os.environ.get("XDG_DATA_HOME") or Path.home() / ".local" / "share"
+    return Path(base) / "dustem_app" / "projects"
+
+
+class StoredResult(Mapping):
+    """Résultat stocké : dictionnaire de colonnes chargées à la demande"""
+
+    def __init__(self, path, columns):
+        self.path = Path(path)
+        self.columns = list(columns)
+        self._loaded = {}
+
+    def __getitem__(self, column):
+        if column not in self.columns:
+            raise KeyError(column)
+        if column not in self._loaded:
+            self._loaded[column] = np.load(self.path / f"{column}.npy", mmap_mode="r")
+        return self._loaded[column]
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def read(self, column):
+        """Lit une colonne entière sans projection en mémoire
+
+        Plus rapide que ``result[column]`` quand la colonne est lue en
+        totalité pour beaucoup de résultats (calculs sur tout un projet).
+        """
+        if column not in self.columns:
+            raise KeyError(column)
+        if column in self._loaded:
+            return self._loaded[column]
+        return np.load(self.path / f"{column}.npy")
+
+    @property
+    def meta(self):
+        """Métadonnées et configuration du résultat"""
+        with open(self.path / "meta.json", "r") as f:
+            return json.load(f)
+
+    @property
+    def config(self):
+        return self.meta.get("config")
+
+    def update_meta(self, values):
+        """Met à jour les métadonnées (``meta.json`` réécrit puis renommé)"""
+        meta = dict(self.meta, **values)
+        tmp = self.path / f".meta.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f, indent=1)
+        os.replace(tmp, self.path / "meta.json")
+
+    def record_stage(self, stage, seconds):
+        """Enregistre la durée d'une étape postérieure à l'exécution (ex. ``plot``) dans ses mesures"""
+        metrics = dict(self.meta.get("metrics") or {})
+        metrics["stages"] = dict(metrics.get("stages") or {}, **{stage: seconds})
+        self.update_meta({"metrics": metrics})
+
+    @property
+    def outputs(self):
+        """Autres fichiers de sortie de dustem : produit -> :class:`~dustem_core.outputs.OutputFile`"""
+        return open_outputs(self.path / "outputs")
+
+
+class ResultStore(Mapping):
+    """Résultats d'un projet, indexés par nom de test
+
+    Se comporte comme un dictionnaire en lecture (``store[nom]`` renvoie un
+    :class:`StoredResult`) ; ``append`` ajoute ou remplace un résultat et
+    ``del store[nom]`` le supprime. Les lignes ajoutées à l'index depuis la
+    dernière lecture sont lues dès que le fichier grandit (sans relire les
+    précédentes), ce qui permet à plusieurs sessions de partager un projet.
+    """
+
+    def __init__(self, project="default", root=None):
+        self.project = project
+        self.path = (Path(root) if root else default_store_dir()) / project
+        (self.path / "runs").mkdir(parents=True, exist_ok=True)
+        self.index_file = self.path / "index.jsonl"
+        self._entries = {}
+        # Octets de l'index déjà lus, et fichier (inode) auquel ils se rapportent
+        self._index_size = -1
+        self._index_inode = None
+
+    def _apply(self, entry):
+        self._entries.pop(entry["name"], None)
+        if not entry.get("deleted"):
+            self._entries[entry["name"]] = entry
+
+    def _refresh(self):
+        """Lit les lignes ajoutées à l'index depuis la dernière lecture
+
+        L'index n'est relu en entier que s'il a été remplacé ou tronqué ; une
+        dernière ligne incomplète (écriture en cours) sera lue au prochain
+        appel.
+        """
+        try:
+            st = self.index_file.stat()
+            size, inode = st.st_size, st.st_ino
+        except FileNotFoundError:
+            size, inode = 0, None
+        if size == self._index_size and inode == self._index_inode:
+            return
+        if inode is None:
+            self._entries, self._index_size, self._index_inode = {}, 0, None
+            return
+        if inode != self._index_inode or size < self._index_size:
+            self._entries = {}
+            self._index_size = 0
+            self._index_inode = inode
+        if size <= self._index_size:
+            return
+        with open(self.index_file, "rb") as f:
+            f.seek(self._index_size)
+            chunk = f.read(size - self._index_size)
+        complete = chunk.rfind(b"\n") + 1
+        for ligne in chunk[:complete].splitlines():
+            if ligne.strip():
+                self._apply(json.loads(ligne))
+        self._index_size += complete
+
+    def _log(self, entry):
+        """Ajoute une ligne à l'index en une seule écriture (O_APPEND)"""
+        ligne = (json.dumps(entry) + "\n").encode()
+        fd = os.open(self.index_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, ligne)
+        finally:
+            os.close(fd)
+
+    def __getitem__(self, name):
+        self._refresh()
+        entry = self._entries[name]
+        return StoredResult(self.path / "runs" / entry["run"], entry["columns"])
+
+    def __iter__(self):
+        self._refresh()
+        return iter(list(self._entries))
+
+    def __len__(self):
+        self._refresh()
+        return len(self._entries)
+
+    def __contains__(self, name):
+        self._refresh()
+        return name in self._entries
+
+    def __delitem__(self, name):
+        self._refresh()
+        entry = self._entries[name]
+        self._log({"name": name, "deleted": True, "time": time.time()})
+        shutil.rmtree(self.path / "runs" / entry["run"], ignore_errors=True)
+        self._refresh()
+
+    def entry(self, name):
+        """Ligne d'index d'un résultat (colonnes, taille, date...)"""
+        self._refresh()
+        return self._entries[name]
+
+    def config(self, name):
+        """Configuration (format ``dict_ligne``) ayant produit un résultat"""
+        return self[name].config
+
+    def append(self, name, columns, config=None, metadata=None, grain_template=None, outputs=None):
+        """Ajoute un résultat (remplace un résultat existant du même nom)
+
+        ``columns`` associe un nom de colonne à un tableau 1-D. Si
+        ``grain_template`` est fourni, le GRAIN.DAT exécuté est reconstruit à
+        partir de ce modèle et de ``config``. Les fichiers de sortie du
+        dossier ``outputs`` sont rangés avec le résultat (liens physiques si
+        possible) ; la liste des produits figure dans l'index.
+        """
+        self._refresh()
+        previous = self._entries.get(name)
+        run_id = uuid.uuid4().hex[:16]
+        tmp = self.path / "runs" / f".{run_id}.tmp"
+        tmp.mkdir()
+        n_wl = None
+        for column, values in columns.items():
+            values = np.asarray(values)
+            n_wl = len(values) if n_wl is None else n_wl
+            np.save(tmp / f"{column}.npy", values)
+        if config is not None and grain_template is not None:
+            write_grain(grain_template, config, dest=tmp / "GRAIN.DAT")
+        products = link_outputs(outputs, tmp / "outputs") if outputs is not None else []
+        meta = {"name": name, "created": time.time(), "config": config}
+        meta.update(metadata or {})
+        with open(tmp / "meta.json", "w") as f:
+            json.dump(meta, f, indent=1)
+        os.rename(tmp, self.path / "runs" / run_id)
+
+        entry = {
+            "name": name,
+            "run": run_id,
+            "columns": list(columns),
+            "n_wl": n_wl,
+            "created": meta["created"],
+            **({"outputs": products} if products else {}),
+        }
+        self._log(entry)
+        if previous is not None:
+            shutil.rmtree(self.path / "runs" / previous["run"], ignore_errors=True)
+        # La ligne sera relue au prochain _refresh (sans effet : même entrée)
+        self._apply(entry)
+        return StoredResult(self.path / "runs" / run_id, entry["columns"])
+
+
+def list_projects(root=None):
+    """Noms des projets existants"""
+    root = Path(root) if root else default_store_dir()
+    if not root.exists():
+        return []
+    return sorted(p.name for p in root.iterdir() if (p / "runs").is_dir())
@@ -0,0 +1,158 @@
+"""Balayages de paramètres : produit cartésien ou hypercube latin
+
+Un axe de balayage associe une clé (``G0`` ou ``pop<i>.<champ>``, par
+exemple ``pop1.amin``) à une liste de valeurs. Les axes sont décrits sous
+forme de texte, une ligne par axe::
+
+    G0 = 1e4:1e6:5:log
+    pop1.mdust_mh = 1e-3, 1.7e-3, 2e-3
+    pop2.nsize = 10:30:3
+
+``a:b:n`` donne ``n`` valeurs régulièrement espacées entre ``a`` et ``b``
+(``:log`` pour un espacement logarithmique) ; sinon les valeurs sont listées
+séparées par des virgules.
+"""
+import itertools
+import random
+
+import numpy as np
+
+from .grain import pop_fields
+
+# Champs de population pouvant être balayés
+SWEEP_FIELDS = ("mdust_mh", "amin", "amax", "alpha_a0", "at", "ac", "gamma", "nsize")
+
+
+def _format_value(field, value):
+    if field == "nsize":
+        return str(int(round(value)))
+    return f"{value:.4E}"
+
+
+def parse_axis(text):
+    """Analyse une spécification de valeurs (liste ou intervalle)
+
+    Renvoie un dictionnaire ``{"values", "lo", "hi", "log"}`` : ``values``
+    sert au produit cartésien, ``lo``/``hi``/``log`` à l'échantillonnage par
+    hypercube latin.
+    """
+    text = text.strip()
+    if ":" in text:
+        parts = [p.strip() for p in text.split(":")]
+        if len(parts) not in (3, 4) or (len(parts) == 4 and parts[3] not in ("log", "lin")):
+            raise ValueError(f"Intervalle invalide : {text!r} (attendu a:b:n[:log])")
+        lo, hi, n = float(parts[0]), float(parts[1]), int(parts[2])
+        log = len(parts) == 4 and parts[3] == "log"
+        if log and (lo <= 0 or hi <= 0):
+            raise ValueError(f"Un intervalle logarithmique doit être positif : {text!r}")
+        values = np.geomspace(lo, hi, n) if log else np.linspace(lo, hi, n)
+        return {"values": list(values), "lo": lo, "hi": hi, "log": log}
+
+    values = [float(v) for v in text.split(",") if v.strip()]
+    if not values:
+        raise ValueError("Aucune valeur fournie")
+    log = all(v > 0 for v in values) and max(values) / min(values) >= 100
+    return {"values": values, "lo": min(values), "hi": max(values), "log": log}
+
+
+def parse_axes(text):
+    """Analyse la description textuelle des axes (une ligne ``clé = valeurs``)"""
+    axes = {}
+    for ligne in text.splitlines():
+        ligne = ligne.strip()
+        if not ligne or ligne.startswith("#"):
+            continue
+        if "=" not in ligne:
+            raise ValueError(f"Ligne invalide : {ligne!r} (attendu clé = valeurs)")
+        key, spec = (s.strip() for s in ligne.split("=", 1))
+        _split_key(key)
+        axes[key] = parse_axis(spec)
+    return axes
+
+
+def _split_key(key):
+    """Renvoie (indice de population, champ) ; (None, "G0") pour G0"""
+    if key == "G0":
+        return None, "G0"
+    pop, _, field = key.partition(".")
+    if not pop.startswith("pop") or not pop[3:].isdigit() or field not in SWEEP_FIELDS:
+        raise ValueError(
+            f"Clé inconnue : {key!r} (G0 ou pop<i>.<champ>, champ parmi {', '.join(SWEEP_FIELDS)})"
+        )
+    return int(pop[3:]), field
+
+
+def apply_values(base_config, values):
+    """Copie ``base_config`` en remplaçant les paramètres de ``values``
+
+    Seules les valeurs balayées sont réécrites dans les lignes : les autres
+    colonnes (σ d'une loi log-normale, paramètres ``cv``...) restent telles
+    quelles.
+    """
+    config = dict(base_config)
+    pops = [k for k in base_config if k != "G0"]
+    for key, value in values.items():
+        idx, field = _split_key(key)
+        if idx is None:
+            config["G0"] = _format_value(field, value) + "\n"
+            continue
+        if idx > len(pops):
+            raise ValueError(f"{key} : le modèle de base n'a que {len(pops)} population(s)")
+        tokens = config[pops[idx - 1]].split()
+        fields = pop_fields(tokens[2])[:len(tokens)]
+        if field not in fields:
+            raise ValueError(f"{key} : sans effet pour le type {tokens[2]}")
+        tokens[fields.index(field)] = _format_value(field, value)
+        config[pops[idx - 1]] = "\t".join(tokens) + "\n"
+    return config
+
+
+def grid_points(axes):
+    """Produit cartésien des valeurs de chaque axe"""
+    keys = list(axes)
+    for combo in itertools.product(*(axes[k]["values"] for k in keys)):
+        yield dict(zip(keys, combo))
+
+
+def latin_hypercube_points(axes, n, seed=None):
+    """Échantillon en hypercube latin de ``n`` points dans les bornes des axes"""
+    rng = random.Random(seed)
+    columns = {}
+    for key, axis in axes.items():
+        strata = list(range(n))
+        rng.shuffle(strata)
+        u = [(s + rng.random()) / n for s in strata]
+        lo, hi = axis["lo"], axis["hi"]
+        if axis["log"]:
+            lo, hi = np.log10(lo), np.log10(hi)
+            columns[key] = [10 ** (lo + x * (hi - lo)) for x in u]
+        else:
+            columns[key] = [lo + x * (hi - lo) for x in u]
+    for i in range(n):
+        yield {key: columns[key][i] for key in axes}
+
+
+def count_points(axes, mode="grid", n=None):
+    """Nombre de modèles produits par un balayage"""
+    if mode == "lhs":
+        return n
+    return int(np.prod([len(a["values"]) for a in axes.values()]))
+
+
+def expand_sweep(base_config, axes, mode="grid", n=None, seed=None, prefix="sweep"):
+    """Développe un balayage en dictionnaires de tests nommés
+
+    ``mode`` vaut ``"grid"`` (produit cartésien) ou ``"lhs"`` (hypercube
+    latin de ``n`` points). Renvoie une liste de couples (nom, config).
+    """
+    if mode == "grid":
+        points = grid_points(axes)
+    elif mode == "lhs":
+        points = latin_hypercube_points(axes, n, seed=seed)
+    else:
+        raise ValueError(f"Mode de balayage inconnu : {mode!r}")
+
+    jobs = []
+    for i, values in enumerate(points):
+        jobs.append((f"{prefix}_{i:04d}", apply_values(base_config, values)))
+    return jobs
@@ -0,0 +1,224 @@
+"""Espaces de travail isolés pour les exécutions de dustem
+
+Chaque exécution dispose de son propre répertoire : un GRAIN.DAT privé, des
+liens symboliques vers le reste de l'arborescence ``data/`` (en lecture seule)
+et vers les autres dossiers du repository, et un dossier ``out/`` privé. Le
+binaire est lancé avec ce répertoire comme ``cwd`` : le processus serveur ne
+change jamais de répertoire courant et plusieurs modèles peuvent tourner en
+parallèle sans se marcher dessus.
+
+Cela suppose un binaire compilé avec des chemins relatifs
+(``data_path='./'`` dans ``DM_constants.f90``, cf. ``dowload_dustem.sh``).
+Un binaire compilé avec le chemin absolu du repository lit et écrit toujours
+les fichiers partagés : dans ce cas les exécutions sont sérialisées par un
+verrou (mode « partagé »), comme avant mais sans ``os.chdir``. Ce verrou est
+un ``flock`` sur ``out/.dustem.lock`` : il vaut aussi entre processus (lots
+de :func:`dustem_core.runner.run_batch`, plusieurs applications).
+"""
+import fcntl
+import hashlib
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from .grain import write_grain
+from .outputs import clear_outputs
+
+# Dossiers du repository qui ne sont jamais partagés entre exécutions
+PRIVATE_ENTRIES = ("data", "out", "runs")
+
+SHARED_LOCK_FILE = ".dustem.lock"
+
+_shared_lock = threading.Lock()
+_path_mode_cache = {}
+
+
+def _open_shared_lock(repository):
+    """Fichier verrou du mode partagé (dans ``out/``, sinon dans le dossier temporaire)"""
+    try:
+        return open(repository / "out" / SHARED_LOCK_FILE, "a")
+    except OSError:
+        digest = hashlib.sha256(str(repository).encode()).hexdigest()[:16]
+        return open(Path(tempfile.gettempdir()) / f"dustem_shared_{digest}.lock", "a")
+
+
+def binary_uses_shared_paths(binary, repository):
+    """Indique si le binaire a été compilé avec le chemin absolu du repository
+
+    Le résultat est mis en cache par (chemin, date de modification, taille)
+    pour ne relire le binaire qu'après une recompilation.
+    """
+    binary = Path(binary)
+    st = binary.stat()
+    key = (str(binary), st.st_mtime_ns, st.st_size, str(repository))
+    if key not in _path_mode_cache:
+        needle = (str(Path(repository).resolve()).rstrip("/") + "/").encode()
+        with open(binary, "rb") as f:
+            _path_mode_cache[key] = needle in f.read()
+    return _path_mode_cache[key]
+
+
+class RunWorkspace:
+    """Répertoire de travail d'une exécution de dustem
+
+    S'utilise comme gestionnaire de contexte ; le répertoire est supprimé à la
+    sortie sauf si ``keep=True``.
+    """
+
+    def __init__(self, repository, root=None, keep=False, binary=None):
+        self.repository = Path(repository).resolve()
+        self.binary = Path(binary) if binary else self.repository / "src" / "dustem"
+        self.root = Path(root) if root else Path(tempfile.gettempdir()) / "dustem_runs"
+        self.keep = keep
+        self.shared = False
+        self.path = None
+        self._lock_file = None
+        # Ressources du dernier processus terminé (os.wait4)
+        self.usage = None
+
+    def __enter__(self):
+        self.shared = binary_uses_shared_paths(self.binary, self.repository)
+        if self.shared:
+            _shared_lock.acquire()
+            try:
+                self._lock_file = _open_shared_lock(self.repository)
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+                self.path = self.repository
+                # Produits d'une exécution précédente (ex. EXT.RES d'un GRAIN.DAT avec « ext »)
+                clear_outputs(self.output_dir)
+            except BaseException:
+                if self._lock_file is not None:
+                    self._lock_file.close()
+                    self._lock_file = None
+                _shared_lock.release()
+                raise
+        else:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self.path = Path(tempfile.mkdtemp(prefix="run_", dir=self.root))
+            self._populate()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.shared:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+            _shared_lock.release()
+        elif not self.keep:
+            shutil.rmtree(self.path, ignore_errors=True)
+        return False
+
+    def _populate(self):
+        """Crée les liens vers le repository et les dossiers privés"""
+        for entry in self.repository.iterdir():
+            if entry.name not in PRIVATE_ENTRIES:
+                os.symlink(entry, self.path / entry.name)
+
+        data_dir = self.path / "data"
+        data_dir.mkdir()
+        for entry in (self.repository / "data").iterdir():
+            if entry.name != "GRAIN.DAT":
+                os.symlink(entry, data_dir / entry.name)
+
+        (self.path / "out").mkdir()
+
+    @property
+    def template(self):
+        """GRAIN.DAT partagé servant de modèle (commentaires et mots-clés)"""
+        return self.repository / "data" / "GRAIN.DAT"
+
+    @property
+    def grain_file(self):
+        return self.path / "data" / "GRAIN.DAT"
+
+    @property
+    def output_dir(self):
+        return self.path / "out"
+
+    @property
+    def sed_file(self):
+        return self.output_dir / "SED.RES"
+
+    @property
+    def cwd(self):
+        """Répertoire courant du processus dustem"""
+        return self.repository / "src" if self.shared else self.path
+
+    def write_grain(self, grain_dict):
+        """Écrit le GRAIN.DAT privé de l'exécution"""
+        write_grain(self.template, grain_dict, dest=self.grain_file)
+
+    def poll(self, proc):
+        """Code de retour du processus s'il est terminé, sinon ``None``
+
+        Le processus est récupéré par ``os.wait4`` pour conserver ses
+        ressources (temps CPU, max RSS) dans :attr:`usage`.
+        """
+        if proc.returncode is not None:
+            return proc.returncode
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+        if pid == 0:
+            return None
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        self.usage = usage
+        return proc.returncode
+
+    def wait(self, proc, timeout=None):
+        """Attend la fin du processus ; lève ``subprocess.TimeoutExpired`` au-delà de ``timeout``"""
+        if timeout is None:
+            if proc.returncode is None:
+                _, status, self.usage = os.wait4(proc.pid, 0)
+                proc.returncode = os.waitstatus_to_exitcode(status)
+            return proc.returncode
+        deadline = time.monotonic() + timeout
+        delay = 0.001
+        while self.poll(proc) is None:
+            if time.monotonic() > deadline:
+                raise subprocess.TimeoutExpired(proc.args, timeout)
+            time.sleep(delay)
+            delay = min(2 * delay, 0.05)
+        return proc.returncode
+
+    def run(self, timeout=None):
+        """Lance dustem dans l'espace de travail et attend la fin
+
+        Lève ``subprocess.TimeoutExpired`` (processus arrêté) au-delà de
+        ``timeout`` secondes. Les sorties passent par des fichiers
+        temporaires pour pouvoir attendre le processus avec ``wait4``.
+        """
+        with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+            proc = subprocess.Popen(
+                [str(self.binary)], cwd=self.cwd, stdout=out, stderr=err, start_new_session=True
+            )
+            try:
+                self.wait(proc, timeout)
+            except subprocess.TimeoutExpired:
+                os.killpg(proc.pid, signal.SIGKILL)
+                self.wait(proc)
+                raise
+            out.seek(0)
+            err.seek(0)
+            return subprocess.CompletedProcess(
+                proc.args, proc.returncode, out.read().decode(errors="replace"), err.read().decode(errors="replace")
+            )
+
+    def popen(self):
+        """Lance dustem sans attendre la fin, sorties lisibles en flux
+
+        Le processus est placé dans sa propre session pour pouvoir être
+        arrêté avec tous ses descendants.
+        """
+        return subprocess.Popen(
+            [str(self.binary)],
+            cwd=self.cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            start_new_session=True,
+        )
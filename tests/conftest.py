@@ -0,0 +1,60 @@
+"""Fixtures communes : environnement isolé et faux repository dustEM
+
+Les tests n'écrivent jamais dans le répertoire personnel : cache, stockage,
+journal, mesures et configuration pointent vers le dossier temporaire du
+test, y compris pour les processus des lots (variables d'environnement).
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dustem_core.fake_dustem import POP_LINE, make_fake_repository  # noqa: E402
+
+
+def model(g0, n_pops=2, mdust=1e-3):
+    """Configuration (format ``dict_ligne``) pour le faux repository"""
+    config = {"G0": f"{g0}\n"}
+    for i in range(1, n_pops + 1):
+        tokens = POP_LINE.format(type=f"POP{i}").split("\t")
+        tokens[3] = f"{mdust * i:.3E}"
+        config[f"pop{i}"] = "\t".join(tokens)
+    return config
+
+
+@pytest.fixture(autouse=True)
+def isolated_env(tmp_path, monkeypatch):
+    for name, value in {
+        "DUSTEM_CACHE_DIR": tmp_path / "cache",
+        "DUSTEM_STORE_DIR": tmp_path / "store",
+        "DUSTEM_JOURNAL": tmp_path / "journal.sqlite",
+        "DUSTEM_METRICS_FILE": tmp_path / "metrics.jsonl",
+        "DUSTEM_APP_CONFIG": tmp_path / "config.json",
+        "TMPDIR": tmp_path / "tmp",
+    }.items():
+        monkeypatch.setenv(name, str(value))
+    for name in ("DUSTEM_BINARY", "DUSTEM_REPOSITORY", "DUSTEM_WORKER_LISTEN", "DUSTEM_WORKER_TOKEN"):
+        monkeypatch.delenv(name, raising=False)
+    (tmp_path / "tmp").mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path / "tmp"))
+
+
+@pytest.fixture
+def fake_repo(tmp_path):
+    """Faux repository en espaces de travail isolés (``data_path='./'``)"""
+    return make_fake_repository(tmp_path / "repo", n_wl=50, n_pops=2)
+
+
+@pytest.fixture
+def shared_repo(tmp_path):
+    """Faux repository compilé avec son chemin absolu (mode partagé)"""
+    return make_fake_repository(tmp_path / "shared", n_wl=50, n_pops=2, runtime=0.2, shared=True)
+
+
+# Lignes de population aux colonnes facultatives (σ log-normal, paramètres cv)
+LOGN_LINE = "PAHx\t10\tmix-logn\t7.80E-05\t2.24E+00\t3.10E-08\t1.20E-07\t6.40E-08\t1.00E-01\n"
+CV_LINE = ("aSil\t25\tplaw-ed-cv\t2.55E-03\t3.00E+00\t4.00E-07\t2.00E-04\t-3.40E+00"
+           "\t1.00E-06\t5.00E-06\t1.00E+00\t1.00E-05\t3.00E-01\t1.00E+00\n")
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from dustem_core.abundance import fit_abundances, nnls, rescale, scale_factors, with_abundances
+
+from conftest import LOGN_LINE, model
+
+
+def test_nnls_recovers_nonnegative_solution():
+    rng = np.random.default_rng(0)
+    A = rng.random((40, 4))
+    x = np.array([0.5, 0.0, 2.0, 1.5])
+    np.testing.assert_allclose(nnls(A, A @ x), x, atol=1e-10)
+
+
+def test_nnls_clips_negative_components():
+    A = np.eye(3)
+    np.testing.assert_allclose(nnls(A, np.array([1.0, -2.0, 3.0])), [1.0, 0.0, 3.0])
+
+
+def test_nnls_matches_optimality_conditions():
+    rng = np.random.default_rng(1)
+    A = rng.normal(size=(30, 5))
+    b = rng.normal(size=30)
+    x = nnls(A, b)
+    w = A.T @ (b - A @ x)
+    assert np.all(x >= 0)
+    # KKT : gradient nul sur les variables libres, négatif ou nul sur les autres
+    np.testing.assert_allclose(w[x > 0], 0, atol=1e-9)
+    assert np.all(w[x == 0] <= 1e-9)
+
+
+def test_fit_abundances_on_sed_scale_values():
+    wl = np.logspace(-1, 4, 200)
+    result = {"wl": wl, "pop1": 1e-18 * wl ** -1.0, "pop2": 3e-18 * wl ** -1.5}
+    result["sed_tot"] = result["pop1"] + result["pop2"]
+    wl_obs = np.array([0.3, 1.0, 5.0, 20.0, 100.0, 500.0])
+    flux = 2.0 * 1e-18 * wl_obs ** -1.0 + 0.5 * 3e-18 * wl_obs ** -1.5
+    fit = fit_abundances(result, wl_obs, flux, sigma=0.05 * flux)
+    np.testing.assert_allclose(fit["factors"], [2.0, 0.5], rtol=1e-6)
+    assert fit["chi2"] < 1e-10
+    assert fit["dof"] == 4
+    assert fit["columns"] == ["pop1", "pop2"]
+
+
+def test_fit_abundances_needs_points_on_the_grid():
+    wl = np.logspace(0, 2, 10)
+    result = {"wl": wl, "pop1": wl, "pop2": wl}
+    with pytest.raises(ValueError):
+        fit_abundances(result, [1e5], [1.0])
+
+
+def test_rescale_and_factors():
+    data = np.array([[1.0, 1.0, 2.0, 3.0], [2.0, 4.0, 4.0, 8.0]])
+    np.testing.assert_allclose(rescale(data, [2.0, 0.5]), [[1.0, 2.0, 1.0, 3.0], [2.0, 8.0, 2.0, 10.0]])
+    assert scale_factors([1e-3, 2e-3], [2e-3, 1e-3]) == [2.0, 0.5]
+    assert scale_factors([0.0, 1.0], [1e-3, 1.0]) is None
+    assert with_abundances(model(1), [5e-3, 0.0])["pop1"].split()[3] == "5.000E-03"
+
+
+
+def test_batch_derives_abundance_variants(fake_repo):
+    from dustem_core import api
+    from dustem_core.store import ResultStore
+
+    api.run_batch({"a": model(10, mdust=1e-3)}, repository=fake_repo, project="p")
+    (outcome,) = api.run_batch({"b": model(10, mdust=3e-3)}, repository=fake_repo, project="p")
+    assert outcome["derived"]["factors"] == [3.0, 3.0]
+    store = ResultStore("p")
+    assert store["b"].meta["source"] == "derived"
+    np.testing.assert_allclose(store["b"]["sed_tot"], 3 * store["a"]["sed_tot"], rtol=1e-6)
+
+
+def test_sigma_change_is_not_derived(fake_repo):
+    from dustem_core.abundance import derive_from_cache, model_shape
+    from dustem_core.cache import ResultCache, model_key
+
+    base = {"G0": "1.0\n", "pop1": LOGN_LINE}
+    other = {"G0": "1.0\n", "pop1": LOGN_LINE.replace("1.00E-01", "2.00E-01")}
+    assert model_shape(fake_repo, base)[0] != model_shape(fake_repo, other)[0]
+
+    cache = ResultCache()
+    key, binary = model_key(fake_repo, base)
+    data = np.ones((5, 3))
+    cache.put(key, data, binary, shape=model_shape(fake_repo, base))
+    assert derive_from_cache(cache, fake_repo, dict(base, pop1=LOGN_LINE.replace("7.80E-05", "1.56E-04")))
+    assert derive_from_cache(cache, fake_repo, other) is None
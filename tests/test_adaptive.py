@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from dustem_core.adaptive import refine_sweep, sed_distance
+from dustem_core.sweep import parse_axes
+
+from conftest import model
+
+
+def test_sed_distance_ignores_scale():
+    wl = np.logspace(-1, 1, 101)
+    assert sed_distance(wl ** -1.0, 3 * wl ** -1.0) == pytest.approx(0.0, abs=1e-12)
+    # Pente changée de 0.1 sur deux décades, décalage médian retiré : 0.1 dex
+    assert sed_distance(wl ** -1.0, wl ** -1.1) == pytest.approx(0.1, rel=1e-6)
+
+
+def test_scale_only_axis_converges_on_coarse_grid(fake_repo):
+    result = refine_sweep(fake_repo, model(1), parse_axes("G0 = 1:1e4:3:log"), tol=0.01)
+    assert result["status"] == "converged"
+    assert result["rounds"] == []
+    assert len(result["outcomes"]) == 3
+    assert result["uniform_equivalent"] == 3
+
+
+def test_refines_where_the_shape_changes(fake_repo):
+    rounds = []
+    axes = parse_axes("pop1.mdust_mh = 1e-6:1e-1:3:log")
+    result = refine_sweep(fake_repo, model(1), axes, tol=0.02, budget=100, max_depth=4, on_round=rounds.append)
+    assert result["rounds"] == rounds and rounds
+    assert result["status"] in ("converged", "max_depth")
+    assert len(result["outcomes"]) < result["uniform_equivalent"]
+    values = [o["point"]["pop1.mdust_mh"] for o in result["outcomes"]]
+    assert len(set(values)) == len(values)
+    assert min(values) == pytest.approx(1e-6) and max(values) == pytest.approx(1e-1)
+    if result["status"] == "converged":
+        assert result["max_diff"] <= 0.02
+
+
+def test_budget_stops_refinement(fake_repo):
+    axes = parse_axes("pop1.mdust_mh = 1e-6:1e-1:3:log")
+    result = refine_sweep(fake_repo, model(1), axes, tol=0.001, budget=6)
+    assert result["status"] == "budget"
+    assert len(result["outcomes"]) <= 6
+    assert result["max_diff"] > 0.001
+    with pytest.raises(ValueError):
+        refine_sweep(fake_repo, model(1), parse_axes("G0 = 1:10:8"), budget=6)
@@ -0,0 +1,71 @@
+import json
+
+import numpy as np
+import pytest
+
+from dustem_core import api
+from dustem_core.analytics import (
+    ANALYTICS_FILE, band_power, band_ratios, compute, model_analytics, parse_bands, parse_ratios, residuals,
+)
+from dustem_core.matrix import SEDMatrix
+from dustem_core.store import ResultStore
+
+from conftest import model
+
+
+def test_compute_on_power_laws():
+    wl = np.logspace(0, 2, 2001)
+    pop1, pop2 = np.ones((1, len(wl))), 3 * np.ones((1, len(wl)))
+    out = compute(wl, pop1 + pop2, {"pop1": pop1, "pop2": pop2}, [(2.0, 20.0)])
+    # Spectre plat en log λ : puissance = 4 ln(100)
+    np.testing.assert_allclose(out["power"], 4 * np.log(100.0))
+    np.testing.assert_allclose(out["pop1_frac"] + out["pop2_frac"], 1.0)
+    np.testing.assert_allclose(out["band:2:20"], 4 * np.log(10.0))
+    # Bande hors de la grille
+    assert np.isnan(band_power(wl, pop1, 0.5, 2.0)).all()
+
+    peaked = np.exp(-np.log(wl / 10.0) ** 2)[None, :]
+    assert compute(wl, peaked)["peak_wl"][0] == pytest.approx(10.0)
+
+
+def test_residuals_to_reference():
+    wl = np.logspace(0, 2, 50)
+    matrix = SEDMatrix(["ref", "double", "slope"], wl, np.stack([wl ** -1.0, 2 * wl ** -1.0, wl ** -1.5]))
+    out = residuals(matrix, "ref")
+    np.testing.assert_allclose(out["power_ratio"][:2], [1.0, 2.0])
+    np.testing.assert_allclose(out["rms_dex"][:2], [0.0, np.log10(2.0)], atol=1e-12)
+    np.testing.assert_allclose(out["max_dex"][2], 1.0)
+
+
+def test_model_analytics_is_cached(fake_repo):
+    api.run_batch({f"g{g0}": model(g0) for g0 in (1, 10, 100)}, repository=fake_repo, project="p")
+    store = ResultStore("p")
+    bands = parse_bands("b1 = 1:10\nb2 = 10:100  # IR lointain")
+    frame = model_analytics(store, bands=bands)
+    assert list(frame.index) == ["g1", "g10", "g100"]
+    assert list(frame.columns) == ["G0", "power", "peak_wl", "peak", "pop1_frac", "pop2_frac", "b1", "b2"]
+    np.testing.assert_allclose(frame["power"] / frame["G0"], frame["power"].iloc[0], rtol=1e-5)
+    np.testing.assert_allclose(frame["pop1_frac"] + frame["pop2_frac"], 1.0)
+
+    path = store.path / ANALYTICS_FILE
+    lines = path.read_text().splitlines()
+    assert len(lines) == 3
+    # Rien à recalculer ; une nouvelle bande n'ajoute que sa colonne
+    model_analytics(store, bands=bands)
+    assert path.read_text().splitlines() == lines
+    bands["b3"] = (2.0, 20.0)
+    again = model_analytics(store, bands=bands)
+    new = [json.loads(line) for line in path.read_text().splitlines()[3:]]
+    assert len(new) == 3 and all(set(record) == {"run", "band:2:20"} for record in new)
+    np.testing.assert_allclose(again["b1"], frame["b1"])
+
+    ratios = band_ratios(again, parse_ratios("b2/b1, b3/b1", bands))
+    assert list(ratios.columns) == ["b2/b1", "b3/b1"]
+    with pytest.raises(ValueError):
+        parse_ratios("b1/b9", bands)
+
+
+def test_parse_bands_errors():
+    for text in ("b1 1:10", "b1 = 10", "b1 = 10:1", "b1 = 0:1"):
+        with pytest.raises(ValueError):
+            parse_bands(text)
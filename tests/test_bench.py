@@ -0,0 +1,57 @@
+import pytest
+
+from dustem_core import bench
+from dustem_core.fake_dustem import make_fake_repository
+
+PARAMS = dict(bench.DEFAULTS, n_wl=50, n_pops=2, models=4, workers=2, repeat=2)
+
+
+@pytest.fixture
+def bench_repo(tmp_path):
+    return make_fake_repository(tmp_path / "repo", n_wl=PARAMS["n_wl"], n_pops=PARAMS["n_pops"])
+
+
+@pytest.mark.parametrize("scenario, stages", [
+    ("single", {"workspace", "grain", "process", "parse", "store", "plot", "export_csv", "process_overhead"}),
+    ("sweep", {"batch", "store", "per_model", "per_model_overhead"}),
+    ("compare", {"matrix", "plot", "export_csv", "export_parquet"}),
+])
+def test_scenarios_time_every_stage(tmp_path, bench_repo, scenario, stages):
+    summary = bench.BENCHMARKS[scenario](bench_repo, tmp_path, PARAMS)
+    assert set(summary) == stages
+    assert all(values["min"] <= values["median"] for values in summary.values())
+    if scenario == "single":
+        assert summary["parse"]["n"] == PARAMS["repeat"]
+
+
+def test_run_benchmarks_in_fresh_process():
+    report = bench.run_benchmarks(["single"], n_wl=20, n_pops=1, repeat=1)
+    assert report["params"]["n_wl"] == 20
+    result = report["scenarios"]["single"]
+    assert result["peak_rss_mb"] > 0
+    assert "process" in result["stages"]
+    assert "[single]" in bench.format_report(report)
+
+
+def report(median, rss=100.0, **params):
+    return {
+        "params": dict(PARAMS, **params),
+        "scenarios": {"single": {"stages": {"process": {"median": median}}, "peak_rss_mb": rss}},
+    }
+
+
+def test_compare_to_baseline():
+    baseline = report(0.100)
+    assert bench.compare_to_baseline(report(0.110), baseline) == []
+    # Écart relatif dépassé mais absolu négligeable
+    assert bench.compare_to_baseline(report(0.004), report(0.002)) == []
+    regressions = bench.compare_to_baseline(report(0.200, rss=200.0), baseline)
+    assert [r.split(" :")[0] for r in regressions] == ["single.process", "single.peak_rss"]
+    with pytest.raises(ValueError):
+        bench.compare_to_baseline(report(0.100, n_wl=10), baseline)
+
+
+def test_report_round_trip(tmp_path):
+    path = tmp_path / "bench.json"
+    bench.save_report(report(0.1), path)
+    assert bench.load_report(path) == report(0.1)
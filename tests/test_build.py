@@ -0,0 +1,94 @@
+import hashlib
+import tarfile
+
+import pytest
+
+from dustem_core.build import (
+    BUILD_FILE, BuildError, BuildSpec, build, build_info, fetch_archive, list_builds, patch_constants, read_build,
+)
+
+CONSTANTS = """MODULE CONSTANTS
+  CHARACTER (len=200) :: data_path='/home/dustem/'
+  CHARACTER(len=200)  :: dir_PDR = "/home/dustem/PDR/"
+END MODULE CONSTANTS
+"""
+
+# Le « binaire » est un script : make copie dustem.in et y écrit $(FC)
+MAKEFILE = "FC = gfortran\n\ndustem: dustem.in\n\tsed 's/@FC@/$(FC)/' dustem.in > dustem\n"
+
+SCRIPT = "#!/bin/sh\necho compilé avec @FC@\n"
+
+
+@pytest.fixture
+def tarball(tmp_path):
+    src = tmp_path / "sources" / "dustem4.3" / "src"
+    src.mkdir(parents=True)
+    (src / "DM_constants.f90").write_text(CONSTANTS)
+    (src / "Makefile").write_text(MAKEFILE)
+    (src / "dustem.in").write_text(SCRIPT)
+    (src.parent / "data").mkdir()
+    archive = tmp_path / "dustem4.3_web.tar.gz"
+    with tarfile.open(archive, "w:gz") as tar:
+        tar.add(src.parent, arcname="dustem4.3")
+    return archive
+
+
+def sha256(path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def test_fetch_archive_checks_the_sum(tmp_path, tarball):
+    cache = tmp_path / "tarballs"
+    with pytest.raises(BuildError):
+        fetch_archive(tarball.as_uri(), cache, sha256="0" * 64)
+    assert not (cache / tarball.name).exists()
+
+    path, digest = fetch_archive(tarball.as_uri(), cache, sha256=sha256(tarball))
+    assert digest == sha256(tarball) and path.read_bytes() == tarball.read_bytes()
+    assert (cache / f"{tarball.name}.sha256").read_text().split()[0] == digest
+    # Hors ligne : l'archive en cache est vérifiée contre la somme enregistrée
+    tarball.unlink()
+    assert fetch_archive(tarball.as_uri(), cache) == (path, digest)
+    path.write_bytes(b"archive modifiee")
+    with pytest.raises(BuildError):
+        fetch_archive(tarball.as_uri(), cache)
+
+
+def test_build_is_reused_and_keyed_on_its_content(tmp_path, tarball):
+    root = tmp_path / "builds"
+    messages = []
+    spec = BuildSpec(url=tarball, sha256=sha256(tarball), data_path="{repository}")
+    repository = build(spec, root=root, jobs=2, smoke=True, log=messages.append)
+    assert repository == root / f"dustem4.3-{spec.digest}"
+    constants = (repository / "src" / "DM_constants.f90").read_text()
+    assert f"data_path='{repository}/'" in constants and "dir_PDR = './'" in constants
+    assert "gfortran" in (repository / "src" / "dustem").read_text()
+    info = read_build(repository)
+    assert info["digest"] == spec.digest and info["archive_sha256"] == sha256(tarball)
+    assert build_info(repository) == {"build": spec.digest, "build_name": "dustem4.3"}
+
+    messages.clear()
+    assert build(BuildSpec(url=tarball, data_path="{repository}"), root=root, log=messages.append) == repository
+    assert "déjà construit" in messages[0]
+
+    # Autres variables de make : autre build, à côté du premier
+    other = build(BuildSpec(url=tarball, sha256=sha256(tarball), make_vars={"FC": "ifort"}), root=root)
+    assert other != repository and "ifort" in (other / "src" / "dustem").read_text()
+    assert sorted(b["path"] for b in list_builds(root)) == sorted([str(repository), str(other)])
+
+    # Binaire modifié ou build interrompu : refait
+    (repository / "src" / "dustem").write_text("#!/bin/sh\n")
+    build(spec, root=root)
+    assert "gfortran" in (repository / "src" / "dustem").read_text()
+    (other / BUILD_FILE).unlink()
+    assert [b["path"] for b in list_builds(root)] == [str(repository)]
+
+
+def test_patch_constants_requires_one_declaration(tmp_path):
+    path = tmp_path / "DM_constants.f90"
+    path.write_text(CONSTANTS + CONSTANTS)
+    with pytest.raises(BuildError):
+        patch_constants(path, {"data_path": "./"})
+    path.write_text(CONSTANTS)
+    patch_constants(path, {"data_path": "./", "dir_PDR": "./PDR/"})
+    assert "data_path='./'" in path.read_text() and "dir_PDR = './PDR/'" in path.read_text()
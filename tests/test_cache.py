@@ -0,0 +1,96 @@
+import json
+
+import numpy as np
+import pytest
+
+from dustem_core.cache import ResultCache, canonical_model, inputs_digest, model_key
+
+from conftest import CV_LINE, LOGN_LINE, model
+
+
+def test_canonical_numbers():
+    a = model("1e5")
+    b = model("1.0E+05")
+    b["pop1"] = b["pop1"].replace("1.000E-03", "0.001")
+    assert canonical_model(a) == canonical_model(b)
+    assert canonical_model(a) != canonical_model(model("2e5"))
+
+
+@pytest.mark.parametrize("line, old, new", [
+    (LOGN_LINE, "1.00E-01", "5.00E-01"),  # largeur σ de la loi log-normale
+    (CV_LINE, "3.00E-01", "4.00E-01"),  # paramètre cv
+])
+def test_key_covers_every_column(fake_repo, line, old, new):
+    a = {"G0": "1.00E+00\n", "pop1": line}
+    b = {"G0": "1.00E+00\n", "pop1": line.replace(old, new)}
+    assert canonical_model(a) != canonical_model(b)
+    assert model_key(fake_repo, a)[0] != model_key(fake_repo, b)[0]
+    assert model_key(fake_repo, a, abundances=False)[0] != model_key(fake_repo, b, abundances=False)[0]
+    # Même modèle écrit autrement
+    c = {"G0": "1\n", "pop1": line.replace(old, str(float(old))).replace("\t", "  ")}
+    assert model_key(fake_repo, a)[0] == model_key(fake_repo, c)[0]
+
+
+def test_shape_key_ignores_abundances(fake_repo):
+    key, _ = model_key(fake_repo, model(1, mdust=1e-3))
+    other, _ = model_key(fake_repo, model(1, mdust=2e-3))
+    assert key != other
+    shape, _ = model_key(fake_repo, model(1, mdust=1e-3), abundances=False)
+    assert shape == model_key(fake_repo, model(1, mdust=2e-3), abundances=False)[0]
+
+
+def test_key_depends_on_binary_and_inputs(fake_repo):
+    key, digest = model_key(fake_repo, model(1))
+    (fake_repo / "data" / "LAMBDA.DAT").write_text("# autre grille\n10\n")
+    changed_inputs, _ = model_key(fake_repo, model(1))
+    assert changed_inputs != key
+    with open(fake_repo / "src" / "dustem", "a") as f:
+        f.write("# recompilé\n")
+    changed_binary, new_digest = model_key(fake_repo, model(1))
+    assert new_digest != digest
+    assert changed_binary not in (key, changed_inputs)
+
+
+def test_inputs_digest_ignores_build_file_and_outputs(fake_repo):
+    before = inputs_digest(fake_repo)
+    (fake_repo / "BUILD.json").write_text(json.dumps({"digest": "x"}))
+    (fake_repo / "out" / "SED.RES").write_text("sortie")
+    (fake_repo / "data" / "GRAIN.DAT").write_text("autre modèle")
+    assert inputs_digest(fake_repo) == before
+
+
+def test_get_put_and_counters(tmp_path):
+    cache = ResultCache(tmp_path / "c")
+    data = np.arange(12.0).reshape(4, 3)
+    assert cache.get("k" * 64) is None
+    cache.put("k" * 64, data, "bin")
+    np.testing.assert_array_equal(cache.get("k" * 64), data)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_entries_of_other_binaries_are_kept(tmp_path):
+    cache = ResultCache(tmp_path / "c")
+    cache.put("a" * 64, np.ones((4, 3)), "build_a")
+    cache.put("b" * 64, np.ones((4, 3)), "build_b")
+    assert cache.get("a" * 64) is not None
+    assert cache.get("b" * 64) is not None
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResultCache(tmp_path / "c", max_bytes=10_000)
+    data = np.ones((200, 3))
+    for i, key in enumerate("abc"):
+        cache.put(key * 64, data, "bin")
+        if i == 1:
+            cache.get("a" * 64)
+    assert cache.get("a" * 64) is not None
+    assert cache.get("b" * 64) is None
+    assert cache.get("c" * 64) is not None
+
+
+def test_find_shape(tmp_path):
+    cache = ResultCache(tmp_path / "c")
+    cache.put("a" * 64, np.ones((4, 4)), "bin", shape=("forme", [1e-3, 2e-3]))
+    assert cache.find_shape("forme") == [("a" * 64, [1e-3, 2e-3])]
+    assert cache.find_shape("autre") == []
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from dustem_core import api
+from dustem_core.emulator import feature_names, features, predict_or_run, train_emulators, with_features
+from dustem_core.store import ResultStore
+
+from conftest import CV_LINE, LOGN_LINE, model
+
+CONFIG = {"G0": "1.0\n", "pop1": LOGN_LINE, "pop2": CV_LINE}
+
+
+def test_features_follow_type_keywords():
+    assert feature_names(CONFIG) == ["G0"] + [
+        f"pop1.{k}" for k in ("rho", "amin", "amax", "alpha_a0", "sigma")
+    ] + [
+        f"pop2.{k}" for k in ("rho", "amin", "amax", "alpha_a0", "at", "ac", "gamma", "au", "zeta", "eta")
+    ]
+    x, mdust = features(CONFIG)
+    assert len(x) == len(feature_names(CONFIG))
+    assert x[5] == 0.1
+    assert list(x[-3:]) == [1e-5, 0.3, 1.0]
+    np.testing.assert_allclose(mdust, [7.8e-5, 2.55e-3])
+
+
+def test_with_features_rewrites_only_the_given_columns():
+    new = with_features(CONFIG, {"pop1.sigma": 0.2, "pop2.zeta": 0.5, "G0": 10.0})
+    assert new["pop1"].split() == LOGN_LINE.replace("1.00E-01", "2.000E-01").split()
+    assert new["pop2"].split()[12] == "5.000E-01"
+    assert new["pop2"].split()[:12] == CV_LINE.split()[:12]
+    assert float(new["G0"]) == 10.0
+    # Une population sans ``ed`` n'a pas de at/ac/gamma
+    with pytest.raises(ValueError):
+        with_features(CONFIG, {"pop1.at": 1e-6})
+
+
+def test_emulator_predicts_inside_training_range(fake_repo):
+    api.run_batch({f"g{i}": model(g0) for i, g0 in enumerate(np.geomspace(1, 1e3, 6))},
+                  repository=fake_repo, project="emu")
+    (emulator,) = train_emulators(ResultStore("emu")).values()
+    assert emulator.active_features == ["G0"]
+
+    prediction = emulator.predict(model(30, mdust=2e-3))
+    assert prediction.reliable()
+    exact = api.run_model(model(30, mdust=2e-3), repository=fake_repo)
+    np.testing.assert_allclose(prediction.data.data[:, -1], exact.data[:, -1], rtol=1e-3)
+
+    outside = model(1e5)
+    assert emulator.inside(outside) == "hors de l'intervalle d'entraînement"
+    data, prediction = predict_or_run({emulator.family: emulator}, outside, repository=fake_repo)
+    assert prediction is None and data is not None
@@ -0,0 +1,67 @@
+import gzip
+import io
+import json
+import sys
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dustem_core import api
+from dustem_core.export import export_results
+from dustem_core.fake_dustem import make_fake_repository
+from dustem_core.store import ResultStore
+
+from conftest import model
+
+
+@pytest.fixture
+def store(tmp_path):
+    repo = make_fake_repository(tmp_path / "repo", n_wl=20, n_pops=2, keywords="sed ext")
+    models = {"a": model(1), "b": model(10, n_pops=1), "c": model(100)}
+    api.run_batch(models, workers=2, repository=repo, project="p", cache=False)
+    return ResultStore("p")
+
+
+def test_parquet_one_row_group_per_model(tmp_path, store):
+    import pyarrow.parquet as pq
+
+    path = tmp_path / "p.parquet"
+    export_results(store, path, names=["a", "b", "c"])
+    assert pq.ParquetFile(path).num_row_groups == 3
+    table = pd.read_parquet(path)
+    assert list(table.columns) == ["model", "wavelength_um", "sed_tot", "pop1", "pop2"]
+    assert len(table) == 60
+    b = table[table.model == "b"]
+    assert b.pop2.isna().all()
+    np.testing.assert_allclose(b.sed_tot, store["b"]["sed_tot"])
+
+
+def test_csv_gz_matches_parquet(tmp_path, store):
+    export_results(store, tmp_path / "p.parquet")
+    export_results(store, tmp_path / "p.csv.gz", fmt="csv.gz")
+    with gzip.open(tmp_path / "p.csv.gz", "rt") as f:
+        csv = pd.read_csv(f)
+    pd.testing.assert_frame_equal(csv, pd.read_parquet(tmp_path / "p.parquet"), check_dtype=False)
+
+
+def test_zip_has_a_folder_per_model(store):
+    buffer = io.BytesIO()
+    export_results(store, buffer, fmt="zip", names=["a", "b"])
+    with zipfile.ZipFile(buffer) as zf:
+        files = set(zf.namelist())
+        assert {"a/a_data.csv", "a/GRAIN.DAT", "a/meta.json", "a/EXT.RES", "b/b_data.csv"} <= files
+        assert not any(f.startswith("c/") for f in files)
+        assert json.loads(zf.read("a/meta.json"))["grain_types"] == ["POP1", "POP2"]
+        data = pd.read_csv(zf.open("b/b_data.csv"))
+    assert list(data.columns) == ["wavelength_um", "sed_tot", "pop1"]
+
+
+def test_export_errors(store, monkeypatch):
+    with pytest.raises(ValueError):
+        export_results(store, io.BytesIO(), fmt="xlsx")
+    # Sans pyarrow (API ou CLI sans Streamlit) : message explicite
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    with pytest.raises(ValueError, match="pyarrow"):
+        export_results(store, io.BytesIO(), fmt="parquet")
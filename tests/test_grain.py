@@ -0,0 +1,76 @@
+import io
+
+import pytest
+
+from dustem_core.grain import GrainFile, parse_grain, read_grain, write_grain
+from dustem_core.manifest import iter_manifest, write_manifest
+
+from conftest import model
+
+GRAIN = (
+    "# DUSTEM grain file\r\n"
+    "# type  nsize  type_keywords  Mdust/MH  rho  amin  amax  alpha/a0  at  ac  gamma\r\n"
+    "sed ext\r\n"
+    "  1.00E+00\r\n"
+    "PAHx  10  logn  7.80E-05 2.24E+00 3.10E-08 1.20E-07 6.40E-08 1.00E-01\r\n"
+    "\r\n"
+    "aSilx\t25\tplaw-ed\t2.55E-03\t3.00E+00\t4.00E-07\t2.00E-04\t-3.40E+00\t1.00E-06\t5.00E-06\t1.00E+00"
+)
+
+
+def test_parse_grain_round_trip():
+    grain = parse_grain(GRAIN)
+    assert grain.text() == GRAIN
+    assert grain.g0 == "1.00E+00"
+    assert [p["grain_type"] for p in grain.populations] == ["PAHx", "aSilx"]
+    assert grain.keywords == ["sed ext\r\n"]
+
+
+def test_grain_file_added_and_removed_populations():
+    grain = parse_grain(GRAIN)
+    config = dict(grain.config)
+    del config["pop1"]
+    config["pop3"] = config["pop2"].replace("aSilx", "CM20")
+    text = GrainFile(config, grain.layout).text()
+    assert "PAHx" not in text
+    assert text.index("aSilx") < text.index("CM20")
+    assert text.startswith("# DUSTEM grain file\r\n")
+
+
+def test_parse_grain_requires_g0():
+    with pytest.raises(ValueError):
+        parse_grain("# commentaire seul\n")
+
+
+def test_write_grain_keeps_template_keywords(tmp_path):
+    template = tmp_path / "GRAIN.DAT"
+    template.write_text(GRAIN, newline="")
+    config = model(1e4)
+    write_grain(template, config, dest=tmp_path / "out.DAT")
+    written = read_grain(tmp_path / "out.DAT")
+    assert [k.strip() for k in written.keywords] == ["sed ext"]
+    assert written.config == config
+
+
+@pytest.mark.parametrize("fmt", ["csv", "json", "jsonl", "yaml"])
+def test_manifest_round_trip(fmt):
+    # Les manifestes écrivent des fins de ligne « \n »
+    grain = parse_grain(GRAIN.replace("\r\n", "\n") + "\n")
+    jobs = [("a", model(1)), ("b", model("1.0E+05", n_pops=3)), ("c", grain.config)]
+    buffer = io.BytesIO()
+    write_manifest(jobs, buffer, fmt)
+    buffer.seek(0)
+    assert list(iter_manifest(buffer, fmt)) == jobs
+
+
+@pytest.mark.parametrize("data, name", [
+    ('[{"name": "x", "config": 3}]', "m.json"),
+    ('[{"name": "x", "config": {"G0": "1\\n"}}]', "m.json"),
+    ("hello\ngarbage\n", "junk.dat"),
+    ("name,G0\na,1\n", "m.csv"),
+])
+def test_manifest_rejects_invalid_models(data, name):
+    source = io.BytesIO(data.encode())
+    source.name = name
+    with pytest.raises(ValueError):
+        list(iter_manifest(source))
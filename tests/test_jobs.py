@@ -0,0 +1,116 @@
+import time
+
+import pytest
+
+from dustem_core.fake_dustem import make_fake_repository
+from dustem_core.jobs import CANCELLED, DONE, PRIORITIES, RUNNING, TIMEOUT, JobManager
+from dustem_core.runner import run_job
+
+from conftest import model
+
+
+@pytest.fixture
+def slow_repo(tmp_path):
+    return make_fake_repository(tmp_path / "slow", n_wl=10, n_pops=2, runtime=5.0)
+
+
+def wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+def test_background_job_output(fake_repo):
+    manager = JobManager(max_running=2)
+    request = manager.submit("a", model(10), fake_repo)
+    assert request.wait(30)
+    assert request.state == DONE
+    assert "faux dustem : 2 population(s)" in request.stdout
+    assert request.result.data.shape == (50, 4)
+    assert request.elapsed > 0
+    outcome = request.future.result()
+    assert outcome["name"] == "a" and outcome["error"] is None
+
+
+def test_job_timeout(slow_repo):
+    request = JobManager(max_running=1).submit("lent", model(1), slow_repo, timeout=0.5)
+    assert request.wait(30)
+    assert request.state == TIMEOUT
+    assert request.result is None
+    assert request.future.result()["error"]
+
+
+def test_cancel_running_job(slow_repo):
+    request = JobManager(max_running=1).submit("lent", model(1), slow_repo)
+    wait_for(lambda: request.state == RUNNING)
+    start = time.monotonic()
+    request.cancel()
+    assert request.job.wait(10)
+    assert time.monotonic() - start < 3
+    assert request.state == CANCELLED
+    assert request.job.state == CANCELLED
+
+
+def test_run_job_timeout(tmp_path):
+    repo = make_fake_repository(tmp_path / "slow", n_wl=10, n_pops=1, runtime=5.0)
+    outcome = run_job(str(repo), "slow", model(1, n_pops=1), timeout=0.5)
+    assert outcome["data"] is None
+    assert outcome["error"]
+
+
+@pytest.fixture
+def short_repo(tmp_path):
+    return make_fake_repository(tmp_path / "short", n_wl=10, n_pops=2, runtime=0.5)
+
+
+def test_same_key_shares_one_run(short_repo):
+    manager = JobManager(max_running=2)
+    a = manager.submit("a", model(1), short_repo, key="k")
+    b = manager.submit("b", model(1), short_repo, key="k")
+    other = manager.submit("c", model(2), short_repo, key="k2")
+    assert a.job is b.job and a.coalesced and not other.coalesced
+    assert a.wait(30) and b.wait(30) and other.wait(30)
+    assert [a.future.result()["name"], b.future.result()["name"]] == ["a", "b"]
+    assert a.future.result()["data"] is b.future.result()["data"]
+    # Une fois l'exécution terminée, la même clé relance dustem
+    assert manager.submit("d", model(1), short_repo, key="k").job is not a.job
+
+
+def test_cancel_coalesced_request_keeps_the_run(short_repo):
+    manager = JobManager(max_running=1)
+    a = manager.submit("a", model(1), short_repo, key="k")
+    b = manager.submit("b", model(1), short_repo, key="k")
+    a.cancel()
+    assert a.future.done() and a.state == CANCELLED
+    assert b.wait(30)
+    assert b.state == DONE and a.job.state == DONE
+    assert a.future.result()["data"] is None
+
+
+def test_queue_is_fair_between_users(fake_repo):
+    manager = JobManager(max_running=0)
+    alice = [manager.submit(f"a{i}", model(i + 1), fake_repo, user="alice") for i in range(3)]
+    bob = manager.submit("b0", model(10), fake_repo, user="bob")
+    assert [r.position for r in alice + [bob]] == [1, 3, 4, 2]
+    assert manager.status() == (0, 4, 0)
+
+
+def test_priority_goes_first(fake_repo):
+    manager = JobManager(max_running=0)
+    low = manager.submit("bas", model(1), fake_repo, user="alice", key="k")
+    normal = manager.submit("normal", model(2), fake_repo, user="alice")
+    high = manager.submit("haut", model(3), fake_repo, user="bob", priority=PRIORITIES["haute"])
+    assert [r.position for r in (low, normal, high)] == [2, 3, 1]
+    # Une demande prioritaire rattachée à une exécution en attente la fait avancer
+    manager.submit("bas bis", model(1), fake_repo, user="carol", priority=PRIORITIES["haute"], key="k")
+    assert low.position == 1
+
+
+def test_wait_timeout_returns_false(fake_repo):
+    manager = JobManager(max_running=0)
+    request = manager.submit("a", model(1), fake_repo)
+    assert request.wait(0.1) is False
+    request.cancel()
+    assert request.wait(1)
+    assert request.state == CANCELLED and request.position is None
@@ -0,0 +1,91 @@
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from dustem_core import api
+from dustem_core.journal import DONE, FAILED, QUEUED, Journal
+from dustem_core.store import ResultStore
+
+from conftest import model
+
+MODELS = {f"m{i}": model(10 ** i) for i in range(4)}
+
+
+class Interrupt(Exception):
+    pass
+
+
+def interrupt_after(n):
+    def callback(progress, outcome):
+        if progress.done >= n:
+            raise Interrupt
+    return callback
+
+
+def test_finished_batch_is_recorded(fake_repo):
+    api.run_batch(MODELS, repository=fake_repo, project="p", batch_id="lot")
+    batch = Journal().batch("lot")
+    assert batch["counts"][DONE] == 4
+    assert batch["finished"] is not None and not batch["interrupted"]
+    assert Journal().interrupted() == []
+    with pytest.raises(ValueError):
+        api.resume_batch("lot")
+
+
+def test_resume_runs_only_unfinished_models(fake_repo):
+    with pytest.raises(Interrupt):
+        api.run_batch(MODELS, workers=1, repository=fake_repo, project="p", batch_id="lot",
+                      callback=interrupt_after(2))
+    journal = Journal()
+    (batch,) = journal.interrupted("p")
+    assert batch["batch_id"] == "lot"
+    done = {job["name"] for job in journal.jobs("lot", [DONE])}
+    assert len(done) == 2 and set(ResultStore("p")) == done
+
+    outcomes = api.resume_batch("lot")
+    assert {o["name"] for o in outcomes} == set(MODELS) - done
+    assert journal.batch("lot")["counts"][DONE] == 4
+    assert not journal.batch("lot")["interrupted"]
+    assert set(ResultStore("p")) == set(MODELS)
+
+
+def test_stored_result_is_not_run_again(fake_repo):
+    api.run_batch({"m0": MODELS["m0"]}, repository=fake_repo, project="p", journal=False)
+    journal = Journal()
+    journal.create(MODELS.items(), project="p", repository=fake_repo, params={"metadata": {}}, batch_id="lot")
+    journal.release("lot")
+    assert journal.batch("lot")["interrupted"]
+    outcomes = api.resume_batch("lot")
+    assert sorted(o["name"] for o in outcomes) == ["m1", "m2", "m3"]
+    assert journal.batch("lot")["counts"][DONE] == 4
+
+
+def test_batch_of_a_dead_process_is_interrupted(tmp_path):
+    journal = Journal()
+    journal.create([("a", model(1))], project="p", params={"metadata": {}}, batch_id="lot")
+    # Le processus propriétaire est vivant : le lot est en cours
+    assert not journal.batch("lot")["interrupted"]
+    with pytest.raises(ValueError):
+        api.resume_batch("lot")
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    with sqlite3.connect(journal.path) as db:
+        db.execute("UPDATE batches SET pid = ? WHERE batch_id = 'lot'", (dead.pid,))
+    assert [b["batch_id"] for b in journal.interrupted()] == ["lot"]
+    assert journal.unfinished("lot") == [("a", model(1))]
+
+
+def test_failed_models_are_retried_on_request(fake_repo):
+    journal = Journal()
+    journal.create(MODELS.items(), project="p", repository=fake_repo, params={"metadata": {}}, batch_id="lot")
+    for name in MODELS:
+        journal.mark("lot", name, FAILED, error="arrêt")
+    journal.release("lot")
+    assert journal.batch("lot")["counts"] == {QUEUED: 0, "running": 0, DONE: 0, FAILED: 4}
+    with pytest.raises(ValueError):
+        api.resume_batch("lot")
+    outcomes = api.resume_batch("lot", retry_failed=True)
+    assert len(outcomes) == 4 and all(o["error"] is None for o in outcomes)
+    assert journal.batch("lot")["counts"][DONE] == 4
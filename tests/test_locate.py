@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from dustem_core import locate
+
+
+@pytest.fixture(autouse=True)
+def no_default_install(tmp_path, monkeypatch):
+    monkeypatch.setattr(locate, "APP_DIR", tmp_path / "app")
+
+
+def test_environment_comes_first(fake_repo, shared_repo, monkeypatch):
+    locate.remember_repository(shared_repo)
+    monkeypatch.setenv("DUSTEM_REPOSITORY", str(fake_repo))
+    assert locate.locate_dustem() == (fake_repo / "src", fake_repo)
+    monkeypatch.setenv("DUSTEM_BINARY", str(shared_repo / "src" / "dustem"))
+    assert locate.locate_dustem() == (shared_repo / "src", shared_repo)
+
+
+def test_location_is_remembered(fake_repo, monkeypatch):
+    monkeypatch.setenv("DUSTEM_REPOSITORY", str(fake_repo))
+    locate.locate_dustem()
+    assert json.loads(locate.config_file().read_text()) == {"dustem_binary": str(fake_repo / "src" / "dustem")}
+    monkeypatch.delenv("DUSTEM_REPOSITORY")
+    assert locate.locate_dustem() == (fake_repo / "src", fake_repo)
+
+
+def test_not_found(tmp_path, fake_repo):
+    with pytest.raises(FileNotFoundError):
+        locate.locate_dustem()
+    with pytest.raises(FileNotFoundError):
+        locate.remember_repository(tmp_path / "nulle_part")
+    # Binaire enregistré puis supprimé
+    locate.remember_repository(fake_repo)
+    (fake_repo / "src" / "dustem").unlink()
+    with pytest.raises(FileNotFoundError):
+        locate.locate_dustem()
+
+
+def test_scan_is_bounded(tmp_path, fake_repo):
+    deep = tmp_path / "home" / "a" / "b" / "c"
+    (deep / "node_modules").mkdir(parents=True)
+    (deep / "dustem").symlink_to(fake_repo / "src" / "dustem")
+    (tmp_path / "home" / "a" / "dustem").write_text("pas exécutable")
+    (deep / "node_modules" / "dustem").symlink_to(fake_repo / "src" / "dustem")
+    roots = [tmp_path / "home"]
+    assert locate.scan(roots=roots) == [deep / "dustem"]
+    assert locate.scan(roots=roots, max_depth=2) == []
+    src, repository = locate.scan_and_remember(roots=roots)
+    assert repository == fake_repo
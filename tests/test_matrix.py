@@ -0,0 +1,36 @@
+import numpy as np
+
+from dustem_core.matrix import loglog_resample, sed_matrix
+
+
+def test_loglog_resample():
+    wl = np.array([1.0, 10.0, 100.0])
+    values = np.array([[1.0, 0.1, 0.01], [3.0, 0.0, 5.0]])
+    out = loglog_resample(wl, values, [1.0, np.sqrt(10.0), 10.0, 100.0, 1000.0])
+    np.testing.assert_allclose(out[0, :4], [1.0, 10 ** -0.5, 0.1, 0.01])
+    # Valeurs exactes de la grille, même à côté d'un zéro
+    np.testing.assert_allclose(out[1, [0, 2, 3]], [3.0, 0.0, 5.0])
+    assert out[1, 1] == 0.0
+    assert np.isnan(out[:, 4]).all()
+
+
+def test_sed_matrix_aligns_grids():
+    wl = np.logspace(0, 2, 5)
+    results = {
+        "a": {"wl": wl, "pop1": wl ** -1.0, "sed_tot": wl ** -1.0},
+        "b": {"wl": wl, "pop1": wl ** -1.0, "pop2": wl ** -2.0, "sed_tot": wl ** -1.0 + wl ** -2.0},
+        # Grille plus fine, décroissante : rééchantillonnée sur celle de « a »
+        "c": {"wl": np.logspace(2, 0, 9), "sed_tot": 2 * np.logspace(2, 0, 9) ** -1.0},
+    }
+    matrix = sed_matrix(results, ["a", "b", "c"], populations=True)
+    assert matrix.sed_tot.shape == (3, 5)
+    np.testing.assert_allclose(matrix.sed_tot[2], 2 * wl ** -1.0)
+    assert np.isnan(matrix.pops["pop2"][0]).all()
+    np.testing.assert_allclose(matrix.peak(), [1.0, 2.0, 2.0])
+    assert [sorted(columns) for _, columns in matrix.rows()] == [
+        ["pop1", "sed_tot", "wl"], ["pop1", "pop2", "sed_tot", "wl"], ["sed_tot", "wl"],
+    ]
+    table = matrix.table(populations=True)
+    assert list(table.columns) == [
+        "wavelength_um", "a_SED_total", "a_pop1", "b_SED_total", "b_pop1", "b_pop2", "c_SED_total",
+    ]
@@ -0,0 +1,58 @@
+import json
+
+from dustem_core import api
+from dustem_core.metrics import RunMetrics, default_metrics_file, log_metrics, prometheus_text, read_metrics
+from dustem_core.plotting import FigureCache, plot_result
+from dustem_core.store import ResultStore
+
+from conftest import model
+
+
+def test_batch_runs_are_logged(fake_repo):
+    api.run_batch({"a": model(1), "b": model(10)}, workers=2, repository=fake_repo, project="p")
+    api.run_batch({"a2": model("1.0")}, repository=fake_repo, project="p")
+    records = list(read_metrics())
+    assert sorted(r["name"] for r in records) == ["a", "a2", "b"]
+    by_name = {r["name"]: r for r in records}
+    assert by_name["a"]["cache"] == "miss" and by_name["a2"]["cache"] == "hit"
+    assert {"cache", "workspace", "config", "process", "parse", "store"} <= set(by_name["a"]["stages"])
+    assert by_name["a"]["ok"] and by_name["a"]["returncode"] == 0
+    assert by_name["a"]["cpu_user"] is not None and by_name["a"]["max_rss_mb"] > 0
+    # Une ligne JSON complète par exécution
+    assert all(json.loads(line) for line in default_metrics_file().read_text().splitlines())
+
+
+def test_log_metrics_never_raises(tmp_path):
+    (tmp_path / "fichier").write_text("")
+    log_metrics({"event": "run"}, tmp_path / "fichier" / "metrics.jsonl")
+
+
+def test_prometheus_text():
+    records = [
+        dict(RunMetrics("a").to_dict(), stages={"process": 1.5, "parse": 0.25}, cache="miss", ok=True,
+             queue_wait=0.5, cpu_user=1.0, cpu_system=0.5, max_rss_mb=10.0),
+        dict(RunMetrics("b").to_dict(), stages={"process": 0.5}, cache="miss", ok=False),
+        dict(RunMetrics("c").to_dict(), stages={"cache": 0.01}, cache="hit", ok=True),
+        {"event": "plot", "name": "plot_result", "stages": {"plot": 0.2}},
+    ]
+    text = prometheus_text(records).splitlines()
+    assert 'dustem_runs_total{cache="miss",status="ok"} 1' in text
+    assert 'dustem_runs_total{cache="miss",status="failed"} 1' in text
+    assert 'dustem_runs_total{cache="hit",status="ok"} 1' in text
+    assert 'dustem_stage_seconds_sum{stage="process"} 2.000000' in text
+    assert 'dustem_stage_seconds_count{stage="process"} 2' in text
+    assert 'dustem_stage_seconds_count{stage="plot"} 1' in text
+    assert "dustem_queue_wait_seconds_count 1" in text
+    assert 'dustem_child_cpu_seconds_total{mode="user"} 1.000000' in text
+    assert f"dustem_child_max_rss_bytes {10 * 1024 * 1024}" in text
+
+
+def test_run_metadata_has_every_stage(fake_repo):
+    api.run_batch({"a": model(1)}, repository=fake_repo, project="p", cache=False)
+    run = ResultStore("p")["a"]
+    stages = run.meta["metrics"]["stages"]
+    assert {"workspace", "config", "process", "parse", "store"} <= set(stages)
+    cache = FigureCache()
+    cache.get_png("a", plot_result, run=run, data_dict=run)
+    assert run.meta["metrics"]["stages"]["plot"] > 0
+    assert run.meta["metrics"]["stages"]["store"] == stages["store"]
@@ -0,0 +1,44 @@
+from dustem_core import api
+from dustem_core.fake_dustem import make_fake_repository
+from dustem_core.outputs import product_curves, product_label
+from dustem_core.runner import run_job
+from dustem_core.store import ResultStore
+from dustem_core.workspace import RunWorkspace
+
+from conftest import model
+
+
+def test_shared_mode_drops_stale_outputs(tmp_path):
+    repo = make_fake_repository(tmp_path / "shared", n_wl=20, n_pops=1, keywords="sed ext", shared=True)
+    with RunWorkspace(repo) as workspace:
+        workspace.write_grain(model(1, n_pops=1))
+        workspace.run()
+    assert (repo / "out" / "EXT.RES").exists()
+    grain = repo / "data" / "GRAIN.DAT"
+    grain.write_text(grain.read_text().replace("sed ext", "sed"))
+    outcome = run_job(str(repo), "b", model(2, n_pops=1))
+    assert outcome["outputs"] is None
+
+
+def test_batch_stores_other_outputs(tmp_path):
+    repo = make_fake_repository(tmp_path / "repo", n_wl=20, n_pops=2, keywords="sed ext temp")
+    api.run_batch({"a": model(1)}, repository=repo, project="p", cache=False)
+    store = ResultStore("p")
+    assert store.entry("a")["outputs"] == ["DIST_POP1", "DIST_POP2", "EXT"]
+    ext = store["a"].outputs["EXT"]
+    assert ext.block(0).shape == (20, 4)
+    assert len(store["a"].outputs["DIST_POP1"]) == 10
+
+
+def test_product_curves_skip_results_without_the_product(tmp_path):
+    repo = make_fake_repository(tmp_path / "repo", n_wl=20, n_pops=2, keywords="sed ext")
+    api.run_batch({"a": model(1), "b": model(2)}, repository=repo, project="p", cache=False)
+    plain = make_fake_repository(tmp_path / "plain", n_wl=20, n_pops=2)
+    api.run_batch({"c": model(3)}, repository=plain, project="p", cache=False)
+    curves = product_curves(ResultStore("p"), ["a", "b", "c"], "EXT", column=3)
+    assert sorted(curves) == ["a", "b"]
+    x, y = curves["b"]
+    assert x.shape == y.shape == (20,)
+    assert product_curves(ResultStore("p"), ["a"], "EXT", column=9) == {}
+    assert product_label("DIST_aSil").endswith("(aSil)")
+    assert product_label("INCONNU") == "INCONNU"
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import pytest
+
+from dustem_core.readers import read_sed
+from dustem_core.runner import run_job
+from dustem_core.workspace import RunWorkspace
+
+from conftest import model
+
+
+@pytest.fixture
+def sed_file(tmp_path, fake_repo):
+    with RunWorkspace(fake_repo, keep=True) as workspace:
+        workspace.write_grain(model(1))
+        workspace.run()
+    return workspace.sed_file
+
+
+def test_read_sed_columns(sed_file):
+    table = read_sed(sed_file, ["POP1", "POP2"], sidecar=False)
+    assert table.data.shape == (50, 4)
+    columns = table.columns()
+    assert list(columns) == ["wl", "pop1", "pop2", "sed_tot"]
+    np.testing.assert_allclose(columns["pop1"] + columns["pop2"], columns["sed_tot"], rtol=1e-6)
+    assert np.all(np.diff(columns["wl"]) > 0)
+
+
+@pytest.mark.parametrize("grain_types", [["A"], ["A", "B", "C"]])
+def test_read_sed_checks_populations(sed_file, grain_types):
+    with pytest.raises(ValueError):
+        read_sed(sed_file, grain_types, sidecar=False)
+
+
+def test_read_sed_rejects_truncated_file(tmp_path, sed_file):
+    path = tmp_path / "SED.RES"
+    path.write_text("".join(sed_file.read_text().splitlines(keepends=True)[:20]))
+    with pytest.raises(ValueError):
+        read_sed(path, sidecar=False)
+
+
+def test_sidecar_follows_source(tmp_path, fake_repo):
+    run = run_job(str(fake_repo), "a", model(1))
+    path = tmp_path / "SED.RES"
+    np.savetxt(path, run["data"].data, header="DUSTEM SED\n2 50", comments="# ")
+    first = read_sed(path).data
+    assert os.path.exists(f"{path}.npy")
+    np.testing.assert_array_equal(read_sed(path).data, first)
+    # Réécrit à la même date (horloge grossière) : la copie binaire n'est plus valable
+    stat = os.stat(path)
+    np.savetxt(path, run["data"].data[:40], header="DUSTEM SED\n2 40", comments="# ")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.utime(f"{path}.npy", ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    np.testing.assert_array_equal(read_sed(path).data, first[:40])
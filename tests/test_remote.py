@@ -0,0 +1,134 @@
+import base64
+import io
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from dustem_core.cache import build_id
+from dustem_core.jobs import DONE, FAILED, JobManager
+from dustem_core.remote import WorkerServer, run_worker, serve_workers
+
+from conftest import model
+
+
+def post(server, path, body, token=None):
+    request = urllib.request.Request(
+        server.url + path, data=json.dumps(body).encode(),
+        headers={"Content-Type": "application/json", "X-Dustem-Token": token or ""},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return 200, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def lease(server, repo, worker="w", slots=1):
+    status, reply = post(server, "/lease", {"worker": worker, "capacity": slots, "build": build_id(repo),
+                                            "slots": slots})
+    assert status == 200
+    return [job["lease"] for job in reply["jobs"]]
+
+
+def encode(array):
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+@pytest.fixture
+def server():
+    with WorkerServer(JobManager(max_running=0), port=0, lease_timeout=0.5) as server:
+        yield server
+
+
+@pytest.fixture
+def worker(fake_repo, server):
+    """Démarre des travailleurs (threads) sur le faux repository ; arrêtés en fin de test"""
+    stops = []
+
+    def start(name="w0"):
+        stop = threading.Event()
+        stops.append(stop)
+        threading.Thread(target=run_worker, args=(server.url,), daemon=True, kwargs=dict(
+            repository=fake_repo, capacity=2, name=name, heartbeat=0.2, poll=0.05, stop=stop, log=lambda m: None,
+        )).start()
+
+    yield start
+    for stop in stops:
+        stop.set()
+
+
+def test_remote_workers_run_jobs(fake_repo, server, worker):
+    worker("w0")
+    worker("w1")
+    requests = [server.manager.submit(f"g{g}", model(g), fake_repo) for g in (1, 10, 100)]
+    assert all(r.wait(30) for r in requests)
+    assert [r.state for r in requests] == [DONE] * 3
+    assert requests[0].result.grain_types == ["POP1", "POP2"]
+    np.testing.assert_allclose(requests[2].result.data[:, -1], 100 * requests[0].result.data[:, -1])
+
+
+def test_lost_lease_is_requeued(fake_repo, server, worker):
+    request = server.manager.submit("a", model(1), fake_repo)
+    # Travailleur qui prend la tâche puis disparaît
+    assert len(lease(server, fake_repo, worker="perdu")) == 1
+    time.sleep(1.0)
+    worker("secours")
+    assert request.wait(30)
+    assert request.state == DONE
+    assert request.job.worker == "secours"
+    assert request.job.attempts == 2
+
+
+def test_job_fails_after_max_attempts(fake_repo):
+    with WorkerServer(JobManager(max_running=0), port=0, lease_timeout=0.2, max_attempts=2) as server:
+        request = server.manager.submit("a", model(1), fake_repo)
+        for _ in range(2):
+            deadline = time.time() + 10
+            while not lease(server, fake_repo, worker="perdu"):
+                assert time.time() < deadline
+                time.sleep(0.05)
+        assert request.wait(10)
+        assert request.state == FAILED
+        assert "perdu" in request.error
+
+
+def test_result_of_expired_lease_is_refused(fake_repo, server):
+    server.manager.submit("a", model(1), fake_repo)
+    (old,) = lease(server, fake_repo, worker="lent")
+    time.sleep(1.0)
+    status, reply = post(server, "/result", {"worker": "lent", "lease": old, "state": DONE,
+                                             "sed": encode(np.ones((5, 4)))})
+    assert status == 200 and not reply["accepted"]
+
+
+def test_result_is_validated(fake_repo, server):
+    requests = [server.manager.submit(f"m{i}", model(1), fake_repo) for i in range(2)]
+    leases = lease(server, fake_repo, worker="w", slots=2)
+    status, _ = post(server, "/result", {"worker": "w", "lease": leases[0], "state": "piraté"})
+    assert status == 400
+    # Mauvais nombre de colonnes : tâche en échec, rien n'est enregistré
+    post(server, "/result", {"worker": "w", "lease": leases[0], "state": DONE, "sed": encode(np.ones((5, 3))),
+                             "grain_types": ["X"]})
+    # Types de grains du client ignorés : ceux de la configuration de la tâche
+    post(server, "/result", {"worker": "w", "lease": leases[1], "state": DONE, "sed": encode(np.ones((5, 4))),
+                             "grain_types": ["X", "Y"]})
+    assert all(r.wait(10) for r in requests)
+    assert requests[0].state == FAILED and requests[0].result is None
+    assert requests[1].state == DONE and requests[1].result.grain_types == ["POP1", "POP2"]
+
+
+def test_token_required():
+    with pytest.raises(ValueError):
+        serve_workers(JobManager(max_running=0), "0.0.0.0:0")
+    with WorkerServer(JobManager(max_running=0), port=0, token="secret") as server:
+        assert post(server, "/lease", {})[0] == 403
+        status, _ = post(server, "/lease", {"worker": "w", "capacity": 1, "build": "x", "slots": 1}, token="secret")
+        assert status == 200
+
@@ -0,0 +1,103 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from dustem_core import api
+from dustem_core.store import ResultStore
+
+from conftest import model
+
+
+def columns(scale=1.0, n=20):
+    return {"wl": np.arange(1.0, n + 1), "pop1": np.full(n, scale), "sed_tot": np.full(n, 2 * scale)}
+
+
+@pytest.fixture
+def stores(tmp_path):
+    return ResultStore("p", root=tmp_path / "store"), ResultStore("p", root=tmp_path / "store")
+
+
+def test_append_and_read(stores):
+    store, _ = stores
+    result = store.append("a", columns(), config={"G0": "1\n"}, metadata={"source": "dustem"})
+    assert list(store) == ["a"]
+    np.testing.assert_array_equal(result["sed_tot"], columns()["sed_tot"])
+    assert store["a"].meta["source"] == "dustem"
+    assert store.config("a") == {"G0": "1\n"}
+    assert store.entry("a")["n_wl"] == 20
+
+
+def test_replace_removes_previous_run(stores):
+    store, other = stores
+    store.append("a", columns(1.0))
+    first = store.entry("a")["run"]
+    store.append("a", columns(3.0))
+    assert len(store) == 1
+    assert not (store.path / "runs" / first).exists()
+    assert other["a"]["pop1"][0] == 3.0
+
+
+def test_other_instance_sees_appends_and_deletes(stores):
+    store, other = stores
+    assert len(other) == 0
+    for i in range(5):
+        store.append(f"m{i}", columns(i))
+    assert list(other) == [f"m{i}" for i in range(5)]
+    del store["m2"]
+    store.append("m6", columns())
+    assert "m2" not in other
+    assert list(other)[-1] == "m6"
+    assert len(ResultStore("p", root=store.path.parent)) == 5
+
+
+def test_partial_index_line_is_read_once_complete(stores):
+    store, other = stores
+    store.append("a", columns())
+    len(other)
+    line = json.dumps(dict(store.entry("a"), name="b")).encode()
+    fd = os.open(store.index_file, os.O_WRONLY | os.O_APPEND)
+    os.write(fd, line[:10])
+    assert "b" not in other
+    os.write(fd, line[10:] + b"\n")
+    os.close(fd)
+    assert list(other) == ["a", "b"]
+
+
+def test_rewritten_index_is_reread(stores):
+    store, other = stores
+    store.append("a", columns())
+    store.append("b", columns())
+    assert len(other) == 2
+    lines = store.index_file.read_text().splitlines(keepends=True)
+    tmp = store.index_file.with_name("index.tmp")
+    tmp.write_text(lines[1])
+    os.replace(tmp, store.index_file)
+    assert list(other) == ["b"]
+
+
+def test_many_appends_stay_incremental(stores, monkeypatch):
+    store, _ = stores
+    store.append("m0", columns())
+    reads = []
+    original = json.loads
+    monkeypatch.setattr(json, "loads", lambda s, *a, **k: reads.append(1) or original(s, *a, **k))
+    for i in range(1, 50):
+        store.append(f"m{i}", columns())
+    assert len(store) == 50
+    # Chaque ligne de l'index n'est analysée qu'une fois
+    assert len(reads) <= 50
+
+
+def test_batch_results_are_stored(fake_repo):
+    models = {f"g{g}": model(g) for g in (1, 10, 100)}
+    first = api.run_batch(models, workers=2, repository=fake_repo, project="p")
+    assert not any(o["cached"] for o in first)
+    # Même modèle écrit autrement : servi par le cache
+    again = api.run_batch({"g10": model("1.0E+01")}, repository=fake_repo, project="p")
+    assert again[0]["cached"]
+    store = ResultStore("p")
+    assert sorted(store) == sorted(models)
+    assert store.config("g1") == models["g1"]
+    np.testing.assert_allclose(store["g10"]["sed_tot"], again[0]["data"].data[:, -1])
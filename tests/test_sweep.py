@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from dustem_core import api
+from dustem_core.sweep import apply_values, count_points, expand_sweep, parse_axes, parse_axis
+from dustem_core.workspace import binary_uses_shared_paths
+
+from conftest import CV_LINE, LOGN_LINE, model
+
+G0S = (1, 10, 100, 1000)
+
+
+def check_scaling(outcomes):
+    """Le faux dustem produit un SED proportionnel à G0 : chaque résultat doit être le sien"""
+    by_name = {o["name"]: o for o in outcomes}
+    assert all(o["error"] is None for o in outcomes), [o["error"] for o in outcomes]
+    reference = by_name["g1"]["data"].data[:, -1]
+    for g0 in G0S:
+        np.testing.assert_allclose(by_name[f"g{g0}"]["data"].data[:, -1], g0 * reference)
+
+
+def test_parse_axis():
+    axis = parse_axis("1e4:1e6:3:log")
+    np.testing.assert_allclose(axis["values"], [1e4, 1e5, 1e6])
+    assert axis["log"]
+    assert parse_axis("1, 2, 3") == {"values": [1.0, 2.0, 3.0], "lo": 1.0, "hi": 3.0, "log": False}
+    for text in ("1:2", "-1:1:3:log", ""):
+        with pytest.raises(ValueError):
+            parse_axis(text)
+
+
+def test_expand_grid_and_lhs():
+    axes = parse_axes("G0 = 1:100:3:log\npop1.amin = 1e-8, 2e-8")
+    jobs = expand_sweep(model(1), axes)
+    assert len(jobs) == count_points(axes) == 6
+    assert jobs[0] == ("sweep_0000", apply_values(model(1), {"G0": 1.0, "pop1.amin": 1e-8}))
+    lhs = expand_sweep(model(1), axes, mode="lhs", n=4, seed=0)
+    g0s = sorted(float(config["G0"]) for _, config in lhs)
+    # Une valeur par strate de l'axe logarithmique
+    assert [int(np.log10(g) * 2 // 1) for g in g0s] == [0, 1, 2, 3]
+    with pytest.raises(ValueError):
+        parse_axes("pop1.rho = 1")
+
+
+def test_apply_values_keeps_other_columns():
+    base = {"G0": "1.00E+00\n", "pop1": LOGN_LINE, "pop2": CV_LINE}
+    config = apply_values(base, {"G0": 10, "pop1.amin": 4e-8, "pop2.gamma": 2.0})
+    assert config["G0"] == "1.0000E+01\n"
+    assert config["pop1"].split() == LOGN_LINE.replace("3.10E-08", "4.0000E-08").split()
+    assert config["pop2"].split() == CV_LINE.replace("\t1.00E+00\t1.00E-05", "\t2.0000E+00\t1.00E-05").split()
+    assert base["pop1"] == LOGN_LINE
+    with pytest.raises(ValueError):
+        apply_values(base, {"pop1.at": 1e-6})
+    with pytest.raises(ValueError):
+        apply_values(base, {"pop3.amin": 1e-8})
+
+
+def test_parallel_batch(fake_repo):
+    outcomes = api.run_batch({f"g{g}": model(g) for g in G0S}, workers=4, repository=fake_repo, cache=False)
+    check_scaling(outcomes)
+
+
+def test_shared_mode_batch_is_serialized(shared_repo):
+    assert binary_uses_shared_paths(shared_repo / "src" / "dustem", shared_repo)
+    outcomes = api.run_batch({f"g{g}": model(g) for g in G0S}, workers=4, repository=shared_repo, cache=False)
+    check_scaling(outcomes)
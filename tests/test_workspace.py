@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dustem_core.workspace import RunWorkspace, binary_uses_shared_paths
+
+from conftest import model
+
+
+def test_workspace_is_private_and_removed(tmp_path, fake_repo):
+    grain = (fake_repo / "data" / "GRAIN.DAT").read_text()
+    with RunWorkspace(fake_repo, root=tmp_path / "runs") as workspace:
+        assert not workspace.shared
+        assert workspace.path.parent == tmp_path / "runs"
+        assert (workspace.path / "data" / "LAMBDA.DAT").is_symlink()
+        assert not workspace.grain_file.is_symlink()
+        workspace.write_grain(model(1e3))
+        result = workspace.run()
+        assert result.returncode == 0
+        assert workspace.sed_file.exists()
+        path = workspace.path
+    assert not path.exists()
+    # Ni le GRAIN.DAT ni out/ du repository ne sont touchés
+    assert (fake_repo / "data" / "GRAIN.DAT").read_text() == grain
+    assert not (fake_repo / "out" / "SED.RES").exists()
+
+
+def test_workspace_keeps_template_keywords(fake_repo):
+    with RunWorkspace(fake_repo, keep=True) as workspace:
+        workspace.write_grain(model(5))
+        lines = workspace.grain_file.read_text().splitlines()
+    assert lines[2] == "sed"
+    assert lines[3:] == [line.rstrip("\n") for line in model(5).values()]
+
+
+def test_parallel_workspaces_do_not_mix(fake_repo):
+    def run(g0):
+        with RunWorkspace(fake_repo) as workspace:
+            workspace.write_grain(model(g0))
+            workspace.run()
+            return float(workspace.sed_file.read_text().splitlines()[3].split()[-1])
+
+    with ThreadPoolExecutor(4) as pool:
+        totals = list(pool.map(run, [1, 10, 100, 1000]))
+    assert [t / totals[0] for t in totals] == pytest.approx([1, 10, 100, 1000], rel=1e-5)
+
+
+def test_shared_paths_detection(fake_repo, shared_repo):
+    assert not binary_uses_shared_paths(fake_repo / "src" / "dustem", fake_repo)
+    assert binary_uses_shared_paths(shared_repo / "src" / "dustem", shared_repo)
+    with RunWorkspace(shared_repo) as workspace:
+        assert workspace.shared
+        assert workspace.path == shared_repo